@@ -114,6 +114,20 @@ async def get_platform_analytics(
     analytics = await service.get_platform_analytics(days)
     return analytics
 
+@router.get("/usage")
+async def get_usage(
+    minutes: int = Query(60, ge=1, le=60 * 24 * 7),
+    group_by: str = Query("model", pattern="^(model|tenant_id|agent_id|kind)$"),
+    tenant_id: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Get LLM/TTS/STT token and cost usage rollups
+    """
+    service = AdminService(db)
+    usage = await service.get_usage(minutes, group_by, tenant_id)
+    return usage
+
 @router.get("/audit-logs")
 async def get_audit_logs(
     user_id: Optional[str] = None,
@@ -1,7 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
 from app.core.database import get_db
+from app.services.job_queue import PRIORITIES, QueueFull
 from app.services.knowledge_service import KnowledgeService
+from app.services.quantization import QUANTIZATIONS
 
 router = APIRouter()
 
@@ -9,15 +12,50 @@ router = APIRouter()
 async def upload_document(
     agent_id: str,
     file: UploadFile = File(...),
+    priority: str = "normal",
+    tenant_id: Optional[str] = None,
     db: AsyncSession = Depends(get_db)
 ):
     """
     Upload a document to agent's knowledge base
+
+    Returns the entry with its jobId at once; ingestion runs in the background
+    (progress in GET /agent/{agent_id}, GET /jobs/{job_id}, on the tenant's
+    /ws/user/{tenant_id} sockets and the admin stream)
     """
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"priority must be one of: {', '.join(PRIORITIES)}")
     service = KnowledgeService(db)
-    result = await service.upload_document(agent_id, file)
+    try:
+        result = await service.upload_document(agent_id, file, priority=priority, tenant_id=tenant_id)
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
     return result
 
+@router.post("/crawl")
+async def crawl_site(
+    agent_id: str,
+    url: str,
+    max_pages: Optional[int] = None,
+    priority: str = "normal",
+    tenant_id: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Import a docs site into agent's knowledge base from a sitemap (.xml) or seed URL
+
+    Returns the crawl job at once; pages are fetched and ingested in the background,
+    and crawling the same URL again only re-ingests pages that changed
+    """
+    service = KnowledgeService(db)
+    try:
+        job = await service.crawl_site(agent_id, url, max_pages=max_pages, priority=priority, tenant_id=tenant_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    return job
+
 @router.get("/agent/{agent_id}")
 async def get_knowledge_base(
     agent_id: str,
@@ -30,6 +68,35 @@ async def get_knowledge_base(
     items = await service.get_agent_knowledge(agent_id)
     return items
 
+@router.get("/jobs/{job_id}")
+async def get_ingestion_job(
+    job_id: str,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Status and progress of a document ingestion or crawl job
+    """
+    service = KnowledgeService(db)
+    job = await service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.put("/agent/{agent_id}/quantization")
+async def set_knowledge_quantization(
+    agent_id: str,
+    quantization: str,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Choose how an agent's knowledge vectors are stored: none, int8 or pq
+    """
+    if quantization not in QUANTIZATIONS:
+        raise HTTPException(status_code=400, detail=f"quantization must be one of: {', '.join(QUANTIZATIONS)}")
+    service = KnowledgeService(db)
+    await service.set_quantization(agent_id, quantization)
+    return {"agentId": agent_id, "quantization": quantization}
+
 @router.delete("/{kb_id}")
 async def delete_knowledge_item(
     kb_id: str,
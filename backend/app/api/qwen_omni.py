@@ -3,6 +3,7 @@ from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.database import get_db
 from app.services.qwen_omni_service import qwen_service
+from app.services import ws_codecs
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
 import json
@@ -63,7 +64,7 @@ async def list_qwen_sessions(
     """
     List all active Qwen 3 Omni sessions
     """
-    sessions = qwen_service.get_active_sessions()
+    sessions = await qwen_service.get_active_sessions()
     return {
         "sessions": sessions,
         "count": len(sessions)
@@ -78,7 +79,7 @@ async def get_qwen_session_status(
     """
     Get status of a specific Qwen 3 Omni session
     """
-    status = qwen_service.get_session_status(session_id)
+    status = await qwen_service.get_session_status(session_id)
     if not status:
         raise HTTPException(status_code=404, detail="Session not found")
     return status
@@ -158,15 +159,20 @@ async def qwen_voice_websocket(
       - Audio responses
       - Status updates
     
+    With a binary codec negotiated (Sec-WebSocket-Protocol afo.msgpack,
+    afo.msgpack.deflate, ... or ?codec=) every frame in both directions is
+    a codec message and audio travels as {"type": "audio", "content": <bytes>}
+    
     This provides ultra-low latency voice interaction (211ms average)
     """
-    await websocket.accept()
+    codec = await ws_codecs.accept(websocket)
+    binary_codec = codec != ws_codecs.DEFAULT_CODEC
     
     try:
         # Verify session exists
-        status = qwen_service.get_session_status(session_id)
+        status = await qwen_service.get_session_status(session_id)
         if not status:
-            await websocket.send_json({
+            await ws_codecs.send(websocket, codec, {
                 "type": "error",
                 "message": "Session not found"
             })
@@ -174,9 +180,10 @@ async def qwen_voice_websocket(
             return
         
         # Send welcome message
-        await websocket.send_json({
+        await ws_codecs.send(websocket, codec, {
             "type": "connected",
             "session_id": session_id,
+            "codec": codec,
             "capabilities": {
                 "audio_input": True,
                 "video_input": True,
@@ -189,10 +196,20 @@ async def qwen_voice_websocket(
         while True:
             # Receive audio data from client
             data = await websocket.receive()
+            if data.get("type") == "websocket.disconnect":
+                raise WebSocketDisconnect()
             
-            if "bytes" in data:
-                # Audio data received
+            message = None
+            audio_bytes = None
+            if data.get("bytes") is not None and not binary_codec:
                 audio_bytes = data["bytes"]
+            else:
+                message = ws_codecs.decode(codec, data.get("text") if data.get("text") is not None else data["bytes"])
+                if message.get("type") == "audio":
+                    audio_bytes = message.get("content", b"")
+            
+            if audio_bytes is not None:
+                # Audio data received
                 
                 # Process audio and stream responses
                 async for response in qwen_service.process_audio(
@@ -200,20 +217,18 @@ async def qwen_voice_websocket(
                     audio_data=audio_bytes,
                     stream=True
                 ):
-                    if response["type"] == "audio":
-                        # Send audio response as binary
+                    if response["type"] == "audio" and not binary_codec:
+                        # Send audio response as a raw binary frame
                         await websocket.send_bytes(response["content"])
                     else:
-                        # Send text/status as JSON
-                        await websocket.send_json(response)
+                        # Send text/status (and audio, for binary codecs) in the negotiated codec
+                        await ws_codecs.send(websocket, codec, response)
                         
-            elif "text" in data:
-                # Text message received
-                message = json.loads(data["text"])
-                
+            else:
+                # Control/text message received
                 if message.get("type") == "ping":
                     # Respond to ping
-                    await websocket.send_json({"type": "pong"})
+                    await ws_codecs.send(websocket, codec, {"type": "pong"})
                     
                 elif message.get("type") == "text":
                     # Process text message
@@ -222,14 +237,14 @@ async def qwen_voice_websocket(
                         text=message.get("content", ""),
                         stream=True
                     ):
-                        await websocket.send_json(response)
+                        await ws_codecs.send(websocket, codec, response)
                         
     except WebSocketDisconnect:
         print(f"WebSocket disconnected for session {session_id}")
     except Exception as e:
         print(f"WebSocket error for session {session_id}: {e}")
         try:
-            await websocket.send_json({
+            await ws_codecs.send(websocket, codec, {
                 "type": "error",
                 "message": str(e)
             })
@@ -289,5 +304,8 @@ async def qwen_health_check():
         "status": "healthy" if qwen_service.is_loaded else "loading",
         "model_loaded": qwen_service.is_loaded,
         "device": qwen_service.device,
-        "active_sessions": len(qwen_service.get_active_sessions())
+        "active_sessions": len(await qwen_service.get_active_sessions()),
+        "generation": qwen_service.scheduler.get_stats() if qwen_service.scheduler else None,
+        "prefix_cache": qwen_service.scheduler.prefix_cache.get_stats()
+        if qwen_service.scheduler and qwen_service.scheduler.prefix_cache else None
     }
@@ -53,7 +53,8 @@ async def text_to_speech(
             text=tts_request.text,
             voice_id=tts_request.voice_id,
             model_id=tts_request.model_id,
-            voice_settings=tts_request.voice_settings
+            voice_settings=tts_request.voice_settings,
+            tenant_id=user_id
         )
         
         # Return audio as streaming response
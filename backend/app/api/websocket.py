@@ -1,7 +1,10 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
 from app.services.websocket_manager import ws_manager
+from app.services.admin_stream import admin_stream
+from app.core.config import settings
 from app.services.chat_service import ChatService
-import json
+from app.services.rag_service import rag_service
+from app.services import ws_codecs
 
 router = APIRouter()
 
@@ -9,15 +12,40 @@ router = APIRouter()
 async def websocket_chat(websocket: WebSocket, agent_id: str):
     """
     WebSocket endpoint for real-time agent chat
+
+    Offer Sec-WebSocket-Protocol afo.msgpack / afo.json.deflate /
+    afo.msgpack.deflate (or ?codec=) for binary frames; JSON text is the default.
+    The server sends {"type": "ping"} heartbeats; clients that answer them
+    with {"type": "pong"} are reaped once silent past WS_IDLE_TIMEOUT_SECONDS
     """
-    await ws_manager.connect(websocket, agent_id)
+    connection_id = await ws_manager.connect(websocket, agent_id)
+    if connection_id is None:
+        # Rejected by admission control, socket already closed
+        return
+    codec = ws_manager.connections[connection_id].codec
     chat_service = ChatService()
+    if settings.RAG_ENABLED and settings.KNOWLEDGE_INDEX_PREWARM:
+        rag_service.prewarm(agent_id)
     
     try:
         while True:
             # Receive message from client
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
+            message_data = await ws_codecs.receive(websocket, codec)
+            if message_data is None:
+                raise WebSocketDisconnect()
+            if not ws_manager.receive_allowed(connection_id, pong=message_data.get("type") == "pong"):
+                # Over the inbound rate: drop instead of queueing another LLM call
+                await ws_manager.send_personal(connection_id, {
+                    "type": "error",
+                    "code": "rate_limited",
+                    "message": "Too many messages, slow down"
+                })
+                continue
+            if message_data.get("type") == "pong":
+                continue
+            if message_data.get("type") == "ping":
+                await ws_manager.send_personal(connection_id, {"type": "pong"})
+                continue
             
             # Process message through agent
             response = await chat_service.process_message(
@@ -27,32 +55,80 @@ async def websocket_chat(websocket: WebSocket, agent_id: str):
                 user_info=message_data.get("user_info", {})
             )
             
-            # Send response back to client
-            await websocket.send_json(response)
+            # Send response back to client (through its writer queue)
+            await ws_manager.send_personal(connection_id, response)
             
     except WebSocketDisconnect:
-        ws_manager.disconnect(websocket, agent_id)
+        ws_manager.disconnect(connection_id, agent_id)
     except Exception as e:
         print(f"WebSocket error: {e}")
         await websocket.close()
-        ws_manager.disconnect(websocket, agent_id)
+        ws_manager.disconnect(connection_id, agent_id)
+
+@router.websocket("/user/{user_id}")
+async def websocket_user(websocket: WebSocket, user_id: str):
+    """
+    WebSocket endpoint for a user's own notifications
+
+    Progress of the user's background jobs (document uploads, crawls)
+    arrives as {"type": "job", "job": {...}}; only this user's sockets and
+    the admin stream get them, never the public chat sockets. Same codecs
+    and heartbeats as /ws/chat
+    """
+    connection_id = await ws_manager.connect_user(websocket, user_id)
+    if connection_id is None:
+        return
+    codec = ws_manager.connections[connection_id].codec
+    
+    try:
+        while True:
+            message_data = await ws_codecs.receive(websocket, codec)
+            if message_data is None:
+                raise WebSocketDisconnect()
+            pong = message_data.get("type") == "pong"
+            if not ws_manager.receive_allowed(connection_id, pong=pong) or pong:
+                continue
+            if message_data.get("type") == "ping":
+                await ws_manager.send_personal(connection_id, {"type": "pong"})
+            
+    except WebSocketDisconnect:
+        ws_manager.disconnect_user(connection_id, user_id)
+    except Exception as e:
+        print(f"User WebSocket error: {e}")
+        await websocket.close()
+        ws_manager.disconnect_user(connection_id, user_id)
 
 @router.websocket("/admin")
 async def websocket_admin(websocket: WebSocket):
     """
     WebSocket endpoint for admin real-time monitoring
+
+    Supports the same codec negotiation as /ws/chat. Events arrive
+    coalesced per topic; send {"type": "subscribe", "topics": [...],
+    "agents": [...]} to narrow the stream and get current snapshots
     """
-    await ws_manager.connect_admin(websocket)
+    connection_id = await ws_manager.connect_admin(websocket)
+    if connection_id is None:
+        return
+    codec = ws_manager.connections[connection_id].codec
+    admin_stream.attach(connection_id)
     
     try:
         while True:
-            # Keep connection alive and receive any admin commands
-            data = await websocket.receive_text()
-            # Admin can send commands if needed
+            # Keep connection alive and receive admin commands
+            command = await ws_codecs.receive(websocket, codec)
+            if command is None:
+                raise WebSocketDisconnect()
+            pong = command.get("type") == "pong"
+            if not ws_manager.receive_allowed(connection_id, pong=pong) or pong:
+                continue
+            await admin_stream.handle_command(connection_id, command)
             
     except WebSocketDisconnect:
-        ws_manager.disconnect_admin(websocket)
+        admin_stream.detach(connection_id)
+        ws_manager.disconnect_admin(connection_id)
     except Exception as e:
         print(f"Admin WebSocket error: {e}")
         await websocket.close()
-        ws_manager.disconnect_admin(websocket)
\ No newline at end of file
+        admin_stream.detach(connection_id)
+        ws_manager.disconnect_admin(connection_id)
\ No newline at end of file
@@ -10,13 +10,135 @@ class Settings:
     # Redis
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379")
     
+    # Conversation state - "memory" (per process) or "redis" (shared across workers)
+    CONVERSATION_STORE_BACKEND: str = os.getenv("CONVERSATION_STORE_BACKEND", "memory")
+    CONVERSATION_IDLE_TTL_SECONDS: float = float(os.getenv("CONVERSATION_IDLE_TTL_SECONDS", "3600"))
+    CONVERSATION_MAX_ENTRIES: int = int(os.getenv("CONVERSATION_MAX_ENTRIES", "10000"))
+    CONVERSATION_MEMORY_CAP_MB: int = int(os.getenv("CONVERSATION_MEMORY_CAP_MB", "256"))
+    CONVERSATION_MAX_TURNS: int = int(os.getenv("CONVERSATION_MAX_TURNS", "20"))
+    
     # Milvus
     MILVUS_HOST: str = os.getenv("MILVUS_HOST", "localhost")
     MILVUS_PORT: int = int(os.getenv("MILVUS_PORT", "19530"))
     
+    # Vector store - "local" (embedded, memory-mapped) or "milvus"
+    VECTOR_STORE_BACKEND: str = os.getenv("VECTOR_STORE_BACKEND", "local")
+    VECTOR_STORE_DIR: str = os.getenv("VECTOR_STORE_DIR", "./data/vectors")
+    # Local backend: collections past this size get an IVF index; lists scanned per query
+    VECTOR_INDEX_THRESHOLD: int = int(os.getenv("VECTOR_INDEX_THRESHOLD", "50000"))
+    VECTOR_IVF_NPROBE: int = int(os.getenv("VECTOR_IVF_NPROBE", "16"))
+    # Default quantization of new collections - "none", "int8" (4x smaller) or "pq" (~32x)
+    VECTOR_QUANTIZATION: str = os.getenv("VECTOR_QUANTIZATION", "none")
+    VECTOR_PQ_SUBVECTORS: int = int(os.getenv("VECTOR_PQ_SUBVECTORS", "0"))  # 0 = dim / 8
+    # Quantized searches re-score this many times top_k candidates in full precision
+    VECTOR_RERANK_FACTOR: int = int(os.getenv("VECTOR_RERANK_FACTOR", "8"))
+    VECTOR_QUANTIZATION_TRAIN_SIZE: int = int(os.getenv("VECTOR_QUANTIZATION_TRAIN_SIZE", "10000"))
+    # Hybrid retrieval - BM25 keyword index next to the vectors, fused by reciprocal rank
+    KEYWORD_INDEX_DIR: str = os.getenv("KEYWORD_INDEX_DIR", "./data/keywords")
+    # Chunk texts and metadata - append-only memory-mapped segments, compacted once this share is deleted
+    CHUNK_STORE_DIR: str = os.getenv("CHUNK_STORE_DIR", "./data/chunks")
+    CHUNK_STORE_COMPACT_RATIO: float = float(os.getenv("CHUNK_STORE_COMPACT_RATIO", "0.3"))
+    CHUNK_STORE_COMPACT_MIN_BYTES: int = int(os.getenv("CHUNK_STORE_COMPACT_MIN_BYTES", str(1024 * 1024)))
+    HYBRID_CANDIDATES: int = int(os.getenv("HYBRID_CANDIDATES", "50"))
+    HYBRID_RRF_K: int = int(os.getenv("HYBRID_RRF_K", "60"))
+    # BM25 hits below this fraction of the best score are dropped before fusion
+    HYBRID_KEYWORD_MIN_SCORE_RATIO: float = float(os.getenv("HYBRID_KEYWORD_MIN_SCORE_RATIO", "0.25"))
+    # Weight of the BM25 ranking when the query contains an identifier (SKU, error code)
+    HYBRID_IDENTIFIER_WEIGHT: float = float(os.getenv("HYBRID_IDENTIFIER_WEIGHT", "2.0"))
+    # Per-agent indexes (local vectors, keywords, chunks) load on first use; least recently used are closed past these
+    KNOWLEDGE_INDEX_MEMORY_BUDGET_MB: int = int(os.getenv("KNOWLEDGE_INDEX_MEMORY_BUDGET_MB", "2048"))
+    KNOWLEDGE_INDEX_MAX_RESIDENT: int = int(os.getenv("KNOWLEDGE_INDEX_MAX_RESIDENT", "1000"))
+    # Load an agent's indexes when a chat connects instead of on its first question
+    KNOWLEDGE_INDEX_PREWARM: bool = os.getenv("KNOWLEDGE_INDEX_PREWARM", "true").lower() == "true"
+    
+    # Knowledge base ingestion - streamed upload, pooled extraction, pipelined chunk/embed/store
+    KNOWLEDGE_UPLOAD_DIR: str = os.getenv("KNOWLEDGE_UPLOAD_DIR", "/tmp/afo_uploads")
+    KNOWLEDGE_UPLOAD_CHUNK_BYTES: int = int(os.getenv("KNOWLEDGE_UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+    KNOWLEDGE_EXTRACT_WORKERS: int = int(os.getenv("KNOWLEDGE_EXTRACT_WORKERS", "2"))
+    KNOWLEDGE_CHUNK_TOKENS: int = int(os.getenv("KNOWLEDGE_CHUNK_TOKENS", "512"))
+    KNOWLEDGE_CHUNK_OVERLAP_TOKENS: int = int(os.getenv("KNOWLEDGE_CHUNK_OVERLAP_TOKENS", "64"))
+    KNOWLEDGE_EMBED_BATCH_SIZE: int = int(os.getenv("KNOWLEDGE_EMBED_BATCH_SIZE", "64"))
+    KNOWLEDGE_PIPELINE_QUEUE_SIZE: int = int(os.getenv("KNOWLEDGE_PIPELINE_QUEUE_SIZE", "4"))
+    # Ingestion jobs - bounded workers, priority, round-robin across tenants
+    KNOWLEDGE_JOB_WORKERS: int = int(os.getenv("KNOWLEDGE_JOB_WORKERS", "2"))
+    KNOWLEDGE_JOB_MAX_QUEUED: int = int(os.getenv("KNOWLEDGE_JOB_MAX_QUEUED", "1000"))
+    KNOWLEDGE_JOB_MAX_RUNNING_PER_TENANT: int = int(os.getenv("KNOWLEDGE_JOB_MAX_RUNNING_PER_TENANT", "1"))
+    KNOWLEDGE_JOB_PROGRESS_INTERVAL_MS: float = float(os.getenv("KNOWLEDGE_JOB_PROGRESS_INTERVAL_MS", "500"))
+    KNOWLEDGE_JOB_HISTORY: int = int(os.getenv("KNOWLEDGE_JOB_HISTORY", "1000"))  # finished jobs kept for lookups
+    # Crawling docs sites (sitemap or seed URL) into a knowledge base; polite per host,
+    # re-crawls send ETag / Last-Modified validators and only re-ingest changed pages
+    KNOWLEDGE_CRAWL_CONCURRENCY: int = int(os.getenv("KNOWLEDGE_CRAWL_CONCURRENCY", "8"))
+    KNOWLEDGE_CRAWL_INGEST_CONCURRENCY: int = int(os.getenv("KNOWLEDGE_CRAWL_INGEST_CONCURRENCY", "2"))
+    KNOWLEDGE_CRAWL_HOST_INTERVAL_MS: float = float(os.getenv("KNOWLEDGE_CRAWL_HOST_INTERVAL_MS", "250"))  # raised by robots Crawl-delay
+    KNOWLEDGE_CRAWL_MAX_PAGES: int = int(os.getenv("KNOWLEDGE_CRAWL_MAX_PAGES", "500"))
+    KNOWLEDGE_CRAWL_MAX_PAGE_BYTES: int = int(os.getenv("KNOWLEDGE_CRAWL_MAX_PAGE_BYTES", str(5 * 1024 * 1024)))
+    KNOWLEDGE_CRAWL_USER_AGENT: str = os.getenv("KNOWLEDGE_CRAWL_USER_AGENT", "AFOBot/1.0")
+    # Crawls only reach public addresses (no loopback/private/link-local, even via redirects)
+    # unless this is set - for crawling local test servers, never in production
+    KNOWLEDGE_CRAWL_ALLOW_PRIVATE_NETWORKS: bool = os.getenv("KNOWLEDGE_CRAWL_ALLOW_PRIVATE_NETWORKS", "false").lower() == "true"
+    # Chunk embeddings cached by (content hash, model) so re-uploads only embed what changed
+    EMBEDDING_CACHE_DIR: str = os.getenv("EMBEDDING_CACHE_DIR", "./data/embedding_cache")
+    
     # OpenAI
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     
+    # LLM routing - "provider:model" routes in preference order, extra
+    # OpenAI-compatible providers as "name=base_url" pairs
+    LLM_ROUTES: str = os.getenv("LLM_ROUTES", "openai:gpt-4,openai:gpt-4o-mini")
+    LLM_PROVIDER_URLS: str = os.getenv("LLM_PROVIDER_URLS", "")
+    LLM_HEDGING_ENABLED: bool = os.getenv("LLM_HEDGING_ENABLED", "true").lower() == "true"
+    LLM_HEDGE_AFTER_MS: float = float(os.getenv("LLM_HEDGE_AFTER_MS", "1500"))
+    LLM_HEDGE_PERCENTILE: float = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+    
+    # Embeddings & moderation - requests are micro-batched across conversations
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+    EMBEDDING_BASE_URL: str = os.getenv("EMBEDDING_BASE_URL", "")
+    EMBEDDING_BATCH_MAX_SIZE: int = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "256"))
+    MODERATION_BATCH_MAX_SIZE: int = int(os.getenv("MODERATION_BATCH_MAX_SIZE", "32"))
+    BATCH_MAX_WAIT_MS: float = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+    CHAT_MODERATION_ENABLED: bool = os.getenv("CHAT_MODERATION_ENABLED", "false").lower() == "true"
+    
+    # RAG - knowledge retrieval for chat and workflows, bounded by a latency budget
+    RAG_ENABLED: bool = os.getenv("RAG_ENABLED", "true").lower() == "true"
+    RAG_TOP_K: int = int(os.getenv("RAG_TOP_K", "5"))
+    RAG_LATENCY_BUDGET_MS: float = float(os.getenv("RAG_LATENCY_BUDGET_MS", "300"))
+    RAG_CONTEXT_MAX_TOKENS: int = int(os.getenv("RAG_CONTEXT_MAX_TOKENS", "1500"))
+    RAG_CACHE_TTL_SECONDS: float = float(os.getenv("RAG_CACHE_TTL_SECONDS", "300"))
+    RAG_CACHE_MAX_ENTRIES_PER_AGENT: int = int(os.getenv("RAG_CACHE_MAX_ENTRIES_PER_AGENT", "256"))
+    # Re-ranking of retrieved chunks - "lexical" or a cross-encoder model name
+    RERANK_ENABLED: bool = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+    RERANK_MODEL: str = os.getenv("RERANK_MODEL", "lexical")
+    RERANK_LEXICAL_WEIGHTS: str = os.getenv("RERANK_LEXICAL_WEIGHTS", "")  # JSON file of feature weights
+    # The re-ranker scores this many times top_k first-stage candidates
+    RERANK_CANDIDATE_FACTOR: int = int(os.getenv("RERANK_CANDIDATE_FACTOR", "4"))
+    RERANK_WORKERS: int = int(os.getenv("RERANK_WORKERS", "2"))
+    RERANK_CACHE_SIZE: int = int(os.getenv("RERANK_CACHE_SIZE", "50000"))
+    
+    # Outbound HTTP - one pooled client per process (see http_client), connections reused across requests
+    HTTP_POOL_MAX_CONNECTIONS: int = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100"))
+    HTTP_POOL_MAX_KEEPALIVE: int = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20"))
+    HTTP_TIMEOUT_SECONDS: float = float(os.getenv("HTTP_TIMEOUT_SECONDS", "30"))
+    
+    # Usage accounting - per-minute rollups, "memory" or "redis"
+    USAGE_STORE_BACKEND: str = os.getenv("USAGE_STORE_BACKEND", "memory")
+    USAGE_FLUSH_INTERVAL_SECONDS: float = float(os.getenv("USAGE_FLUSH_INTERVAL_SECONDS", "10"))
+    USAGE_RETENTION_HOURS: float = float(os.getenv("USAGE_RETENTION_HOURS", "48"))
+    
+    # Intent classification - below this local confidence we fall back to the LLM
+    INTENT_CONFIDENCE_THRESHOLD: float = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.7"))
+    
+    # Qwen 3 Omni generation - one scheduler steps all sessions' text-only requests
+    # as a shared batch (continuous batching) instead of a generate() thread each;
+    # audio/video prompts still go through generate()
+    QWEN_BATCHING_ENABLED: bool = os.getenv("QWEN_BATCHING_ENABLED", "true").lower() == "true"
+    QWEN_MAX_BATCH_SIZE: int = int(os.getenv("QWEN_MAX_BATCH_SIZE", "8"))
+    QWEN_MAX_NEW_TOKENS: int = int(os.getenv("QWEN_MAX_NEW_TOKENS", "1024"))
+    # KV state of agents' system prompts and sessions' last prompts, reused by the next turn
+    QWEN_PREFIX_CACHE_ENABLED: bool = os.getenv("QWEN_PREFIX_CACHE_ENABLED", "true").lower() == "true"
+    QWEN_PREFIX_CACHE_MB: int = int(os.getenv("QWEN_PREFIX_CACHE_MB", "2048"))
+    # Worker threads for blocking model calls (generate() without batching, audio); more wait their turn
+    QWEN_GENERATION_WORKERS: int = int(os.getenv("QWEN_GENERATION_WORKERS", "2"))
+    
     # Service
     HOST: str = os.getenv("HOST", "0.0.0.0")
     PORT: int = int(os.getenv("PORT", "8001"))
@@ -31,10 +153,32 @@ class Settings:
     
     # WebSocket
     WS_MAX_CONNECTIONS: int = int(os.getenv("WS_MAX_CONNECTIONS", "1000"))
+    WS_MAX_CONNECTIONS_PER_AGENT: int = int(os.getenv("WS_MAX_CONNECTIONS_PER_AGENT", "500"))
+    WS_SEND_QUEUE_SIZE: int = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+    WS_SEND_TIMEOUT_SECONDS: float = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "10"))
+    # "drop" disconnects clients that fall behind, "sample" keeps only their newest messages
+    WS_SLOW_CONSUMER_POLICY: str = os.getenv("WS_SLOW_CONSUMER_POLICY", "drop")
+    # Cross-worker broadcast relay: "memory" (single process) or "redis"
+    WS_BACKPLANE: str = os.getenv("WS_BACKPLANE", "memory")
+    WS_BACKPLANE_FLUSH_MS: float = float(os.getenv("WS_BACKPLANE_FLUSH_MS", "2"))
+    # Transport-level compression for clients that offer it (compresses per socket;
+    # the *.deflate codecs compress once per broadcast instead)
+    WS_PER_MESSAGE_DEFLATE: bool = os.getenv("WS_PER_MESSAGE_DEFLATE", "true").lower() == "true"
+    # Heartbeats/idle reaping and per-connection inbound rate limits
+    WS_HEARTBEAT_INTERVAL_SECONDS: float = float(os.getenv("WS_HEARTBEAT_INTERVAL_SECONDS", "20"))
+    WS_IDLE_TIMEOUT_SECONDS: float = float(os.getenv("WS_IDLE_TIMEOUT_SECONDS", "60"))
+    WS_INBOUND_RATE_PER_SECOND: float = float(os.getenv("WS_INBOUND_RATE_PER_SECOND", "2"))
+    WS_INBOUND_BURST: int = int(os.getenv("WS_INBOUND_BURST", "10"))
+    WS_MAX_RATE_VIOLATIONS: int = int(os.getenv("WS_MAX_RATE_VIOLATIONS", "20"))
+    # Admin dashboard stream: events are coalesced per topic into windows
+    ADMIN_STREAM_WINDOW_MS: float = float(os.getenv("ADMIN_STREAM_WINDOW_MS", "250"))
+    ADMIN_STREAM_MAX_EVENTS_PER_WINDOW: int = int(os.getenv("ADMIN_STREAM_MAX_EVENTS_PER_WINDOW", "100"))
+    ADMIN_STREAM_RECENT_EVENTS: int = int(os.getenv("ADMIN_STREAM_RECENT_EVENTS", "50"))
     
-    # Monitoring
+    # Monitoring - Prometheus metrics on the app's own /metrics. With several
+    # workers set PROMETHEUS_MULTIPROC_DIR to an empty directory (cleared on
+    # each deploy) so /metrics aggregates all of them
     ENABLE_METRICS: bool = os.getenv("ENABLE_METRICS", "true").lower() == "true"
-    METRICS_PORT: int = int(os.getenv("METRICS_PORT", "9090"))
     
     def __post_init__(self):
         if self.ALLOWED_ORIGINS is None:
@@ -2,6 +2,21 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional, Dict
 from datetime import datetime, timedelta
 import asyncio
+from app.services.model_router import model_router
+from app.services.embedding_service import embedding_service
+from app.services.conversation_store import conversation_store
+from app.services.usage_accounting import usage_accounting
+from app.services.websocket_manager import ws_manager
+from app.services.admin_stream import admin_stream
+from app.services.vector_store import vector_store
+from app.services.keyword_index import keyword_store
+from app.services.chunk_store import chunk_store
+from app.services.collection_manager import collection_manager
+from app.services.job_queue import ingestion_queue
+from app.services.crawler import web_crawler
+from app.services.embedding_cache import embedding_cache
+from app.services.rag_service import rag_service
+from app.services.reranker import reranker
 
 class AdminService:
     def __init__(self, db: AsyncSession):
@@ -94,17 +109,34 @@ class AdminService:
             "redisStatus": "healthy",
             "dbStatus": "healthy",
             "avgResponseTime": 0.5,
-            "activeConnections": 0,
+            "activeConnections": len(ws_manager.connections),
+            "reapedConnections": sum(ws_manager.reaped.values()),
             "queuedJobs": 0,
             "cpuUsage": 25.0,
             "memoryUsage": 45.0,
             "diskUsage": 30.0,
-            "milvusStorage": 1024 * 1024 * 100  # 100MB
+            "milvusStorage": 1024 * 1024 * 100,  # 100MB
+            "llmRouting": model_router.get_stats(),
+            "batching": embedding_service.get_stats(),
+            "conversationStore": conversation_store.get_stats(),
+            "websockets": ws_manager.get_stats(),
+            "adminStream": admin_stream.get_stats(),
+            "vectorStore": vector_store.get_stats(),
+            "keywordIndex": keyword_store.get_stats(),
+            "chunkStore": chunk_store.get_stats(),
+            "knowledgeIndexes": collection_manager.get_stats(),
+            "ingestionJobs": ingestion_queue.get_stats(),
+            "crawler": web_crawler.get_stats(),
+            "embeddingCache": embedding_cache.get_stats(),
+            "rag": rag_service.get_stats(),
+            "rerank": reranker.get_stats()
         }
     
     async def get_platform_analytics(self, days: int = 30) -> dict:
         """Get platform analytics for specified period"""
         # TODO: Query PlatformStats table for the period
+        # LLM cost comes from usage rollups (bounded by their retention window)
+        llm_cost = (await usage_accounting.get_summary(days * 24 * 60))["totals"]["cost"]
         return {
             "period": f"last_{days}_days",
             "users": {
@@ -130,11 +162,22 @@ class AdminService:
             },
             "financial": {
                 "revenue": 0.0,
-                "llmCost": 0.0,
-                "profit": 0.0
+                "llmCost": round(llm_cost, 4),
+                "profit": round(-llm_cost, 4)
             }
         }
     
+    async def get_usage(
+        self,
+        minutes: int = 60,
+        group_by: str = "model",
+        tenant_id: Optional[str] = None
+    ) -> dict:
+        """Token/cost usage from the per-minute rollups (billing & dashboard)"""
+        summary = await usage_accounting.get_summary(minutes, group_by=group_by, tenant_id=tenant_id)
+        summary["rollups"] = await usage_accounting.get_rollups(minutes, tenant_id=tenant_id)
+        return summary
+    
     async def get_audit_logs(
         self,
         user_id: Optional[str] = None,
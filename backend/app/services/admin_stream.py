@@ -0,0 +1,260 @@
+"""
+Admin Event Stream for AFO Platform
+Coalesces system events per topic into short windows and pushes one
+frame per topic per window to the admin sockets subscribed to it
+
+Two kinds of publishes:
+- keyed (publish(topic, data, key=...)): state such as per-agent metrics;
+  only the latest value per key survives a window and subscribers get
+  deltas of the keys that changed. Publishing None removes the key
+  (it shows up as null in the next delta)
+- unkeyed: discrete events such as anomalies; a window's events go out
+  together, keeping the newest ones when a window overflows
+
+Admins subscribe per topic and optionally per agent by sending
+{"type": "subscribe", "topics": [...], "agents": [...]}. A new subscriber
+gets the cached last-known snapshot instead of triggering a recompute.
+"""
+
+from collections import deque
+from typing import Any, Dict, FrozenSet, List, Optional, Set
+from app.core.config import settings
+from app.services.websocket_manager import WebSocketManager, ws_manager
+from app.services.ws_codecs import EncodedMessage
+import asyncio
+import json
+import time
+
+# Backplane channel relaying raw publishes between processes
+STREAM_CHANNEL = "admin-stream"
+# Subscription to every topic (what an admin gets until it subscribes explicitly)
+ALL_TOPICS = "*"
+
+
+class _Topic:
+    __slots__ = ("state", "recent", "changed", "events", "dropped", "snapshots")
+
+    def __init__(self, recent_size: int, window_size: int):
+        # key -> (agent_id, data), last-known state
+        self.state: Dict[str, tuple] = {}
+        # (agent_id, data) of the latest discrete events
+        self.recent: deque = deque(maxlen=recent_size)
+        # Pending for the current window
+        self.changed: Set[str] = set()
+        # Newest events win when a window overflows
+        self.events: deque = deque(maxlen=window_size)
+        self.dropped = 0
+        # agent filter -> encoded snapshot of the current state
+        self.snapshots: Dict[Optional[FrozenSet[str]], EncodedMessage] = {}
+
+
+class AdminStream:
+    """
+    Windowed, per-topic admin event fan-out
+
+    Frames look like {"event": topic, "type": "delta" | "events" | "snapshot",
+    "data": ..., "timestamp": ...}. For "events" frames data is the latest
+    event (so single-event handlers keep working) and "events" holds the
+    whole window.
+    """
+
+    def __init__(
+        self,
+        manager: WebSocketManager,
+        window_ms: float = 250,
+        max_events_per_window: int = 100,
+        recent_events: int = 50
+    ):
+        self.manager = manager
+        self.window = window_ms / 1000
+        self.max_events_per_window = max_events_per_window
+        self.recent_events = recent_events
+        self.topics: Dict[str, _Topic] = {}
+        # connection_id -> {topic: agent filter or None}
+        self.subscriptions: Dict[str, Dict[str, Optional[FrozenSet[str]]]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.published = 0
+        self.frames_sent = 0
+        self.windows = 0
+        manager.channel_handlers[STREAM_CHANNEL] = self._on_remote
+        # emit_system_event goes through the windows instead of straight to every socket
+        manager.event_sink = self.publish
+
+    def _topic(self, name: str) -> _Topic:
+        topic = self.topics.get(name)
+        if topic is None:
+            topic = self.topics[name] = _Topic(self.recent_events, self.max_events_per_window)
+        return topic
+
+    # Publishing
+
+    def publish(self, topic: str, data: Any, key: Optional[str] = None, agent_id: Optional[str] = None):
+        """Queue an event (unkeyed) or a state update (keyed) for the next window"""
+        self._ingest(topic, data, key, agent_id)
+        self.manager.backplane.publish(STREAM_CHANNEL, json.dumps([topic, data, key, agent_id]))
+
+    async def _on_remote(self, payloads: List[str]):
+        for payload in payloads:
+            self._ingest(*json.loads(payload))
+
+    def _ingest(self, name: str, data: Any, key: Optional[str], agent_id: Optional[str]):
+        self.published += 1
+        topic = self._topic(name)
+        if key is not None:
+            topic.state[key] = (agent_id, data)
+        else:
+            topic.recent.append((agent_id, data))
+        topic.snapshots.clear()
+
+        # Nobody to push to: the snapshot above is all that needs updating
+        if not self.subscriptions:
+            if key is not None and data is None:
+                del topic.state[key]
+                # Pending from before the last subscriber left; nothing left to announce
+                topic.changed.discard(key)
+            return
+        if key is not None:
+            topic.changed.add(key)
+        else:
+            if len(topic.events) == self.max_events_per_window:
+                topic.dropped += 1
+            topic.events.append((agent_id, data))
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+
+    # Subscriptions
+
+    def attach(self, connection_id: str):
+        """Register an admin socket; it receives every topic until it subscribes"""
+        if not self.subscriptions:
+            self.manager.backplane.subscribe(STREAM_CHANNEL)
+        self.subscriptions[connection_id] = {ALL_TOPICS: None}
+
+    def detach(self, connection_id: str):
+        if self.subscriptions.pop(connection_id, None) is not None and not self.subscriptions:
+            self.manager.backplane.unsubscribe(STREAM_CHANNEL)
+
+    def subscribe(self, connection_id: str, topics: List[str], agents: Optional[List[str]] = None):
+        """Subscribe to topics (optionally only events of some agents) and send their snapshots"""
+        current = self.subscriptions.get(connection_id)
+        if current is None:
+            return
+        # The first explicit subscription replaces the implicit "everything"
+        current.pop(ALL_TOPICS, None)
+        agent_filter = frozenset(agents) if agents else None
+        for name in topics:
+            current[name] = agent_filter
+            if name != ALL_TOPICS and name in self.topics:
+                self.manager.send_encoded(connection_id, self._snapshot(name, agent_filter))
+
+    def unsubscribe(self, connection_id: str, topics: List[str]):
+        current = self.subscriptions.get(connection_id)
+        if current is not None:
+            for name in topics:
+                current.pop(name, None)
+
+    async def handle_command(self, connection_id: str, command: dict):
+        """Apply a subscribe/unsubscribe command sent by an admin client"""
+        topics = command.get("topics") or []
+        if command.get("type") == "subscribe":
+            self.subscribe(connection_id, topics, command.get("agents"))
+        elif command.get("type") == "unsubscribe":
+            self.unsubscribe(connection_id, topics)
+
+    # Fan-out
+
+    @staticmethod
+    def _visible(agent_id: Optional[str], agent_filter: Optional[FrozenSet[str]]) -> bool:
+        return agent_filter is None or agent_id is None or agent_id in agent_filter
+
+    @staticmethod
+    def _frame(name: str, frame_type: str, data: Any, **extra) -> EncodedMessage:
+        message = {"event": name, "type": frame_type, "data": data, "timestamp": time.time()}
+        message.update(extra)
+        return EncodedMessage(message)
+
+    def _snapshot(self, name: str, agent_filter: Optional[FrozenSet[str]]) -> EncodedMessage:
+        """Last-known state of a topic, encoded once per change and agent filter"""
+        topic = self.topics[name]
+        snapshot = topic.snapshots.get(agent_filter)
+        if snapshot is None:
+            recent = [data for agent_id, data in topic.recent if self._visible(agent_id, agent_filter)]
+            if topic.state:
+                data = {
+                    key: value for key, (agent_id, value) in topic.state.items()
+                    if value is not None and self._visible(agent_id, agent_filter)
+                }
+            else:
+                data = recent[-1] if recent else None
+            snapshot = topic.snapshots[agent_filter] = self._frame(name, "snapshot", data, events=recent)
+        return snapshot
+
+    def _window_frame(self, name: str, topic: _Topic, agent_filter: Optional[FrozenSet[str]]) -> Optional[EncodedMessage]:
+        delta = {
+            key: topic.state[key][1] for key in topic.changed
+            if self._visible(topic.state[key][0], agent_filter)
+        }
+        events = [data for agent_id, data in topic.events if self._visible(agent_id, agent_filter)]
+        if not delta and not events:
+            return None
+        if not events:
+            return self._frame(name, "delta", delta)
+        extra = {"events": events}
+        if delta:
+            extra["state"] = delta
+        if topic.dropped:
+            extra["dropped"] = topic.dropped
+        return self._frame(name, "events", events[-1], **extra)
+
+    def _flush(self):
+        self._timer = None
+        self.windows += 1
+        pending = [(name, topic) for name, topic in self.topics.items() if topic.changed or topic.events]
+
+        for name, topic in pending:
+            # One encoded frame per distinct agent filter, shared by its subscribers
+            frames: Dict[Optional[FrozenSet[str]], Optional[EncodedMessage]] = {}
+            for connection_id, subscribed in list(self.subscriptions.items()):
+                if name in subscribed:
+                    agent_filter = subscribed[name]
+                elif ALL_TOPICS in subscribed:
+                    agent_filter = subscribed[ALL_TOPICS]
+                else:
+                    continue
+                if agent_filter not in frames:
+                    frames[agent_filter] = self._window_frame(name, topic, agent_filter)
+                frame = frames[agent_filter]
+                if frame is None:
+                    continue
+                if self.manager.send_encoded(connection_id, frame):
+                    self.frames_sent += 1
+                else:
+                    # Dropped by the manager (slow consumer, send failure)
+                    self.detach(connection_id)
+
+            # Removed keys have been announced
+            for key in topic.changed:
+                if key in topic.state and topic.state[key][1] is None:
+                    del topic.state[key]
+            topic.changed.clear()
+            topic.events.clear()
+            topic.dropped = 0
+
+    def get_stats(self) -> dict:
+        return {
+            "subscribers": len(self.subscriptions),
+            "topics": len(self.topics),
+            "window_ms": self.window * 1000,
+            "published": self.published,
+            "windows": self.windows,
+            "frames_sent": self.frames_sent
+        }
+
+
+# Global admin stream instance
+admin_stream = AdminStream(
+    ws_manager,
+    window_ms=settings.ADMIN_STREAM_WINDOW_MS,
+    max_events_per_window=settings.ADMIN_STREAM_MAX_EVENTS_PER_WINDOW,
+    recent_events=settings.ADMIN_STREAM_RECENT_EVENTS
+)
@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 from collections import deque
 import statistics
 from app.services.websocket_manager import ws_manager
+from app.services.usage_accounting import usage_accounting
 
 class AnomalyDetector:
     def __init__(self):
@@ -107,14 +108,18 @@ class AnomalyDetector:
     
     async def _collect_metrics(self) -> Dict:
         """Collect current system metrics"""
-        # TODO: Collect real metrics from database
-        # For now, returning mock data
+        # LLM cost and latency come from the usage rollups
+        # TODO: Collect remaining metrics from database
+        usage = await usage_accounting.get_summary(60, group_by="kind")
+        llm_usage = usage["kind"].get("llm", {})
+        llm_calls = llm_usage.get("calls", 0)
         return {
             "timestamp": datetime.utcnow(),
             "error_rate": 0.01,  # 1%
-            "avg_response_time": 0.5,  # 0.5s
+            "avg_response_time": (llm_usage["latency_ms"] / llm_calls / 1000) if llm_calls else 0.0,
             "conversations_per_minute": 10,
-            "llm_cost_per_hour": 2.5,
+            # LLM spend only; TTS/STT/embedding costs are in the totals too
+            "llm_cost_per_hour": llm_usage.get("cost", 0.0),
             "failed_integrations": 0,
             "active_agents": 5,
             "active_conversations": 15
@@ -125,7 +130,7 @@ class AnomalyDetector:
         # TODO: Save anomaly to database
         
         # Broadcast to admin dashboard
-        await ws_manager.broadcast_to_admins(
+        await ws_manager.emit_system_event(
             "anomaly.detected",
             {
                 "id": f"anomaly_{datetime.utcnow().timestamp()}",
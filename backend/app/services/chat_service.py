@@ -1,14 +1,19 @@
-from openai import AsyncOpenAI
 from app.core.config import settings
-from app.services.knowledge_service import KnowledgeService
-from typing import Optional, Dict
+from app.services.model_router import model_router
+from app.services.embedding_service import embedding_service
+from app.services.conversation_store import conversation_store
+from app.services.rag_service import rag_service
+from app.services.intent_classifier import intent_classifier, INTENTS
+from typing import Optional
+import asyncio
+import json
 import uuid
 from datetime import datetime
 
 class ChatService:
     def __init__(self):
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-        self.conversation_history: Dict[str, list] = {}
+        # History lives in the shared store so any worker can continue a conversation
+        self.store = conversation_store
     
     async def process_message(
         self,
@@ -23,23 +28,42 @@ class ChatService:
         # Create new conversation if needed
         if not conversation_id:
             conversation_id = str(uuid.uuid4())
-            self.conversation_history[conversation_id] = []
+        history_key = f"chat:{conversation_id}"
+        
+        # Moderation check (batched with all concurrent conversations)
+        if settings.CHAT_MODERATION_ENABLED:
+            try:
+                moderation = await embedding_service.moderate(message)
+                if moderation["flagged"]:
+                    return {
+                        "conversation_id": conversation_id,
+                        "error": "Message flagged by moderation",
+                        "message": "I'm sorry, but I can't help with that request.",
+                        "moderation": moderation
+                    }
+            except Exception as e:
+                print(f"Moderation check failed: {e}")
         
         # Get agent configuration
         # TODO: Fetch from database
         agent_config = {
             "systemPrompt": "You are a helpful AI assistant for lead qualification and meeting scheduling.",
-            "model": "gpt-4",
+            # None lets the router pick from live stats; set to pin the agent to a model
+            "model": None,
             "temperature": 0.7
         }
         
-        # Get relevant context from knowledge base
-        context = ""
-        # TODO: Query knowledge base with RAG
-        
-        # Build conversation history
-        if conversation_id not in self.conversation_history:
-            self.conversation_history[conversation_id] = []
+        # Knowledge retrieval (bounded by the RAG latency budget) runs alongside
+        # history loading (only the recent turns are decoded)
+        if settings.RAG_ENABLED:
+            rag, history = await asyncio.gather(
+                rag_service.get_context(agent_id, message),
+                self.store.get_history(history_key, limit=settings.CONVERSATION_MAX_TURNS)
+            )
+        else:
+            rag = None
+            history = await self.store.get_history(history_key, limit=settings.CONVERSATION_MAX_TURNS)
+        context = rag["context"] if rag else ""
         
         messages = [
             {"role": "system", "content": agent_config["systemPrompt"]}
@@ -52,43 +76,52 @@ class ChatService:
             })
         
         # Add conversation history
-        messages.extend(self.conversation_history[conversation_id])
+        messages.extend(history)
         
         # Add current user message
         messages.append({"role": "user", "content": message})
         
         try:
-            # Call OpenAI API
-            response = await self.client.chat.completions.create(
-                model=agent_config["model"],
-                messages=messages,
+            # Call the LLM through the router (hedging + fallback)
+            response = await model_router.chat_completion(
+                messages,
+                agent_id=agent_id,
+                model=agent_config.get("model"),
+                tenant_id=(user_info or {}).get("user_id"),
                 temperature=agent_config["temperature"],
                 max_tokens=500
             )
             
-            assistant_message = response.choices[0].message.content
+            assistant_message = response["content"]
             
-            # Update conversation history
-            self.conversation_history[conversation_id].append(
-                {"role": "user", "content": message}
-            )
-            self.conversation_history[conversation_id].append(
-                {"role": "assistant", "content": assistant_message}
+            # Update conversation history (store keeps the last N turns)
+            await self.store.append(
+                history_key,
+                [
+                    {"role": "user", "content": message},
+                    {"role": "assistant", "content": assistant_message}
+                ],
+                max_turns=settings.CONVERSATION_MAX_TURNS
             )
             
-            # Limit history to last 20 messages
-            if len(self.conversation_history[conversation_id]) > 20:
-                self.conversation_history[conversation_id] = \
-                    self.conversation_history[conversation_id][-20:]
-            
             # TODO: Save messages to database
             
-            return {
+            result = {
                 "conversation_id": conversation_id,
                 "message": assistant_message,
                 "timestamp": datetime.utcnow().isoformat(),
-                "tokens_used": response.usage.total_tokens if response.usage else 0
+                "tokens_used": response["total_tokens"],
+                "model": response["model"]
             }
+            if rag:
+                result["rag"] = {
+                    "chunks": len(rag["results"]),
+                    "context_tokens": rag["tokens"],
+                    "latency_ms": rag["latency_ms"],
+                    "cached": rag["cached"],
+                    "timed_out": rag["timed_out"]
+                }
+            return result
             
         except Exception as e:
             print(f"Error processing message: {e}")
@@ -101,26 +134,71 @@ class ChatService:
     async def analyze_intent(self, message: str) -> dict:
         """
         Analyze user intent from message
+
+        The local classifier answers confident cases in well under a
+        millisecond; only low-confidence messages go to the LLM
         """
+        local = intent_classifier.classify(message)
+        if local["confident"]:
+            return {
+                "intent": local["intent"],
+                "entities": local["entities"],
+                "confidence": local["confidence"],
+                "source": "local"
+            }
+        
         try:
-            response = await self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Analyze the user's intent. Classify as: information_request, meeting_scheduling, support, or other. Also extract any entities like name, email, company."
-                    },
-                    {"role": "user", "content": message}
-                ],
-                temperature=0.3
-            )
-            
-            # TODO: Parse response and return structured intent
+            llm_result = await self._analyze_intent_llm(message)
+            # Regex entities are exact matches, keep them over LLM guesses
+            entities = {**llm_result.get("entities", {}), **local["entities"]}
             return {
-                "intent": "information_request",
-                "entities": {}
+                "intent": llm_result["intent"],
+                "entities": entities,
+                "confidence": llm_result.get("confidence", local["confidence"]),
+                "source": "llm"
             }
             
         except Exception as e:
             print(f"Error analyzing intent: {e}")
-            return {"intent": "other", "entities": {}}
\ No newline at end of file
+            return {
+                "intent": local["intent"],
+                "entities": local["entities"],
+                "confidence": local["confidence"],
+                "source": "local"
+            }
+    
+    async def _analyze_intent_llm(self, message: str) -> dict:
+        """Classify with the LLM using a structured JSON response"""
+        response = await model_router.chat_completion(
+            [
+                {
+                    "role": "system",
+                    "content": (
+                        "Analyze the user's intent. Respond with a JSON object of the form "
+                        '{"intent": one of ' + json.dumps(INTENTS) + ', '
+                        '"confidence": number between 0 and 1, '
+                        '"entities": {"name": string, "email": string, "phone": string, "company": string}}. '
+                        "Omit entities that are not present in the message."
+                    )
+                },
+                {"role": "user", "content": message}
+            ],
+            model="gpt-4o-mini",
+            temperature=0,
+            response_format={"type": "json_object"}
+        )
+        
+        parsed = json.loads(response["content"] or "{}")
+        intent = parsed.get("intent")
+        if intent not in INTENTS:
+            intent = "other"
+        entities = {
+            key: str(value)
+            for key, value in (parsed.get("entities") or {}).items()
+            if key in ("name", "email", "phone", "company") and value
+        }
+        return {
+            "intent": intent,
+            "entities": entities,
+            "confidence": float(parsed.get("confidence", 0.0) or 0.0)
+        }
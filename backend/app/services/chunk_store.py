@@ -0,0 +1,350 @@
+"""
+Chunk Store for AFO Platform
+Texts and metadata of knowledge base chunks, in one append-only segment
+file per collection that is read through a memory map
+
+Retrieving the passages of a query's top hits is an in-memory index
+lookup and a slice of the mapped segment: no database round trip, no
+reading or parsing of records that weren't asked for, and the text is
+decoded straight out of the page cache. Deletes only append to the
+index; once dead records make up compact_ratio of a segment, compact()
+copies the live ones into a new generation and the old files are
+removed. Reads are never blocked by writes or compaction.
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.services.collection_manager import CollectionManager, collection_manager
+import asyncio
+import mmap
+import msgpack
+import os
+import struct
+import threading
+import time
+
+_LENGTH = struct.Struct("<I")
+# Python objects per indexed chunk (id string, tuple, dict entry), for memory estimates
+_ENTRY_BYTES = 200
+
+
+class _Generation:
+    """A segment file, its mapping and its index; replaced wholesale by compaction"""
+
+    def __init__(self, number: int):
+        self.number = number
+        # id -> (offset, text length, metadata length)
+        self.index: Dict[str, Tuple[int, int, int]] = {}
+        self.map: Optional[mmap.mmap] = None
+        self.size = 0
+        self.live_bytes = 0
+
+
+class ChunkSegment:
+    """
+    The chunks of one collection
+
+    CURRENT          generation in use, replaced atomically by compaction
+    chunks.<n>.seg   records back to back: UTF-8 text, then msgpack metadata
+    chunks.<n>.idx   length-prefixed msgpack [id, offset, text length,
+                     metadata length]; offset -1 is a delete of id
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        # Writers (add, delete, compact) take the lock; readers use whatever generation is current
+        self._lock = threading.Lock()
+        self._compacting = False
+        self.compactions = 0
+        self._gen = self._load(self._current())
+        self._open(self._gen)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _current(self) -> int:
+        try:
+            with open(self._file("CURRENT")) as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    # Persistence
+
+    def _load(self, number: int) -> _Generation:
+        gen = _Generation(number)
+        segment_path = self._file(f"chunks.{number}.seg")
+        gen.size = os.path.getsize(segment_path) if os.path.exists(segment_path) else 0
+        index_path = self._file(f"chunks.{number}.idx")
+        if not os.path.exists(index_path):
+            return gen
+        position = 0
+        with open(index_path, "rb") as f:
+            while True:
+                header = f.read(_LENGTH.size)
+                if len(header) < _LENGTH.size:
+                    break
+                (length,) = _LENGTH.unpack(header)
+                body = f.read(length)
+                if len(body) < length:
+                    break  # torn write at the tail
+                id_, offset, text_length, meta_length = msgpack.unpackb(body)
+                previous = gen.index.pop(id_, None)
+                if previous is not None:
+                    gen.live_bytes -= previous[1] + previous[2]
+                if offset >= 0 and offset + text_length + meta_length <= gen.size:
+                    gen.index[id_] = (offset, text_length, meta_length)
+                    gen.live_bytes += text_length + meta_length
+                position += _LENGTH.size + length
+        if position < os.path.getsize(index_path):
+            # Drop a torn tail so new entries append after the last good one
+            with open(index_path, "r+b") as f:
+                f.truncate(position)
+        return gen
+
+    def _open(self, gen: _Generation):
+        self._segment = open(self._file(f"chunks.{gen.number}.seg"), "ab")
+        self._index_log = open(self._file(f"chunks.{gen.number}.idx"), "ab")
+        self._remap(gen)
+
+    def _remap(self, gen: _Generation):
+        # Readers holding the old mapping keep using it; it covers a prefix of the file
+        if gen.size:
+            with open(self._file(f"chunks.{gen.number}.seg"), "rb") as f:
+                gen.map = mmap.mmap(f.fileno(), gen.size, access=mmap.ACCESS_READ)
+
+    def _append_index(self, id_: str, offset: int, text_length: int, meta_length: int):
+        body = msgpack.packb([id_, offset, text_length, meta_length])
+        self._index_log.write(_LENGTH.pack(len(body)) + body)
+
+    # Writes
+
+    def add(self, ids: List[str], texts: List[str], metadata: List[dict]):
+        """Store (or replace) chunks by id"""
+        records = [(text.encode("utf-8"), msgpack.packb(meta)) for text, meta in zip(texts, metadata)]
+        with self._lock:
+            gen = self._gen
+            offset = gen.size
+            # Segment first: a crash before the index write leaves unreferenced bytes, never dangling entries
+            self._segment.write(b"".join(text + meta for text, meta in records))
+            self._segment.flush()
+            entries = []
+            for id_, (text, meta) in zip(ids, records):
+                entries.append((id_, (offset, len(text), len(meta))))
+                self._append_index(id_, offset, len(text), len(meta))
+                offset += len(text) + len(meta)
+            self._index_log.flush()
+            gen.size = offset
+            # Map the new bytes before the index points readers at them
+            self._remap(gen)
+            for id_, entry in entries:
+                previous = gen.index.get(id_)
+                if previous is not None:
+                    gen.live_bytes -= previous[1] + previous[2]
+                gen.index[id_] = entry
+                gen.live_bytes += entry[1] + entry[2]
+
+    def delete(self, ids: List[str]) -> int:
+        deleted = 0
+        with self._lock:
+            gen = self._gen
+            for id_ in ids:
+                entry = gen.index.pop(id_, None)
+                if entry is None:
+                    continue
+                gen.live_bytes -= entry[1] + entry[2]
+                self._append_index(id_, -1, 0, 0)
+                deleted += 1
+            self._index_log.flush()
+        return deleted
+
+    def dead_bytes(self) -> int:
+        gen = self._gen
+        return gen.size - gen.live_bytes
+
+    def dead_ratio(self) -> float:
+        gen = self._gen
+        return 1 - gen.live_bytes / gen.size if gen.size else 0.0
+
+    def compact(self) -> dict:
+        """Copy the live chunks into the next generation; returns the bytes reclaimed"""
+        with self._lock:
+            old = self._gen
+            if old.size == old.live_bytes:
+                return {"reclaimed_bytes": 0, "chunks": len(old.index)}
+            self._compacting = True
+            try:
+                new = _Generation(old.number + 1)
+                entries = sorted(old.index.items(), key=lambda item: item[1][0])
+                view = memoryview(old.map) if old.map is not None else None
+                with open(self._file(f"chunks.{new.number}.seg"), "wb") as segment, \
+                        open(self._file(f"chunks.{new.number}.idx"), "wb") as index_log:
+                    for id_, (offset, text_length, meta_length) in entries:
+                        length = text_length + meta_length
+                        segment.write(view[offset:offset + length])
+                        body = msgpack.packb([id_, new.size, text_length, meta_length])
+                        index_log.write(_LENGTH.pack(len(body)) + body)
+                        new.index[id_] = (new.size, text_length, meta_length)
+                        new.size += length
+                    for f in (segment, index_log):
+                        f.flush()
+                        os.fsync(f.fileno())
+                if view is not None:
+                    view.release()
+                new.live_bytes = new.size
+                current = self._file("CURRENT.tmp")
+                with open(current, "w") as f:
+                    f.write(str(new.number))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(current, self._file("CURRENT"))
+
+                self._segment.close()
+                self._index_log.close()
+                self._open(new)
+                # Readers that picked up the old generation still hold its mapping
+                self._gen = new
+                for name in (f"chunks.{old.number}.seg", f"chunks.{old.number}.idx"):
+                    os.remove(self._file(name))
+                self.compactions += 1
+                return {"reclaimed_bytes": old.size - new.size, "chunks": len(new.index)}
+            finally:
+                self._compacting = False
+
+    # Reads
+
+    def get(self, ids: List[str]) -> Dict[str, dict]:
+        """{id: {"text", **metadata}} of the ids that exist"""
+        gen = self._gen
+        found = [(id_, gen.index.get(id_)) for id_ in ids]
+        # Read after the lookups: anything they found is mapped by now
+        mapped = gen.map
+        if mapped is None:
+            return {}
+        chunks = {}
+        with memoryview(mapped) as view:
+            for id_, entry in found:
+                if entry is None:
+                    continue
+                offset, text_length, meta_length = entry
+                end = offset + text_length
+                with view[offset:end] as text, view[end:end + meta_length] as meta:
+                    chunks[id_] = {**msgpack.unpackb(meta), "text": str(text, "utf-8")}
+        return chunks
+
+    def live_count(self) -> int:
+        return len(self._gen.index)
+
+    # Residency (see CollectionManager)
+
+    def memory_bytes(self) -> int:
+        """The in-memory index; segment pages are page cache the kernel can drop"""
+        return len(self._gen.index) * _ENTRY_BYTES
+
+    def evictable(self) -> bool:
+        return not self._compacting
+
+    def close(self):
+        with self._lock:
+            self._segment.close()
+            self._index_log.close()
+            # Unmapped once the last reader lets go of it
+            self._gen.map = None
+
+    def get_stats(self) -> dict:
+        gen = self._gen
+        return {
+            "chunks": len(gen.index),
+            "segment_bytes": gen.size,
+            "dead_ratio": round(self.dead_ratio(), 3),
+            "generation": gen.number,
+            "compactions": self.compactions
+        }
+
+
+class ChunkStore:
+    """
+    One ChunkSegment directory per vector store collection
+
+    Segments are opened on first use and closed again when the manager
+    needs room for others (a private one unless a shared one is passed).
+    """
+
+    def __init__(
+        self,
+        data_dir: str,
+        compact_ratio: float = 0.3,
+        compact_min_bytes: int = 1024 * 1024,
+        manager: Optional[CollectionManager] = None
+    ):
+        self.data_dir = data_dir
+        self.compact_ratio = compact_ratio
+        self.compact_min_bytes = compact_min_bytes
+        self.manager = manager or CollectionManager()
+        self.stats = {"compactions": 0, "reclaimed_bytes": 0}
+
+    def _opener(self, collection: str):
+        def open_segment(create: bool) -> Optional[ChunkSegment]:
+            path = os.path.join(self.data_dir, collection)
+            if not create and not os.path.isdir(path):
+                return None
+            return ChunkSegment(path)
+
+        return open_segment
+
+    async def _run(self, collection: str, operation, default, create: bool = False):
+        def run():
+            with self.manager.use(("chunks", collection), self._opener(collection), create) as segment:
+                return default if segment is None else operation(segment)
+
+        return await asyncio.to_thread(run)
+
+    async def add(self, collection: str, ids: List[str], texts: List[str], metadata: List[dict]):
+        await self._run(collection, lambda segment: segment.add(ids, texts, metadata), None, create=True)
+
+    async def get(self, collection: str, ids: List[str]) -> Dict[str, dict]:
+        if not ids:
+            return {}
+        return await self._run(collection, lambda segment: segment.get(ids), {})
+
+    async def delete(self, collection: str, ids: List[str]) -> int:
+        return await self._run(collection, lambda segment: segment.delete(ids), 0)
+
+    async def needs_compaction(self, collection: str) -> bool:
+        def check(segment: ChunkSegment) -> bool:
+            return segment.dead_bytes() >= self.compact_min_bytes and segment.dead_ratio() >= self.compact_ratio
+
+        return await self._run(collection, check, False)
+
+    async def compact(self, collection: str, report: Optional[Callable[..., None]] = None) -> dict:
+        start = time.perf_counter()
+        result = await self._run(collection, lambda segment: segment.compact(), {"reclaimed_bytes": 0, "chunks": 0})
+        result["ms"] = round((time.perf_counter() - start) * 1000, 1)
+        if result["reclaimed_bytes"]:
+            self.stats["compactions"] += 1
+            self.stats["reclaimed_bytes"] += result["reclaimed_bytes"]
+        if report is not None:
+            report(reclaimedBytes=result["reclaimed_bytes"], chunks=result["chunks"])
+        return result
+
+    async def prewarm(self, collection: str) -> bool:
+        key = ("chunks", collection)
+        if self.manager.is_resident(key):
+            return True
+        return await asyncio.to_thread(self.manager.prewarm, key, self._opener(collection))
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "collections": {name: segment.get_stats() for name, segment in self.manager.resident("chunks").items()}
+        }
+
+
+# Global chunk store instance
+chunk_store = ChunkStore(
+    settings.CHUNK_STORE_DIR,
+    compact_ratio=settings.CHUNK_STORE_COMPACT_RATIO,
+    compact_min_bytes=settings.CHUNK_STORE_COMPACT_MIN_BYTES,
+    manager=collection_manager
+)
@@ -0,0 +1,189 @@
+"""
+Collection Manager for AFO Platform
+Keeps per-agent knowledge indexes (local vector collections, BM25 keyword
+indexes) resident only while they are in use. With one collection per
+agent and most agents idle, holding every index opened since startup
+costs memory and file descriptors for nothing.
+
+- Lazy: an index is opened on its first use; concurrent first uses
+  share one load
+- Bounded: resident indexes share one memory budget and a count cap (each
+  holds open files); past either, the least recently used ones that no
+  request is using are closed
+- Pre-warm: prewarm() opens an index ahead of its first query, e.g. when
+  a chat connects
+
+Keys are (kind, collection) tuples so stores can share the manager.
+Managed objects provide close(), memory_bytes() and evictable().
+"""
+
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+from app.core.config import settings
+import numpy as np
+import threading
+import time
+
+# open_fn(create) -> the opened index, or None when it doesn't exist and create is False
+OpenFn = Callable[[bool], Optional[object]]
+
+
+class _Resident:
+    __slots__ = ("obj", "bytes", "pins")
+
+    def __init__(self, obj, size: int):
+        self.obj = obj
+        self.bytes = size
+        self.pins = 0
+
+
+class CollectionManager:
+    def __init__(self, memory_budget_bytes: int = 2 * 1024 ** 3, max_resident: int = 1000):
+        self.memory_budget_bytes = memory_budget_bytes
+        self.max_resident = max_resident
+        self._resident: "OrderedDict[tuple, _Resident]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[tuple, threading.Lock] = {}
+        self.resident_bytes = 0
+        self.stats = {"hits": 0, "loads": 0, "evictions": 0, "prewarms": 0}
+        self._load_ms: deque = deque(maxlen=1000)
+
+    @contextmanager
+    def use(self, key: tuple, open_fn: OpenFn, create: bool = False) -> Iterator[Optional[object]]:
+        """
+        The index under key, opened with open_fn(create) if not resident, and
+        kept resident while the block runs
+
+        Yields None when open_fn finds nothing (it doesn't exist and create
+        is False). Blocking - a load reads the index from disk - so call it
+        from a worker thread.
+        """
+        obj = self._acquire(key, open_fn, create)
+        try:
+            yield obj
+        finally:
+            if obj is not None:
+                self._release(key)
+
+    def is_resident(self, key: tuple) -> bool:
+        return key in self._resident
+
+    def prewarm(self, key: tuple, open_fn: OpenFn) -> bool:
+        """Open an index ahead of its first query; False if it doesn't exist"""
+        if key in self._resident:
+            return True
+        with self.use(key, open_fn) as obj:
+            if obj is not None:
+                self.stats["prewarms"] += 1
+            return obj is not None
+
+    def _acquire(self, key: tuple, open_fn: OpenFn, create: bool) -> Optional[object]:
+        with self._lock:
+            entry = self._resident.get(key)
+            if entry is not None:
+                entry.pins += 1
+                self._resident.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry.obj
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # One loader per collection; the others wait and then find it resident
+        with load_lock:
+            with self._lock:
+                entry = self._resident.get(key)
+                if entry is not None:
+                    entry.pins += 1
+                    self._resident.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return entry.obj
+            start = time.perf_counter()
+            obj = open_fn(create)
+            if obj is None:
+                with self._lock:
+                    self._load_locks.pop(key, None)
+                return None
+            self._load_ms.append((time.perf_counter() - start) * 1000)
+            with self._lock:
+                entry = _Resident(obj, obj.memory_bytes())
+                entry.pins = 1
+                self._resident[key] = entry
+                self.resident_bytes += entry.bytes
+                self.stats["loads"] += 1
+                self._load_locks.pop(key, None)
+                victims = self._select_victims()
+        self._close(victims)
+        return obj
+
+    def _release(self, key: tuple):
+        with self._lock:
+            entry = self._resident.get(key)
+            if entry is None:
+                return
+            entry.pins -= 1
+            # Writes grow collections; re-measure while it's at hand
+            size = entry.obj.memory_bytes()
+            self.resident_bytes += size - entry.bytes
+            entry.bytes = size
+            victims = self._select_victims()
+        self._close(victims)
+
+    def _select_victims(self) -> list:
+        """Take least recently used idle collections out until within budget (lock held)"""
+        victims = []
+        for key in list(self._resident):
+            if self.resident_bytes <= self.memory_budget_bytes and len(self._resident) <= self.max_resident:
+                break
+            entry = self._resident[key]
+            # In use by a request or a background index build
+            if entry.pins or not entry.obj.evictable():
+                continue
+            del self._resident[key]
+            self.resident_bytes -= entry.bytes
+            self.stats["evictions"] += 1
+            victims.append(entry.obj)
+        return victims
+
+    @staticmethod
+    def _close(victims: list):
+        for obj in victims:
+            try:
+                obj.close()
+            except Exception as e:
+                print(f"Error closing evicted collection: {e}")
+
+    def evict(self, key: tuple) -> bool:
+        """Close an index now (unless it is in use)"""
+        with self._lock:
+            entry = self._resident.get(key)
+            if entry is None or entry.pins or not entry.obj.evictable():
+                return False
+            del self._resident[key]
+            self.resident_bytes -= entry.bytes
+            self.stats["evictions"] += 1
+        self._close([entry.obj])
+        return True
+
+    def resident(self, kind: str) -> Dict[str, object]:
+        """Resident indexes of one kind by collection"""
+        with self._lock:
+            return {key[1]: entry.obj for key, entry in self._resident.items() if key[0] == kind}
+
+    def get_stats(self) -> dict:
+        load_ms = np.array(self._load_ms) if self._load_ms else np.zeros(1)
+        return {
+            **self.stats,
+            "resident": len(self._resident),
+            "resident_mb": round(self.resident_bytes / 2 ** 20, 1),
+            "budget_mb": round(self.memory_budget_bytes / 2 ** 20, 1),
+            "max_resident": self.max_resident,
+            "load_ms_p50": round(float(np.percentile(load_ms, 50)), 2),
+            "load_ms_p99": round(float(np.percentile(load_ms, 99)), 2)
+        }
+
+
+# Global collection manager instance, shared by the vector and keyword stores
+collection_manager = CollectionManager(
+    memory_budget_bytes=settings.KNOWLEDGE_INDEX_MEMORY_BUDGET_MB * 1024 * 1024,
+    max_resident=settings.KNOWLEDGE_INDEX_MAX_RESIDENT
+)
@@ -0,0 +1,275 @@
+"""
+Conversation State Store for AFO Platform
+Shared home for chat history and voice session state, replacing the
+per-process dicts in ChatService and Qwen3OmniService
+
+Backends:
+- memory: idle-TTL + LRU eviction under an entry and memory cap
+- redis: shared across uvicorn workers/nodes (any redis.asyncio-compatible
+  client works, so tests can pass a local stand-in)
+
+Turns are msgpack-encoded individually so reads only decode the most
+recent ones.
+"""
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+import msgpack
+import time
+
+
+class ConversationStore(ABC):
+    """Interface for conversation history and session metadata"""
+
+    @abstractmethod
+    async def get_history(self, key: str, limit: Optional[int] = None) -> List[dict]:
+        """Most recent turns (oldest first), at most `limit`"""
+
+    @abstractmethod
+    async def append(self, key: str, turns: List[dict], max_turns: Optional[int] = None):
+        """Append turns, keeping only the last `max_turns`"""
+
+    @abstractmethod
+    async def get_meta(self, key: str) -> Optional[dict]:
+        """Session metadata, or None if missing/expired"""
+
+    @abstractmethod
+    async def set_meta(self, key: str, meta: dict):
+        """Create or replace session metadata"""
+
+    @abstractmethod
+    async def delete(self, key: str) -> bool:
+        """Drop history and metadata; True if anything existed"""
+
+    @abstractmethod
+    async def keys(self, prefix: str = "") -> List[str]:
+        """Live keys starting with prefix"""
+
+    def get_stats(self) -> dict:
+        return {}
+
+
+class _Entry:
+    __slots__ = ("turns", "meta", "nbytes", "last_access")
+
+    def __init__(self):
+        self.turns: List[bytes] = []
+        self.meta: Optional[bytes] = None
+        self.nbytes = 0
+        self.last_access = time.monotonic()
+
+
+class InMemoryConversationStore(ConversationStore):
+    """
+    Single-process store with idle-TTL, LRU and memory-cap eviction
+
+    Entries are kept in access order, so idle ones are always at the
+    head and expiry only looks at the entries that actually expired.
+    """
+
+    def __init__(
+        self,
+        idle_ttl_seconds: float = 3600,
+        max_entries: int = 10000,
+        memory_cap_bytes: int = 256 * 1024 * 1024,
+        max_turns: int = 20
+    ):
+        self.idle_ttl = idle_ttl_seconds
+        self.max_entries = max_entries
+        self.memory_cap = memory_cap_bytes
+        self.max_turns = max_turns
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self.evictions = {"ttl": 0, "lru": 0, "memory": 0}
+
+    def _remove(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.nbytes
+        return entry
+
+    def _expire(self):
+        deadline = time.monotonic() - self.idle_ttl
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.last_access > deadline:
+                break
+            self._remove(key)
+            self.evictions["ttl"] += 1
+
+    def _enforce_limits(self, keep: str):
+        while len(self._entries) > self.max_entries:
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            self._remove(key)
+            self.evictions["lru"] += 1
+        while self._bytes > self.memory_cap and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            self._remove(key)
+            self.evictions["memory"] += 1
+
+    def _get(self, key: str, create: bool = False) -> Optional[_Entry]:
+        self._expire()
+        entry = self._entries.get(key)
+        if entry is None:
+            if not create:
+                return None
+            entry = self._entries[key] = _Entry()
+        else:
+            self._entries.move_to_end(key)
+        entry.last_access = time.monotonic()
+        return entry
+
+    async def get_history(self, key: str, limit: Optional[int] = None) -> List[dict]:
+        entry = self._get(key)
+        if entry is None:
+            return []
+        turns = entry.turns[-limit:] if limit else entry.turns
+        return [msgpack.unpackb(turn) for turn in turns]
+
+    async def append(self, key: str, turns: List[dict], max_turns: Optional[int] = None):
+        entry = self._get(key, create=True)
+        encoded = [msgpack.packb(turn) for turn in turns]
+        entry.turns.extend(encoded)
+        added = sum(len(t) for t in encoded)
+
+        max_turns = max_turns or self.max_turns
+        if len(entry.turns) > max_turns:
+            dropped = entry.turns[:-max_turns]
+            entry.turns = entry.turns[-max_turns:]
+            added -= sum(len(t) for t in dropped)
+
+        entry.nbytes += added
+        self._bytes += added
+        self._enforce_limits(keep=key)
+
+    async def get_meta(self, key: str) -> Optional[dict]:
+        entry = self._get(key)
+        if entry is None or entry.meta is None:
+            return None
+        return msgpack.unpackb(entry.meta)
+
+    async def set_meta(self, key: str, meta: dict):
+        entry = self._get(key, create=True)
+        packed = msgpack.packb(meta)
+        delta = len(packed) - (len(entry.meta) if entry.meta else 0)
+        entry.meta = packed
+        entry.nbytes += delta
+        self._bytes += delta
+        self._enforce_limits(keep=key)
+
+    async def delete(self, key: str) -> bool:
+        return self._remove(key) is not None
+
+    async def keys(self, prefix: str = "") -> List[str]:
+        self._expire()
+        return [key for key in self._entries if key.startswith(prefix)]
+
+    def get_stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "evictions": dict(self.evictions)
+        }
+
+
+class RedisConversationStore(ConversationStore):
+    """
+    Redis-backed store shared by every worker and node
+
+    History is a Redis list of msgpack turns (LRANGE only fetches the tail),
+    metadata a msgpack string. Both get the idle TTL refreshed on access;
+    LRU/memory limits are the Redis server's maxmemory policy.
+    """
+
+    def __init__(
+        self,
+        client=None,
+        url: str = "redis://localhost:6379",
+        idle_ttl_seconds: float = 3600,
+        max_turns: int = 20,
+        namespace: str = "afo:conv:"
+    ):
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.from_url(url)
+        self.client = client
+        self.idle_ttl = int(idle_ttl_seconds)
+        self.max_turns = max_turns
+        self.namespace = namespace
+
+    def _history_key(self, key: str) -> str:
+        return f"{self.namespace}{key}:h"
+
+    def _meta_key(self, key: str) -> str:
+        return f"{self.namespace}{key}:m"
+
+    async def get_history(self, key: str, limit: Optional[int] = None) -> List[dict]:
+        history_key = self._history_key(key)
+        pipe = self.client.pipeline()
+        pipe.lrange(history_key, -limit if limit else 0, -1)
+        pipe.expire(history_key, self.idle_ttl)
+        pipe.expire(self._meta_key(key), self.idle_ttl)
+        turns, _, _ = await pipe.execute()
+        return [msgpack.unpackb(turn) for turn in turns]
+
+    async def append(self, key: str, turns: List[dict], max_turns: Optional[int] = None):
+        if not turns:
+            return
+        history_key = self._history_key(key)
+        pipe = self.client.pipeline()
+        pipe.rpush(history_key, *[msgpack.packb(turn) for turn in turns])
+        pipe.ltrim(history_key, -(max_turns or self.max_turns), -1)
+        pipe.expire(history_key, self.idle_ttl)
+        pipe.expire(self._meta_key(key), self.idle_ttl)
+        await pipe.execute()
+
+    async def get_meta(self, key: str) -> Optional[dict]:
+        meta_key = self._meta_key(key)
+        pipe = self.client.pipeline()
+        pipe.get(meta_key)
+        pipe.expire(meta_key, self.idle_ttl)
+        pipe.expire(self._history_key(key), self.idle_ttl)
+        packed, _, _ = await pipe.execute()
+        return msgpack.unpackb(packed) if packed else None
+
+    async def set_meta(self, key: str, meta: dict):
+        await self.client.set(self._meta_key(key), msgpack.packb(meta), ex=self.idle_ttl)
+
+    async def delete(self, key: str) -> bool:
+        return bool(await self.client.delete(self._history_key(key), self._meta_key(key)))
+
+    async def keys(self, prefix: str = "") -> List[str]:
+        keys = set()
+        async for raw in self.client.scan_iter(match=f"{self.namespace}{prefix}*"):
+            raw = raw.decode() if isinstance(raw, bytes) else raw
+            keys.add(raw[len(self.namespace):-2])
+        return sorted(keys)
+
+    def get_stats(self) -> dict:
+        return {"backend": "redis", "namespace": self.namespace}
+
+
+def _build_store() -> ConversationStore:
+    if settings.CONVERSATION_STORE_BACKEND == "redis":
+        return RedisConversationStore(
+            url=settings.REDIS_URL,
+            idle_ttl_seconds=settings.CONVERSATION_IDLE_TTL_SECONDS,
+            max_turns=settings.CONVERSATION_MAX_TURNS
+        )
+    return InMemoryConversationStore(
+        idle_ttl_seconds=settings.CONVERSATION_IDLE_TTL_SECONDS,
+        max_entries=settings.CONVERSATION_MAX_ENTRIES,
+        memory_cap_bytes=settings.CONVERSATION_MEMORY_CAP_MB * 1024 * 1024,
+        max_turns=settings.CONVERSATION_MAX_TURNS
+    )
+
+
+# Global conversation store instance
+conversation_store = _build_store()
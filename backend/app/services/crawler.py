@@ -0,0 +1,525 @@
+"""
+Web Crawler for AFO Platform
+Imports a docs site into a knowledge base, starting from a sitemap or a
+seed page
+
+- Discovery: a seed ending in .xml (or .xml.gz) is read as a sitemap or
+  sitemap index; any other seed is crawled breadth-first through its
+  links, staying on its host and under its directory
+- Polite: robots.txt is honoured per host (Disallow, Crawl-delay, and
+  noindex / nofollow robots meta tags), and requests to a host are spaced
+  at least host_interval_ms apart, across all crawls in the process
+- Bounded: pages are fetched over the shared HTTP pool with at most
+  `concurrency` requests in flight, and at most `ingest_concurrency`
+  changed pages are handed to on_page at once; fetching carries on while
+  pages ingest
+- Incremental: what is known about each page (ETag, Last-Modified, content
+  hash, links) lives in the caller's `known` dict. Re-crawls send
+  conditional requests, skip sitemap entries whose lastmod predates the
+  last fetch and only pass on pages whose content changed; known pages
+  that are now gone (404 / 410, or noindex) are passed to on_gone
+- Public only: every request's host is resolved first and loopback,
+  private, link-local (cloud metadata) and other non-global addresses are
+  refused - redirects are followed by hand so each hop is checked too -
+  unless allow_private_networks is set (local test servers)
+"""
+
+from datetime import datetime, timezone
+from html.parser import HTMLParser
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import urldefrag, urljoin, urlsplit
+from urllib.robotparser import RobotFileParser
+from xml.etree import ElementTree
+from app.core.config import settings
+from app.services.http_client import get_http_client
+import asyncio
+import hashlib
+import httpx
+import ipaddress
+import socket
+import time
+import zlib
+
+HTML_TYPES = ("text/html", "application/xhtml+xml")
+PAGE_TYPES = HTML_TYPES + ("text/plain", "text/markdown", "application/pdf")
+# What's remembered per page between crawls
+PAGE_STATE = ("etag", "lastModified", "contentHash", "links", "fetchedAt")
+SITEMAP_MAX_DEPTH = 3
+ROBOTS_TTL_SECONDS = 3600
+ROBOTS_RETRY_SECONDS = 60  # after robots.txt couldn't be fetched
+MAX_REDIRECTS = 5
+
+PageFn = Callable[[dict], Awaitable[None]]
+GoneFn = Callable[[str], Awaitable[None]]
+
+
+class PageTooLarge(Exception):
+    pass
+
+
+class BlockedAddress(ValueError):
+    """A URL whose host resolves to an address crawls may not reach"""
+
+
+class _PageParser(HTMLParser):
+    """Links and robots meta directives of an HTML page"""
+
+    def __init__(self, robot_name: str):
+        super().__init__(convert_charrefs=True)
+        self.robot_name = robot_name
+        self.links: List[str] = []
+        self.base: Optional[str] = None
+        self.directives: Set[str] = set()
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {name: value or "" for name, value in attrs}
+        if tag == "a" and attrs.get("href") and "nofollow" not in attrs.get("rel", "").lower():
+            self.links.append(attrs["href"])
+        elif tag == "base" and attrs.get("href") and self.base is None:
+            self.base = attrs["href"]
+        elif tag == "meta" and attrs.get("name", "").lower() in ("robots", self.robot_name):
+            self.directives.update(d.strip() for d in attrs.get("content", "").lower().split(","))
+
+
+def parse_page(html: str, url: str, robot_name: str) -> Tuple[List[str], Set[str]]:
+    """(absolute links without fragments, robots meta directives) of an HTML page"""
+    parser = _PageParser(robot_name)
+    parser.feed(html)
+    parser.close()
+    base = urljoin(url, parser.base) if parser.base else url
+    links = []
+    for href in parser.links:
+        link = urldefrag(urljoin(base, href.strip()))[0]
+        if link.startswith(("http://", "https://")):
+            links.append(link)
+    return links, parser.directives
+
+
+def parse_sitemap(body: bytes, max_bytes: Optional[int] = None) -> Tuple[List[Tuple[str, Optional[str]]], List[str]]:
+    """
+    ((loc, lastmod) of each page, nested sitemap URLs) of a sitemap or sitemap index
+
+    A gzipped sitemap is inflated to at most max_bytes (PageTooLarge past that)
+    """
+    if body[:2] == b"\x1f\x8b":
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        limit = max_bytes + 1 if max_bytes else 0
+        body = inflater.decompress(body, limit)
+        if max_bytes and len(body) > max_bytes:
+            raise PageTooLarge(f"sitemap inflates to over {max_bytes} bytes")
+    root = ElementTree.fromstring(body)
+    kind = _local_name(root.tag)
+    if kind not in ("urlset", "sitemapindex"):
+        raise ValueError(f"not a sitemap (root element {kind})")
+    pages, sitemaps = [], []
+    for entry in root:
+        fields = {_local_name(child.tag): (child.text or "").strip() for child in entry}
+        if not fields.get("loc"):
+            continue
+        if kind == "sitemapindex":
+            sitemaps.append(fields["loc"])
+        else:
+            pages.append((fields["loc"], fields.get("lastmod")))
+    return pages, sitemaps
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _parse_lastmod(value: Optional[str]) -> Optional[datetime]:
+    """A W3C datetime as naive UTC (like the fetchedAt times it's compared with)"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def is_sitemap_url(url: str) -> bool:
+    return urlsplit(url).path.lower().endswith((".xml", ".xml.gz"))
+
+
+class Crawler:
+    def __init__(
+        self,
+        client: Optional[httpx.AsyncClient] = None,
+        concurrency: int = 8,
+        ingest_concurrency: int = 2,
+        host_interval_ms: float = 250,
+        max_page_bytes: int = 5 * 1024 * 1024,
+        user_agent: str = "AFOBot/1.0",
+        allow_private_networks: bool = False
+    ):
+        self._client = client
+        self.concurrency = concurrency
+        self.ingest_concurrency = ingest_concurrency
+        self.host_interval = host_interval_ms / 1000
+        self.max_page_bytes = max_page_bytes
+        self.user_agent = user_agent
+        self.allow_private_networks = allow_private_networks
+        # robots.txt name, e.g. "afobot"
+        self.robot_name = user_agent.split("/")[0].lower()
+        self._robots: Dict[str, Tuple[RobotFileParser, float]] = {}
+        self._robots_locks: Dict[str, asyncio.Lock] = {}
+        self._host_locks: Dict[str, asyncio.Lock] = {}
+        self._next_request: Dict[str, float] = {}
+        self.stats = {"crawls": 0, "requests": 0, "not_modified": 0, "bytes": 0, "blocked": 0}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client or get_http_client()
+
+    async def crawl(
+        self,
+        seed: str,
+        known: Dict[str, dict],
+        on_page: PageFn,
+        on_gone: GoneFn,
+        report: Optional[Callable[..., None]] = None,
+        max_pages: int = 500
+    ) -> dict:
+        """
+        Crawl from seed; returns the counters (also passed to report as they change)
+
+        on_page(page) gets each new or changed page as {"url", "contentType",
+        "body", "etag", "lastModified", "contentHash", "links", "fetchedAt"};
+        once it returns, the page is recorded in known. Pages on_page fails on
+        are counted and retried by the next crawl.
+        """
+        self.stats["crawls"] += 1
+        return await _Crawl(self, seed, known, on_page, on_gone, report, max_pages).run()
+
+    def address_allowed(self, address: ipaddress._BaseAddress) -> bool:
+        if self.allow_private_networks:
+            return True
+        if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        return address.is_global
+
+    async def check_url(self, url: str):
+        """Raise BlockedAddress unless every address url's host resolves to may be crawled"""
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise BlockedAddress(f"{url} is not an http(s) URL")
+        if self.allow_private_networks:
+            return
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(
+                parts.hostname, parts.port or (443 if parts.scheme == "https" else 80), type=socket.SOCK_STREAM
+            )
+        except socket.gaierror as e:
+            raise BlockedAddress(f"{parts.hostname} does not resolve: {e}")
+        for *_, sockaddr in infos:
+            address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+            if not self.address_allowed(address):
+                self.stats["blocked"] += 1
+                raise BlockedAddress(f"{parts.hostname} resolves to non-public address {address}")
+
+    async def _open(self, url: str, headers: dict) -> httpx.Response:
+        """
+        Streamed GET of url, following redirects one hop at a time so every
+        hop's address is checked; close the response when done
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            await self.check_url(url)
+            self.stats["requests"] += 1
+            response = await self.client.send(self.client.build_request("GET", url, headers=headers), stream=True)
+            if not response.has_redirect_location:
+                return response
+            await response.aclose()
+            url = str(response.url.join(response.headers["location"]))
+        raise httpx.TooManyRedirects(f"more than {MAX_REDIRECTS} redirects", request=response.request)
+
+    async def _wait_turn(self, origin: str, interval: float):
+        """Space requests to one host; slots are reserved under the lock, waited for outside it"""
+        lock = self._host_locks.setdefault(origin, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            at = max(now, self._next_request.get(origin, 0.0))
+            self._next_request[origin] = at + interval
+        if at > now:
+            await asyncio.sleep(at - now)
+
+    async def robots(self, origin: str) -> RobotFileParser:
+        """The host's robots.txt rules (cached)"""
+        cached = self._robots.get(origin)
+        if cached is not None and time.monotonic() < cached[1]:
+            return cached[0]
+        async with self._robots_locks.setdefault(origin, asyncio.Lock()):
+            cached = self._robots.get(origin)
+            if cached is not None and time.monotonic() < cached[1]:
+                return cached[0]
+            parser = RobotFileParser(f"{origin}/robots.txt")
+            ttl = ROBOTS_TTL_SECONDS
+            try:
+                await self._wait_turn(origin, self.host_interval)
+                response = await self._open(f"{origin}/robots.txt", {"User-Agent": self.user_agent})
+                try:
+                    await response.aread()
+                finally:
+                    await response.aclose()
+                if response.status_code in (401, 403):
+                    parser.disallow_all = True
+                elif response.status_code >= 500:
+                    # Unreachable robots.txt means no crawling (RFC 9309); retry soon
+                    parser.disallow_all = True
+                    ttl = ROBOTS_RETRY_SECONDS
+                elif response.status_code >= 400:
+                    parser.allow_all = True
+                else:
+                    parser.parse(response.text.splitlines())
+            except (httpx.HTTPError, BlockedAddress) as e:
+                print(f"robots.txt of {origin} unavailable: {e}")
+                parser.disallow_all = True
+                ttl = ROBOTS_RETRY_SECONDS
+            self._robots[origin] = (parser, time.monotonic() + ttl)
+            return parser
+
+    def crawl_interval(self, robots: RobotFileParser) -> float:
+        delay = robots.crawl_delay(self.user_agent)
+        return max(self.host_interval, float(delay)) if delay else self.host_interval
+
+    async def fetch(self, url: str, validators: Optional[dict] = None) -> Tuple[httpx.Response, Optional[bytes]]:
+        """GET url (conditionally, given a page's etag / lastModified); the body only for a 200"""
+        headers = {"User-Agent": self.user_agent}
+        if validators:
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("lastModified"):
+                headers["If-Modified-Since"] = validators["lastModified"]
+        response = await self._open(url, headers)
+        try:
+            if response.status_code != 200:
+                if response.status_code == 304:
+                    self.stats["not_modified"] += 1
+                return response, None
+            length = response.headers.get("content-length")
+            if length and length.isdigit() and int(length) > self.max_page_bytes:
+                raise PageTooLarge(f"{url} is {length} bytes")
+            blocks, size = [], 0
+            async for block in response.aiter_bytes():
+                size += len(block)
+                if size > self.max_page_bytes:
+                    raise PageTooLarge(f"{url} is over {self.max_page_bytes} bytes")
+                blocks.append(block)
+            self.stats["bytes"] += size
+            return response, b"".join(blocks)
+        finally:
+            await response.aclose()
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "hosts": len(self._next_request)}
+
+
+class _Crawl:
+    """State of one crawl: frontier, fetch workers, ingesting pages, counters"""
+
+    def __init__(
+        self,
+        crawler: Crawler,
+        seed: str,
+        known: Dict[str, dict],
+        on_page: PageFn,
+        on_gone: GoneFn,
+        report: Optional[Callable[..., None]],
+        max_pages: int
+    ):
+        self.crawler = crawler
+        self.seed = urldefrag(seed)[0]
+        self.known = known
+        self.on_page = on_page
+        self.on_gone = on_gone
+        self.report = report or (lambda **counters: None)
+        self.max_pages = max_pages
+        self.sitemap = is_sitemap_url(self.seed)
+        parts = urlsplit(self.seed)
+        self.origin = _origin(self.seed)
+        # Link crawls stay under the seed's directory
+        self.prefix = parts.path[:parts.path.rfind("/") + 1] or "/"
+        self.frontier: "asyncio.Queue[Tuple[str, Optional[str]]]" = asyncio.Queue()
+        self.seen: Set[str] = set()
+        self.ingesting: Set[asyncio.Task] = set()
+        self.ingest_slots = asyncio.Semaphore(crawler.ingest_concurrency)
+        self.counters = {
+            "pagesDiscovered": 0,
+            "pagesFetched": 0,
+            "notModified": 0,
+            "pagesIngested": 0,
+            "pagesRemoved": 0,
+            "skippedRobots": 0,
+            "skipped": 0,
+            "failed": 0
+        }
+
+    async def run(self) -> dict:
+        if self.sitemap:
+            await self._read_sitemap(self.seed, 0)
+        else:
+            self._discover(self.seed)
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.crawler.concurrency)]
+        try:
+            await self.frontier.join()
+            while self.ingesting:
+                await asyncio.gather(*self.ingesting)
+        finally:
+            pending = workers + list(self.ingesting)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        self.report(**self.counters)
+        return dict(self.counters)
+
+    def _discover(self, url: str, lastmod: Optional[str] = None):
+        if url in self.seen or len(self.seen) >= self.max_pages:
+            return
+        self.seen.add(url)
+        self.counters["pagesDiscovered"] += 1
+        self.frontier.put_nowait((url, lastmod))
+
+    def _in_scope(self, url: str) -> bool:
+        return _origin(url) == self.origin and urlsplit(url).path.startswith(self.prefix)
+
+    async def _read_sitemap(self, url: str, depth: int):
+        robots = await self.crawler.robots(_origin(url))
+        if not robots.can_fetch(self.crawler.user_agent, url):
+            self.counters["skippedRobots"] += 1
+            return
+        await self.crawler._wait_turn(_origin(url), self.crawler.crawl_interval(robots))
+        response, body = await self.crawler.fetch(url)
+        if body is None:
+            raise ValueError(f"sitemap {url} returned HTTP {response.status_code}")
+        pages, sitemaps = await asyncio.to_thread(parse_sitemap, body, self.crawler.max_page_bytes)
+        for loc, lastmod in pages:
+            # Sitemaps may only list pages of their own host
+            if _origin(loc) == self.origin:
+                self._discover(urldefrag(loc)[0], lastmod)
+        if depth < SITEMAP_MAX_DEPTH:
+            for nested in sitemaps:
+                if len(self.seen) >= self.max_pages:
+                    break
+                await self._read_sitemap(nested, depth + 1)
+
+    async def _worker(self):
+        while True:
+            url, lastmod = await self.frontier.get()
+            try:
+                await self._visit(url, lastmod)
+            except Exception as e:
+                print(f"Crawling {url} failed: {e}")
+                self.counters["failed"] += 1
+            finally:
+                self.frontier.task_done()
+                self.report(**self.counters)
+
+    async def _visit(self, url: str, lastmod: Optional[str]):
+        crawler = self.crawler
+        page = self.known.get(url)
+        changed_at = _parse_lastmod(lastmod)
+        if page is not None and changed_at is not None and changed_at <= page["fetchedAt"]:
+            # The sitemap says it hasn't changed since we fetched it
+            self.counters["notModified"] += 1
+            return
+        origin = _origin(url)
+        robots = await crawler.robots(origin)
+        if not robots.can_fetch(crawler.user_agent, url):
+            self.counters["skippedRobots"] += 1
+            return
+        await crawler._wait_turn(origin, crawler.crawl_interval(robots))
+        response, body = await crawler.fetch(url, page)
+        fetched_at = datetime.utcnow()
+
+        if response.status_code == 304 and page is not None:
+            page["fetchedAt"] = fetched_at
+            self.counters["notModified"] += 1
+            self._follow(page.get("links", ()))
+            return
+        if response.status_code in (404, 410):
+            if page is not None:
+                await self._remove(url)
+            else:
+                self.counters["failed"] += 1
+            return
+        if body is None:
+            raise ValueError(f"HTTP {response.status_code}")
+        self.counters["pagesFetched"] += 1
+        content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+        if content_type not in PAGE_TYPES:
+            self.counters["skipped"] += 1
+            return
+
+        links: List[str] = []
+        directives: Set[str] = set()
+        if content_type in HTML_TYPES:
+            html = body.decode(response.encoding or "utf-8", errors="replace")
+            links, directives = await asyncio.to_thread(parse_page, html, str(response.url), crawler.robot_name)
+            if self.sitemap or "nofollow" in directives or "none" in directives:
+                links = []
+            links = [link for link in links if self._in_scope(link)]
+            self._follow(links)
+        if "noindex" in directives or "none" in directives:
+            self.counters["skippedRobots"] += 1
+            if page is not None:
+                await self._remove(url)
+            return
+
+        state = {
+            "etag": response.headers.get("etag"),
+            "lastModified": response.headers.get("last-modified"),
+            "contentHash": hashlib.sha256(body).hexdigest(),
+            "links": links,
+            "fetchedAt": fetched_at
+        }
+        if page is not None and page.get("contentHash") == state["contentHash"]:
+            # Served in full (no validators, or they changed) but the same bytes
+            page.update(state)
+            self.counters["notModified"] += 1
+            return
+        # Wait here while every ingest slot is busy, so fetched bodies don't pile up
+        await self.ingest_slots.acquire()
+        task = asyncio.create_task(self._ingest(url, {"url": url, "contentType": content_type, "body": body, **state}))
+        self.ingesting.add(task)
+        task.add_done_callback(self.ingesting.discard)
+
+    def _follow(self, links):
+        if self.sitemap:
+            return
+        for link in links:
+            self._discover(link)
+
+    async def _remove(self, url: str):
+        del self.known[url]
+        await self.on_gone(url)
+        self.counters["pagesRemoved"] += 1
+
+    async def _ingest(self, url: str, page: dict):
+        try:
+            await self.on_page(page)
+            self.known[url] = {key: page[key] for key in PAGE_STATE}
+            self.counters["pagesIngested"] += 1
+        except Exception as e:
+            print(f"Ingesting {url} failed: {e}")
+            self.counters["failed"] += 1
+        finally:
+            self.ingest_slots.release()
+            self.report(**self.counters)
+
+
+# Global crawler instance
+web_crawler = Crawler(
+    concurrency=settings.KNOWLEDGE_CRAWL_CONCURRENCY,
+    ingest_concurrency=settings.KNOWLEDGE_CRAWL_INGEST_CONCURRENCY,
+    host_interval_ms=settings.KNOWLEDGE_CRAWL_HOST_INTERVAL_MS,
+    max_page_bytes=settings.KNOWLEDGE_CRAWL_MAX_PAGE_BYTES,
+    user_agent=settings.KNOWLEDGE_CRAWL_USER_AGENT,
+    allow_private_networks=settings.KNOWLEDGE_CRAWL_ALLOW_PRIVATE_NETWORKS
+)
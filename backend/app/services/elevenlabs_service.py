@@ -4,6 +4,8 @@ from typing import Optional, List
 import uuid
 import os
 import aiofiles
+import time
+from app.services.usage_accounting import usage_accounting
 
 class ElevenLabsService:
     """
@@ -19,7 +21,9 @@ class ElevenLabsService:
         text: str,
         voice_id: str = "EXAVITQu4vr4xnSDxMaL",  # Default voice (Sarah)
         model_id: str = "eleven_monolingual_v1",
-        voice_settings: Optional[dict] = None
+        voice_settings: Optional[dict] = None,
+        tenant_id: Optional[str] = None,
+        agent_id: Optional[str] = None
     ) -> bytes:
         """
         Convert text to speech audio
@@ -29,10 +33,13 @@ class ElevenLabsService:
             voice_id: ElevenLabs voice ID
             model_id: Model to use (eleven_monolingual_v1, eleven_multilingual_v2, etc)
             voice_settings: Optional voice settings (stability, similarity_boost, style, use_speaker_boost)
+            tenant_id: Tenant to bill the characters to
+            agent_id: Agent the speech was generated for
         
         Returns:
             Audio bytes in MP3 format
         """
+        start = time.perf_counter()
         try:
             # Default voice settings
             if voice_settings is None:
@@ -53,6 +60,16 @@ class ElevenLabsService:
             
             # Convert generator to bytes
             audio_bytes = b"".join(audio)
+            
+            # ElevenLabs bills per character
+            usage_accounting.record(
+                "tts",
+                model_id,
+                tenant_id=tenant_id,
+                agent_id=agent_id,
+                prompt_tokens=len(text),
+                latency_ms=(time.perf_counter() - start) * 1000
+            )
             return audio_bytes
             
         except Exception as e:
@@ -0,0 +1,90 @@
+"""
+Embedding Cache for AFO Platform
+Chunk embeddings keyed by (content hash, embedding model), so re-uploading
+a document - or uploading one that shares text with another - only sends
+new or changed chunks to the embeddings API
+
+Stored on disk as one embedded collection per model (the same memory-
+mapped format as the local vector store, never indexed). Vectors come
+back normalized, which is all cosine search needs.
+"""
+
+from typing import Awaitable, Callable, Dict, List, Tuple
+from app.core.config import settings
+from app.services.vector_store import LocalCollection
+import asyncio
+import hashlib
+import os
+import re
+import sys
+import threading
+
+
+def content_hash(text: str) -> str:
+    """Fingerprint of a chunk's text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+class EmbeddingCache:
+    """Persistent (hash, model) -> vector cache in front of an embed function"""
+
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        self.collections: Dict[str, LocalCollection] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _collection(self, model: str) -> LocalCollection:
+        collection = self.collections.get(model)
+        if collection is None:
+            with self._lock:
+                if model not in self.collections:
+                    path = os.path.join(self.data_dir, re.sub(r"[^0-9A-Za-z_.-]", "_", model))
+                    # Lookups are by hash only, so no similarity index is ever built
+                    self.collections[model] = LocalCollection(path, index_threshold=sys.maxsize)
+                collection = self.collections[model]
+        return collection
+
+    async def embed_many(
+        self,
+        texts: List[str],
+        embed_fn: Callable[[List[str]], Awaitable[List[List[float]]]],
+        model: str
+    ) -> Tuple[List[List[float]], int]:
+        """
+        Embeddings of texts, calling embed_fn only for uncached ones
+
+        Returns (vectors, number of texts served from the cache)
+        """
+        collection = self._collection(model)
+        hashes = [content_hash(text) for text in texts]
+        cached = await asyncio.to_thread(collection.get_vectors, hashes)
+
+        # Repeated texts within the batch are embedded once
+        missing: Dict[str, str] = {}
+        for text, hash_ in zip(texts, hashes):
+            if hash_ not in cached:
+                missing.setdefault(hash_, text)
+        if missing:
+            computed = await embed_fn(list(missing.values()))
+            await asyncio.to_thread(collection.upsert, list(missing), computed, [{}] * len(missing))
+            cached.update(zip(missing, computed))
+
+        served = len(texts) - len(missing)
+        self.hits += served
+        self.misses += len(missing)
+        return [list(map(float, cached[hash_])) for hash_ in hashes], served
+
+    def get_stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "models": {model: collection.live_count() for model, collection in self.collections.items()}
+        }
+
+
+# Global embedding cache instance
+embedding_cache = EmbeddingCache(settings.EMBEDDING_CACHE_DIR)
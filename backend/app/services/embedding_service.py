@@ -0,0 +1,97 @@
+"""
+Embedding & Moderation Service for AFO Platform
+Single-item calls from all concurrent conversations are micro-batched
+into one upstream request per window
+"""
+
+from openai import AsyncOpenAI
+from app.core.config import settings
+from app.services.micro_batcher import MicroBatcher
+from app.services.usage_accounting import usage_accounting
+from typing import List, Optional
+import time
+
+
+class EmbeddingService:
+    """
+    Batched access to the embeddings and moderation APIs
+
+    Callers use embed()/moderate() as if each were its own request;
+    the batchers coalesce them behind the scenes
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: Optional[str] = None,
+        model: str = "text-embedding-3-small",
+        max_batch_size: int = 256,
+        moderation_max_batch_size: int = 32,
+        max_wait_ms: float = 5
+    ):
+        self.client = AsyncOpenAI(api_key=api_key or "not-set", base_url=base_url)
+        self.model = model
+        self.embedding_batcher = MicroBatcher(
+            "embeddings",
+            self._embed_batch,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms
+        )
+        self.moderation_batcher = MicroBatcher(
+            "moderation",
+            self._moderate_batch,
+            max_batch_size=moderation_max_batch_size,
+            max_wait_ms=max_wait_ms
+        )
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        response = await self.client.embeddings.create(model=self.model, input=texts)
+        usage_accounting.record(
+            "embedding",
+            self.model,
+            prompt_tokens=response.usage.prompt_tokens if response.usage else 0,
+            latency_ms=(time.perf_counter() - start) * 1000
+        )
+        # The API may return items out of order; index restores it
+        ordered = sorted(response.data, key=lambda item: item.index)
+        return [item.embedding for item in ordered]
+
+    async def _moderate_batch(self, texts: List[str]) -> List[dict]:
+        response = await self.client.moderations.create(input=texts)
+        return [
+            {
+                "flagged": result.flagged,
+                "categories": {k: v for k, v in dict(result.categories or {}).items() if v}
+            }
+            for result in response.results
+        ]
+
+    async def embed(self, text: str) -> List[float]:
+        """Embed one text (batched with concurrent callers)"""
+        return await self.embedding_batcher.submit(text)
+
+    async def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """Embed several texts (batched with concurrent callers)"""
+        return await self.embedding_batcher.submit_many(texts)
+
+    async def moderate(self, text: str) -> dict:
+        """Moderation check for one text (batched with concurrent callers)"""
+        return await self.moderation_batcher.submit(text)
+
+    def get_stats(self) -> dict:
+        return {
+            "embeddings": self.embedding_batcher.get_stats(),
+            "moderation": self.moderation_batcher.get_stats()
+        }
+
+
+# Global instance
+embedding_service = EmbeddingService(
+    api_key=settings.OPENAI_API_KEY,
+    base_url=settings.EMBEDDING_BASE_URL or None,
+    model=settings.EMBEDDING_MODEL,
+    max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+    moderation_max_batch_size=settings.MODERATION_BATCH_MAX_SIZE,
+    max_wait_ms=settings.BATCH_MAX_WAIT_MS
+)
@@ -0,0 +1,468 @@
+"""
+Generation Scheduler for AFO Platform
+Continuous batching for the locally hosted model: one scheduler thread
+owns the model and advances every active request together, one token
+per step, instead of each request running its own generate() thread
+and competing for the model
+
+- Admission: waiting requests are prefilled between decode steps and
+  join the running batch (up to max_batch_size); requests that finish,
+  or whose caller stopped listening, leave it after any step, so one
+  long answer never holds the others back
+- Batched decode: the rows' KV caches are kept left-padded to a common
+  length in one batched cache; the attention mask hides the padding and
+  each row carries its own position ids
+- Prefix reuse: with a PrefixCache, a request's prompt is looked up under
+  the keys it names (its agent's system prompt, its session's last
+  prompt) and only the tokens after the longest cached prefix are
+  prefilled; the new prompt's KV state is stored back under them
+- Streaming: text is decoded incrementally per request and put on the
+  request's asyncio queue from the scheduler thread with
+  loop.call_soon_threadsafe
+
+Works with Hugging Face causal LMs whose forward() takes past_key_values,
+attention_mask and position_ids. Models that have to go through
+generate() stream with AsyncTextStreamer instead.
+"""
+
+from collections import deque
+from typing import AsyncIterator, Deque, Hashable, Iterable, List, Optional, Tuple
+from prometheus_client import Counter, Histogram
+from transformers import DynamicCache, TextStreamer
+from app.services.prefix_cache import PrefixCache
+import asyncio
+import numpy as np
+import threading
+import time
+import torch
+import torch.nn.functional as F
+import uuid
+
+BATCH_SIZE = Histogram(
+    "afo_generation_batch_size",
+    "Requests advanced together per decode step",
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+TIME_TO_FIRST_TOKEN = Histogram(
+    "afo_generation_ttft_seconds",
+    "Time from submitting a request to its first generated token",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+)
+TOKENS = Counter("afo_generation_tokens_total", "Tokens generated by the scheduler")
+
+_END = object()
+
+
+class GenerationRequest:
+    """One prompt's generation; iterate stream() for its text as it's produced"""
+
+    def __init__(
+        self,
+        prompt_ids: List[int],
+        max_new_tokens: int,
+        temperature: float,
+        top_p: float,
+        loop: asyncio.AbstractEventLoop,
+        prefixes: List[Tuple[Hashable, Optional[int]]]
+    ):
+        self.id = str(uuid.uuid4())
+        self.prompt_ids = prompt_ids
+        self.prefixes = prefixes
+        self.cached_tokens = 0
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.tokens: List[int] = []
+        self.error: Optional[BaseException] = None
+        self.cancelled = False
+        self.finished = False
+        self.submitted_at = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._loop = loop
+        self._queue: asyncio.Queue = asyncio.Queue()
+        # Incremental detokenization: tokens since the last newline, chars of them already sent
+        self._text_tokens: List[int] = []
+        self._sent = 0
+
+    def _put(self, item):
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+        except RuntimeError:
+            # The caller's loop is gone
+            self.cancelled = True
+
+    async def stream(self) -> AsyncIterator[str]:
+        """Text deltas until the request finishes; raises if generation failed"""
+        try:
+            while True:
+                item = await self._queue.get()
+                if item is _END:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                yield item
+        finally:
+            # A caller that stops early (client gone) frees its batch slot
+            if not self.finished:
+                self.cancelled = True
+
+    @property
+    def ttft_ms(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return (self.first_token_at - self.submitted_at) * 1000
+
+
+class GenerationCancelled(Exception):
+    """Raised inside generate() once nobody is reading its output"""
+
+
+class AsyncTextStreamer(TextStreamer):
+    """
+    Streamer for generate() running on a worker thread, read with async for
+    on the event loop
+
+    Text is handed over with loop.call_soon_threadsafe, so waiting for the
+    next piece never blocks the loop (TextIteratorStreamer's blocking queue
+    does). A reader that stops early stops the generation at its next token,
+    freeing the worker.
+    """
+
+    def __init__(self, tokenizer, loop: asyncio.AbstractEventLoop, skip_prompt: bool = True, **decode_kwargs):
+        super().__init__(tokenizer, skip_prompt=skip_prompt, **decode_kwargs)
+        self.error: Optional[BaseException] = None
+        self.cancelled = False
+        self._loop = loop
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    def put(self, value):
+        if self.cancelled:
+            raise GenerationCancelled()
+        super().put(value)
+
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        if text:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, text)
+        if stream_end:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, _END)
+
+    def fail(self, error: BaseException):
+        """End the stream with error (call from the generating thread)"""
+        self.error = error
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, _END)
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        try:
+            while True:
+                item = await self._queue.get()
+                if item is _END:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                yield item
+        finally:
+            self.cancelled = True
+
+
+def _layers(past) -> tuple:
+    """Per-layer (key, value) tensors of a model's past_key_values"""
+    if hasattr(past, "to_legacy_cache"):
+        return past.to_legacy_cache()
+    if hasattr(past, "layers"):
+        return tuple((layer.keys, layer.values) for layer in past.layers)
+    return tuple(past)
+
+
+def _as_cache(layers: tuple) -> DynamicCache:
+    cache = DynamicCache()
+    for index, (keys, values) in enumerate(layers):
+        cache.update(keys, values, index)
+    return cache
+
+
+def _pad_left(layers: tuple, mask: torch.Tensor, pad: int):
+    """Prepend pad masked-out positions to every row of a [batch, heads, length, dim] cache"""
+    layers = tuple((F.pad(keys, (0, 0, pad, 0)), F.pad(values, (0, 0, pad, 0))) for keys, values in layers)
+    return layers, F.pad(mask, (pad, 0))
+
+
+class GenerationScheduler:
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        device: str = "cpu",
+        max_batch_size: int = 8,
+        max_new_tokens: int = 1024,
+        eos_token_ids: Optional[Iterable[int]] = None,
+        prefix_cache: Optional[PrefixCache] = None
+    ):
+        self.model = model
+        self.prefix_cache = prefix_cache
+        self.tokenizer = tokenizer
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.max_new_tokens = max_new_tokens
+        if eos_token_ids is None:
+            eos = getattr(getattr(model, "generation_config", None), "eos_token_id", None)
+            if eos is None:
+                eos = tokenizer.eos_token_id
+            eos_token_ids = eos if isinstance(eos, (list, tuple)) else [eos] if eos is not None else []
+        self.eos_token_ids = set(eos_token_ids)
+        self._waiting: Deque[GenerationRequest] = deque()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        # Batch state (scheduler thread only): rows in _active order
+        self._active: List[GenerationRequest] = []
+        self._cache: Optional[tuple] = None
+        self._mask: Optional[torch.Tensor] = None
+        self._positions: List[int] = []
+        self.stats = {
+            "requests": 0,
+            "completed": 0,
+            "cancelled": 0,
+            "failed": 0,
+            "steps": 0,
+            "tokens": 0,
+            "prompt_tokens": 0,
+            "cached_prompt_tokens": 0
+        }
+        self._busy_seconds = 0.0
+        self._ttft_ms: Deque[float] = deque(maxlen=1000)
+
+    def submit(
+        self,
+        prompt_ids: List[int],
+        max_new_tokens: Optional[int] = None,
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+        prefixes: Optional[List[Tuple[Hashable, Optional[int]]]] = None
+    ) -> GenerationRequest:
+        """
+        Queue a prompt; it joins the batch at the next step boundary
+
+        prefixes are (prefix cache key, length) pairs: the prompt's KV state
+        is looked up under the keys and its first length tokens (all of them
+        for None) are stored back under each.
+        """
+        request = GenerationRequest(
+            list(prompt_ids),
+            max_new_tokens or self.max_new_tokens,
+            temperature,
+            top_p,
+            asyncio.get_running_loop(),
+            prefixes or []
+        )
+        with self._condition:
+            self._waiting.append(request)
+            self.stats["requests"] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="generation-scheduler", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return request
+
+    # Scheduler thread
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._waiting and not self._active:
+                    self._condition.wait()
+                admitted = []
+                while self._waiting and len(self._active) + len(admitted) < self.max_batch_size:
+                    admitted.append(self._waiting.popleft())
+            started = time.perf_counter()
+            try:
+                with torch.inference_mode():
+                    for request in admitted:
+                        if request.cancelled:
+                            self._finish(request)
+                            continue
+                        try:
+                            self._prefill(request)
+                        except Exception as e:
+                            print(f"Generation prefill failed: {e}")
+                            self._finish(request, e)
+                    self._drop([i for i, request in enumerate(self._active) if request.cancelled])
+                    if self._active:
+                        self._step()
+            except Exception as e:
+                # The batched cache can't be trusted after a failure part way
+                # through joining, stepping or dropping rows: fail everything
+                # in flight or queued rather than let the thread die and leave
+                # later submit() calls waiting forever
+                print(f"Generation scheduler failed: {e}")
+                self._fail_all(admitted, e)
+            self._busy_seconds += time.perf_counter() - started
+
+    def _fail_all(self, admitted: List[GenerationRequest], error: Exception):
+        with self._condition:
+            waiting = list(self._waiting)
+            self._waiting.clear()
+        for request in [*self._active, *admitted, *waiting]:
+            self._finish(request, error)
+        self._active, self._cache, self._mask, self._positions = [], None, None, []
+
+    def _prefill(self, request: GenerationRequest):
+        cached, past = 0, None
+        if self.prefix_cache is not None and request.prefixes:
+            cached, past = self.prefix_cache.lookup([key for key, _ in request.prefixes], request.prompt_ids)
+        input_ids = torch.tensor([request.prompt_ids[cached:]], dtype=torch.long, device=self.device)
+        output = self.model(
+            input_ids=input_ids,
+            past_key_values=_as_cache(past) if past is not None else None,
+            use_cache=True
+        )
+        request.cached_tokens = cached
+        self.stats["prompt_tokens"] += len(request.prompt_ids)
+        self.stats["cached_prompt_tokens"] += cached
+        layers = _layers(output.past_key_values)
+        if self.prefix_cache is not None:
+            for key, length in request.prefixes:
+                self.prefix_cache.store(key, request.prompt_ids, layers, length)
+        token = self._sample(output.logits[:, -1, :], [request])[0]
+        if self._accept(request, token):
+            return
+        self._join(request, layers, len(request.prompt_ids))
+
+    def _join(self, request: GenerationRequest, layers: tuple, length: int):
+        mask = torch.ones(1, length, dtype=torch.long, device=self.device)
+        if self._cache is None:
+            self._cache, self._mask = layers, mask
+        else:
+            width = self._mask.shape[1]
+            if length < width:
+                layers, mask = _pad_left(layers, mask, width - length)
+            elif length > width:
+                self._cache, self._mask = _pad_left(self._cache, self._mask, length - width)
+            self._cache = tuple(
+                (torch.cat([keys, new_keys]), torch.cat([values, new_values]))
+                for (keys, values), (new_keys, new_values) in zip(self._cache, layers)
+            )
+            self._mask = torch.cat([self._mask, mask])
+        self._active.append(request)
+        self._positions.append(length)
+
+    def _step(self):
+        batch = len(self._active)
+        input_ids = torch.tensor([[request.tokens[-1]] for request in self._active], dtype=torch.long, device=self.device)
+        position_ids = torch.tensor([[position] for position in self._positions], dtype=torch.long, device=self.device)
+        mask = torch.cat([self._mask, torch.ones(batch, 1, dtype=torch.long, device=self.device)], dim=1)
+        output = self.model(
+            input_ids=input_ids,
+            attention_mask=mask,
+            position_ids=position_ids,
+            past_key_values=_as_cache(self._cache),
+            use_cache=True
+        )
+        self._cache, self._mask = _layers(output.past_key_values), mask
+        self._positions = [position + 1 for position in self._positions]
+        self.stats["steps"] += 1
+        BATCH_SIZE.observe(batch)
+        tokens = self._sample(output.logits[:, -1, :], self._active)
+        self._drop([i for i, (request, token) in enumerate(zip(self._active, tokens)) if self._accept(request, token)])
+
+    def _drop(self, rows: List[int]):
+        """Remove finished rows from the batch and the padding nobody needs any more"""
+        if not rows:
+            return
+        dropped = set(rows)
+        keep = [i for i in range(len(self._active)) if i not in dropped]
+        for i in rows:
+            if not self._active[i].finished:
+                self._finish(self._active[i])
+        if not keep:
+            self._active, self._cache, self._mask, self._positions = [], None, None, []
+            return
+        index = torch.tensor(keep, dtype=torch.long, device=self.device)
+        self._active = [self._active[i] for i in keep]
+        self._positions = [self._positions[i] for i in keep]
+        mask = self._mask.index_select(0, index)
+        # Leading columns that are padding in every remaining row
+        start = int(mask.any(dim=0).nonzero()[0])
+        self._mask = mask[:, start:]
+        self._cache = tuple(
+            (keys.index_select(0, index)[:, :, start:], values.index_select(0, index)[:, :, start:])
+            for keys, values in self._cache
+        )
+
+    def _sample(self, logits: torch.Tensor, requests: List[GenerationRequest]) -> List[int]:
+        """Per-row temperature and nucleus (top-p) sampling; temperature 0 is greedy"""
+        logits = logits.float()
+        temperature = torch.tensor([request.temperature for request in requests], device=logits.device)
+        top_p = torch.tensor([request.top_p for request in requests], device=logits.device)
+        probs = torch.softmax(logits / temperature.clamp(min=1e-5).unsqueeze(1), dim=-1)
+        sorted_probs, sorted_ids = probs.sort(dim=-1, descending=True)
+        # Keep the smallest prefix whose mass reaches top_p (always at least one token)
+        outside = sorted_probs.cumsum(dim=-1) - sorted_probs > top_p.unsqueeze(1)
+        sorted_probs = sorted_probs.masked_fill(outside, 0.0)
+        sampled = sorted_ids.gather(1, torch.multinomial(sorted_probs, 1)).squeeze(1)
+        return torch.where(temperature <= 0, logits.argmax(dim=-1), sampled).tolist()
+
+    def _accept(self, request: GenerationRequest, token: int) -> bool:
+        """Record a generated token and stream its text; True once the request is done"""
+        if request.first_token_at is None:
+            request.first_token_at = time.perf_counter()
+            self._ttft_ms.append(request.ttft_ms)
+            TIME_TO_FIRST_TOKEN.observe(request.ttft_ms / 1000)
+        if request.cancelled or token in self.eos_token_ids:
+            self._finish(request)
+            return True
+        request.tokens.append(token)
+        request._text_tokens.append(token)
+        self.stats["tokens"] += 1
+        TOKENS.inc()
+        self._emit(request, final=False)
+        if len(request.tokens) >= request.max_new_tokens:
+            self._finish(request)
+            return True
+        return False
+
+    def _emit(self, request: GenerationRequest, final: bool):
+        # Like TextIteratorStreamer: decode the tokens since the last newline and
+        # send complete words, so merges across token boundaries come out right
+        text = self.tokenizer.decode(request._text_tokens, skip_special_tokens=True)
+        if final or text.endswith("\n"):
+            delta = text[request._sent:]
+            request._text_tokens, request._sent = [], 0
+        elif text.endswith("\ufffd"):
+            return  # a multi-byte character split across tokens
+        else:
+            cut = text.rfind(" ") + 1
+            if cut <= request._sent:
+                return
+            delta = text[request._sent:cut]
+            request._sent = cut
+        if delta:
+            request._put(delta)
+
+    def _finish(self, request: GenerationRequest, error: Optional[BaseException] = None):
+        if request.finished:
+            return
+        request.finished = True
+        request.finished_at = time.perf_counter()
+        if error is not None:
+            request.error = error
+            self.stats["failed"] += 1
+        elif request.cancelled:
+            self.stats["cancelled"] += 1
+        else:
+            self._emit(request, final=True)
+            self.stats["completed"] += 1
+        request._put(_END)
+
+    def get_stats(self) -> dict:
+        stats = {
+            **self.stats,
+            "waiting": len(self._waiting),
+            "active": len(self._active),
+            "max_batch_size": self.max_batch_size,
+            "tokens_per_second": round(self.stats["tokens"] / self._busy_seconds, 1) if self._busy_seconds else 0.0,
+            "mean_batch_size": round(self.stats["tokens"] / self.stats["steps"], 2) if self.stats["steps"] else 0.0
+        }
+        if self._ttft_ms:
+            p50, p99 = np.percentile(np.array(self._ttft_ms), [50, 99])
+            stats["ttft_ms"] = {"p50": round(float(p50), 1), "p99": round(float(p99), 1)}
+        return stats
@@ -0,0 +1,32 @@
+"""
+Shared HTTP client for AFO Platform
+One pooled httpx.AsyncClient per process, so outbound requests reuse
+connections (and TLS sessions) instead of opening a client per call
+"""
+
+from typing import Optional
+from app.core.config import settings
+import httpx
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """The process-wide client (created on first use)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_POOL_MAX_KEEPALIVE
+            ),
+            timeout=httpx.Timeout(settings.HTTP_TIMEOUT_SECONDS)
+        )
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,117 @@
+"""
+Hybrid Retrieval for AFO Platform
+Runs vector search and BM25 over an agent's knowledge base concurrently
+and fuses the two rankings with reciprocal-rank fusion (RRF):
+
+    score(d) = sum over rankings of 1 / (k + rank(d))
+
+RRF only looks at ranks, so cosine similarities and BM25 scores never
+have to be put on a common scale. Plain RRF still lets a chunk that is
+middling in both lists beat the one exact match for an error code, so
+weak BM25 hits (far below the best one) are cut before fusion and, when
+the query contains an identifier (a term with digits, such as a SKU), the
+keyword ranking is weighted up.
+
+Chunk texts come from the chunk store, for the fused top hits only.
+"""
+
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.services.chunk_store import ChunkStore, chunk_store
+from app.services.embedding_service import embedding_service
+from app.services.keyword_index import KeywordStore, keyword_store, tokenize
+from app.services.vector_store import VectorStore, vector_store
+import asyncio
+
+
+def reciprocal_rank_fusion(
+    rankings: List[List[str]],
+    k: int = 60,
+    weights: Optional[List[float]] = None
+) -> List[Tuple[str, float]]:
+    """Fuse ranked id lists (best first) into [(id, score)], best first"""
+    scores: Dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights or [1.0] * len(rankings)):
+        for rank, id_ in enumerate(ranking, start=1):
+            scores[id_] = scores.get(id_, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class HybridRetriever:
+    """Vector + BM25 retrieval over the same collections, fused with RRF"""
+
+    def __init__(
+        self,
+        vectors: VectorStore,
+        keywords: KeywordStore,
+        chunks: ChunkStore,
+        embed_fn: Callable[[str], Awaitable[List[float]]],
+        candidates: int = 50,
+        rrf_k: int = 60,
+        keyword_min_score_ratio: float = 0.25,
+        identifier_weight: float = 2.0
+    ):
+        self.vectors = vectors
+        self.keywords = keywords
+        self.chunks = chunks
+        self.embed_fn = embed_fn
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.keyword_min_score_ratio = keyword_min_score_ratio
+        self.identifier_weight = identifier_weight
+
+    async def _vector_search(self, collection: str, query: str, limit: int) -> List[dict]:
+        return await self.vectors.search(collection, await self.embed_fn(query), limit, with_payload=False)
+
+    async def search(self, collection: str, query: str, top_k: int = 5) -> List[dict]:
+        """
+        Fused results as [{"id", "score", "payload", "vectorRank", "keywordRank"}]
+
+        Ranks are 1-based positions in each retriever's candidate list, or
+        None when that retriever did not return the chunk.
+        """
+        limit = max(self.candidates, top_k)
+        vector_hits, keyword_hits = await asyncio.gather(
+            self._vector_search(collection, query, limit),
+            self.keywords.search(collection, query, limit, self.keyword_min_score_ratio)
+        )
+        vector_ids = [hit["id"] for hit in vector_hits]
+        keyword_ids = [hit["id"] for hit in keyword_hits]
+        has_identifier = any(any(c.isdigit() for c in term) for term in tokenize(query))
+        keyword_weight = self.identifier_weight if has_identifier else 1.0
+        fused = reciprocal_rank_fusion([vector_ids, keyword_ids], self.rrf_k, [1.0, keyword_weight])[:top_k]
+
+        # Texts of the hits that made the cut; chunks stored before the chunk
+        # store existed still have theirs in the vector payload
+        payloads = await self.chunks.get(collection, [id_ for id_, _ in fused])
+        missing = [id_ for id_, _ in fused if id_ not in payloads]
+        if missing:
+            payloads.update(await self.vectors.fetch(collection, missing))
+
+        vector_rank = {id_: rank for rank, id_ in enumerate(vector_ids, start=1)}
+        keyword_rank = {id_: rank for rank, id_ in enumerate(keyword_ids, start=1)}
+        return [
+            {
+                "id": id_,
+                "score": score,
+                "payload": payloads[id_],
+                "vectorRank": vector_rank.get(id_),
+                "keywordRank": keyword_rank.get(id_)
+            }
+            for id_, score in fused
+            # A chunk deleted between the keyword search and the fetch is skipped
+            if id_ in payloads
+        ]
+
+
+# Global hybrid retriever instance
+hybrid_retriever = HybridRetriever(
+    vector_store,
+    keyword_store,
+    chunk_store,
+    embed_fn=embedding_service.embed,
+    candidates=settings.HYBRID_CANDIDATES,
+    rrf_k=settings.HYBRID_RRF_K,
+    keyword_min_score_ratio=settings.HYBRID_KEYWORD_MIN_SCORE_RATIO,
+    identifier_weight=settings.HYBRID_IDENTIFIER_WEIGHT
+)
@@ -0,0 +1,241 @@
+"""
+Knowledge Base Ingestion Pipeline for AFO Platform
+Turns an extracted text file into embedded, stored chunks as a chain of
+stages joined by bounded queues:
+
+    read + chunk (thread) -> embed (batched) -> upsert
+
+Each stage only holds a few batches, so a slow embedding API or vector
+store applies backpressure all the way to the file reader and memory
+stays flat whatever the document size.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Awaitable, Callable, List, Optional
+from app.core.config import settings
+import asyncio
+import multiprocessing
+import re
+
+# Characters read per step; the partial word at the end waits for the next block
+READ_BLOCK_CHARS = 256 * 1024
+# A "word" longer than this (minified/binary-ish text) is tokenized as-is
+MAX_CARRY_CHARS = 64 * 1024
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n")
+
+
+class TokenChunker:
+    """
+    Incremental token-window chunker
+
+    feed() takes text in arbitrary blocks and returns the chunks completed
+    so far; windows are up to chunk_tokens long and overlap by
+    overlap_tokens. Tokens come from tiktoken (the embedding model's
+    encoding) unless an encoding with encode()/decode() is passed in.
+
+    A window ends at its last paragraph break when one falls in its second
+    half. Chunk boundaries then follow the content rather than a fixed
+    stride, so an edit early in a document only changes the chunks around
+    it and later chunks hash the same as before (see embedding_cache).
+    """
+
+    def __init__(
+        self,
+        chunk_tokens: int = 512,
+        overlap_tokens: int = 64,
+        encoding_name: str = "cl100k_base",
+        encoding: Any = None
+    ):
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError("overlap_tokens must be smaller than chunk_tokens")
+        if encoding is None:
+            import tiktoken
+            encoding = tiktoken.get_encoding(encoding_name)
+        self.encoding = encoding
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self._tokens: List[int] = []
+        # Token offsets in _tokens where a paragraph starts
+        self._breaks: List[int] = []
+        # Leading tokens of _tokens already sent in the previous chunk (the overlap)
+        self._emitted = 0
+        self._carry = ""
+
+    def _window_end(self) -> int:
+        end = self.chunk_tokens
+        for offset in reversed(self._breaks):
+            if offset <= end:
+                if offset > end // 2:
+                    end = offset
+                break
+        return end
+
+    def _drain(self, final: bool = False) -> List[str]:
+        chunks = []
+        # At the end, leftover tokens that only repeat the last overlap are not a new chunk
+        while len(self._tokens) >= self.chunk_tokens or (final and len(self._tokens) > self._emitted):
+            end = self._window_end()
+            text = self.encoding.decode(self._tokens[:end]).strip()
+            if text:
+                chunks.append(text)
+            if final and len(self._tokens) <= end:
+                break
+            step = max(end - self.overlap_tokens, 1)
+            self._tokens = self._tokens[step:]
+            self._breaks = [offset - step for offset in self._breaks if offset > step]
+            self._emitted = end - step
+        if final:
+            self._tokens = []
+            self._breaks = []
+            self._emitted = 0
+        return chunks
+
+    def _encode(self, text: str):
+        # Paragraphs are encoded separately so their starts are known token offsets
+        start = 0
+        for match in _PARAGRAPH_BREAK.finditer(text):
+            self._tokens.extend(self.encoding.encode(text[start:match.end()], disallowed_special=()))
+            self._breaks.append(len(self._tokens))
+            start = match.end()
+        if start < len(text):
+            self._tokens.extend(self.encoding.encode(text[start:], disallowed_special=()))
+
+    def feed(self, block: str) -> List[str]:
+        text = self._carry + block
+        # Cut after a paragraph break when there is one so breaks never straddle blocks
+        match = None
+        for match in _PARAGRAPH_BREAK.finditer(text):
+            pass
+        cut = match.end() if match is not None else max(text.rfind(" "), text.rfind("\n"))
+        if cut <= 0:
+            if len(text) < MAX_CARRY_CHARS:
+                self._carry = text
+                return []
+            cut = len(text)
+        self._carry = text[cut:]
+        self._encode(text[:cut])
+        return self._drain()
+
+    def finish(self) -> List[str]:
+        if self._carry:
+            self._encode(self._carry)
+            self._carry = ""
+        return self._drain(final=True)
+
+
+class IngestionPipeline:
+    """
+    Bounded-queue pipeline from a UTF-8 text file to stored chunks
+
+    embed_fn(texts) -> vectors and upsert_fn(first_seq, texts, vectors) are
+    supplied by the caller; on_progress(chunks_stored) runs after every upsert.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], Awaitable[List[List[float]]]],
+        upsert_fn: Callable[[int, List[str], List[List[float]]], Awaitable[None]],
+        chunker: TokenChunker,
+        embed_batch_size: int = 64,
+        queue_size: int = 4,
+        embed_concurrency: int = 2,
+        on_progress: Optional[Callable[[int], Awaitable[None]]] = None
+    ):
+        self.embed_fn = embed_fn
+        self.upsert_fn = upsert_fn
+        self.chunker = chunker
+        self.embed_batch_size = embed_batch_size
+        self.queue_size = queue_size
+        self.embed_concurrency = embed_concurrency
+        self.on_progress = on_progress
+        self.chunks_stored = 0
+
+    async def run(self, text_path: str) -> int:
+        """Ingest text_path; returns the number of chunks stored"""
+        to_embed: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        to_store: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+
+        tasks = [asyncio.create_task(self._read_and_chunk(text_path, to_embed))]
+        tasks += [
+            asyncio.create_task(self._embed(to_embed, to_store))
+            for _ in range(self.embed_concurrency)
+        ]
+        tasks.append(asyncio.create_task(self._store(to_store)))
+
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # One failed stage stops the rest instead of leaving them blocked on a queue
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return self.chunks_stored
+
+    async def _read_and_chunk(self, text_path: str, to_embed: asyncio.Queue):
+        seq = 0
+        batch: List[str] = []
+        with open(text_path, "r", encoding="utf-8", errors="replace") as f:
+            while True:
+                # File reads and tokenization stay off the event loop
+                block = await asyncio.to_thread(f.read, READ_BLOCK_CHARS)
+                if block:
+                    chunks = await asyncio.to_thread(self.chunker.feed, block)
+                else:
+                    chunks = await asyncio.to_thread(self.chunker.finish)
+                for chunk in chunks:
+                    batch.append(chunk)
+                    if len(batch) >= self.embed_batch_size:
+                        await to_embed.put((seq, batch))
+                        seq += len(batch)
+                        batch = []
+                if not block:
+                    break
+        if batch:
+            await to_embed.put((seq, batch))
+        for _ in range(self.embed_concurrency):
+            await to_embed.put(None)
+
+    async def _embed(self, to_embed: asyncio.Queue, to_store: asyncio.Queue):
+        while True:
+            item = await to_embed.get()
+            if item is None:
+                await to_store.put(None)
+                return
+            seq, texts = item
+            vectors = await self.embed_fn(texts)
+            await to_store.put((seq, texts, vectors))
+
+    async def _store(self, to_store: asyncio.Queue):
+        finished_embedders = 0
+        while finished_embedders < self.embed_concurrency:
+            item = await to_store.get()
+            if item is None:
+                finished_embedders += 1
+                continue
+            seq, texts, vectors = item
+            await self.upsert_fn(seq, texts, vectors)
+            self.chunks_stored += len(texts)
+            if self.on_progress is not None:
+                await self.on_progress(self.chunks_stored)
+
+
+_extract_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_extract_pool() -> ProcessPoolExecutor:
+    """Process pool for document parsing (spawned, so workers don't inherit the event loop)"""
+    global _extract_pool
+    if _extract_pool is None:
+        _extract_pool = ProcessPoolExecutor(
+            max_workers=settings.KNOWLEDGE_EXTRACT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _extract_pool
+
+
+def shutdown_extract_pool():
+    global _extract_pool
+    if _extract_pool is not None:
+        _extract_pool.shutdown(wait=False, cancel_futures=True)
+        _extract_pool = None
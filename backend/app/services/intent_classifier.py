@@ -0,0 +1,239 @@
+"""
+Local Intent Classifier for AFO Platform
+Fast first stage in front of the LLM intent analysis:
+regex/gazetteer entity extraction + hashed n-gram logistic regression
+"""
+
+from typing import Dict, List, Optional, Tuple
+import re
+import zlib
+import numpy as np
+from app.core.config import settings
+
+
+INTENTS = ["information_request", "meeting_scheduling", "support", "other"]
+
+# Seed training set bundled with the service - small on purpose,
+# the classifier only has to cover the common phrasings confidently
+SEED_EXAMPLES: List[Tuple[str, str]] = [
+    ("what does your product do", "information_request"),
+    ("how much does it cost", "information_request"),
+    ("what are your pricing plans", "information_request"),
+    ("can you tell me more about your services", "information_request"),
+    ("do you integrate with salesforce", "information_request"),
+    ("what features are included in the pro plan", "information_request"),
+    ("is there a free trial", "information_request"),
+    ("where are you located", "information_request"),
+    ("which languages do you support", "information_request"),
+    ("send me a brochure", "information_request"),
+    ("i want to learn more about the platform", "information_request"),
+    ("how does the onboarding work", "information_request"),
+    ("what is the difference between the plans", "information_request"),
+    ("do you offer discounts for startups", "information_request"),
+    ("tell me about your company", "information_request"),
+    ("can i book a demo", "meeting_scheduling"),
+    ("i'd like to schedule a call", "meeting_scheduling"),
+    ("let's set up a meeting next week", "meeting_scheduling"),
+    ("are you available tomorrow at 3pm", "meeting_scheduling"),
+    ("book a meeting with sales", "meeting_scheduling"),
+    ("can we talk on monday", "meeting_scheduling"),
+    ("schedule a demo for my team", "meeting_scheduling"),
+    ("i want to speak with someone from sales", "meeting_scheduling"),
+    ("what times are free on thursday", "meeting_scheduling"),
+    ("please reschedule my appointment", "meeting_scheduling"),
+    ("set up a call with an account executive", "meeting_scheduling"),
+    ("can i get a slot this friday afternoon", "meeting_scheduling"),
+    ("send me a calendar invite", "meeting_scheduling"),
+    ("let's hop on a quick call", "meeting_scheduling"),
+    ("i need to cancel my meeting", "meeting_scheduling"),
+    ("my account is not working", "support"),
+    ("i can't log in", "support"),
+    ("i forgot my password", "support"),
+    ("the app keeps crashing", "support"),
+    ("i got an error when uploading a file", "support"),
+    ("my payment failed", "support"),
+    ("the integration stopped syncing", "support"),
+    ("how do i reset my api key", "support"),
+    ("something is broken on the dashboard", "support"),
+    ("i was charged twice", "support"),
+    ("the agent is not responding", "support"),
+    ("i need help with a bug", "support"),
+    ("error code 500 when i save", "support"),
+    ("webhook keeps failing", "support"),
+    ("please fix my account", "support"),
+    ("hello", "other"),
+    ("hi there", "other"),
+    ("thanks", "other"),
+    ("thank you so much", "other"),
+    ("ok", "other"),
+    ("bye", "other"),
+    ("good morning", "other"),
+    ("lol", "other"),
+    ("nice weather today", "other"),
+    ("are you a robot", "other"),
+    ("never mind", "other"),
+    ("sounds good", "other"),
+    ("who are you", "other"),
+    ("cool", "other"),
+    ("have a nice day", "other"),
+]
+
+EMAIL_PATTERN = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
+PHONE_PATTERN = re.compile(r"(?<!\w)(?:\+?\d{1,3}[\s.-]?)?(?:\(\d{2,4}\)|\d{2,4})[\s.-]?\d{3,4}[\s.-]?\d{3,4}(?!\w)")
+COMPANY_SUFFIX_PATTERN = re.compile(
+    r"\b((?:[A-Z][\w&'-]*\s){0,3}[A-Z][\w&'-]*)\s+(Inc|LLC|Ltd|GmbH|Corp|Corporation|Co|Company|Group|Labs|AG|SA|BV)\b\.?"
+)
+COMPANY_CONTEXT_PATTERN = re.compile(
+    r"\b(?:I work (?:at|for)|I'm (?:at|with|from)|I am (?:at|with|from)|from|at|with)\s+((?:[A-Z][\w&'-]*)(?:\s[A-Z][\w&'-]*){0,3})"
+)
+# Dates (2024-03-15, 20240315, 15.03.2024) look like phone numbers to PHONE_PATTERN
+DATE_PATTERN = re.compile(
+    r"(?<!\d)(?:(?:19|20)\d{2}[./-]?(?:0[1-9]|1[0-2])[./-]?(?:0[1-9]|[12]\d|3[01])"
+    r"|(?:0?[1-9]|[12]\d|3[01])[./-](?:0?[1-9]|1[0-2])[./-](?:19|20)\d{2})(?!\d)"
+)
+NAME_PATTERN = re.compile(r"\b(?i:my name is|i'm|i am|this is)\s+([A-Z][a-z]+(?:\s[A-Z][a-z]+)?)")
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+# Capitalized words that are never a company name on their own ("talk with Sales", "I'm with the CFO")
+COMPANY_STOPWORDS = {
+    "I", "The", "A", "An", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday",
+    "Sales", "Support", "Marketing", "Engineering", "Finance", "Billing", "Accounting", "Legal", "HR",
+    "IT", "Ops", "Operations", "Product", "Procurement", "Security", "Customer", "Success", "Team",
+    "Department", "Someone", "CEO", "CTO", "CFO", "COO", "CIO", "VP", "Head", "Manager", "Director",
+    "Founder", "Account", "Executive", "Representative", "Rep", "Agent", "Admin"
+}
+
+
+class IntentClassifier:
+    """
+    Hashed n-gram logistic regression with NumPy inference
+    Handles the common cases locally; callers fall back to the LLM
+    when confidence is below the threshold
+    """
+
+    def __init__(
+        self,
+        n_features: int = 2 ** 16,
+        confidence_threshold: float = 0.7,
+        company_gazetteer: Optional[List[str]] = None
+    ):
+        self.n_features = n_features
+        self.confidence_threshold = confidence_threshold
+        self.labels = list(INTENTS)
+        self.weights = np.zeros((n_features, len(self.labels)), dtype=np.float32)
+        self.bias = np.zeros(len(self.labels), dtype=np.float32)
+        self.company_gazetteer = {name.lower(): name for name in (company_gazetteer or [])}
+
+    def _features(self, text: str) -> np.ndarray:
+        """Hash word unigrams/bigrams and char trigrams into feature indices"""
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        for token in tokens:
+            padded = f"#{token}#"
+            grams.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        if not grams:
+            return np.zeros(0, dtype=np.int64)
+        # crc32 is stable across processes, unlike the salted built-in hash()
+        return np.fromiter(
+            (zlib.crc32(g.encode()) % self.n_features for g in grams),
+            dtype=np.int64,
+            count=len(grams)
+        )
+
+    def fit(self, examples: List[Tuple[str, str]], epochs: int = 30, learning_rate: float = 0.5):
+        """Train with plain SGD on softmax cross-entropy"""
+        label_index = {label: i for i, label in enumerate(self.labels)}
+        data = [(self._features(text), label_index[label]) for text, label in examples]
+        rng = np.random.default_rng(0)
+
+        for _ in range(epochs):
+            for i in rng.permutation(len(data)):
+                indices, target = data[i]
+                probs = self._softmax(self.weights[indices].sum(axis=0) + self.bias)
+                grad = probs
+                grad[target] -= 1.0
+                scale = learning_rate / max(len(indices), 1) ** 0.5
+                np.subtract.at(self.weights, indices, scale * grad)
+                self.bias -= learning_rate * 0.1 * grad
+        return self
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        exp = np.exp(logits - logits.max())
+        return exp / exp.sum()
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """Return (intent, confidence)"""
+        indices = self._features(text)
+        probs = self._softmax(self.weights[indices].sum(axis=0) + self.bias)
+        best = int(probs.argmax())
+        return self.labels[best], float(probs[best])
+
+    def extract_entities(self, text: str) -> Dict[str, str]:
+        """Extract name, email, phone and company with regexes and the gazetteer"""
+        entities = {}
+
+        email = EMAIL_PATTERN.search(text)
+        if email:
+            entities["email"] = email.group(0)
+
+        # Strip emails and dates first so their digits are not mistaken for phone numbers
+        phone = PHONE_PATTERN.search(DATE_PATTERN.sub(" ", EMAIL_PATTERN.sub(" ", text)))
+        if phone and sum(c.isdigit() for c in phone.group(0)) >= 7:
+            entities["phone"] = phone.group(0).strip()
+
+        name = NAME_PATTERN.search(text)
+        if name:
+            entities["name"] = name.group(1)
+
+        company = self._extract_company(text, entities.get("name"))
+        if company:
+            entities["company"] = company
+
+        return entities
+
+    def _extract_company(self, text: str, name: Optional[str]) -> Optional[str]:
+        lowered = text.lower()
+        for key, canonical in self.company_gazetteer.items():
+            if re.search(rf"\b{re.escape(key)}\b", lowered):
+                return canonical
+
+        match = COMPANY_SUFFIX_PATTERN.search(text)
+        if match:
+            return match.group(0).rstrip(".")
+
+        match = COMPANY_CONTEXT_PATTERN.search(text)
+        if match:
+            candidate = match.group(1)
+            if not set(candidate.split()) <= COMPANY_STOPWORDS and candidate != name:
+                return candidate
+        return None
+
+    def classify(self, text: str) -> dict:
+        """
+        Classify a message locally
+
+        Returns:
+            intent, entities, confidence and whether the result is confident
+            enough to skip the LLM fallback
+        """
+        intent, confidence = self.predict(text)
+        entities = self.extract_entities(text)
+        # The seed "other" phrases are small talk; a message that also carries
+        # contact details (an introduction, a lead) is beyond them - ask the LLM
+        confident = confidence >= self.confidence_threshold and not (
+            intent == "other" and entities.keys() & {"company", "email", "phone"}
+        )
+        return {
+            "intent": intent,
+            "entities": entities,
+            "confidence": confidence,
+            "confident": confident,
+            "source": "local"
+        }
+
+
+# Global instance, trained once at import on the bundled seed set
+intent_classifier = IntentClassifier(
+    confidence_threshold=settings.INTENT_CONFIDENCE_THRESHOLD
+).fit(SEED_EXAMPLES)
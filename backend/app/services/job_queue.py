@@ -0,0 +1,298 @@
+"""
+Job Queue for AFO Platform
+Background jobs (document ingestion) run by a bounded pool of worker
+coroutines instead of one unbounded task per request
+
+- Priority: "high" jobs go before "normal" before "low"
+- Fairness: within a priority, tenants take turns (round-robin), and one
+  tenant runs at most max_running_per_tenant jobs at a time, so a bulk
+  upload doesn't hold every worker while other tenants wait
+- Progress: jobs report progress as they go; status changes and
+  (throttled) progress are published to the admin stream (keyed by job
+  id) and to the submitting user's own WebSocket clients (/ws/user) as
+  {"type": "job", ...} - never to the agent's public chat sockets
+
+Jobs are in-process; finished ones are kept (up to history) for lookups.
+"""
+
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set
+from app.core.config import settings
+from app.services.admin_stream import admin_stream
+from app.services.websocket_manager import ws_manager
+import asyncio
+import time
+import uuid
+
+PRIORITIES = ("high", "normal", "low")
+FINISHED = ("done", "failed", "cancelled")
+
+
+class QueueFull(Exception):
+    """More jobs are queued than the queue accepts"""
+
+
+class Job:
+    def __init__(
+        self,
+        kind: str,
+        run: Callable[["Job"], Awaitable[None]],
+        agent_id: str,
+        tenant_id: str,
+        priority: str,
+        on_discard: Optional[Callable[[], None]] = None,
+        user_id: Optional[str] = None
+    ):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.run = run
+        self.agent_id = agent_id
+        self.tenant_id = tenant_id
+        # Whose /ws/user sockets get the job's progress (None: admins only)
+        self.user_id = user_id
+        self.priority = priority
+        self.on_discard = on_discard
+        self.status = "queued"
+        self.progress: dict = {}
+        self.error: Optional[str] = None
+        self.queued_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+        self._finished = asyncio.Event()
+        self._listener: Optional[Callable[["Job", bool], None]] = None
+
+    def report(self, **progress):
+        """Update progress counters (e.g. stage, pagesParsed, chunksEmbedded)"""
+        self.progress.update(progress)
+        if self._listener is not None:
+            self._listener(self, False)
+
+    async def wait(self):
+        """Until the job has finished, however it finished"""
+        await self._finished.wait()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "agentId": self.agent_id,
+            "tenantId": self.tenant_id,
+            "priority": self.priority,
+            "status": self.status,
+            "progress": dict(self.progress),
+            "error": self.error,
+            "queuedAt": self.queued_at.isoformat(),
+            "startedAt": self.started_at.isoformat() if self.started_at else None,
+            "finishedAt": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class JobQueue:
+    def __init__(
+        self,
+        name: str,
+        workers: int = 2,
+        max_queued: int = 1000,
+        max_running_per_tenant: int = 1,
+        progress_interval_ms: float = 500,
+        history: int = 1000
+    ):
+        self.name = name
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_running_per_tenant = max_running_per_tenant
+        self.progress_interval = progress_interval_ms / 1000
+        self.history = history
+        # priority -> tenant -> queued jobs; tenants rotate to the back after their turn
+        self._queues: Dict[str, "OrderedDict[str, Deque[Job]]"] = {p: OrderedDict() for p in PRIORITIES}
+        self._running: Dict[str, int] = {}
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queued = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+        self._last_progress: Dict[str, float] = {}
+        # In-flight progress sends, referenced so they aren't garbage-collected mid-run
+        self._sends: Set[asyncio.Task] = set()
+        self.stats = {"submitted": 0, "done": 0, "failed": 0, "cancelled": 0, "rejected": 0}
+
+    def _ensure_workers(self):
+        if self._workers:
+            return
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(
+        self,
+        kind: str,
+        run: Callable[[Job], Awaitable[None]],
+        agent_id: str,
+        tenant_id: Optional[str] = None,
+        priority: str = "normal",
+        on_discard: Optional[Callable[[], None]] = None
+    ) -> Job:
+        """
+        Queue run(job); returns the job at once
+
+        on_discard runs instead if the job is cancelled before it starts.
+        The submitting tenant (a user id) gets progress on its /ws/user
+        sockets. Raises QueueFull when max_queued jobs are waiting.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of: {', '.join(PRIORITIES)}")
+        if self.full():
+            self.stats["rejected"] += 1
+            raise QueueFull(f"{self._queued} {self.name} jobs already queued")
+        self._ensure_workers()
+        job = Job(kind, run, agent_id, tenant_id or agent_id, priority, on_discard, user_id=tenant_id)
+        job._listener = self._on_update
+        self.jobs[job.id] = job
+        self._queues[priority].setdefault(job.tenant_id, deque()).append(job)
+        self._queued += 1
+        self.stats["submitted"] += 1
+        self._publish(job)
+        self._wakeup.set()
+        return job
+
+    def full(self) -> bool:
+        return self._queued >= self.max_queued
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def position(self, job: Job) -> Optional[int]:
+        """Jobs picked before a queued one, assuming no tenant is at its running cap"""
+        if job.status != "queued":
+            return None
+        ahead = 0
+        for priority in PRIORITIES:
+            tenants = self._queues[priority]
+            if priority != job.priority:
+                ahead += sum(len(jobs) for jobs in tenants.values())
+                continue
+            # Each round every tenant gets a turn, starting from the front of the rotation
+            rounds = tenants[job.tenant_id].index(job)
+            order = list(tenants)
+            turn = order.index(job.tenant_id)
+            ahead += rounds
+            for i, tenant in enumerate(order):
+                if tenant != job.tenant_id:
+                    ahead += min(len(tenants[tenant]), rounds + (i < turn))
+            break
+        return ahead
+
+    async def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job; waits for a running one to stop"""
+        job = self.jobs.get(job_id)
+        if job is None or job.status in FINISHED:
+            return False
+        if job.status == "queued":
+            tenants = self._queues[job.priority]
+            tenants[job.tenant_id].remove(job)
+            if not tenants[job.tenant_id]:
+                del tenants[job.tenant_id]
+            self._queued -= 1
+            if job.on_discard is not None:
+                job.on_discard()
+            self._finish(job, "cancelled")
+            return True
+        job.task.cancel()
+        await job.wait()
+        return True
+
+    def _next(self) -> Optional[Job]:
+        for priority in PRIORITIES:
+            tenants = self._queues[priority]
+            for tenant in list(tenants):
+                if self._running.get(tenant, 0) >= self.max_running_per_tenant:
+                    continue
+                queue = tenants.pop(tenant)
+                job = queue.popleft()
+                if queue:
+                    # Back of the rotation
+                    tenants[tenant] = queue
+                self._queued -= 1
+                return job
+        return None
+
+    async def _worker(self):
+        while True:
+            job = self._next()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            self._running[job.tenant_id] = self._running.get(job.tenant_id, 0) + 1
+            job.status = "running"
+            job.started_at = datetime.utcnow()
+            self._publish(job)
+            job.task = asyncio.create_task(job.run(job))
+            try:
+                await job.task
+                self._finish(job, "done")
+            except asyncio.CancelledError:
+                if not job.task.cancelled():
+                    raise  # the worker itself is being cancelled
+                self._finish(job, "cancelled")
+            except Exception as e:
+                print(f"{self.name} job {job.id} failed: {e}")
+                job.error = str(e)
+                self._finish(job, "failed")
+            finally:
+                self._running[job.tenant_id] -= 1
+                if not self._running[job.tenant_id]:
+                    del self._running[job.tenant_id]
+                # A tenant at its cap may have become eligible
+                self._wakeup.set()
+
+    def _finish(self, job: Job, status: str):
+        job.status = status
+        job.finished_at = datetime.utcnow()
+        job._finished.set()
+        self.stats[status] += 1
+        self._last_progress.pop(job.id, None)
+        self._publish(job)
+        # Keep recent finished jobs for lookups
+        finished = [j for j in self.jobs.values() if j.status in FINISHED]
+        for old in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[old.id]
+            admin_stream.publish(self.name, None, key=old.id, agent_id=old.agent_id)
+
+    def _on_update(self, job: Job, force: bool):
+        now = time.monotonic()
+        if not force and now - self._last_progress.get(job.id, 0.0) < self.progress_interval:
+            return
+        self._last_progress[job.id] = now
+        self._publish(job)
+
+    def _publish(self, job: Job):
+        data = job.to_dict()
+        admin_stream.publish(self.name, data, key=job.id, agent_id=job.agent_id)
+        if job.user_id is not None:
+            send = asyncio.create_task(ws_manager.send_to_user(job.user_id, {"type": "job", "job": data}))
+            self._sends.add(send)
+            send.add_done_callback(self._sends.discard)
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "queued": self._queued,
+            "running": sum(self._running.values()),
+            "workers": self.workers,
+            "queued_by_priority": {
+                priority: sum(len(jobs) for jobs in tenants.values())
+                for priority, tenants in self._queues.items()
+            }
+        }
+
+
+# Global ingestion queue instance
+ingestion_queue = JobQueue(
+    "knowledge_jobs",
+    workers=settings.KNOWLEDGE_JOB_WORKERS,
+    max_queued=settings.KNOWLEDGE_JOB_MAX_QUEUED,
+    max_running_per_tenant=settings.KNOWLEDGE_JOB_MAX_RUNNING_PER_TENANT,
+    progress_interval_ms=settings.KNOWLEDGE_JOB_PROGRESS_INTERVAL_MS,
+    history=settings.KNOWLEDGE_JOB_HISTORY
+)
@@ -0,0 +1,246 @@
+"""
+Keyword Index for AFO Platform
+BM25 over knowledge base chunks, kept next to the vector store (one index
+per collection) so exact identifiers such as SKUs and error codes are
+found even when their embeddings are not close to the query's
+
+The tokenizer keeps compound identifiers ("ax-4410-b", "0x80070005") as
+one term and also indexes their parts, so "AX-4410-B" matches both the
+full code and a query for "4410". Each index is an in-memory inverted
+index rebuilt from an append-only postings log when it is first used.
+"""
+
+from collections import Counter
+from typing import Dict, List, Optional
+from app.core.config import settings
+from app.services.collection_manager import CollectionManager, collection_manager
+import asyncio
+import heapq
+import math
+import msgpack
+import os
+import re
+import struct
+import threading
+
+_LENGTH = struct.Struct("<I")
+# Approximate Python object sizes, for memory estimates: a posting's dict
+# entry and int, a document's entry and term tuple, a term's key and dict
+_POSTING_BYTES = 80
+_DOC_BYTES = 200
+_TERM_BYTES = 300
+_TERM = re.compile(r"[0-9a-z]+(?:[-_./:][0-9a-z]+)*")
+_PARTS = re.compile(r"[-_./:]")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how i in is it its my of on or "
+    "that the this to was what when where which why with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms; compound identifiers yield themselves and their parts"""
+    terms = []
+    for term in _TERM.findall(text.lower()):
+        if term in _STOPWORDS:
+            continue
+        terms.append(term)
+        if not term.isalnum():
+            terms.extend(part for part in _PARTS.split(term) if len(part) > 1 and part not in _STOPWORDS)
+    return terms
+
+
+class KeywordIndex:
+    """
+    BM25 inverted index for one collection
+
+    postings.log  length-prefixed msgpack [id, {term: tf}]; None instead
+                  of the term counts is a delete of id
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        # term -> {doc id: term frequency}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        # doc id -> (terms, length); the terms are what a delete has to unlink
+        self.docs: Dict[str, tuple] = {}
+        self.total_length = 0
+        # (doc, term) pairs, for memory estimates
+        self.posting_count = 0
+        self._load()
+        self._log = open(os.path.join(path, "postings.log"), "ab")
+
+    def _load(self):
+        log_path = os.path.join(self.path, "postings.log")
+        if not os.path.exists(log_path):
+            return
+        position = 0
+        with open(log_path, "rb") as f:
+            while True:
+                header = f.read(_LENGTH.size)
+                if len(header) < _LENGTH.size:
+                    break
+                (length,) = _LENGTH.unpack(header)
+                body = f.read(length)
+                if len(body) < length:
+                    break  # torn write at the tail
+                id_, counts = msgpack.unpackb(body)
+                self._remove(id_)
+                if counts is not None:
+                    self._insert(id_, counts)
+                position += _LENGTH.size + length
+        if position < os.path.getsize(log_path):
+            with open(log_path, "r+b") as f:
+                f.truncate(position)
+
+    def _insert(self, id_: str, counts: Dict[str, int]):
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[id_] = tf
+        length = sum(counts.values())
+        self.docs[id_] = (tuple(counts), length)
+        self.total_length += length
+        self.posting_count += len(counts)
+
+    def _remove(self, id_: str) -> bool:
+        doc = self.docs.pop(id_, None)
+        if doc is None:
+            return False
+        terms, length = doc
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(id_, None)
+                if not posting:
+                    del self.postings[term]
+        self.total_length -= length
+        self.posting_count -= len(terms)
+        return True
+
+    def _append(self, id_: str, counts: Optional[Dict[str, int]]):
+        body = msgpack.packb([id_, counts])
+        self._log.write(_LENGTH.pack(len(body)) + body)
+
+    def add(self, ids: List[str], texts: List[str]):
+        """Index (or re-index) chunks by id"""
+        counted = [(id_, dict(Counter(tokenize(text)))) for id_, text in zip(ids, texts)]
+        with self._lock:
+            for id_, counts in counted:
+                self._remove(id_)
+                self._insert(id_, counts)
+                self._append(id_, counts)
+            self._log.flush()
+
+    def delete(self, ids: List[str]) -> int:
+        deleted = 0
+        with self._lock:
+            for id_ in ids:
+                if self._remove(id_):
+                    self._append(id_, None)
+                    deleted += 1
+            self._log.flush()
+        return deleted
+
+    def search(self, query: str, top_k: int = 10, min_score_ratio: float = 0.0) -> List[dict]:
+        """
+        Best-scoring chunks as [{"id", "score"}], best first
+
+        Hits scoring below min_score_ratio of the best one are dropped, so a
+        query whose rare term matches a handful of chunks doesn't also return
+        every chunk that shares one of its common words.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self.docs)
+            if n == 0 or not terms:
+                return []
+            average_length = self.total_length / n
+            scores: Dict[str, float] = {}
+            for term in terms:
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                df = len(posting)
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                k1, b, docs = self.k1, self.b, self.docs
+                for id_, tf in posting.items():
+                    norm = k1 * (1 - b + b * docs[id_][1] / average_length)
+                    scores[id_] = scores.get(id_, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        if not best:
+            return []
+        cutoff = best[0][1] * min_score_ratio
+        return [{"id": id_, "score": score} for id_, score in best if score >= cutoff]
+
+    # Residency (see CollectionManager)
+
+    def memory_bytes(self) -> int:
+        """Estimated size of the in-memory index"""
+        return (
+            self.posting_count * _POSTING_BYTES
+            + len(self.docs) * _DOC_BYTES
+            + len(self.postings) * _TERM_BYTES
+        )
+
+    def evictable(self) -> bool:
+        return True
+
+    def close(self):
+        with self._lock:
+            self._log.close()
+
+    def get_stats(self) -> dict:
+        return {"documents": len(self.docs), "terms": len(self.postings)}
+
+
+class KeywordStore:
+    """
+    One KeywordIndex directory per vector store collection
+
+    Indexes are loaded on first use and dropped again when the manager
+    needs room for others (a private one unless a shared one is passed).
+    """
+
+    def __init__(self, data_dir: str, manager: Optional[CollectionManager] = None):
+        self.data_dir = data_dir
+        self.manager = manager or CollectionManager()
+
+    def _opener(self, collection: str):
+        def open_index(create: bool) -> Optional[KeywordIndex]:
+            path = os.path.join(self.data_dir, collection)
+            if not create and not os.path.isdir(path):
+                return None
+            return KeywordIndex(path)
+
+        return open_index
+
+    async def _run(self, collection: str, operation, default, create: bool = False):
+        def run():
+            with self.manager.use(("keywords", collection), self._opener(collection), create) as index:
+                return default if index is None else operation(index)
+
+        return await asyncio.to_thread(run)
+
+    async def add(self, collection: str, ids: List[str], texts: List[str]):
+        await self._run(collection, lambda index: index.add(ids, texts), None, create=True)
+
+    async def search(self, collection: str, query: str, top_k: int = 10, min_score_ratio: float = 0.0) -> List[dict]:
+        return await self._run(collection, lambda index: index.search(query, top_k, min_score_ratio), [])
+
+    async def delete(self, collection: str, ids: List[str]) -> int:
+        return await self._run(collection, lambda index: index.delete(ids), 0)
+
+    async def prewarm(self, collection: str) -> bool:
+        key = ("keywords", collection)
+        if self.manager.is_resident(key):
+            return True
+        return await asyncio.to_thread(self.manager.prewarm, key, self._opener(collection))
+
+    def get_stats(self) -> dict:
+        return {name: index.get_stats() for name, index in self.manager.resident("keywords").items()}
+
+
+# Global keyword store instance
+keyword_store = KeywordStore(settings.KEYWORD_INDEX_DIR, manager=collection_manager)
@@ -1,75 +1,460 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import UploadFile
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional
 import uuid
 from datetime import datetime
 import aiofiles
+import asyncio
 import os
+from urllib.parse import urlsplit
+from app.core.config import settings
+from app.services.embedding_cache import content_hash, embedding_cache
+from app.services.embedding_service import embedding_service
+from app.services.hybrid_search import hybrid_retriever
+from app.services.ingestion_pipeline import IngestionPipeline, TokenChunker, get_extract_pool
+from app.services.chunk_store import chunk_store
+from app.services.crawler import web_crawler
+from app.services.job_queue import FINISHED, PRIORITIES, Job, QueueFull, ingestion_queue
+from app.services.keyword_index import keyword_store
+from app.services.reranker import reranker
+from app.services.text_extraction import detect_type, extract_to_file
+from app.services.vector_store import collection_name, vector_store
+
+# Knowledge base entries by id (in-process until the KnowledgeBase table exists)
+knowledge_entries: Dict[str, dict] = {}
+# Latest ingestion job per knowledge base entry
+_ingestion_jobs: Dict[str, Job] = {}
+# Latest crawl job per (agent, seed URL)
+_crawl_jobs: Dict[tuple, Job] = {}
+# Crawled pages per agent: url -> ETag / Last-Modified / content hash / links, for re-crawls
+_crawled_pages: Dict[str, Dict[str, dict]] = {}
+# Latest chunk store compaction job per collection
+_compaction_jobs: Dict[str, Job] = {}
+# Chunk ids ("{kb_id}:{content hash}") stored for each entry
+_chunk_ids: Dict[str, set] = {}
+# Bumped whenever a collection's chunks change, so cached retrievals can tell they're stale
+_collection_versions: Dict[str, int] = {}
+
+
+def knowledge_version(collection: str) -> int:
+    return _collection_versions.get(collection, 0)
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
 
 class KnowledgeService:
     def __init__(self, db: AsyncSession):
         self.db = db
     
-    async def upload_document(self, agent_id: str, file: UploadFile) -> dict:
-        """Upload and process a document for the knowledge base"""
-        kb_id = str(uuid.uuid4())
+    async def upload_document(
+        self,
+        agent_id: str,
+        file: UploadFile,
+        priority: str = "normal",
+        tenant_id: Optional[str] = None
+    ) -> dict:
+        """
+        Upload a document for the knowledge base and queue its ingestion
         
-        # Save file temporarily
-        temp_path = f"/tmp/{kb_id}_{file.filename}"
-        async with aiofiles.open(temp_path, 'wb') as out_file:
-            content = await file.read()
-            await out_file.write(content)
+        The upload is streamed to disk and the entry returned with its jobId
+        right away; extraction, chunking, embedding and storage run as a
+        background job (see job_queue) while the entry's status and job
+        progress track it. Uploading a file with the same name again updates
+        that entry: only new or changed chunks are embedded and stored, and
+        chunks the new version no longer has are deleted
         
-        # Create knowledge base entry
-        kb_entry = {
-            "id": kb_id,
-            "agentId": agent_id,
-            "name": file.filename,
-            "fileName": file.filename,
-            "fileType": file.content_type or "application/octet-stream",
-            "s3Key": f"knowledge/{agent_id}/{kb_id}",
-            "milvusCollection": f"agent_{agent_id}",
-            "status": "processing",
-            "documentCount": 0,
-            "chunkCount": 0,
-            "storageBytes": len(content),
-            "createdAt": datetime.utcnow()
-        }
+        Raises QueueFull when the ingestion queue is full and BlockedAddress
+        (a ValueError) when the URL's host isn't a public address
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of: {', '.join(PRIORITIES)}")
+        # Refuse before reading the body rather than after
+        if ingestion_queue.full():
+            raise QueueFull("Too many documents waiting to be ingested")
+        file_name = os.path.basename(file.filename or "document")
         
-        # TODO: 
-        # 1. Upload to S3
-        # 2. Process document (extract text, chunk)
-        # 3. Generate embeddings
-        # 4. Store in Milvus
-        # 5. Update status to "ready"
+        # Stream the upload to disk without holding it in memory
+        os.makedirs(settings.KNOWLEDGE_UPLOAD_DIR, exist_ok=True)
+        source_path = os.path.join(settings.KNOWLEDGE_UPLOAD_DIR, f"{uuid.uuid4().hex}_{file_name}")
+        size = 0
+        async with aiofiles.open(source_path, 'wb') as out_file:
+            while True:
+                block = await file.read(settings.KNOWLEDGE_UPLOAD_CHUNK_BYTES)
+                if not block:
+                    break
+                await out_file.write(block)
+                size += len(block)
         
-        # Clean up temp file
+        kb_entry = self._find_entry(agent_id, file_name)
+        if kb_entry is not None and kb_entry["id"] in _ingestion_jobs:
+            # A newer upload supersedes one still queued or being ingested; a running
+            # one records what it stored before stopping, which this version diffs against
+            await ingestion_queue.cancel(_ingestion_jobs.pop(kb_entry["id"]).id)
+        kb_entry = self._save_entry(kb_entry, agent_id, file_name, file.content_type, size)
+        kb_id = kb_entry["id"]
+        
+        # TODO: Upload to S3
         try:
-            os.remove(temp_path)
-        except:
-            pass
+            job = ingestion_queue.submit(
+                "ingest",
+                lambda job: self._ingest(kb_entry, source_path, job.report),
+                agent_id,
+                tenant_id=tenant_id,
+                priority=priority,
+                on_discard=lambda: _remove_file(source_path)
+            )
+        except QueueFull as e:
+            _remove_file(source_path)
+            kb_entry.update({"status": "failed", "error": str(e)})
+            raise
+        _ingestion_jobs[kb_id] = job
+        kb_entry["jobId"] = job.id
         
+        return self._with_job(kb_entry)
+    
+    def _find_entry(self, agent_id: str, file_name: str) -> Optional[dict]:
+        return next(
+            (
+                entry for entry in knowledge_entries.values()
+                if entry["agentId"] == agent_id and entry["fileName"] == file_name
+            ),
+            None
+        )
+    
+    def _save_entry(
+        self,
+        kb_entry: Optional[dict],
+        agent_id: str,
+        file_name: str,
+        file_type: Optional[str],
+        size: int,
+        **fields
+    ) -> dict:
+        """Create an entry, or record a new version of an existing one; either way queued for ingestion"""
+        if kb_entry is None:
+            # Create knowledge base entry
+            kb_id = str(uuid.uuid4())
+            kb_entry = {
+                "id": kb_id,
+                "agentId": agent_id,
+                "name": file_name,
+                "fileName": file_name,
+                "fileType": file_type or "application/octet-stream",
+                "s3Key": f"knowledge/{agent_id}/{kb_id}",
+                "milvusCollection": collection_name(agent_id),
+                "status": "queued",
+                "documentCount": 0,
+                "chunkCount": 0,
+                "storageBytes": size,
+                "version": 1,
+                "createdAt": datetime.utcnow(),
+                **fields
+            }
+            knowledge_entries[kb_id] = kb_entry
+        else:
+            # New version of an existing document
+            kb_entry.update({
+                "fileType": file_type or kb_entry["fileType"],
+                "status": "queued",
+                "storageBytes": size,
+                "version": kb_entry["version"] + 1,
+                "updatedAt": datetime.utcnow(),
+                **fields
+            })
         return kb_entry
     
+    def _with_job(self, kb_entry: dict) -> dict:
+        """The entry with its latest job's live status and progress"""
+        job = _ingestion_jobs.get(kb_entry["id"])
+        if job is None:
+            return dict(kb_entry)
+        return {**kb_entry, "job": {**job.to_dict(), "queuePosition": ingestion_queue.position(job)}}
+    
+    async def _ingest(self, kb_entry: dict, source_path: str, report: Callable[..., None]):
+        """Extract -> chunk -> embed -> store, updating the entry and reporting progress as it goes"""
+        kb_id = kb_entry["id"]
+        previous_ids = _chunk_ids.get(kb_id, set())
+        stored_ids: set = set()
+        completed = False
+        kb_entry.update({"embeddingCallsSaved": 0, "chunksAdded": 0, "chunksRemoved": 0})
+        text_path: Optional[str] = None
+        chunks_embedded = 0
+        try:
+            file_type = detect_type(kb_entry["fileName"], kb_entry["fileType"])
+            if file_type == "text":
+                text_path = source_path
+            else:
+                # Parsing is CPU-bound; keep it off the event loop and the GIL
+                kb_entry["status"] = "extracting"
+                report(stage="extracting")
+                extracted = await asyncio.get_running_loop().run_in_executor(
+                    get_extract_pool(),
+                    extract_to_file,
+                    source_path,
+                    file_type,
+                    f"{source_path}.txt"
+                )
+                text_path = extracted["output_path"]
+                if file_type == "pdf":
+                    report(pagesParsed=extracted["units"])
+                report(bytesExtracted=extracted["bytes"])
+            
+            kb_entry["status"] = "embedding"
+            report(stage="embedding", chunksEmbedded=0, chunksStored=0)
+            collection = kb_entry["milvusCollection"]
+            
+            async def embed(texts: List[str]) -> List[List[float]]:
+                nonlocal chunks_embedded
+                vectors, served = await embedding_cache.embed_many(
+                    texts,
+                    embedding_service.embed_many,
+                    embedding_service.model
+                )
+                kb_entry["embeddingCallsSaved"] += served
+                chunks_embedded += len(texts)
+                report(
+                    chunksEmbedded=chunks_embedded,
+                    embeddingCallsSaved=kb_entry["embeddingCallsSaved"]
+                )
+                return vectors
+            
+            async def upsert(seq: int, texts: List[str], vectors: List[List[float]]):
+                # Chunks the stored version already has (same content hash) are left alone
+                new = {}
+                for text, vector in zip(texts, vectors):
+                    chunk_id = f"{kb_id}:{content_hash(text)}"
+                    if chunk_id not in previous_ids and chunk_id not in stored_ids:
+                        new[chunk_id] = (text, vector)
+                    stored_ids.add(chunk_id)
+                if new:
+                    await self._upsert_chunks(
+                        collection,
+                        kb_id,
+                        list(new),
+                        [text for text, _ in new.values()],
+                        [vector for _, vector in new.values()]
+                    )
+                    kb_entry["chunksAdded"] += len(new)
+            
+            async def on_progress(chunks_stored: int):
+                kb_entry["chunkCount"] = chunks_stored
+                report(chunksStored=chunks_stored)
+            
+            pipeline = IngestionPipeline(
+                embed_fn=embed,
+                upsert_fn=upsert,
+                chunker=TokenChunker(settings.KNOWLEDGE_CHUNK_TOKENS, settings.KNOWLEDGE_CHUNK_OVERLAP_TOKENS),
+                embed_batch_size=settings.KNOWLEDGE_EMBED_BATCH_SIZE,
+                queue_size=settings.KNOWLEDGE_PIPELINE_QUEUE_SIZE,
+                on_progress=on_progress
+            )
+            await pipeline.run(text_path)
+            
+            # Tombstone the chunks of the previous version that are gone
+            stale = list(previous_ids - stored_ids)
+            if stale:
+                await self._delete_chunks(kb_entry, stale)
+            _chunk_ids[kb_id] = stored_ids
+            completed = True
+            kb_entry.update({
+                "chunkCount": len(stored_ids),
+                "chunksRemoved": len(stale),
+                "documentCount": 1,
+                "status": "ready"
+            })
+            kb_entry.pop("error", None)
+            report(stage="ready", chunkCount=len(stored_ids), chunksRemoved=len(stale))
+        except asyncio.CancelledError:
+            kb_entry["status"] = "cancelled"
+            raise
+        except Exception as e:
+            print(f"Error ingesting {kb_entry['fileName']}: {e}")
+            kb_entry["status"] = "failed"
+            kb_entry["error"] = str(e)
+            # Fails the caller (the job) too
+            raise
+        finally:
+            if not completed:
+                # Keep tracking whatever this attempt stored so nothing is orphaned
+                _chunk_ids[kb_id] = previous_ids | stored_ids
+            for path in {source_path, text_path}:
+                if path:
+                    _remove_file(path)
+    
+    async def _upsert_chunks(self, collection: str, kb_id: str, ids: List[str], texts: List[str], vectors: List[List[float]]):
+        """Store one batch of embedded chunks: texts in the chunk store, then the vector and keyword indexes"""
+        # Before the indexes, so every hit they return has its text
+        await chunk_store.add(collection, ids, texts, [{"kb_id": kb_id}] * len(ids))
+        await asyncio.gather(
+            vector_store.upsert(collection, ids, vectors, [{"kb_id": kb_id}] * len(ids)),
+            keyword_store.add(collection, ids, texts)
+        )
+        _collection_versions[collection] = knowledge_version(collection) + 1
+    
+    async def _delete_chunks(self, kb_entry: dict, ids: List[str]):
+        collection = kb_entry["milvusCollection"]
+        await asyncio.gather(
+            vector_store.delete(collection, ids),
+            keyword_store.delete(collection, ids)
+        )
+        # After the indexes, so no hit points at a deleted chunk
+        await chunk_store.delete(collection, ids)
+        _collection_versions[collection] = knowledge_version(collection) + 1
+        if await chunk_store.needs_compaction(collection):
+            self._schedule_compaction(kb_entry["agentId"], collection)
+    
+    def _schedule_compaction(self, agent_id: str, collection: str):
+        """Reclaim the space of deleted chunks in a low-priority background job"""
+        job = _compaction_jobs.get(collection)
+        if job is not None and job.status not in FINISHED:
+            return
+        if ingestion_queue.full():
+            return  # the next delete tries again
+        _compaction_jobs[collection] = ingestion_queue.submit(
+            "compact",
+            lambda job: chunk_store.compact(collection, job.report),
+            agent_id,
+            priority="low"
+        )
+    
     async def get_agent_knowledge(self, agent_id: str) -> List[dict]:
         """Get all knowledge base items for an agent"""
         # TODO: Implement actual database query
-        return []
+        return [self._with_job(entry) for entry in knowledge_entries.values() if entry["agentId"] == agent_id]
+    
+    async def get_job(self, job_id: str) -> Optional[dict]:
+        """Status and progress of an ingestion job (finished ones are kept for a while)"""
+        job = ingestion_queue.get(job_id)
+        if job is None:
+            return None
+        return {**job.to_dict(), "queuePosition": ingestion_queue.position(job)}
+    
+    async def crawl_site(
+        self,
+        agent_id: str,
+        url: str,
+        max_pages: Optional[int] = None,
+        priority: str = "normal",
+        tenant_id: Optional[str] = None
+    ) -> dict:
+        """
+        Import a docs site from a sitemap or seed URL as a background job
+        
+        Each page becomes an entry (its fileName is the URL) and goes through
+        the same extract -> chunk -> embed -> store pipeline as uploads.
+        Crawling the same URL again only re-ingests pages that changed and
+        deletes the entries of pages that are gone. A crawl of the URL still
+        queued or running is returned instead of starting another
+        
+        Raises QueueFull when the ingestion queue is full and BlockedAddress
+        (a ValueError) when the URL's host isn't a public address
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of: {', '.join(PRIORITIES)}")
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.netloc:
+            raise ValueError("url must be an http(s) URL")
+        await web_crawler.check_url(url)
+        job = _crawl_jobs.get((agent_id, url))
+        if job is None or job.status in FINISHED:
+            max_pages = min(max_pages or settings.KNOWLEDGE_CRAWL_MAX_PAGES, settings.KNOWLEDGE_CRAWL_MAX_PAGES)
+            job = ingestion_queue.submit(
+                "crawl",
+                lambda job: self._crawl(agent_id, url, max_pages, job.report),
+                agent_id,
+                tenant_id=tenant_id,
+                priority=priority
+            )
+            _crawl_jobs[(agent_id, url)] = job
+        return {**job.to_dict(), "queuePosition": ingestion_queue.position(job)}
+    
+    async def _crawl(self, agent_id: str, seed: str, max_pages: int, report: Callable[..., None]):
+        report(stage="crawling")
+        
+        async def on_page(page: dict):
+            url = page["url"]
+            os.makedirs(settings.KNOWLEDGE_UPLOAD_DIR, exist_ok=True)
+            source_path = os.path.join(settings.KNOWLEDGE_UPLOAD_DIR, f"{uuid.uuid4().hex}_page")
+            async with aiofiles.open(source_path, 'wb') as out_file:
+                await out_file.write(page["body"])
+            kb_entry = self._save_entry(
+                self._find_entry(agent_id, url),
+                agent_id,
+                url,
+                page["contentType"],
+                len(page["body"]),
+                source="crawl",
+                url=url
+            )
+            # Per-page progress would overwrite the crawl's counters
+            await self._ingest(kb_entry, source_path, lambda **progress: None)
+        
+        async def on_gone(url: str):
+            kb_entry = self._find_entry(agent_id, url)
+            if kb_entry is not None:
+                await self.delete_knowledge(kb_entry["id"])
+        
+        await web_crawler.crawl(
+            seed,
+            _crawled_pages.setdefault(agent_id, {}),
+            on_page,
+            on_gone,
+            report,
+            max_pages
+        )
+        report(stage="ready")
+    
+    async def set_quantization(self, agent_id: str, quantization: str):
+        """Store the agent's vectors as float32, int8 or PQ codes (re-encoded in the background)"""
+        await vector_store.set_quantization(collection_name(agent_id), quantization)
     
     async def delete_knowledge(self, kb_id: str) -> bool:
         """Delete a knowledge base item"""
-        # TODO: Implement actual deletion from DB, S3, and Milvus
-        return False
+        # TODO: Implement actual deletion from DB and S3
+        kb_entry = knowledge_entries.pop(kb_id, None)
+        if kb_entry is None:
+            return False
+        job = _ingestion_jobs.pop(kb_id, None)
+        if job is not None:
+            await ingestion_queue.cancel(job.id)
+        if kb_entry.get("source") == "crawl":
+            # Ingested again if a later crawl finds it
+            _crawled_pages.get(kb_entry["agentId"], {}).pop(kb_entry["url"], None)
+        await self._delete_chunks(kb_entry, list(_chunk_ids.pop(kb_id, ())))
+        return True
     
-    async def query_knowledge(self, agent_id: str, query: str, top_k: int = 5) -> dict:
-        """Query the knowledge base using RAG"""
-        # TODO: Implement RAG query
-        # 1. Generate query embedding
-        # 2. Search Milvus for similar chunks
-        # 3. Return relevant context
+    async def query_knowledge(
+        self,
+        agent_id: str,
+        query: str,
+        top_k: int = 5,
+        rerank: Optional[bool] = None
+    ) -> dict:
+        """Query the knowledge base using RAG (vector + BM25, fused by rank, optionally re-ranked)"""
+        rerank = settings.RERANK_ENABLED if rerank is None else rerank
+        candidates = top_k * settings.RERANK_CANDIDATE_FACTOR if rerank else top_k
+        hits = await hybrid_retriever.search(collection_name(agent_id), query, candidates)
         
+        results = [
+            {
+                "id": hit["id"],
+                "score": round(hit["score"], 4),
+                "text": hit["payload"].get("text", ""),
+                "kbId": hit["payload"].get("kb_id"),
+                "vectorRank": hit["vectorRank"],
+                "keywordRank": hit["keywordRank"]
+            }
+            for hit in hits
+        ]
+        if rerank:
+            results = await reranker.rerank(query, results, top_k)
         return {
             "query": query,
-            "results": [],
-            "context": ""
+            "results": results,
+            "context": "\n\n".join(result["text"] for result in results)
         }
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""
+Micro-batching dispatcher for AFO Platform
+Collects single-item requests from concurrent conversations for a few
+milliseconds (or up to N items) and resolves each caller from one
+batched upstream call
+"""
+
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+from prometheus_client import Counter, Histogram
+import asyncio
+import time
+
+
+BATCH_SIZE = Histogram(
+    "afo_batcher_batch_size",
+    "Items per upstream batch call",
+    ["batcher"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+)
+ADDED_LATENCY = Histogram(
+    "afo_batcher_added_latency_seconds",
+    "Time an item waited in the batcher before its upstream call started",
+    ["batcher"],
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25)
+)
+BATCH_ERRORS = Counter(
+    "afo_batcher_errors_total",
+    "Upstream batch calls that failed",
+    ["batcher"]
+)
+
+
+class MicroBatcher:
+    """
+    Generic async micro-batcher
+
+    batch_fn receives a list of items and must return a list of results
+    in the same order. A batch is flushed when it reaches max_batch_size
+    or when its oldest item has waited max_wait_ms.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        batch_fn: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5,
+        max_concurrent_batches: int = 4
+    ):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._pending: List[Tuple[Any, asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._inflight: set = set()
+        self._semaphore = asyncio.Semaphore(max_concurrent_batches)
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future, time.perf_counter()))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    async def submit_many(self, items: List[Any]) -> List[Any]:
+        """Queue several items; they may be split across batches"""
+        return list(await asyncio.gather(*(self.submit(item) for item in items)))
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        # Callers that gave up (cancelled) are dropped before the upstream call
+        pending = [entry for entry in self._pending if not entry[1].done()]
+        batch, self._pending = pending[:self.max_batch_size], pending[self.max_batch_size:]
+
+        if self._pending:
+            if len(self._pending) >= self.max_batch_size:
+                asyncio.get_running_loop().call_soon(self._flush)
+            else:
+                self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future, float]]):
+        async with self._semaphore:
+            started = time.perf_counter()
+            for _, _, enqueued_at in batch:
+                ADDED_LATENCY.labels(self.name).observe(started - enqueued_at)
+            BATCH_SIZE.labels(self.name).observe(len(batch))
+            self.batches += 1
+            self.items += len(batch)
+
+            try:
+                results = await self.batch_fn([item for item, _, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(
+                        f"{self.name} batch returned {len(results)} results for {len(batch)} items"
+                    )
+            except Exception as e:
+                BATCH_ERRORS.labels(self.name).inc()
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def get_stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "pending": len(self._pending),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000
+        }
@@ -0,0 +1,373 @@
+"""
+LLM Model Router for AFO Platform
+Picks a provider/model per agent from live latency and error stats,
+hedges slow requests and falls back to secondary models on errors
+"""
+
+from openai import AsyncOpenAI
+from app.core.config import settings
+from app.services.usage_accounting import usage_accounting
+from typing import Dict, List, Optional, Tuple
+from collections import deque
+from dataclasses import dataclass, field
+import asyncio
+import os
+import time
+
+
+@dataclass
+class Route:
+    """A provider/model pair the router can send a request to"""
+    provider: str
+    model: str
+    client: AsyncOpenAI
+
+    @property
+    def key(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+
+@dataclass
+class RouteStats:
+    """Rolling latency and error stats for one route"""
+    ttft_samples: deque = field(default_factory=lambda: deque(maxlen=200))
+    outcomes: deque = field(default_factory=lambda: deque(maxlen=100))
+    requests: int = 0
+    errors: int = 0
+    hedges_won: int = 0
+
+    def record_first_token(self, seconds: float):
+        self.ttft_samples.append(seconds)
+
+    def record_success(self):
+        self.requests += 1
+        self.outcomes.append(True)
+
+    def record_error(self):
+        self.requests += 1
+        self.errors += 1
+        self.outcomes.append(False)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.ttft_samples:
+            return None
+        ordered = sorted(self.ttft_samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return 1.0 - sum(self.outcomes) / len(self.outcomes)
+
+    def to_dict(self) -> dict:
+        p50 = self.percentile(0.5)
+        p95 = self.percentile(0.95)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate, 4),
+            "ttft_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "ttft_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "hedges_won": self.hedges_won
+        }
+
+
+class ModelRouter:
+    """
+    Routes chat completions across OpenAI-compatible providers
+
+    - Ranks an agent's routes by observed time-to-first-token and error rate;
+      a pinned model goes first unless its route is degraded
+    - If the primary has not produced a token within the hedge threshold
+      (the route's TTFT percentile, or the configured default until enough
+      samples exist), a hedged request goes to the next route; the loser
+      is cancelled
+    - Errors fall through to the next route, including a stream that fails
+      after its first token (the reply is buffered, so nothing was sent yet)
+    """
+
+    MIN_SAMPLES = 20
+    # A pinned model's route loses its place at the front past this error rate
+    DEGRADED_ERROR_RATE = 0.25
+
+    def __init__(
+        self,
+        default_routes: Optional[List[Tuple[str, str]]] = None,
+        hedge_after_ms: float = 1500,
+        hedge_percentile: float = 0.95,
+        hedging_enabled: bool = True
+    ):
+        self.providers: Dict[str, AsyncOpenAI] = {}
+        self.default_routes = default_routes or [("openai", "gpt-4")]
+        self.agent_routes: Dict[str, List[Tuple[str, str]]] = {}
+        self.stats: Dict[str, RouteStats] = {}
+        self.hedge_after = hedge_after_ms / 1000
+        self.hedge_percentile = hedge_percentile
+        self.hedging_enabled = hedging_enabled
+        self.hedges_sent = 0
+        self.fallbacks = 0
+
+    def register_provider(self, name: str, api_key: str, base_url: Optional[str] = None):
+        """Register an OpenAI-compatible provider (OpenAI, vLLM, mock servers, ...)"""
+        # No client-side retries: the router's fallback replaces them
+        self.providers[name] = AsyncOpenAI(api_key=api_key or "not-set", base_url=base_url, max_retries=0)
+
+    def set_agent_routes(self, agent_id: str, routes: List[Tuple[str, str]]):
+        """Set the candidate (provider, model) list for an agent, in preference order"""
+        self.agent_routes[agent_id] = routes
+
+    def _stats(self, route: Route) -> RouteStats:
+        if route.key not in self.stats:
+            self.stats[route.key] = RouteStats()
+        return self.stats[route.key]
+
+    def rank_routes(self, agent_id: Optional[str] = None, model: Optional[str] = None) -> List[Route]:
+        """
+        Candidate routes for an agent, best first
+
+        An explicitly requested model goes first unless its route is
+        degraded (error rate past DEGRADED_ERROR_RATE, or typical TTFT past
+        the hedge threshold); untested routes are scored as if they ran at
+        the default hedge threshold so configured preference order holds
+        until real stats arrive
+        """
+        candidates = list(self.agent_routes.get(agent_id, self.default_routes))
+        routes = [
+            Route(provider, name, self.providers[provider])
+            for provider, name in candidates
+            if provider in self.providers
+        ]
+
+        def score(indexed: Tuple[int, Route]) -> float:
+            index, route = indexed
+            stats = self.stats.get(route.key)
+            if stats is None or len(stats.ttft_samples) < self.MIN_SAMPLES:
+                latency = self.hedge_after * (1 + index)
+            else:
+                latency = stats.percentile(0.5)
+            error_rate = stats.error_rate if stats else 0.0
+            return latency * (1 + 10 * error_rate)
+
+        ranked = [route for _, route in sorted(enumerate(routes), key=score)]
+        if model:
+            preferred = [r for r in ranked if r.model == model]
+            if not preferred and ranked:
+                preferred = [Route(ranked[0].provider, model, ranked[0].client)]
+            others = [r for r in ranked if r.model != model]
+            healthy = [r for r in preferred if not self._degraded(r)]
+            # A degraded pinned route stays a candidate, behind the stats-ranked ones
+            ranked = healthy + others + [r for r in preferred if r not in healthy]
+        return ranked
+
+    def _degraded(self, route: Route) -> bool:
+        stats = self.stats.get(route.key)
+        if stats is None:
+            return False
+        if len(stats.outcomes) >= self.MIN_SAMPLES and stats.error_rate > self.DEGRADED_ERROR_RATE:
+            return True
+        return len(stats.ttft_samples) >= self.MIN_SAMPLES and stats.percentile(0.5) > self.hedge_after
+
+    def select_model(self, agent_id: Optional[str] = None, provider: str = "openai", default: str = "gpt-4") -> str:
+        """
+        Best-ranked model name for a provider among an agent's own routes (for
+        pipelines that manage their own client); default for agents without
+        routes, whose pipeline keeps the model it was configured with
+        """
+        if agent_id not in self.agent_routes:
+            return default
+        for route in self.rank_routes(agent_id):
+            if route.provider == provider:
+                return route.model
+        return default
+
+    def _hedge_threshold(self, route: Route) -> float:
+        stats = self.stats.get(route.key)
+        if stats is not None and len(stats.ttft_samples) >= self.MIN_SAMPLES:
+            return stats.percentile(self.hedge_percentile)
+        return self.hedge_after
+
+    async def _run_attempt(
+        self,
+        route: Route,
+        messages: list,
+        params: dict,
+        first_token: asyncio.Future
+    ) -> dict:
+        """Stream one completion, resolving first_token when content starts"""
+        stats = self._stats(route)
+        start = time.perf_counter()
+        try:
+            stream = await route.client.chat.completions.create(
+                model=route.model,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **params
+            )
+            parts = []
+            usage = None
+            async for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if not first_token.done():
+                        ttft = time.perf_counter() - start
+                        stats.record_first_token(ttft)
+                        first_token.set_result(ttft)
+                    parts.append(chunk.choices[0].delta.content)
+            stats.record_success()
+            return {
+                "content": "".join(parts),
+                "provider": route.provider,
+                "model": route.model,
+                "prompt_tokens": usage.prompt_tokens if usage else 0,
+                "completion_tokens": usage.completion_tokens if usage else 0,
+                "total_tokens": usage.total_tokens if usage else 0,
+                "ttft_ms": (first_token.result() * 1000) if first_token.done() else None,
+                "latency_ms": (time.perf_counter() - start) * 1000
+            }
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            stats.record_error()
+            raise
+
+    async def chat_completion(
+        self,
+        messages: list,
+        agent_id: Optional[str] = None,
+        model: Optional[str] = None,
+        tenant_id: Optional[str] = None,
+        **params
+    ) -> dict:
+        """
+        Run a chat completion with hedging and fallback
+
+        Returns:
+            Dict with content, provider, model, token usage and latency
+        """
+        remaining = self.rank_routes(agent_id, model)
+        if not remaining:
+            raise RuntimeError("No LLM routes configured")
+
+        loop = asyncio.get_running_loop()
+        active: Dict[asyncio.Task, Tuple[Route, asyncio.Future]] = {}
+        last_error: Optional[BaseException] = None
+        hedged = False
+
+        def launch():
+            route = remaining.pop(0)
+            first_token = loop.create_future()
+            task = asyncio.create_task(self._run_attempt(route, messages, params, first_token))
+            active[task] = (route, first_token)
+            return route
+
+        primary = launch()
+        hedge_deadline = time.perf_counter() + self._hedge_threshold(primary)
+
+        try:
+            while active:
+                timeout = None
+                if self.hedging_enabled and not hedged and remaining:
+                    timeout = max(0.0, hedge_deadline - time.perf_counter())
+
+                waiters = set(active) | {ft for _, ft in active.values()}
+                done, _ = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    hedged = True
+                    self.hedges_sent += 1
+                    launch()
+                    continue
+
+                winner = next(
+                    (
+                        task for task, (_, first_token) in active.items()
+                        if first_token.done()
+                        or (task.done() and not task.cancelled() and task.exception() is None)
+                    ),
+                    None
+                )
+                if winner is not None:
+                    route, _ = active.pop(winner)
+                    for task in active:
+                        task.cancel()
+                    active.clear()
+                    try:
+                        result = await winner
+                    except Exception as e:
+                        # Failed after its first token (dropped stream, mid-stream 5xx); the
+                        # reply is buffered, so the next route can still answer in its place
+                        last_error = e
+                        print(f"⚠️ LLM route {route.key} failed mid-stream: {e}")
+                        if remaining:
+                            self.fallbacks += 1
+                            fallback = launch()
+                            hedge_deadline = time.perf_counter() + self._hedge_threshold(fallback)
+                        continue
+                    if hedged and route is not primary:
+                        self._stats(route).hedges_won += 1
+                    usage_accounting.record(
+                        "llm",
+                        result["model"],
+                        tenant_id=tenant_id,
+                        agent_id=agent_id,
+                        prompt_tokens=result["prompt_tokens"],
+                        completion_tokens=result["completion_tokens"],
+                        latency_ms=result["latency_ms"]
+                    )
+                    return result
+
+                for task in [t for t in active if t.done()]:
+                    route, _ = active.pop(task)
+                    last_error = task.exception()
+                    print(f"⚠️ LLM route {route.key} failed: {last_error}")
+                if not active and remaining:
+                    self.fallbacks += 1
+                    fallback = launch()
+                    hedge_deadline = time.perf_counter() + self._hedge_threshold(fallback)
+        finally:
+            for task in active:
+                task.cancel()
+
+        raise last_error or RuntimeError("All LLM routes failed")
+
+    def get_stats(self) -> dict:
+        """Router stats for the admin dashboard"""
+        return {
+            "hedges_sent": self.hedges_sent,
+            "fallbacks": self.fallbacks,
+            "routes": {key: stats.to_dict() for key, stats in self.stats.items()}
+        }
+
+
+def _parse_routes(value: str) -> List[Tuple[str, str]]:
+    routes = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        provider, _, model = item.partition(":")
+        routes.append((provider, model) if model else ("openai", provider))
+    return routes
+
+
+def _build_router() -> ModelRouter:
+    router = ModelRouter(
+        default_routes=_parse_routes(settings.LLM_ROUTES),
+        hedge_after_ms=settings.LLM_HEDGE_AFTER_MS,
+        hedge_percentile=settings.LLM_HEDGE_PERCENTILE,
+        hedging_enabled=settings.LLM_HEDGING_ENABLED
+    )
+    router.register_provider("openai", settings.OPENAI_API_KEY)
+    # Extra OpenAI-compatible providers: LLM_PROVIDER_URLS="local=http://localhost:8000/v1"
+    for item in settings.LLM_PROVIDER_URLS.split(","):
+        name, _, base_url = item.strip().partition("=")
+        if name and base_url:
+            router.register_provider(name, os.getenv(f"{name.upper()}_API_KEY", ""), base_url)
+    return router
+
+
+# Global model router instance
+model_router = _build_router()
@@ -0,0 +1,136 @@
+"""
+Prefix Cache for AFO Platform
+KV state of prompt prefixes the model has already encoded, so a turn only
+prefills the tokens that are new since the last one
+
+- Per agent: the system prompt, shared by every session of that agent
+- Per session: the whole prompt of its last turn (system prompt, history,
+  last user message); the next turn's prompt starts with it, so only the
+  reply and the new message are encoded
+
+Lookups match by token ids: the longest common prefix of the prompt and
+any entry offered is reused, so a template or history that changed part
+way still reuses what's the same. Entries are never written in place -
+extending one (batching, padding, decoding) always builds new tensors -
+so sessions share them copy-on-write. Past memory_cap_bytes the least
+recently used entries are dropped.
+"""
+
+from collections import OrderedDict
+from typing import Hashable, List, Optional, Sequence, Tuple
+from app.core.config import settings
+import threading
+
+# Per-layer (key, value) tensors, [batch, heads, length, head dim]
+Layers = Tuple[Tuple[object, object], ...]
+
+
+class _Entry:
+    __slots__ = ("tokens", "layers", "bytes")
+
+    def __init__(self, tokens: Tuple[int, ...], layers: Layers, size: int):
+        self.tokens = tokens
+        self.layers = layers
+        self.bytes = size
+
+
+def _common_prefix(a: Sequence[int], b: Sequence[int]) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def _trim(layers: Layers, length: int) -> Layers:
+    return tuple((keys[:, :, :length], values[:, :, :length]) for keys, values in layers)
+
+
+class PrefixCache:
+    def __init__(self, memory_cap_bytes: int = 1024 ** 3):
+        self.memory_cap_bytes = memory_cap_bytes
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.stats = {"lookups": 0, "hits": 0, "reused_tokens": 0, "prompt_tokens": 0, "evictions": 0}
+
+    def lookup(self, keys: List[Hashable], token_ids: Sequence[int]) -> Tuple[int, Optional[Layers]]:
+        """
+        The longest cached prefix of token_ids among the entries under keys
+
+        Returns (length, layers) with layers covering token_ids[:length], or
+        (0, None). At least the last token is always left to encode, since
+        its logits are what the next token is sampled from.
+        """
+        best, best_entry = 0, None
+        with self._lock:
+            self.stats["lookups"] += 1
+            self.stats["prompt_tokens"] += len(token_ids)
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                length = min(_common_prefix(entry.tokens, token_ids), len(token_ids) - 1)
+                if length > best:
+                    best, best_entry = length, entry
+                self._entries.move_to_end(key)
+            if best_entry is None:
+                return 0, None
+            self.stats["hits"] += 1
+            self.stats["reused_tokens"] += best
+        return best, _trim(best_entry.layers, best)
+
+    def store(self, key: Hashable, token_ids: Sequence[int], layers: Layers, length: Optional[int] = None):
+        """
+        Cache layers, the KV state of token_ids, as that of token_ids[:length]
+        (all of them by default)
+
+        A shorter prefix is copied out, so the entry doesn't keep the whole
+        of the tensors it was sliced from alive.
+        """
+        length = len(token_ids) if length is None else min(length, len(token_ids))
+        if length <= 0:
+            return
+        tokens = tuple(token_ids[:length])
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None and current.tokens == tokens:
+                self._entries.move_to_end(key)
+                return
+        if length < len(token_ids):
+            layers = tuple((keys.clone(), values.clone()) for keys, values in _trim(layers, length))
+        size = sum(keys.untyped_storage().nbytes() + values.untyped_storage().nbytes() for keys, values in layers)
+        if size > self.memory_cap_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = _Entry(tokens, layers, size)
+            self.bytes += size
+            while self.bytes > self.memory_cap_bytes:
+                self._remove(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry.bytes
+
+    def get_stats(self) -> dict:
+        lookups = self.stats["lookups"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "memory_cap_bytes": self.memory_cap_bytes,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            "reused_ratio": round(self.stats["reused_tokens"] / self.stats["prompt_tokens"], 3)
+            if self.stats["prompt_tokens"] else 0.0
+        }
+
+
+# Global prefix cache instance
+prefix_cache = PrefixCache(settings.QWEN_PREFIX_CACHE_MB * 1024 * 1024)
@@ -0,0 +1,149 @@
+"""
+Vector quantizers for the local vector store
+Compressed codes are what similarity scans read; the float32 rows stay
+on disk and are only touched to re-rank the best candidates exactly
+
+- int8: per-dimension scalar quantization, 1 byte per dimension (4x smaller)
+- pq:   product quantization, the vector split into m sub-vectors of
+        which each is stored as the id (1 byte) of its nearest of 256
+        trained centroids; 384-d vectors with m=48 take 48 bytes (32x)
+
+Scores are approximate inner products with a (normalized) query.
+"""
+
+from typing import Optional
+import numpy as np
+
+QUANTIZATIONS = ("none", "int8", "pq")
+# Rows per step when encoding, bounding temporary buffers
+_BLOCK = 65536
+# Rows per step when scoring; small enough that the gathered table entries stay in cache
+_SCORE_BLOCK = 4096
+
+
+class Int8Quantizer:
+    mode = "int8"
+
+    def __init__(self, dim: int, scale: Optional[np.ndarray] = None):
+        self.dim = dim
+        self.code_size = dim
+        self.dtype = np.int8
+        self.scale = scale
+
+    @property
+    def trained(self) -> bool:
+        return self.scale is not None
+
+    def train(self, sample: np.ndarray):
+        # Components of normalized vectors rarely come near 1; per-dimension
+        # ranges keep the 255 levels where the values actually are
+        self.scale = np.maximum(np.abs(sample).max(axis=0), 1e-6).astype(np.float32) / 127
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+
+    def scorer(self, query: np.ndarray):
+        weights = (query * self.scale).astype(np.float32)
+
+        def score(codes: np.ndarray) -> np.ndarray:
+            # einsum upcasts in small internal buffers instead of a float copy of every code
+            return np.einsum("ij,j->i", codes, weights, dtype=np.float32)
+
+        return score
+
+    def state(self) -> dict:
+        return {"scale": self.scale}
+
+
+class PQQuantizer:
+    mode = "pq"
+
+    def __init__(self, dim: int, m: int = 0, centroids: Optional[np.ndarray] = None):
+        if not m:
+            # About 8 dimensions per sub-vector
+            m = max(d for d in range(1, dim // 8 + 1) if dim % d == 0) if dim >= 8 else dim
+        if dim % m:
+            raise ValueError(f"PQ sub-vector count {m} must divide the dimension {dim}")
+        self.dim = dim
+        self.m = m
+        self.sub_dim = dim // m
+        self.code_size = m
+        self.dtype = np.uint8
+        # (m, 256, sub_dim)
+        self.centroids = centroids
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        return vectors.reshape(len(vectors), self.m, self.sub_dim)
+
+    def train(self, sample: np.ndarray, iterations: int = 10, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        sub = self._split(sample.astype(np.float32))
+        k = min(256, len(sample))
+        centroids = np.zeros((self.m, 256, self.sub_dim), dtype=np.float32)
+        for j in range(self.m):
+            points = sub[:, j, :]
+            book = points[rng.choice(len(points), size=k, replace=False)].copy()
+            for _ in range(iterations):
+                labels = self._nearest(points, book)
+                counts = np.bincount(labels, minlength=k)
+                sums = np.stack(
+                    [np.bincount(labels, weights=points[:, d], minlength=k) for d in range(self.sub_dim)],
+                    axis=1
+                )
+                nonempty = counts > 0
+                book[nonempty] = sums[nonempty] / counts[nonempty, None]
+                # Reseed empty cells from random points
+                empty = ~nonempty
+                book[empty] = points[rng.choice(len(points), size=int(empty.sum()))]
+            centroids[j, :k] = book
+            # Unused ids (fewer than 256 training points) repeat the first centroid
+            centroids[j, k:] = book[0]
+        self.centroids = centroids
+
+    @staticmethod
+    def _nearest(points: np.ndarray, book: np.ndarray) -> np.ndarray:
+        distances = (book * book).sum(axis=1) - 2 * points @ book.T
+        return np.argmin(distances, axis=1)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for i in range(0, len(vectors), _BLOCK):
+            sub = self._split(np.asarray(vectors[i:i + _BLOCK], dtype=np.float32))
+            for j in range(self.m):
+                codes[i:i + _BLOCK, j] = self._nearest(sub[:, j, :], self.centroids[j])
+        return codes
+
+    def scorer(self, query: np.ndarray):
+        # Asymmetric distance: the query stays exact, one lookup per sub-vector
+        table = np.einsum("md,mkd->mk", self._split(query[None, :].astype(np.float32))[0], self.centroids)
+        flat = table.ravel()
+        base = (np.arange(self.m) * 256).astype(np.intp)
+
+        def score(codes: np.ndarray) -> np.ndarray:
+            out = np.empty(len(codes), dtype=np.float32)
+            for i in range(0, len(codes), _SCORE_BLOCK):
+                out[i:i + _SCORE_BLOCK] = flat[codes[i:i + _SCORE_BLOCK] + base].sum(axis=1)
+            return out
+
+        return score
+
+    def state(self) -> dict:
+        return {"centroids": self.centroids}
+
+
+def make_quantizer(mode: str, dim: int, pq_subvectors: int = 0, state: Optional[dict] = None):
+    """Quantizer for a collection's mode (None for "none"); state restores a trained one"""
+    state = state or {}
+    if mode == "int8":
+        return Int8Quantizer(dim, scale=state.get("scale"))
+    if mode == "pq":
+        centroids = state.get("centroids")
+        m = centroids.shape[0] if centroids is not None else pq_subvectors
+        return PQQuantizer(dim, m=m, centroids=centroids)
+    if mode == "none":
+        return None
+    raise ValueError(f"Unknown quantization {mode!r}; expected one of {', '.join(QUANTIZATIONS)}")
@@ -4,16 +4,22 @@ Handles end-to-end multimodal voice conversations
 Replaces the STT -> LLM -> TTS pipeline with a single model
 """
 
-from typing import Optional, Dict, AsyncIterator
+from typing import Optional, Dict, AsyncIterator, Tuple
+from concurrent.futures import ThreadPoolExecutor
 import asyncio
+import time
 import uuid
 import os
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer, TextIteratorStreamer
-from threading import Thread
+from transformers import AutoModelForCausalLM, AutoTokenizer
 import numpy as np
 import soundfile as sf
 import io
+from app.core.config import settings
+from app.services.generation_scheduler import AsyncTextStreamer, GenerationCancelled, GenerationScheduler
+from app.services.prefix_cache import prefix_cache
+from app.services.conversation_store import conversation_store
+from app.services.usage_accounting import usage_accounting
 
 
 class Qwen3OmniService:
@@ -28,7 +34,18 @@ class Qwen3OmniService:
         self.tokenizer = None
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.model_id = os.getenv("QWEN_MODEL_ID", "Qwen/Qwen3-Omni-30B-A3B-Instruct")
-        self.active_sessions: Dict[str, Dict] = {}
+        # Session state lives in the shared store (TTL-evicted, visible to all workers)
+        self.store = conversation_store
+        self.scheduler: Optional[GenerationScheduler] = None
+        # Blocking model calls (generate() without the scheduler, audio) run here, never on the event loop
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.QWEN_GENERATION_WORKERS,
+            thread_name_prefix="qwen-generate"
+        )
+        # Agent id -> (system prompt, its length in tokens), for the agent's prefix cache entry;
+        # one per agent, replaced when the agent's prompt changes
+        self._system_lengths: Dict[str, Tuple[str, int]] = {}
+        self._load_lock = asyncio.Lock()
         self.is_loaded = False
         
     async def load_model(self):
@@ -36,37 +53,52 @@ class Qwen3OmniService:
         Load Qwen 3 Omni model into memory
         This is resource-intensive, do it once at startup
         """
-        if self.is_loaded:
-            return
+        async with self._load_lock:
+            if self.is_loaded:
+                return
             
-        print(f"🚀 Loading Qwen 3 Omni model: {self.model_id}")
-        print(f"📍 Device: {self.device}")
-        
-        try:
-            # Load tokenizer
-            self.tokenizer = AutoTokenizer.from_pretrained(
-                self.model_id,
-                trust_remote_code=True
-            )
+            print(f"🚀 Loading Qwen 3 Omni model: {self.model_id}")
+            print(f"📍 Device: {self.device}")
             
-            # Load model with optimizations
-            self.model = AutoModelForCausalLM.from_pretrained(
-                self.model_id,
-                device_map="auto",
-                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-                trust_remote_code=True,
-                # Use Flash Attention 2 if available (faster, lower memory)
-                attn_implementation="flash_attention_2" if self.device == "cuda" else None
+            try:
+                # Minutes of disk reads and weight setup; the app keeps serving meanwhile
+                await asyncio.to_thread(self._load)
+                self.is_loaded = True
+                
+                print("✅ Qwen 3 Omni model loaded successfully!")
+                
+            except Exception as e:
+                print(f"❌ Failed to load Qwen 3 Omni model: {e}")
+                raise
+    
+    def _load(self):
+        # Load tokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(
+            self.model_id,
+            trust_remote_code=True
+        )
+        
+        # Load model with optimizations
+        self.model = AutoModelForCausalLM.from_pretrained(
+            self.model_id,
+            device_map="auto",
+            torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
+            trust_remote_code=True,
+            # Use Flash Attention 2 if available (faster, lower memory)
+            attn_implementation="flash_attention_2" if self.device == "cuda" else None
+        )
+        
+        self.model.eval()  # Set to evaluation mode
+        if settings.QWEN_BATCHING_ENABLED:
+            # All sessions' generations share one batch, stepped by one thread
+            self.scheduler = GenerationScheduler(
+                self.model,
+                self.tokenizer,
+                device=self.model.device,
+                max_batch_size=settings.QWEN_MAX_BATCH_SIZE,
+                max_new_tokens=settings.QWEN_MAX_NEW_TOKENS,
+                prefix_cache=prefix_cache if settings.QWEN_PREFIX_CACHE_ENABLED else None
             )
-            
-            self.model.eval()  # Set to evaluation mode
-            self.is_loaded = True
-            
-            print("✅ Qwen 3 Omni model loaded successfully!")
-            
-        except Exception as e:
-            print(f"❌ Failed to load Qwen 3 Omni model: {e}")
-            raise
     
     async def create_voice_session(
         self,
@@ -102,12 +134,11 @@ class Qwen3OmniService:
             "system_prompt": system_prompt,
             "voice_id": voice_id,
             "language": language,
-            "conversation_history": [],
             "status": "active",
-            "created_at": asyncio.get_event_loop().time()
+            "created_at": time.time()
         }
         
-        self.active_sessions[session_id] = session
+        await self.store.set_meta(self._key(session_id), session)
         
         return {
             "session_id": session_id,
@@ -146,16 +177,21 @@ class Qwen3OmniService:
         Yields:
             Response chunks with audio and text
         """
-        if session_id not in self.active_sessions:
+        session = await self.store.get_meta(self._key(session_id))
+        if session is None:
             raise ValueError(f"Session {session_id} not found")
         
-        session = self.active_sessions[session_id]
-        
         try:
             # 1. Audio Understanding (Built-in to Qwen 3 Omni)
             # Convert audio bytes to tensor
             audio_array = np.frombuffer(audio_data, dtype=np.int16)
             audio_tensor = torch.from_numpy(audio_array).float() / 32768.0
+            usage_accounting.record(
+                "stt",
+                self.model_id,
+                agent_id=session["agent_id"],
+                prompt_tokens=len(audio_array) / sample_rate
+            )
             
             # 2. Construct multimodal prompt
             messages = [
@@ -163,8 +199,9 @@ class Qwen3OmniService:
             ]
             
             # Add conversation history
-            for turn in session["conversation_history"]:
-                messages.append(turn)
+            messages.extend(await self.store.get_history(
+                self._key(session_id), limit=settings.CONVERSATION_MAX_TURNS
+            ))
             
             # Add current audio input
             messages.append({
@@ -199,59 +236,80 @@ class Qwen3OmniService:
         Stream response generation with audio output
         """
         # Prepare input for model
-        text = self.tokenizer.apply_chat_template(
-            messages,
-            tokenize=False,
-            add_generation_prompt=True
-        )
-        
-        # Create streamer for real-time text generation
-        streamer = TextIteratorStreamer(
-            self.tokenizer,
-            skip_prompt=True,
-            skip_special_tokens=True
-        )
+        inputs, prefixes = await asyncio.to_thread(self._prepare, messages, session)
         
-        # Tokenize input
-        inputs = self.tokenizer(
-            text,
-            return_tensors="pt",
-            padding=True
-        ).to(self.device)
-        
-        # Generation parameters
-        generation_kwargs = dict(
-            inputs,
-            streamer=streamer,
-            max_new_tokens=1024,
-            temperature=0.7,
-            top_p=0.9,
-            do_sample=True,
-            # Enable audio generation
-            output_audio=True,
-            voice_id=session["voice_id"]
-        )
-        
-        # Generate in background thread
-        thread = Thread(target=self.model.generate, kwargs=generation_kwargs)
-        thread.start()
-        
-        # Stream responses
+        started = time.perf_counter()
         full_response = ""
-        for text_chunk in streamer:
-            full_response += text_chunk
+        if prefixes is not None:
+            # Joins the shared batch at the next decode step; the reply is
+            # spoken in the session's voice by _generate_audio below
+            request = self.scheduler.submit(
+                inputs["input_ids"][0].tolist(),
+                temperature=0.7,
+                top_p=0.9,
+                prefixes=prefixes
+            )
+            async for text_chunk in request.stream():
+                full_response += text_chunk
+                
+                yield {
+                    "type": "text",
+                    "content": text_chunk,
+                    "session_id": session["session_id"]
+                }
+            completion_tokens = len(request.tokens)
+        else:
+            # Create streamer for real-time text generation (read without blocking the loop)
+            loop = asyncio.get_running_loop()
+            streamer = AsyncTextStreamer(
+                self.tokenizer,
+                loop,
+                skip_prompt=True,
+                skip_special_tokens=True
+            )
             
-            yield {
-                "type": "text",
-                "content": text_chunk,
-                "session_id": session["session_id"]
-            }
+            # Generation parameters
+            generation_kwargs = dict(
+                inputs,
+                streamer=streamer,
+                max_new_tokens=settings.QWEN_MAX_NEW_TOKENS,
+                temperature=0.7,
+                top_p=0.9,
+                do_sample=True,
+                # Enable audio generation
+                output_audio=True,
+                voice_id=session["voice_id"]
+            )
+            
+            # Generate on the worker pool; past its size, requests wait their turn
+            loop.run_in_executor(self.executor, self._generate_streaming, streamer, generation_kwargs)
+            
+            # Stream responses
+            async for text_chunk in streamer:
+                full_response += text_chunk
+                
+                yield {
+                    "type": "text",
+                    "content": text_chunk,
+                    "session_id": session["session_id"]
+                }
+            completion_tokens = len(await asyncio.to_thread(self.tokenizer.encode, full_response))
+        
+        usage_accounting.record(
+            "llm",
+            self.model_id,
+            agent_id=session["agent_id"],
+            prompt_tokens=inputs["input_ids"].shape[1],
+            completion_tokens=completion_tokens,
+            latency_ms=(time.perf_counter() - started) * 1000
+        )
         
         # Add to conversation history
-        session["conversation_history"].append({
-            "role": "assistant",
-            "content": full_response
-        })
+        await self.store.append(
+            self._key(session["session_id"]),
+            [{"role": "assistant", "content": full_response}],
+            max_turns=settings.CONVERSATION_MAX_TURNS
+        )
         
         # Generate audio for complete response
         # Note: In production, you'd stream audio chunks too
@@ -279,6 +337,65 @@ class Qwen3OmniService:
         Generate complete response (non-streaming)
         """
         # Prepare input
+        inputs, prefixes = await asyncio.to_thread(self._prepare, messages, session)
+        
+        # Generate
+        started = time.perf_counter()
+        prompt_length = inputs["input_ids"].shape[1]
+        if prefixes is not None:
+            request = self.scheduler.submit(
+                inputs["input_ids"][0].tolist(),
+                temperature=0.7,
+                top_p=0.9,
+                prefixes=prefixes
+            )
+            response_text = "".join([text_chunk async for text_chunk in request.stream()])
+            completion_tokens = len(request.tokens)
+        else:
+            outputs = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self._generate, inputs, session
+            )
+            completion_tokens = outputs.shape[1] - prompt_length
+            
+            # Decode text response
+            response_text = await asyncio.to_thread(
+                self.tokenizer.decode,
+                outputs[0],
+                skip_special_tokens=True
+            )
+        
+        usage_accounting.record(
+            "llm",
+            self.model_id,
+            agent_id=session["agent_id"],
+            prompt_tokens=prompt_length,
+            completion_tokens=completion_tokens,
+            latency_ms=(time.perf_counter() - started) * 1000
+        )
+        
+        # Get audio output
+        audio_output = await self._generate_audio(response_text, session)
+        
+        # Update conversation history
+        await self.store.append(
+            self._key(session["session_id"]),
+            [{"role": "assistant", "content": response_text}],
+            max_turns=settings.CONVERSATION_MAX_TURNS
+        )
+        
+        return {
+            "type": "complete",
+            "text": response_text,
+            "audio": audio_output,
+            "session_id": session["session_id"]
+        }
+    
+    def _prepare(self, messages: list, session: dict):
+        """
+        Model inputs for messages, and their prefix cache entries when the
+        scheduler generates them - None when generate() has to (blocking -
+        run it off the event loop)
+        """
         text = self.tokenizer.apply_chat_template(
             messages,
             tokenize=False,
@@ -291,39 +408,58 @@ class Qwen3OmniService:
             padding=True
         ).to(self.device)
         
-        # Generate
+        prefixes = self._prefixes(messages, session) if self._batchable(messages) else None
+        return inputs, prefixes
+    
+    def _batchable(self, messages: list) -> bool:
+        """
+        Whether the scheduler can generate for messages: it only steps the
+        language model over token ids, so prompts with audio or video parts
+        go through generate(), whose multimodal encoders and talker
+        (output_audio, voice_id) it doesn't run
+        """
+        return self.scheduler is not None and all(isinstance(m["content"], str) for m in messages)
+    
+    def _generate(self, inputs, session: dict):
+        """Blocking generate() for the worker pool"""
         with torch.no_grad():
-            outputs = self.model.generate(
+            return self.model.generate(
                 **inputs,
-                max_new_tokens=1024,
+                max_new_tokens=settings.QWEN_MAX_NEW_TOKENS,
                 temperature=0.7,
                 top_p=0.9,
                 do_sample=True,
                 output_audio=True,
                 voice_id=session["voice_id"]
             )
-        
-        # Decode text response
-        response_text = self.tokenizer.decode(
-            outputs[0],
-            skip_special_tokens=True
-        )
-        
-        # Get audio output
-        audio_output = await self._generate_audio(response_text, session)
-        
-        # Update conversation history
-        session["conversation_history"].append({
-            "role": "assistant",
-            "content": response_text
-        })
-        
-        return {
-            "type": "complete",
-            "text": response_text,
-            "audio": audio_output,
-            "session_id": session["session_id"]
-        }
+    
+    def _generate_streaming(self, streamer: AsyncTextStreamer, generation_kwargs: dict):
+        """Blocking streamed generate() for the worker pool"""
+        try:
+            with torch.no_grad():
+                self.model.generate(**generation_kwargs)
+        except GenerationCancelled:
+            pass  # the reader went away
+        except Exception as e:
+            streamer.fail(e)
+    
+    def _prefixes(self, messages: list, session: dict) -> list:
+        """
+        Prefix cache entries for a prompt: the agent's system prompt, shared
+        by its sessions, and the session's whole prompt, which the next
+        turn's prompt starts with
+        """
+        system_prompt = messages[0]["content"]
+        cached = self._system_lengths.get(session["agent_id"])
+        if cached is None or cached[0] != system_prompt:
+            # return_dict=False: transformers 5 returns a BatchEncoding (len() 2) by default
+            system_ids = self.tokenizer.apply_chat_template(messages[:1], tokenize=True, return_dict=False)
+            cached = (system_prompt, len(system_ids))
+            self._system_lengths[session["agent_id"]] = cached
+        return [
+            (("agent", session["agent_id"]), cached[1]),
+            (("session", session["session_id"]), None)
+        ]
     
     async def _generate_audio(
         self,
@@ -339,27 +475,33 @@ class Qwen3OmniService:
         # may vary based on the model version
         
         try:
-            # Use Qwen's built-in audio generation
-            # Note: This is conceptual - adjust based on actual Qwen API
-            audio_tensor = self.model.generate_audio(
-                text=text,
-                voice_id=session["voice_id"],
-                language=session["language"]
+            # Synthesis and WAV encoding block; keep them off the event loop
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, self._synthesize, text, session
             )
             
-            # Convert to WAV bytes
-            audio_np = audio_tensor.cpu().numpy()
-            audio_bytes = io.BytesIO()
-            sf.write(audio_bytes, audio_np, 24000, format='WAV')
-            audio_bytes.seek(0)
-            
-            return audio_bytes.read()
-            
         except Exception as e:
             print(f"⚠️ Audio generation error: {e}")
             # Fallback to empty audio
             return b""
     
+    def _synthesize(self, text: str, session: dict) -> bytes:
+        # Use Qwen's built-in audio generation
+        # Note: This is conceptual - adjust based on actual Qwen API
+        audio_tensor = self.model.generate_audio(
+            text=text,
+            voice_id=session["voice_id"],
+            language=session["language"]
+        )
+        
+        # Convert to WAV bytes
+        audio_np = audio_tensor.cpu().numpy()
+        audio_bytes = io.BytesIO()
+        sf.write(audio_bytes, audio_np, 24000, format='WAV')
+        audio_bytes.seek(0)
+        
+        return audio_bytes.read()
+    
     async def process_text(
         self,
         session_id: str,
@@ -377,23 +519,24 @@ class Qwen3OmniService:
         Yields:
             Response chunks
         """
-        if session_id not in self.active_sessions:
+        session = await self.store.get_meta(self._key(session_id))
+        if session is None:
             raise ValueError(f"Session {session_id} not found")
         
-        session = self.active_sessions[session_id]
-        
         # Construct messages
         messages = [
             {"role": "system", "content": session["system_prompt"]},
         ]
         
-        for turn in session["conversation_history"]:
-            messages.append(turn)
+        messages.extend(await self.store.get_history(
+            self._key(session_id), limit=settings.CONVERSATION_MAX_TURNS
+        ))
         
-        messages.append({
-            "role": "user",
-            "content": text
-        })
+        user_turn = {"role": "user", "content": text}
+        messages.append(user_turn)
+        await self.store.append(
+            self._key(session_id), [user_turn], max_turns=settings.CONVERSATION_MAX_TURNS
+        )
         
         # Generate response
         if stream:
@@ -413,12 +556,10 @@ class Qwen3OmniService:
         Returns:
             True if session was ended successfully
         """
-        if session_id in self.active_sessions:
-            del self.active_sessions[session_id]
-            return True
-        return False
+        prefix_cache.invalidate(("session", session_id))
+        return await self.store.delete(self._key(session_id))
     
-    def get_session_status(self, session_id: str) -> Optional[Dict]:
+    async def get_session_status(self, session_id: str) -> Optional[Dict]:
         """
         Get status of a voice session
         
@@ -428,27 +569,36 @@ class Qwen3OmniService:
         Returns:
             Session status or None if not found
         """
-        session = self.active_sessions.get(session_id)
+        session = await self.store.get_meta(self._key(session_id))
         if not session:
             return None
         
+        history = await self.store.get_history(self._key(session_id))
         return {
             "session_id": session_id,
             "agent_id": session["agent_id"],
             "status": session["status"],
-            "message_count": len(session["conversation_history"]),
+            "message_count": len(history),
             "created_at": session["created_at"],
-            "uptime_seconds": asyncio.get_event_loop().time() - session["created_at"]
+            "uptime_seconds": time.time() - session["created_at"]
         }
     
-    def get_active_sessions(self) -> list:
+    async def get_active_sessions(self) -> list:
         """
         Get all active voice sessions
         
         Returns:
             List of active session IDs
         """
-        return list(self.active_sessions.keys())
+        return [key[len("qwen:"):] for key in await self.store.keys("qwen:")]
+    
+    def shutdown(self):
+        """Stop the generation workers (generations in progress finish on their own)"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+    
+    @staticmethod
+    def _key(session_id: str) -> str:
+        return f"qwen:{session_id}"
 
 
 # Global instance
@@ -0,0 +1,205 @@
+"""
+RAG Service for AFO Platform
+Knowledge base retrieval for the chat path and workflow rag_query nodes
+
+- Latency budget: callers wait at most budget_ms for retrieval and go on
+  without context when it is late. The late retrieval still finishes in
+  the background and lands in the cache for the next ask.
+- Token cap: retrieved chunks are added to the context in rank order
+  until max_context_tokens; the last one is cut to fit.
+- Cache: per agent, keyed by normalized query and top_k, invalidated
+  when the agent's knowledge changes. Concurrent identical queries share
+  one retrieval.
+- Pre-warm: an agent's indexes can be loaded when a chat connects, so
+  its first question doesn't pay for opening them.
+"""
+
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.services.chunk_store import chunk_store
+from app.services.keyword_index import keyword_store
+from app.services.knowledge_service import KnowledgeService, knowledge_version
+from app.services.vector_store import collection_name, vector_store
+import asyncio
+import time
+
+
+class RagService:
+    def __init__(
+        self,
+        top_k: int = 5,
+        budget_ms: float = 300,
+        max_context_tokens: int = 1500,
+        cache_ttl_seconds: float = 300,
+        cache_entries_per_agent: int = 256,
+        encoding_name: str = "cl100k_base"
+    ):
+        self.top_k = top_k
+        self.budget_ms = budget_ms
+        self.max_context_tokens = max_context_tokens
+        self.cache_ttl = cache_ttl_seconds
+        self.cache_entries_per_agent = cache_entries_per_agent
+        self.encoding_name = encoding_name
+        self._encoding = None
+        # agent_id -> (knowledge version, {(query, top_k): (expires_at, result)})
+        self._cache: Dict[str, Tuple[int, "OrderedDict[tuple, tuple]"]] = {}
+        self._inflight: Dict[tuple, asyncio.Task] = {}
+        self._prewarming: Dict[str, asyncio.Task] = {}
+        self.stats = {"requests": 0, "cache_hits": 0, "timeouts": 0, "errors": 0}
+
+    # Retrieval
+
+    def _cached(self, agent_id: str, key: tuple, version: int) -> Optional[dict]:
+        entry = self._cache.get(agent_id)
+        if entry is None or entry[0] != version:
+            return None
+        hit = entry[1].get(key)
+        if hit is None or hit[0] < time.monotonic():
+            return None
+        entry[1].move_to_end(key)
+        return hit[1]
+
+    def _store(self, agent_id: str, key: tuple, version: int, result: dict):
+        entry = self._cache.get(agent_id)
+        if entry is None or entry[0] != version:
+            # The agent's knowledge changed: everything cached for it is stale
+            entry = self._cache[agent_id] = (version, OrderedDict())
+        entries = entry[1]
+        entries[key] = (time.monotonic() + self.cache_ttl, result)
+        entries.move_to_end(key)
+        while len(entries) > self.cache_entries_per_agent:
+            entries.popitem(last=False)
+
+    async def _query(self, agent_id: str, query: str, top_k: int) -> dict:
+        # Agents without knowledge skip the query embedding entirely
+        if not await vector_store.count(collection_name(agent_id)):
+            return {"query": query, "results": [], "context": ""}
+        return await KnowledgeService(None).query_knowledge(agent_id, query, top_k)
+
+    async def retrieve(self, agent_id: str, query: str, top_k: Optional[int] = None) -> dict:
+        """query_knowledge() result for the agent, served from the cache when fresh"""
+        result, _ = await self._retrieve(agent_id, query, top_k)
+        return result
+
+    async def _retrieve(self, agent_id: str, query: str, top_k: Optional[int]) -> Tuple[dict, bool]:
+        top_k = top_k or self.top_k
+        key = (" ".join(query.lower().split()), top_k)
+        version = knowledge_version(collection_name(agent_id))
+        cached = self._cached(agent_id, key, version)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            return cached, True
+
+        flight_key = (agent_id, version) + key
+        task = self._inflight.get(flight_key)
+        if task is None:
+            task = asyncio.create_task(self._query(agent_id, query, top_k))
+            self._inflight[flight_key] = task
+
+            def done(finished: asyncio.Task):
+                self._inflight.pop(flight_key, None)
+                if not finished.cancelled() and finished.exception() is None:
+                    self._store(agent_id, key, version, finished.result())
+
+            task.add_done_callback(done)
+        # Shielded: a caller giving up on its budget doesn't cancel the shared retrieval
+        return await asyncio.shield(task), False
+
+    def prewarm(self, agent_id: str):
+        """Load the agent's indexes in the background ahead of its first question"""
+        if agent_id in self._prewarming:
+            return
+        collection = collection_name(agent_id)
+
+        async def load():
+            try:
+                await asyncio.gather(
+                    vector_store.prewarm(collection),
+                    keyword_store.prewarm(collection),
+                    chunk_store.prewarm(collection)
+                )
+            except Exception as e:
+                print(f"Pre-warming knowledge for agent {agent_id} failed: {e}")
+            finally:
+                self._prewarming.pop(agent_id, None)
+
+        self._prewarming[agent_id] = asyncio.create_task(load())
+
+    # Context
+
+    def _get_encoding(self):
+        if self._encoding is None:
+            import tiktoken
+            self._encoding = tiktoken.get_encoding(self.encoding_name)
+        return self._encoding
+
+    def build_context(self, results: List[dict], max_tokens: Optional[int] = None) -> Tuple[str, int]:
+        """Numbered chunk texts in rank order, capped at max_tokens; returns (context, tokens)"""
+        max_tokens = max_tokens or self.max_context_tokens
+        encoding = self._get_encoding()
+        parts, used = [], 0
+        for i, result in enumerate(results, start=1):
+            tokens = encoding.encode(f"[{i}] {result['text']}", disallowed_special=())
+            if used + len(tokens) > max_tokens:
+                remaining = max_tokens - used
+                # A sliver of a chunk is noise; only cut one that keeps some substance
+                if remaining >= 32:
+                    parts.append(encoding.decode(tokens[:remaining]))
+                    used += remaining
+                break
+            parts.append(encoding.decode(tokens))
+            used += len(tokens)
+        return "\n\n".join(parts), used
+
+    async def get_context(
+        self,
+        agent_id: str,
+        query: str,
+        top_k: Optional[int] = None,
+        budget_ms: Optional[float] = None
+    ) -> dict:
+        """
+        Retrieval within the latency budget; never raises
+
+        Returns {"context", "results", "tokens", "latency_ms", "cached", "timed_out"};
+        context is "" when retrieval failed, was late or found nothing.
+        """
+        budget_ms = self.budget_ms if budget_ms is None else budget_ms
+        self.stats["requests"] += 1
+        start = time.perf_counter()
+        outcome = {"context": "", "results": [], "tokens": 0, "cached": False, "timed_out": False}
+        try:
+            result, outcome["cached"] = await asyncio.wait_for(
+                self._retrieve(agent_id, query, top_k),
+                budget_ms / 1000
+            )
+            outcome["results"] = result["results"]
+            outcome["context"], outcome["tokens"] = self.build_context(result["results"])
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            outcome["timed_out"] = True
+            print(f"RAG retrieval for agent {agent_id} exceeded its {budget_ms:.0f}ms budget; answering without context")
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"RAG retrieval for agent {agent_id} failed: {e}")
+        outcome["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return outcome
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "budget_ms": self.budget_ms,
+            "cached_agents": len(self._cache),
+            "inflight": len(self._inflight)
+        }
+
+
+# Global RAG service instance
+rag_service = RagService(
+    top_k=settings.RAG_TOP_K,
+    budget_ms=settings.RAG_LATENCY_BUDGET_MS,
+    max_context_tokens=settings.RAG_CONTEXT_MAX_TOKENS,
+    cache_ttl_seconds=settings.RAG_CACHE_TTL_SECONDS,
+    cache_entries_per_agent=settings.RAG_CACHE_MAX_ENTRIES_PER_AGENT
+)
@@ -0,0 +1,211 @@
+"""
+Re-ranking stage for knowledge queries
+Re-orders the candidates of first-stage retrieval (vector + BM25) with a
+scorer that reads the query and each chunk together, so the right chunk
+lands in the first few positions and fewer chunks need to go into the
+prompt
+
+Scorers:
+- lexical: a linear model over query/chunk match features (weighted term
+  coverage, identifier matches, adjacent query bigrams, term proximity,
+  first-stage rank); weights can be loaded from a JSON file
+- any other RERANK_MODEL value: a Hugging Face cross-encoder (e.g.
+  cross-encoder/ms-marco-MiniLM-L-6-v2) on CPU, loaded on first use
+
+Scoring runs on a thread pool, one batch per query, and scores of hot
+(query, chunk) pairs are cached.
+"""
+
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from app.core.config import settings
+from app.services.embedding_cache import content_hash
+from app.services.keyword_index import tokenize
+import asyncio
+import json
+import math
+import threading
+
+
+class LexicalScorer:
+    """Feature-based query/chunk relevance; no model download, ~0.1ms per pair"""
+
+    name = "lexical"
+    DEFAULT_WEIGHTS = {
+        "coverage": 1.0,
+        "identifier": 1.5,
+        "bigrams": 0.5,
+        "proximity": 0.3,
+        "prior": 0.8,
+    }
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None):
+        self.weights = {**self.DEFAULT_WEIGHTS, **(weights or {})}
+
+    @staticmethod
+    def _proximity(positions: List[List[int]]) -> float:
+        """1 for matched terms side by side, falling towards 0 as they spread out"""
+        if len(positions) < 2:
+            return 1.0 if positions else 0.0
+        # Smallest window holding one position of every matched term
+        events = sorted((p, i) for i, plist in enumerate(positions) for p in plist)
+        counts: Counter = Counter()
+        covered, best, left = 0, math.inf, 0
+        for position, term in events:
+            counts[term] += 1
+            if counts[term] == 1:
+                covered += 1
+            while covered == len(positions):
+                best = min(best, position - events[left][0] + 1)
+                counts[events[left][1]] -= 1
+                if counts[events[left][1]] == 0:
+                    covered -= 1
+                left += 1
+        return len(positions) / best
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        if not query_terms:
+            return [0.0] * len(texts)
+        documents = [tokenize(text) for text in texts]
+        # Term weights from this candidate set: a term every candidate has tells them apart least
+        document_sets = [set(terms) for terms in documents]
+        n = len(documents)
+        idf = {
+            term: math.log(1 + (n + 1) / (sum(term in terms for terms in document_sets) + 0.5))
+            for term in query_terms
+        }
+        total_idf = sum(idf.values())
+        query_bigrams = list(zip(query_terms, query_terms[1:]))
+        identifiers = [term for term in query_terms if any(c.isdigit() for c in term)]
+
+        scores = []
+        for rank, (terms, term_set) in enumerate(zip(documents, document_sets)):
+            matched = [term for term in query_terms if term in term_set]
+            positions = [[i for i, t in enumerate(terms) if t == term] for term in matched]
+            bigram_set = set(zip(terms, terms[1:]))
+            features = {
+                "coverage": sum(idf[term] for term in matched) / total_idf,
+                "identifier": (
+                    sum(term in term_set for term in identifiers) / len(identifiers) if identifiers else 0.0
+                ),
+                "bigrams": (
+                    sum(bigram in bigram_set for bigram in query_bigrams) / len(query_bigrams)
+                    if query_bigrams else 0.0
+                ),
+                "proximity": self._proximity(positions),
+                # Candidates arrive best-first from retrieval
+                "prior": 1.0 / (1.0 + rank),
+            }
+            scores.append(sum(self.weights[name] * value for name, value in features.items()))
+        return scores
+
+
+class CrossEncoderScorer:
+    """Hugging Face sequence-classification cross-encoder on CPU"""
+
+    def __init__(self, model_name: str, batch_size: int = 32, max_length: int = 512):
+        self.name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        # Loaded on the first query, on a rerank worker thread
+        with self._lock:
+            if self.model is None:
+                import torch
+                from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+                self.torch = torch
+                self.tokenizer = AutoTokenizer.from_pretrained(self.name)
+                self.model = AutoModelForSequenceClassification.from_pretrained(self.name).eval()
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        if self.model is None:
+            self._load()
+        scores: List[float] = []
+        with self.torch.inference_mode():
+            for i in range(0, len(texts), self.batch_size):
+                batch = texts[i:i + self.batch_size]
+                inputs = self.tokenizer(
+                    [query] * len(batch),
+                    batch,
+                    padding=True,
+                    truncation=True,
+                    max_length=self.max_length,
+                    return_tensors="pt"
+                )
+                logits = self.model(**inputs).logits
+                scores.extend(logits[:, 0].tolist() if logits.shape[1] == 1 else logits[:, -1].tolist())
+        return scores
+
+
+class Reranker:
+    """Re-orders retrieval results with a scorer, off the event loop, with a pair-score cache"""
+
+    def __init__(self, scorer, workers: int = 2, cache_size: int = 50000):
+        self.scorer = scorer
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rerank")
+        self.cache_size = cache_size
+        # (query, chunk hash, scorer) -> score
+        self._cache: "OrderedDict[tuple, float]" = OrderedDict()
+        self.stats = {"queries": 0, "pairs": 0, "cache_hits": 0}
+
+    async def rerank(self, query: str, results: List[dict], top_n: Optional[int] = None) -> List[dict]:
+        """results (best first, each with "text") re-ordered by the scorer; adds "rerankScore" """
+        if not results:
+            return []
+        normalized = " ".join(query.lower().split())
+        keys = [(normalized, content_hash(result["text"]), self.scorer.name) for result in results]
+        scores = [self._cache.get(key) for key in keys]
+        self.stats["queries"] += 1
+        self.stats["pairs"] += len(results)
+
+        missing = [i for i, score in enumerate(scores) if score is None]
+        self.stats["cache_hits"] += len(results) - len(missing)
+        if missing:
+            # The lexical scorer's features depend on the candidate set and order, so it
+            # always sees the full list; only the scores it wasn't asked for are cached
+            if isinstance(self.scorer, LexicalScorer):
+                texts, targets = [result["text"] for result in results], list(range(len(results)))
+            else:
+                texts, targets = [results[i]["text"] for i in missing], missing
+            computed = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.scorer.score, query, texts
+            )
+            for i, score in zip(targets, computed):
+                if scores[i] is None:
+                    scores[i] = score
+                    self._cache[keys[i]] = score
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        for key in keys:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+
+        order = sorted(range(len(results)), key=lambda i: scores[i], reverse=True)
+        return [{**results[i], "rerankScore": round(float(scores[i]), 4)} for i in order[:top_n]]
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "scorer": self.scorer.name, "cached_pairs": len(self._cache)}
+
+
+def _build_scorer():
+    if settings.RERANK_MODEL == "lexical":
+        weights = None
+        if settings.RERANK_LEXICAL_WEIGHTS:
+            with open(settings.RERANK_LEXICAL_WEIGHTS) as f:
+                weights = json.load(f)
+        return LexicalScorer(weights)
+    return CrossEncoderScorer(settings.RERANK_MODEL)
+
+
+# Global reranker instance
+reranker = Reranker(
+    _build_scorer(),
+    workers=settings.RERANK_WORKERS,
+    cache_size=settings.RERANK_CACHE_SIZE
+)
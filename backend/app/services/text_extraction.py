@@ -0,0 +1,138 @@
+"""
+Text extraction for knowledge base documents
+Runs inside the ingestion process pool, so this module only imports the
+parsers it needs, per call. Every extractor streams its text into an
+output file instead of returning it, keeping the parent process's
+memory flat however large the document is.
+"""
+
+import os
+import re
+
+
+_MARKDOWN_BLOCK = re.compile(r"^\s{0,3}(?:#{1,6}\s+|>\s?|[-*+]\s+|\d+\.\s+)")
+_MARKDOWN_LINK = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+_MARKDOWN_CODE = re.compile(r"(`+)(.+?)\1")
+# Paired emphasis/strikethrough delimiters at word boundaries only, so
+# identifiers (ERR_CONNECTION_RESET, AB-1234_X, __init__.py, 2*3) keep
+# their characters
+_MARKDOWN_EMPHASIS = re.compile(
+    r"(?<![\w*~])(?<!\w[.\-/:])(\*{1,3}|_{1,3}|~~)(?=\S)(.+?)(?<=\S)\1(?![\w*~])(?![.\-/:]\w)"
+)
+
+
+def _strip_emphasis(text: str) -> str:
+    # Twice for nested markers ("**bold _and italic_**")
+    for _ in range(2):
+        text = _MARKDOWN_EMPHASIS.sub(r"\2", text)
+    return text
+
+
+def _strip_markdown(line: str) -> str:
+    line = _MARKDOWN_LINK.sub(r"\1", _MARKDOWN_BLOCK.sub("", line))
+    # Code spans keep their content verbatim
+    parts, last = [], 0
+    for match in _MARKDOWN_CODE.finditer(line):
+        parts.append(_strip_emphasis(line[last:match.start()]))
+        parts.append(match.group(2))
+        last = match.end()
+    parts.append(_strip_emphasis(line[last:]))
+    return "".join(parts)
+
+
+def detect_type(file_name: str, content_type: str = "") -> str:
+    """Map a file to one of: pdf, docx, html, markdown, text"""
+    extension = os.path.splitext(file_name or "")[1].lower()
+    content_type = (content_type or "").lower()
+    if extension == ".pdf" or content_type == "application/pdf":
+        return "pdf"
+    if extension == ".docx" or "wordprocessingml" in content_type:
+        return "docx"
+    if extension in (".html", ".htm") or content_type == "text/html":
+        return "html"
+    if extension in (".md", ".markdown") or content_type == "text/markdown":
+        return "markdown"
+    return "text"
+
+
+def _extract_pdf(source_path: str, out) -> int:
+    from pypdf import PdfReader
+
+    reader = PdfReader(source_path)
+    pages = 0
+    for page in reader.pages:
+        text = page.extract_text() or ""
+        if text:
+            out.write(text)
+            out.write("\n\n")
+        pages += 1
+    return pages
+
+
+def _extract_docx(source_path: str, out) -> int:
+    from docx import Document
+
+    document = Document(source_path)
+    paragraphs = 0
+    for paragraph in document.paragraphs:
+        if paragraph.text:
+            out.write(paragraph.text)
+            out.write("\n")
+            paragraphs += 1
+    for table in document.tables:
+        for row in table.rows:
+            out.write(" | ".join(cell.text for cell in row.cells))
+            out.write("\n")
+    return paragraphs
+
+
+def _extract_html(source_path: str, out) -> int:
+    from bs4 import BeautifulSoup
+
+    with open(source_path, "rb") as f:
+        soup = BeautifulSoup(f, "html.parser")
+    for tag in soup(["script", "style", "noscript", "nav", "footer"]):
+        tag.decompose()
+    blocks = 0
+    for line in soup.get_text("\n").splitlines():
+        line = line.strip()
+        if line:
+            out.write(line)
+            out.write("\n")
+            blocks += 1
+    return blocks
+
+
+def _extract_markdown(source_path: str, out) -> int:
+    # Line by line, so large files never sit in memory whole
+    lines = 0
+    with open(source_path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            out.write(_strip_markdown(line))
+            lines += 1
+    return lines
+
+
+EXTRACTORS = {
+    "pdf": _extract_pdf,
+    "docx": _extract_docx,
+    "html": _extract_html,
+    "markdown": _extract_markdown,
+}
+
+
+def extract_to_file(source_path: str, file_type: str, output_path: str) -> dict:
+    """
+    Extract the text of a document into output_path (UTF-8)
+
+    Returns:
+        {"output_path", "units" (pages/paragraphs/lines), "bytes"}
+    """
+    extractor = EXTRACTORS[file_type]
+    with open(output_path, "w", encoding="utf-8") as out:
+        units = extractor(source_path, out)
+    return {
+        "output_path": output_path,
+        "units": units,
+        "bytes": os.path.getsize(output_path)
+    }
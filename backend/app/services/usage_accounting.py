@@ -0,0 +1,247 @@
+"""
+Usage Accounting for AFO Platform
+Every LLM/TTS/STT call records (tenant, agent, model, tokens, latency)
+into a lock-free in-process buffer; a background task drains it in bulk
+into per-minute rollups that anomaly detection, billing and the admin
+dashboard read instead of mock data
+"""
+
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+import asyncio
+import time
+
+
+# USD per 1K units. LLM units are tokens (prompt, completion);
+# TTS units are characters, STT units are audio seconds (prompt side only)
+MODEL_PRICING: Dict[str, Tuple[float, float]] = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-turbo-preview": (0.01, 0.03),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "text-embedding-3-small": (0.00002, 0.0),
+    "eleven_monolingual_v1": (0.3, 0.0),
+    "eleven_multilingual_v2": (0.3, 0.0),
+    "eleven_turbo_v2_5": (0.15, 0.0),
+    "nova-2": (0.0717, 0.0),
+}
+
+# Rollup row fields after the (tenant, agent, model, kind) key
+METRICS = ("calls", "prompt_tokens", "completion_tokens", "latency_ms", "cost")
+
+
+def estimate_cost(model: str, prompt_units: float, completion_units: float) -> float:
+    prompt_price, completion_price = MODEL_PRICING.get(model, (0.0, 0.0))
+    return (prompt_units * prompt_price + completion_units * completion_price) / 1000
+
+
+class InMemoryUsageStore:
+    """Per-minute rollups kept in process for a bounded retention window"""
+
+    def __init__(self, retention_hours: float = 48):
+        self.retention_minutes = int(retention_hours * 60)
+        self.minutes: Dict[int, Dict[tuple, List[float]]] = {}
+
+    async def write(self, rollups: Dict[int, Dict[tuple, List[float]]]):
+        for minute, rows in rollups.items():
+            bucket = self.minutes.setdefault(minute, {})
+            for key, values in rows.items():
+                current = bucket.get(key)
+                if current is None:
+                    bucket[key] = list(values)
+                else:
+                    for i, value in enumerate(values):
+                        current[i] += value
+
+        cutoff = int(time.time() // 60) - self.retention_minutes
+        for minute in [m for m in self.minutes if m < cutoff]:
+            del self.minutes[minute]
+
+    async def read(self, since_minute: int) -> List[Tuple[int, tuple, List[float]]]:
+        return [
+            (minute, key, values)
+            for minute, rows in self.minutes.items() if minute >= since_minute
+            for key, values in rows.items()
+        ]
+
+
+class RedisUsageStore:
+    """
+    Per-minute rollups in Redis hashes (one hash per minute), shared by
+    every worker; a flush is one pipelined round-trip
+    """
+
+    def __init__(self, client=None, url: str = "redis://localhost:6379", retention_hours: float = 48, namespace: str = "afo:usage:"):
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.from_url(url)
+        self.client = client
+        self.retention_seconds = int(retention_hours * 3600)
+        self.namespace = namespace
+
+    async def write(self, rollups: Dict[int, Dict[tuple, List[float]]]):
+        pipe = self.client.pipeline(transaction=False)
+        for minute, rows in rollups.items():
+            hash_key = f"{self.namespace}{minute}"
+            for key, values in rows.items():
+                prefix = "|".join(key)
+                for metric, value in zip(METRICS, values):
+                    if value:
+                        pipe.hincrbyfloat(hash_key, f"{prefix}|{metric}", value)
+            pipe.expire(hash_key, self.retention_seconds)
+        await pipe.execute()
+
+    async def read(self, since_minute: int) -> List[Tuple[int, tuple, List[float]]]:
+        now_minute = int(time.time() // 60)
+        # Nothing older than the retention window exists, don't ask for it
+        since_minute = max(since_minute, now_minute - self.retention_seconds // 60)
+        minutes = list(range(since_minute, now_minute + 1))
+        pipe = self.client.pipeline(transaction=False)
+        for minute in minutes:
+            pipe.hgetall(f"{self.namespace}{minute}")
+        results = await pipe.execute()
+
+        rows = []
+        for minute, fields in zip(minutes, results):
+            grouped: Dict[tuple, List[float]] = {}
+            for field, value in fields.items():
+                field = field.decode() if isinstance(field, bytes) else field
+                *key, metric = field.split("|")
+                values = grouped.setdefault(tuple(key), [0.0] * len(METRICS))
+                values[METRICS.index(metric)] = float(value)
+            rows.extend((minute, key, values) for key, values in grouped.items())
+        return rows
+
+
+class UsageAccounting:
+    """
+    Low-overhead usage recording
+
+    record() only appends a tuple to a deque (atomic in CPython, safe from
+    generation threads without locks); the flush loop aggregates and
+    writes rollups in bulk
+    """
+
+    def __init__(self, store=None, flush_interval_seconds: float = 10):
+        self.store = store or InMemoryUsageStore()
+        self.flush_interval = flush_interval_seconds
+        self._buffer: deque = deque()
+        self.running = False
+        self._task: Optional[asyncio.Task] = None
+        self.recorded = 0
+        self.flushed = 0
+
+    def record(
+        self,
+        kind: str,
+        model: str,
+        tenant_id: Optional[str] = None,
+        agent_id: Optional[str] = None,
+        prompt_tokens: float = 0,
+        completion_tokens: float = 0,
+        latency_ms: float = 0.0
+    ):
+        """Record one call; kind is "llm", "tts", "stt" or "embedding" """
+        self._buffer.append((
+            time.time(), tenant_id or "unknown", agent_id or "unknown", model, kind,
+            prompt_tokens, completion_tokens, latency_ms
+        ))
+        self.recorded += 1
+
+    async def start(self):
+        """Start the background flush task"""
+        self.running = True
+        self._task = asyncio.create_task(self._flush_loop())
+        print("✅ Usage accounting started")
+
+    async def stop(self):
+        """Stop the flush task and flush what is left"""
+        self.running = False
+        if self._task:
+            self._task.cancel()
+        await self.flush()
+        print("🛑 Usage accounting stopped")
+
+    async def _flush_loop(self):
+        while self.running:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error flushing usage records: {e}")
+
+    async def flush(self) -> int:
+        """Drain the buffer into per-minute rollups"""
+        rollups: Dict[int, Dict[tuple, List[float]]] = {}
+        drained = 0
+        while True:
+            try:
+                ts, tenant, agent, model, kind, prompt, completion, latency = self._buffer.popleft()
+            except IndexError:
+                break
+            drained += 1
+            row = rollups.setdefault(int(ts // 60), {}).setdefault(
+                (tenant, agent, model, kind), [0.0] * len(METRICS)
+            )
+            row[0] += 1
+            row[1] += prompt
+            row[2] += completion
+            row[3] += latency
+            row[4] += estimate_cost(model, prompt, completion)
+
+        if rollups:
+            await self.store.write(rollups)
+        self.flushed += drained
+        return drained
+
+    async def get_rollups(
+        self,
+        minutes: int = 60,
+        tenant_id: Optional[str] = None,
+        agent_id: Optional[str] = None
+    ) -> List[dict]:
+        """Per-minute rollup rows for the last `minutes` minutes"""
+        since = int(time.time() // 60) - minutes + 1
+        rows = []
+        for minute, (tenant, agent, model, kind), values in await self.store.read(since):
+            if tenant_id and tenant != tenant_id:
+                continue
+            if agent_id and agent != agent_id:
+                continue
+            row = {
+                "minute": minute * 60,
+                "tenant_id": tenant,
+                "agent_id": agent,
+                "model": model,
+                "kind": kind
+            }
+            row.update(zip(METRICS, values))
+            rows.append(row)
+        return sorted(rows, key=lambda r: r["minute"])
+
+    async def get_summary(self, minutes: int = 60, group_by: str = "model", tenant_id: Optional[str] = None) -> dict:
+        """Totals over the window, grouped by model, tenant, agent or kind"""
+        totals = {metric: 0.0 for metric in METRICS}
+        groups: Dict[str, Dict[str, float]] = {}
+        for row in await self.get_rollups(minutes, tenant_id=tenant_id):
+            group = groups.setdefault(row[group_by], {metric: 0.0 for metric in METRICS})
+            for metric in METRICS:
+                group[metric] += row[metric]
+                totals[metric] += row[metric]
+
+        totals["avg_latency_ms"] = totals["latency_ms"] / totals["calls"] if totals["calls"] else 0.0
+        return {"window_minutes": minutes, "totals": totals, group_by: groups}
+
+
+def _build_usage_accounting() -> UsageAccounting:
+    if settings.USAGE_STORE_BACKEND == "redis":
+        store = RedisUsageStore(url=settings.REDIS_URL, retention_hours=settings.USAGE_RETENTION_HOURS)
+    else:
+        store = InMemoryUsageStore(retention_hours=settings.USAGE_RETENTION_HOURS)
+    return UsageAccounting(store, flush_interval_seconds=settings.USAGE_FLUSH_INTERVAL_SECONDS)
+
+
+# Global usage accounting instance
+usage_accounting = _build_usage_accounting()
@@ -0,0 +1,849 @@
+"""
+Vector Store for AFO Platform
+Pluggable storage and similarity search for knowledge base chunks, one
+collection per agent (agent_{id})
+
+Backends:
+- milvus: the Milvus service at MILVUS_HOST:MILVUS_PORT
+- local: an embedded index persisted to memory-mapped files, for edge
+  deployments and tests. Small collections are searched brute-force;
+  past VECTOR_INDEX_THRESHOLD vectors an IVF index (k-means lists stored
+  contiguously) is built in the background, so a query only scans the
+  few lists nearest to it. Collections are opened on first use and
+  closed again, least recently used first, to stay within
+  KNOWLEDGE_INDEX_MEMORY_BUDGET_MB.
+
+Vectors are compared by cosine similarity; scores are in [-1, 1].
+"""
+
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Dict, List, Optional
+from app.core.config import settings
+from app.services.collection_manager import CollectionManager, collection_manager
+from app.services.quantization import PQQuantizer, make_quantizer
+import asyncio
+import json
+import msgpack
+import numpy as np
+import os
+import re
+import struct
+import threading
+import time
+
+_LENGTH = struct.Struct("<I")
+# Python objects per row id (string, list slot, dict entry), for memory estimates
+_ID_OVERHEAD = 160
+
+
+class VectorStore(ABC):
+    """Interface shared by the Milvus and local backends"""
+
+    @abstractmethod
+    async def upsert(self, collection: str, ids: List[str], vectors: List[List[float]], payloads: List[dict]):
+        """Insert or replace vectors with their payloads"""
+
+    @abstractmethod
+    async def search(self, collection: str, vector: List[float], top_k: int = 5, with_payload: bool = True) -> List[dict]:
+        """Nearest chunks as [{"id", "score", "payload"}], best first; without payloads {"id", "score"}"""
+
+    @abstractmethod
+    async def fetch(self, collection: str, ids: List[str]) -> Dict[str, dict]:
+        """Payloads of the given ids that exist, by id"""
+
+    @abstractmethod
+    async def delete(self, collection: str, ids: List[str]) -> int:
+        """Delete vectors by id; returns how many existed"""
+
+    @abstractmethod
+    async def count(self, collection: str) -> int:
+        """Live vectors in a collection (0 if it doesn't exist)"""
+
+    @abstractmethod
+    async def set_quantization(self, collection: str, quantization: str):
+        """Choose how a collection stores its vectors: "none", "int8" or "pq" """
+
+    async def prewarm(self, collection: str) -> bool:
+        """Load a collection ahead of its first query; False if it doesn't exist"""
+        return False
+
+    def get_stats(self) -> dict:
+        return {}
+
+
+def collection_name(agent_id: str) -> str:
+    """Per-agent collection name (Milvus only allows letters, digits and underscores)"""
+    return "agent_" + re.sub(r"[^0-9A-Za-z_]", "_", agent_id)
+
+
+class MilvusVectorStore(VectorStore):
+    """
+    Milvus backend; pymilvus is synchronous, so calls run in threads
+
+    Quantization maps to Milvus index types: int8 -> IVF_SQ8, pq -> IVF_PQ
+    (Milvus re-ranks internally), none -> AUTOINDEX.
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 19530,
+        client=None,
+        quantization: str = "none",
+        pq_subvectors: int = 0
+    ):
+        if client is None:
+            from pymilvus import MilvusClient
+            client = MilvusClient(uri=f"http://{host}:{port}")
+        self.client = client
+        self.quantization = quantization
+        self.pq_subvectors = pq_subvectors
+        # collection -> quantization chosen for it (others use the default)
+        self.quantizations: Dict[str, str] = {}
+        self._known: set = set()
+
+    def _apply_index(self, collection: str, quantization: str, dim: int):
+        index_params = self.client.prepare_index_params()
+        if quantization == "int8":
+            index_params.add_index("vector", index_type="IVF_SQ8", metric_type="COSINE", params={"nlist": 1024})
+        elif quantization == "pq":
+            m = self.pq_subvectors or PQQuantizer(dim).m
+            index_params.add_index(
+                "vector",
+                index_type="IVF_PQ",
+                metric_type="COSINE",
+                params={"nlist": 1024, "m": m, "nbits": 8}
+            )
+        else:
+            index_params.add_index("vector", index_type="AUTOINDEX", metric_type="COSINE")
+        self.client.release_collection(collection)
+        self.client.drop_index(collection, "vector")
+        self.client.create_index(collection, index_params)
+        self.client.load_collection(collection)
+
+    def _ensure(self, collection: str, dim: int):
+        if collection in self._known:
+            return
+        if not self.client.has_collection(collection):
+            self.client.create_collection(
+                collection,
+                dimension=dim,
+                metric_type="COSINE",
+                id_type="string",
+                max_length=128
+            )
+            quantization = self.quantizations.get(collection, self.quantization)
+            if quantization != "none":
+                self._apply_index(collection, quantization, dim)
+        self._known.add(collection)
+
+    async def upsert(self, collection: str, ids: List[str], vectors: List[List[float]], payloads: List[dict]):
+        rows = [
+            {**payload, "id": id_, "vector": vector}
+            for id_, vector, payload in zip(ids, vectors, payloads)
+        ]
+
+        def write():
+            self._ensure(collection, len(vectors[0]))
+            self.client.upsert(collection, rows)
+
+        await asyncio.to_thread(write)
+
+    async def search(self, collection: str, vector: List[float], top_k: int = 5, with_payload: bool = True) -> List[dict]:
+        def query():
+            if not self.client.has_collection(collection):
+                return []
+            output_fields = ["*"] if with_payload else []
+            return self.client.search(collection, data=[vector], limit=top_k, output_fields=output_fields)[0]
+
+        hits = await asyncio.to_thread(query)
+        if not with_payload:
+            return [{"id": hit["id"], "score": float(hit["distance"])} for hit in hits]
+        results = []
+        for hit in hits:
+            payload = dict(hit.get("entity") or {})
+            payload.pop("vector", None)
+            payload.pop("id", None)
+            results.append({"id": hit["id"], "score": float(hit["distance"]), "payload": payload})
+        return results
+
+    async def fetch(self, collection: str, ids: List[str]) -> Dict[str, dict]:
+        def get():
+            if not ids or not self.client.has_collection(collection):
+                return []
+            return self.client.get(collection, ids=ids, output_fields=["*"])
+
+        payloads = {}
+        for row in await asyncio.to_thread(get):
+            row = dict(row)
+            row.pop("vector", None)
+            payloads[row.pop("id")] = row
+        return payloads
+
+    async def delete(self, collection: str, ids: List[str]) -> int:
+        def remove():
+            if not self.client.has_collection(collection):
+                return 0
+            return self.client.delete(collection, ids=ids).get("delete_count", 0)
+
+        return await asyncio.to_thread(remove)
+
+    async def count(self, collection: str) -> int:
+        def stats():
+            if not self.client.has_collection(collection):
+                return 0
+            return int(self.client.get_collection_stats(collection).get("row_count", 0))
+
+        return await asyncio.to_thread(stats)
+
+    async def set_quantization(self, collection: str, quantization: str):
+        make_quantizer(quantization, 8)  # validate
+        self.quantizations[collection] = quantization
+
+        def reindex():
+            if self.client.has_collection(collection):
+                schema = self.client.describe_collection(collection)
+                dim = next(
+                    field["params"]["dim"] for field in schema["fields"]
+                    if field["name"] == "vector"
+                )
+                self._apply_index(collection, quantization, int(dim))
+
+        await asyncio.to_thread(reindex)
+
+    async def prewarm(self, collection: str) -> bool:
+        def load():
+            if not self.client.has_collection(collection):
+                return False
+            self.client.load_collection(collection)
+            return True
+
+        return await asyncio.to_thread(load)
+
+    def get_stats(self) -> dict:
+        return {"backend": "milvus", "quantizations": dict(self.quantizations)}
+
+
+class _IVFIndex:
+    """
+    Inverted-file index over the first indexed_count rows
+
+    Rows are re-laid out so each list is one contiguous slice of a
+    memory-mapped file (float vectors, or quantizer codes when quantized);
+    rows[i] maps position i back to its row id.
+    """
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, rows: np.ndarray, vectors: np.ndarray, quantized: bool = False):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = rows
+        self.vectors = vectors
+        self.quantized = quantized
+        self.indexed_count = len(rows)
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+
+class LocalCollection:
+    """
+    One embedded collection on disk
+
+    meta.json       dimension and quantization ("none", "int8" or "pq")
+    vectors.f32     normalized float32 rows (memory-mapped, grows by doubling)
+    records.log     length-prefixed msgpack [row, id, payload]; payload None
+                    is a delete of id
+    quantizer.npz   trained quantizer, once train_size rows exist
+    codes.bin       quantized rows; scans read these and only the best
+                    rerank_factor * top_k candidates are re-scored in float
+    ivf.npz/.f32    IVF index (.codes when quantized), rebuilt in the
+                    background as rows are added
+    """
+
+    def __init__(
+        self,
+        path: str,
+        index_threshold: int = 50000,
+        nprobe: int = 16,
+        quantization: str = "none",
+        pq_subvectors: int = 0,
+        rerank_factor: int = 8,
+        train_size: int = 10000
+    ):
+        self.path = path
+        self.index_threshold = index_threshold
+        self.nprobe = nprobe
+        # Applies when the collection is created; an existing one keeps its meta.json setting
+        self.quantization = quantization
+        self.pq_subvectors = pq_subvectors
+        self.rerank_factor = rerank_factor
+        self.train_size = train_size
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self.dim: Optional[int] = None
+        self.count = 0
+        self.capacity = 0
+        self.vectors: Optional[np.ndarray] = None
+        self.quantizer = None
+        self.codes: Optional[np.ndarray] = None
+        # Rows [0, encoded_count) have codes
+        self.encoded_count = 0
+        self.ids: List[str] = []
+        self.row_of: Dict[str, int] = {}
+        self.offsets = np.zeros(0, dtype=np.int64)
+        self.alive = np.zeros(0, dtype=bool)
+        self.ivf: Optional[_IVFIndex] = None
+        self._building = False
+        make_quantizer(quantization, 8)  # validate early
+        self._load()
+        self._log = open(self._file("records.log"), "ab")
+        self._reader = open(self._file("records.log"), "rb")
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    # Persistence
+
+    def _write_meta(self):
+        with open(self._file("meta.json"), "w") as f:
+            json.dump({"dim": self.dim, "quantization": self.quantization}, f)
+
+    def _load(self):
+        meta_path = self._file("meta.json")
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path) as f:
+            meta = json.load(f)
+        self.dim = meta["dim"]
+        self.quantization = meta.get("quantization", "none")
+        quantizer_path = self._file("quantizer.npz")
+        state = dict(np.load(quantizer_path)) if os.path.exists(quantizer_path) else None
+        self.quantizer = make_quantizer(self.quantization, self.dim, self.pq_subvectors, state)
+
+        offsets = []
+        position = 0
+        log_path = self._file("records.log")
+        if not os.path.exists(log_path):
+            return
+        with open(log_path, "rb") as f:
+            while True:
+                header = f.read(_LENGTH.size)
+                if len(header) < _LENGTH.size:
+                    break
+                (length,) = _LENGTH.unpack(header)
+                body = f.read(length)
+                if len(body) < length:
+                    break  # torn write at the tail
+                row, id_, payload = msgpack.unpackb(body)
+                if payload is None:
+                    dead = self.row_of.pop(id_, None)
+                    if dead is not None:
+                        offsets[dead] = -1
+                else:
+                    previous = self.row_of.get(id_)
+                    if previous is not None:
+                        offsets[previous] = -1
+                    self.ids.append(id_)
+                    self.row_of[id_] = row
+                    offsets.append(position)
+                position += _LENGTH.size + length
+        if position < os.path.getsize(log_path):
+            # Drop a torn tail so new records append after the last good one
+            with open(log_path, "r+b") as f:
+                f.truncate(position)
+
+        self.count = len(offsets)
+        self._map_vectors(max(self.count, 1))
+        self.offsets[:self.count] = offsets
+        self.alive[:self.count] = self.offsets[:self.count] >= 0
+        if self.quantizer is not None and self.quantizer.trained:
+            # Codes are written with their rows once the quantizer exists
+            self.encoded_count = self.count
+
+        ivf_path = self._file("ivf.npz")
+        if os.path.exists(ivf_path):
+            data = np.load(ivf_path)
+            rows = data["rows"]
+            quantized = bool(data["quantized"]) if "quantized" in data else False
+            if quantized and not (self.quantizer is not None and self.quantizer.trained):
+                return  # left over from a previous quantization; rebuilt on the next write
+            if quantized:
+                vectors = np.memmap(
+                    self._file("ivf.codes"),
+                    dtype=self.quantizer.dtype,
+                    mode="r",
+                    shape=(len(rows), self.quantizer.code_size)
+                )
+            else:
+                vectors = np.memmap(self._file("ivf.f32"), dtype=np.float32, mode="r", shape=(len(rows), self.dim))
+            self.ivf = _IVFIndex(data["centroids"], data["offsets"], rows, vectors, quantized)
+
+    def _map_vectors(self, needed: int):
+        """Grow the vector file and the per-row arrays (amortized doubling)"""
+        if needed <= self.capacity:
+            return
+        capacity = max(needed, self.capacity * 2, 1024)
+        path = self._file("vectors.f32")
+        with open(path, "ab") as f:
+            if f.tell() < capacity * self.dim * 4:
+                f.truncate(capacity * self.dim * 4)
+        # Searches holding the old mapping keep working; it covers a prefix of the file
+        self.vectors = np.memmap(path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        offsets = np.full(capacity, -1, dtype=np.int64)
+        offsets[:self.capacity] = self.offsets
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self.capacity] = self.alive
+        self.offsets, self.alive = offsets, alive
+        self.capacity = capacity
+        self._map_codes()
+
+    def _map_codes(self):
+        if self.quantizer is None:
+            self.codes = None
+            return
+        path = self._file("codes.bin")
+        size = self.capacity * self.quantizer.code_size * np.dtype(self.quantizer.dtype).itemsize
+        with open(path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        self.codes = np.memmap(path, dtype=self.quantizer.dtype, mode="r+", shape=(self.capacity, self.quantizer.code_size))
+
+    def _append_record(self, row: int, id_: str, payload: Optional[dict]) -> int:
+        body = msgpack.packb([row, id_, payload])
+        position = self._log.tell()
+        self._log.write(_LENGTH.pack(len(body)) + body)
+        return position
+
+    # Writes
+
+    def upsert(self, ids: List[str], vectors: np.ndarray, payloads: List[dict]):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(set(ids)) < len(ids):
+            # An id repeated within the batch: the last one wins, the rest never get a row
+            keep = sorted({id_: i for i, id_ in enumerate(ids)}.values())
+            ids, vectors, payloads = [ids[i] for i in keep], vectors[keep], [payloads[i] for i in keep]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self.quantizer = make_quantizer(self.quantization, self.dim, self.pq_subvectors)
+                self._write_meta()
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+
+            start = self.count
+            end = start + len(ids)
+            self._map_vectors(end)
+            # Vectors first: a crash before the log write leaves unreferenced rows, never dangling ones
+            self.vectors[start:end] = vectors
+            if self.quantizer is not None and self.quantizer.trained:
+                self.codes[start:end] = self.quantizer.encode(vectors)
+
+            # Rows past a search's snapshot of count are invisible to it, so in-place updates are safe
+            for i, (id_, payload) in enumerate(zip(ids, payloads)):
+                previous = self.row_of.get(id_)
+                if previous is not None:
+                    self.alive[previous] = False
+                self.offsets[start + i] = self._append_record(start + i, id_, payload)
+                self.row_of[id_] = start + i
+                self.ids.append(id_)
+            self._log.flush()
+
+            self.alive[start:end] = True
+            self.count = end
+            if self.quantizer is not None and self.quantizer.trained:
+                self.encoded_count = end
+
+        self._maybe_build()
+
+    def delete(self, ids: List[str]) -> int:
+        deleted = 0
+        with self._lock:
+            for id_ in ids:
+                row = self.row_of.pop(id_, None)
+                if row is None:
+                    continue
+                self.alive[row] = False
+                self._append_record(row, id_, None)
+                deleted += 1
+            self._log.flush()
+        return deleted
+
+    def set_quantization(self, quantization: str):
+        """Switch quantization; codes and index are rebuilt in the background"""
+        with self._lock:
+            if quantization == self.quantization:
+                return
+            quantizer = make_quantizer(quantization, self.dim or 8, self.pq_subvectors)
+            self.quantization = quantization
+            if self.dim is None:
+                return
+            self.quantizer = quantizer
+            self.encoded_count = 0
+            for name in ("quantizer.npz", "codes.bin"):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+            self._map_codes()
+            self._write_meta()
+            # Searches fall back to the float rows until the new index is built
+            self.ivf = None
+        self._maybe_build()
+
+    # Index
+
+    def _needs_training(self) -> bool:
+        return self.quantizer is not None and not self.quantizer.trained and self.count >= self.train_size
+
+    def _maybe_build(self):
+        with self._lock:
+            if self._building:
+                return
+            if not self._needs_training():
+                if self.count < self.index_threshold:
+                    return
+                stale = self.ivf is None or self.ivf.quantized != (self.quantizer is not None and self.quantizer.trained)
+                # Rebuild once rows added since the last build reach 20% of it
+                if not stale and self.count - self.ivf.indexed_count < 0.2 * self.ivf.indexed_count:
+                    return
+            self._building = True
+        threading.Thread(target=self._build_safely, daemon=True).start()
+
+    def _build_safely(self):
+        try:
+            if self._needs_training():
+                self.train_quantizer()
+            if self.count >= self.index_threshold:
+                self.build_index()
+        except Exception as e:
+            print(f"Error building vector index for {self.path}: {e}")
+        finally:
+            self._building = False
+
+    def train_quantizer(self, sample_size: int = 16384, seed: int = 0):
+        """Train the quantizer on a sample of the rows and encode them all"""
+        quantizer = make_quantizer(self.quantization, self.dim, self.pq_subvectors)
+        n = self.count
+        vectors = self.vectors[:n]
+        rng = np.random.default_rng(seed)
+        quantizer.train(np.asarray(vectors[np.sort(rng.choice(n, size=min(n, sample_size), replace=False))]))
+
+        codes = self.codes[:n]
+        for i in range(0, n, 65536):
+            codes[i:i + 65536] = quantizer.encode(vectors[i:i + 65536])
+        with self._lock:
+            if self.quantization != quantizer.mode:
+                return  # switched while training
+            # Rows written while training; from here on upserts encode their own
+            if self.count > n:
+                self.codes[n:self.count] = quantizer.encode(self.vectors[n:self.count])
+            self.codes.flush()
+            with open(self._file("quantizer.npz.tmp"), "wb") as f:
+                np.savez(f, **quantizer.state())
+            os.replace(self._file("quantizer.npz.tmp"), self._file("quantizer.npz"))
+            self.quantizer = quantizer
+            self.encoded_count = self.count
+
+    def build_index(self, iterations: int = 8, seed: int = 0):
+        """Train spherical k-means lists over the current rows and swap the index in"""
+        n = self.count
+        vectors = self.vectors[:n]
+        quantizer = self.quantizer if self.quantizer is not None and self.quantizer.trained else None
+        codes = self.codes[:n] if quantizer is not None else None
+        rng = np.random.default_rng(seed)
+        nlist = int(min(max(2 * np.sqrt(n), 16), 4096))
+
+        sample = vectors[np.sort(rng.choice(n, size=min(n, 40 * nlist), replace=False))]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            counts = np.bincount(labels, minlength=nlist)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            sums = np.zeros_like(centroids)
+            nonempty = counts > 0
+            sums[nonempty] = np.add.reduceat(sample[np.argsort(labels, kind="stable")], starts[nonempty], axis=0)
+            empty = ~nonempty
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()), replace=False)]
+            centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+        labels = np.empty(n, dtype=np.int32)
+        for i in range(0, n, 65536):
+            labels[i:i + 65536] = np.argmax(vectors[i:i + 65536] @ centroids.T, axis=1)
+        rows = np.argsort(labels, kind="stable").astype(np.int64)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=nlist))]).astype(np.int64)
+
+        # Quantized collections lay out codes, so list scans never touch the float rows
+        name = "ivf.codes" if quantizer is not None else "ivf.f32"
+        source = codes if quantizer is not None else vectors
+        dtype = quantizer.dtype if quantizer is not None else np.float32
+        width = quantizer.code_size if quantizer is not None else self.dim
+        laid_out = np.memmap(self._file(name + ".tmp"), dtype=dtype, mode="w+", shape=(n, width))
+        for i in range(0, n, 65536):
+            laid_out[i:i + 65536] = source[rows[i:i + 65536]]
+        laid_out.flush()
+        del laid_out
+        with open(self._file("ivf.npz.tmp"), "wb") as f:
+            np.savez(f, centroids=centroids, offsets=offsets, rows=rows, quantized=quantizer is not None)
+        os.replace(self._file(name + ".tmp"), self._file(name))
+        os.replace(self._file("ivf.npz.tmp"), self._file("ivf.npz"))
+
+        mapped = np.memmap(self._file(name), dtype=dtype, mode="r", shape=(n, width))
+        with self._lock:
+            if quantizer is not None and self.quantizer is not quantizer:
+                return  # quantization switched while building; the next build replaces this one
+            self.ivf = _IVFIndex(centroids, offsets, rows, mapped, quantizer is not None)
+        # The other layout's file is stale now
+        stale = self._file("ivf.f32" if quantizer is not None else "ivf.codes")
+        if os.path.exists(stale):
+            os.remove(stale)
+
+    # Reads
+
+    def _payload(self, row: int) -> dict:
+        header = os.pread(self._reader.fileno(), _LENGTH.size, int(self.offsets[row]))
+        (length,) = _LENGTH.unpack(header)
+        body = os.pread(self._reader.fileno(), length, int(self.offsets[row]) + _LENGTH.size)
+        return msgpack.unpackb(body)[2]
+
+    def search(self, vector: np.ndarray, top_k: int = 5, with_payload: bool = True) -> List[dict]:
+        # Snapshot; writers only touch rows past count or replace arrays wholesale
+        count, alive, vectors, ivf = self.count, self.alive, self.vectors, self.ivf
+        quantizer, codes, encoded = self.quantizer, self.codes, self.encoded_count
+        if count == 0:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        score_codes = quantizer.scorer(query) if quantizer is not None and quantizer.trained else None
+
+        def score_range(start: int, end: int) -> np.ndarray:
+            # Encoded rows are scored from their codes, newer ones from the float rows
+            split = min(max(encoded, start), end) if score_codes is not None else start
+            parts = []
+            if split > start:
+                parts.append(score_codes(codes[start:split]))
+            if end > split:
+                parts.append(vectors[split:end] @ query)
+            return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+        if ivf is None:
+            rows = np.arange(count)
+            scores = score_range(0, count)
+        else:
+            nprobe = min(self.nprobe, ivf.nlist)
+            probe = np.argpartition(-(ivf.centroids @ query), nprobe - 1)[:nprobe]
+            row_parts, score_parts = [], []
+            for list_id in probe:
+                start, end = ivf.offsets[list_id], ivf.offsets[list_id + 1]
+                if start < end:
+                    row_parts.append(ivf.rows[start:end])
+                    if ivf.quantized:
+                        score_parts.append(score_codes(ivf.vectors[start:end]))
+                    else:
+                        score_parts.append(ivf.vectors[start:end] @ query)
+            # Rows added since the last build are scanned directly
+            if ivf.indexed_count < count:
+                row_parts.append(np.arange(ivf.indexed_count, count))
+                score_parts.append(score_range(ivf.indexed_count, count))
+            if not row_parts:
+                return []
+            rows = np.concatenate(row_parts)
+            scores = np.concatenate(score_parts)
+
+        scores = np.where(alive[rows], scores, -np.inf)
+        approximate = score_codes is not None and (ivf is None or ivf.quantized or encoded > ivf.indexed_count)
+        k = min(top_k * self.rerank_factor if approximate else top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        if approximate:
+            # Exact re-rank of the candidates from the float rows (sorted for sequential reads)
+            finite = best[np.isfinite(scores[best])]
+            order = np.argsort(rows[finite])
+            candidates = finite[order]
+            scores[candidates] = vectors[rows[candidates]] @ query
+            best = finite
+        best = best[np.argsort(-scores[best])][:top_k]
+        if not with_payload:
+            return [{"id": self.ids[rows[i]], "score": float(scores[i])} for i in best if np.isfinite(scores[i])]
+        return [
+            {"id": self.ids[rows[i]], "score": float(scores[i]), "payload": self._payload(rows[i])}
+            for i in best if np.isfinite(scores[i])
+        ]
+
+    def fetch(self, ids: List[str]) -> Dict[str, dict]:
+        rows = [(id_, self.row_of.get(id_)) for id_ in ids]
+        return {id_: self._payload(row) for id_, row in rows if row is not None}
+
+    def get_vectors(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        """Stored (normalized) vectors of the given ids that exist"""
+        rows = [(id_, self.row_of.get(id_)) for id_ in ids]
+        vectors = self.vectors
+        return {id_: np.array(vectors[row]) for id_, row in rows if row is not None}
+
+    def live_count(self) -> int:
+        return int(self.alive[:self.count].sum())
+
+    # Residency (see CollectionManager)
+
+    def memory_bytes(self) -> int:
+        """Estimated memory a resident collection holds: row bookkeeping plus the pages scans touch"""
+        quantized = self.quantizer is not None and self.quantizer.trained
+        scanned = self.quantizer.code_size * np.dtype(self.quantizer.dtype).itemsize if quantized else (self.dim or 0) * 4
+        # offsets + alive per row of capacity; id string, list slot and dict entry per row
+        size = self.capacity * 9 + self.count * (_ID_OVERHEAD + scanned)
+        if self.ivf is not None:
+            size += self.ivf.centroids.nbytes + self.ivf.rows.nbytes + self.ivf.indexed_count * scanned
+        return size
+
+    def evictable(self) -> bool:
+        # A background build still reads the mapped rows
+        return not self._building
+
+    def close(self):
+        with self._lock:
+            self._log.close()
+            self._reader.close()
+            for array in (self.vectors, self.codes):
+                if isinstance(array, np.memmap):
+                    array.flush()
+            self.vectors = self.codes = self.ivf = None
+
+    def get_stats(self) -> dict:
+        quantized = self.quantizer is not None and self.quantizer.trained
+        return {
+            "vectors": self.live_count(),
+            "rows": self.count,
+            "dim": self.dim,
+            "quantization": self.quantization,
+            "quantized": self.encoded_count if quantized else 0,
+            # What similarity scans read per vector
+            "bytes_per_vector": (
+                self.quantizer.code_size * np.dtype(self.quantizer.dtype).itemsize if quantized
+                else (self.dim or 0) * 4
+            ),
+            "index": "ivf" if self.ivf is not None else "flat",
+            "indexed": self.ivf.indexed_count if self.ivf is not None else 0,
+            "building": self._building
+        }
+
+
+class LocalVectorStore(VectorStore):
+    """
+    Embedded backend: one LocalCollection directory per collection
+
+    Collections are opened on first use and closed again when the manager
+    needs room for others (a private one unless a shared one is passed).
+    """
+
+    def __init__(
+        self,
+        data_dir: str,
+        index_threshold: int = 50000,
+        nprobe: int = 16,
+        quantization: str = "none",
+        pq_subvectors: int = 0,
+        rerank_factor: int = 8,
+        train_size: int = 10000,
+        manager: Optional[CollectionManager] = None
+    ):
+        self.data_dir = data_dir
+        self.index_threshold = index_threshold
+        self.nprobe = nprobe
+        # Default for new collections; set_quantization() changes one collection
+        self.quantization = quantization
+        self.pq_subvectors = pq_subvectors
+        self.rerank_factor = rerank_factor
+        self.train_size = train_size
+        self.manager = manager or CollectionManager()
+        # Search latency split by whether the query had to load its collection
+        self._search_ms = {"cold": deque(maxlen=1000), "warm": deque(maxlen=1000)}
+
+    def _opener(self, collection: str):
+        def open_collection(create: bool) -> Optional[LocalCollection]:
+            path = os.path.join(self.data_dir, collection)
+            if not create and not os.path.isdir(path):
+                return None
+            return LocalCollection(
+                path,
+                self.index_threshold,
+                self.nprobe,
+                quantization=self.quantization,
+                pq_subvectors=self.pq_subvectors,
+                rerank_factor=self.rerank_factor,
+                train_size=self.train_size
+            )
+
+        return open_collection
+
+    async def _run(self, collection: str, operation, default, create: bool = False):
+        """operation(local) on a worker thread with the collection resident; default if it doesn't exist"""
+        def run():
+            with self.manager.use(("vectors", collection), self._opener(collection), create) as local:
+                return default if local is None else operation(local)
+
+        return await asyncio.to_thread(run)
+
+    async def upsert(self, collection: str, ids: List[str], vectors: List[List[float]], payloads: List[dict]):
+        await self._run(collection, lambda local: local.upsert(ids, vectors, payloads), None, create=True)
+
+    async def search(self, collection: str, vector: List[float], top_k: int = 5, with_payload: bool = True) -> List[dict]:
+        cold = not self.manager.is_resident(("vectors", collection))
+        start = time.perf_counter()
+        hits = await self._run(collection, lambda local: local.search(vector, top_k, with_payload), [])
+        self._search_ms["cold" if cold else "warm"].append((time.perf_counter() - start) * 1000)
+        return hits
+
+    async def fetch(self, collection: str, ids: List[str]) -> Dict[str, dict]:
+        return await self._run(collection, lambda local: local.fetch(ids), {})
+
+    async def delete(self, collection: str, ids: List[str]) -> int:
+        return await self._run(collection, lambda local: local.delete(ids), 0)
+
+    async def count(self, collection: str) -> int:
+        return await self._run(collection, lambda local: local.live_count(), 0)
+
+    async def set_quantization(self, collection: str, quantization: str):
+        await self._run(collection, lambda local: local.set_quantization(quantization), None, create=True)
+
+    async def prewarm(self, collection: str) -> bool:
+        key = ("vectors", collection)
+        if self.manager.is_resident(key):
+            return True
+        return await asyncio.to_thread(self.manager.prewarm, key, self._opener(collection))
+
+    def get_stats(self) -> dict:
+        latency = {}
+        for kind, samples in self._search_ms.items():
+            if samples:
+                p50, p99 = np.percentile(np.array(samples), [50, 99])
+                latency[kind] = {"queries": len(samples), "p50_ms": round(float(p50), 2), "p99_ms": round(float(p99), 2)}
+        return {
+            "backend": "local",
+            "search_latency": latency,
+            "collections": {name: local.get_stats() for name, local in self.manager.resident("vectors").items()}
+        }
+
+
+def _build_vector_store() -> VectorStore:
+    if settings.VECTOR_STORE_BACKEND == "milvus":
+        return MilvusVectorStore(
+            host=settings.MILVUS_HOST,
+            port=settings.MILVUS_PORT,
+            quantization=settings.VECTOR_QUANTIZATION,
+            pq_subvectors=settings.VECTOR_PQ_SUBVECTORS
+        )
+    return LocalVectorStore(
+        settings.VECTOR_STORE_DIR,
+        index_threshold=settings.VECTOR_INDEX_THRESHOLD,
+        nprobe=settings.VECTOR_IVF_NPROBE,
+        quantization=settings.VECTOR_QUANTIZATION,
+        pq_subvectors=settings.VECTOR_PQ_SUBVECTORS,
+        rerank_factor=settings.VECTOR_RERANK_FACTOR,
+        train_size=settings.VECTOR_QUANTIZATION_TRAIN_SIZE,
+        manager=collection_manager
+    )
+
+
+# Global vector store instance
+vector_store = _build_vector_store()
@@ -1,17 +1,103 @@
+from pipecat.frames.frames import CancelFrame, EndFrame, Frame, InputAudioRawFrame, MetricsFrame
+from pipecat.metrics.metrics import LLMUsageMetricsData, TTFBMetricsData, TTSUsageMetricsData
 from pipecat.pipeline.pipeline import Pipeline
 from pipecat.pipeline.runner import PipelineRunner
 from pipecat.pipeline.task import PipelineParams, PipelineTask
 from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
 from pipecat.services.deepgram import DeepgramSTTService
 from pipecat.services.elevenlabs import ElevenLabsTTSService
 from pipecat.services.openai import OpenAILLMService
 from pipecat.transports.services.livekit import LiveKitTransport, LiveKitParams
 from livekit import api
+from app.services.model_router import model_router
+from app.services.usage_accounting import usage_accounting
 from typing import Optional, Dict
 import asyncio
 import uuid
 import os
 
+STT_MODEL = "nova-2"
+# Streamed audio is recorded in chunks of this many seconds, not per 20ms frame
+STT_RECORD_SECONDS = 15.0
+
+
+class STTUsageMeter(FrameProcessor):
+    """
+    Sits in front of the STT service and records the seconds of caller audio
+    streamed to it (Deepgram bills per audio second and reports no usage)
+    """
+
+    def __init__(self, model: str, agent_id: str, tenant_id: Optional[str] = None):
+        super().__init__()
+        self.model = model
+        self.agent_id = agent_id
+        self.tenant_id = tenant_id
+        self._seconds = 0.0
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if isinstance(frame, InputAudioRawFrame):
+            self._seconds += frame.num_frames / frame.sample_rate
+            if self._seconds >= STT_RECORD_SECONDS:
+                self._record()
+        elif isinstance(frame, (EndFrame, CancelFrame)):
+            self._record()
+        await self.push_frame(frame, direction)
+
+    def _record(self):
+        if self._seconds:
+            usage_accounting.record(
+                "stt",
+                self.model,
+                tenant_id=self.tenant_id,
+                agent_id=self.agent_id,
+                prompt_tokens=self._seconds
+            )
+            self._seconds = 0.0
+
+
+class UsageMetricsRecorder(FrameProcessor):
+    """
+    Sits after the LLM and TTS services and records the usage metrics frames
+    they emit (token counts, synthesized characters), with the latest
+    time-to-first-byte of the same service as the call's latency
+    """
+
+    def __init__(self, agent_id: str, tenant_id: Optional[str] = None):
+        super().__init__()
+        self.agent_id = agent_id
+        self.tenant_id = tenant_id
+        self._ttfb_ms: Dict[str, float] = {}
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if isinstance(frame, MetricsFrame):
+            for data in frame.data:
+                if isinstance(data, TTFBMetricsData):
+                    self._ttfb_ms[data.processor] = data.value * 1000
+                elif isinstance(data, LLMUsageMetricsData):
+                    usage_accounting.record(
+                        "llm",
+                        data.model or "unknown",
+                        tenant_id=self.tenant_id,
+                        agent_id=self.agent_id,
+                        prompt_tokens=data.value.prompt_tokens,
+                        completion_tokens=data.value.completion_tokens,
+                        latency_ms=self._ttfb_ms.pop(data.processor, 0.0)
+                    )
+                elif isinstance(data, TTSUsageMetricsData):
+                    usage_accounting.record(
+                        "tts",
+                        data.model or "unknown",
+                        tenant_id=self.tenant_id,
+                        agent_id=self.agent_id,
+                        prompt_tokens=data.value,
+                        latency_ms=self._ttfb_ms.pop(data.processor, 0.0)
+                    )
+        await self.push_frame(frame, direction)
+
+
 class VoiceSessionService:
     """
     Voice Session Management using Pipecat + LiveKit
@@ -62,7 +148,7 @@ class VoiceSessionService:
             # Initialize services with user's API keys
             stt_service = DeepgramSTTService(
                 api_key=user_credentials.get('deepgram_api_key'),
-                model="nova-2",
+                model=STT_MODEL,
                 language="en-US"
             )
             
@@ -71,9 +157,11 @@ class VoiceSessionService:
                 voice_id=agent_config.get('voiceId', 'EXAVITQu4vr4xnSDxMaL')
             )
             
+            # Pipecat owns the LLM stream here, so the router only picks the
+            # healthiest OpenAI model among the agent's own routes, if it has any
             llm_service = OpenAILLMService(
                 api_key=user_credentials.get('openai_api_key'),
-                model="gpt-4-turbo-preview"
+                model=model_router.select_model(agent_id, default="gpt-4-turbo-preview")
             )
             
             # Setup transport (LiveKit for WebRTC)
@@ -100,19 +188,28 @@ class VoiceSessionService:
                 ]
             )
             
-            # Build pipeline: STT -> LLM -> TTS
+            # Build pipeline: STT -> LLM -> TTS, metering what each bills for
+            tenant_id = agent_config.get('userId')
             pipeline = Pipeline(
                 [
                     transport.input(),
+                    STTUsageMeter(STT_MODEL, agent_id, tenant_id),
                     stt_service,
                     llm_service,
                     tts_service,
+                    UsageMetricsRecorder(agent_id, tenant_id),
                     transport.output()
                 ]
             )
             
-            # Create pipeline task
-            task = PipelineTask(pipeline, params=PipelineParams(allow_interruptions=True))
+            # Create pipeline task; usage metrics frames feed usage accounting
+            # (pipecat only turns usage metrics on along with enable_metrics)
+            task = PipelineTask(pipeline, params=PipelineParams(
+                allow_interruptions=True,
+                enable_metrics=True,
+                enable_usage_metrics=True,
+                send_initial_empty_metrics=False
+            ))
             
             # Store active session
             self.active_sessions[session_id] = task
@@ -1,104 +1,553 @@
 from fastapi import WebSocket
-from typing import Dict, List, Set
-import json
+from typing import Awaitable, Callable, Dict, List, Optional
+from prometheus_client import Counter, Gauge
+from app.core.config import settings
+from app.services.ws_backplane import Backplane, InProcessBackplane, build_backplane
+from app.services import ws_codecs
+from app.services.ws_codecs import EncodedMessage, Frame
+import uuid
+import time
 import asyncio
 
+# Close codes used when a client is turned away or kicked
+CLOSE_TRY_AGAIN_LATER = 1013
+CLOSE_INTERNAL_ERROR = 1011
+CLOSE_GOING_AWAY = 1001
+CLOSE_POLICY_VIOLATION = 1008
+
+# Backplane channels
+ADMIN_CHANNEL = "admins"
+AGENT_CHANNEL_PREFIX = "agent:"
+USER_CHANNEL_PREFIX = "user:"
+
+# livesum: in multiprocess mode /metrics reports the total over live workers
+WS_CONNECTIONS = Gauge(
+    "afo_ws_connections",
+    "Open WebSocket connections",
+    ["kind"],
+    multiprocess_mode="livesum"
+)
+# Series are removed when an agent's last viewer leaves, so only live agents are exported
+# (zeroed first: in multiprocess mode a removed series keeps its last value on disk)
+WS_AGENT_CONNECTIONS = Gauge(
+    "afo_ws_agent_connections",
+    "Open agent chat WebSocket connections per agent",
+    ["agent_id"],
+    multiprocess_mode="livesum"
+)
+WS_REJECTED = Counter(
+    "afo_ws_rejected_total",
+    "WebSocket connections rejected by admission control",
+    ["reason"]
+)
+WS_REAPED = Counter(
+    "afo_ws_reaped_total",
+    "WebSocket connections closed by the server (idle, rate limit, slow consumer)",
+    ["reason"]
+)
+
+# Heartbeat frame, encoded once per codec and reused for every ping
+PING = EncodedMessage({"type": "ping"})
+
+class ClientConnection:
+    """
+    One WebSocket with its own bounded outbound queue and writer task
+
+    Fan-out only enqueues already-encoded frames (in the client's
+    negotiated codec), so a stalled client never delays anyone else
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        queue_size: int,
+        send_timeout: float,
+        on_failure: Callable[["ClientConnection"], None],
+        agent_id: Optional[str] = None,
+        codec: str = ws_codecs.DEFAULT_CODEC,
+        inbound_rate: float = 2.0,
+        inbound_burst: int = 10,
+        user_id: Optional[str] = None
+    ):
+        self.id = uuid.uuid4().hex
+        self.websocket = websocket
+        self.codec = codec
+        # None for admin and user connections
+        self.agent_id = agent_id
+        # Set for a user's own connections (their jobs, notifications)
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.send_timeout = send_timeout
+        self.on_failure = on_failure
+        self.dropped_messages = 0
+        # Last time the client sent anything (messages, pongs)
+        self.last_seen = time.monotonic()
+        # Set by the first pong: only clients known to answer pings are reaped for silence
+        self.answers_pings = False
+        # Inbound token bucket
+        self.inbound_rate = inbound_rate
+        self.inbound_burst = inbound_burst
+        self.tokens = float(inbound_burst)
+        self.rate_limited = 0
+        self.writer = asyncio.create_task(self._write_loop())
+
+    @property
+    def kind(self) -> str:
+        if self.user_id is not None:
+            return "user"
+        return "admin" if self.agent_id is None else "agent"
+
+    def touch(self, pong: bool = False) -> bool:
+        """Record inbound activity; False if the client exceeded its message rate"""
+        now = time.monotonic()
+        self.tokens = min(self.inbound_burst, self.tokens + (now - self.last_seen) * self.inbound_rate)
+        self.last_seen = now
+        self.answers_pings = self.answers_pings or pong
+        if self.tokens >= self.inbound_burst:
+            # The client paused long enough for a full bucket: earlier bursts are forgiven
+            self.rate_limited = 0
+        if self.tokens < 1:
+            self.rate_limited += 1
+            return False
+        self.tokens -= 1
+        return True
+
+    def enqueue(self, payload: Optional[Frame]) -> bool:
+        """Queue an encoded frame; False if the client is too far behind"""
+        try:
+            self.queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def enqueue_latest(self, payload: Frame):
+        """Queue a payload, discarding the oldest pending one if full (down-sampling)"""
+        while not self.enqueue(payload):
+            try:
+                self.queue.get_nowait()
+                self.dropped_messages += 1
+            except asyncio.QueueEmpty:
+                pass
+
+    async def _write_loop(self):
+        try:
+            while True:
+                payload = await self.queue.get()
+                if payload is None:
+                    return
+                if isinstance(payload, str):
+                    send = self.websocket.send_text(payload)
+                else:
+                    send = self.websocket.send_bytes(payload)
+                await asyncio.wait_for(send, self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error sending to client: {e}")
+            self.on_failure(self)
+
+    def stop(self):
+        # The sentinel ends the loop even if wait_for swallowed the cancellation
+        while not self.enqueue(None):
+            self.queue.get_nowait()
+        self.writer.cancel()
+
 class WebSocketManager:
-    def __init__(self):
-        # Agent chat connections: {agent_id: [websockets]}
-        self.agent_connections: Dict[str, List[WebSocket]] = {}
-        # Admin monitoring connections
-        self.admin_connections: Set[WebSocket] = set()
-        # User connections: {user_id: [websockets]}
-        self.user_connections: Dict[str, List[WebSocket]] = {}
-    
-    async def connect(self, websocket: WebSocket, agent_id: str):
-        """Connect a client to an agent chat"""
+    def __init__(
+        self,
+        queue_size: int = 256,
+        send_timeout: float = 10.0,
+        slow_consumer_policy: str = "drop",
+        max_connections: int = 1000,
+        max_connections_per_agent: int = 500,
+        backplane: Optional[Backplane] = None,
+        heartbeat_interval: float = 20.0,
+        idle_timeout: float = 60.0,
+        inbound_rate: float = 2.0,
+        inbound_burst: int = 10,
+        max_rate_violations: int = 20
+    ):
+        # Agent chat connections: {agent_id: {connection_id: connection}}
+        self.agent_connections: Dict[str, Dict[str, ClientConnection]] = {}
+        # Admin monitoring connections: {connection_id: connection}
+        self.admin_connections: Dict[str, ClientConnection] = {}
+        # User connections: {user_id: {connection_id: connection}}
+        self.user_connections: Dict[str, Dict[str, ClientConnection]] = {}
+        # Every connection in this process: {connection_id: connection}
+        self.connections: Dict[str, ClientConnection] = {}
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        # "drop" disconnects clients whose queue is full, "sample" keeps only the newest messages
+        self.slow_consumer_policy = slow_consumer_policy
+        self.max_connections = max_connections
+        self.max_connections_per_agent = max_connections_per_agent
+        self.slow_consumers_dropped = 0
+        self.rejected = {"process_limit": 0, "agent_limit": 0}
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.inbound_rate = inbound_rate
+        self.inbound_burst = inbound_burst
+        self.max_rate_violations = max_rate_violations
+        self.reaped = {"idle": 0, "rate_limit": 0, "slow_consumer": 0, "send_failure": 0}
+        self._reaper: Optional[asyncio.Task] = None
+        # Relays broadcasts to sockets held by other workers/nodes
+        self.backplane = backplane or InProcessBackplane()
+        # Extra backplane channels owned by other services: {channel: handler(payloads)}
+        self.channel_handlers: Dict[str, Callable[[List[str]], Awaitable[None]]] = {}
+        # Set by the admin stream so system events are coalesced: sink(event_type, data)
+        self.event_sink: Optional[Callable[[str, dict], None]] = None
+
+    async def start(self):
+        """Start relaying broadcasts between processes and the heartbeat/reaper loop"""
+        await self.backplane.start(self._on_remote)
+        self._reaper = asyncio.create_task(self._heartbeat_loop())
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                self.reap_idle()
+            except Exception as e:
+                print(f"Error reaping WebSocket connections: {e}")
+
+    def reap_idle(self) -> int:
+        """
+        Close connections silent for longer than the idle timeout and ping the rest
+
+        Half-open TCP connections never answer the pings, so they are
+        reaped on a later pass along with their handler state. Only clients
+        that have answered a ping before are held to this; listen-only
+        clients that never reply are left to the server's protocol-level
+        ping/pong (uvicorn ws_ping_interval), which closes dead sockets too
+        """
+        deadline = time.monotonic() - self.idle_timeout
+        reaped = 0
+        for connection in list(self.connections.values()):
+            if connection.answers_pings and connection.last_seen < deadline:
+                self._reap(connection, "idle", CLOSE_GOING_AWAY)
+                reaped += 1
+            else:
+                self._deliver(connection, PING)
+        return reaped
+
+    def _reap(self, connection: ClientConnection, reason: str, code: int):
+        self.reaped[reason] += 1
+        WS_REAPED.labels(reason).inc()
+        self._drop(connection, code=code)
+
+    def receive_allowed(self, connection_id: str, pong: bool = False) -> bool:
+        """
+        Record an inbound message (pong: a heartbeat reply) and apply the
+        per-connection rate limit
+
+        Returns False if the message should be dropped; a client that keeps
+        flooding past max_rate_violations without ever pausing long enough
+        to refill its bucket is disconnected (1008)
+        """
+        connection = self.connections.get(connection_id)
+        if connection is None:
+            return False
+        if connection.touch(pong):
+            return True
+        if connection.rate_limited >= self.max_rate_violations:
+            print("Disconnecting WebSocket client flooding messages")
+            self._reap(connection, "rate_limit", CLOSE_POLICY_VIOLATION)
+        return False
+
+    async def _on_remote(self, channel: str, payloads: List[str]):
+        """Deliver messages another process published to one of our channels"""
+        handler = self.channel_handlers.get(channel)
+        if handler is not None:
+            await handler(payloads)
+            return
+        if channel == ADMIN_CHANNEL:
+            targets = list(self.admin_connections.values())
+        elif channel.startswith(USER_CHANNEL_PREFIX):
+            targets = list(self.user_connections.get(channel[len(USER_CHANNEL_PREFIX):], {}).values())
+        else:
+            targets = list(self.agent_connections.get(channel[len(AGENT_CHANNEL_PREFIX):], {}).values())
+        for payload in payloads:
+            encoded = EncodedMessage(json_text=payload)
+            for connection in targets:
+                self._deliver(connection, encoded)
+
+    async def _reject(self, websocket: WebSocket, reason: str, detail: str):
+        """Accept-then-close so the client gets a proper close code and reason"""
+        self.rejected[reason] += 1
+        WS_REJECTED.labels(reason).inc()
+        print(f"Rejecting WebSocket connection: {detail}")
         await websocket.accept()
+        await self._close_quietly(websocket, CLOSE_TRY_AGAIN_LATER, detail)
+
+    def _register(
+        self, websocket: WebSocket, agent_id: Optional[str], codec: str, user_id: Optional[str] = None
+    ) -> ClientConnection:
+        connection = ClientConnection(
+            websocket,
+            self.queue_size,
+            self.send_timeout,
+            on_failure=self._on_send_failure,
+            agent_id=agent_id,
+            codec=codec,
+            inbound_rate=self.inbound_rate,
+            inbound_burst=self.inbound_burst,
+            user_id=user_id
+        )
+        self.connections[connection.id] = connection
+        WS_CONNECTIONS.labels(connection.kind).inc()
+        return connection
+
+    def _unregister(self, connection_id: str) -> Optional[ClientConnection]:
+        connection = self.connections.pop(connection_id, None)
+        if connection is not None:
+            connection.stop()
+            WS_CONNECTIONS.labels(connection.kind).dec()
+        return connection
+
+    def _on_send_failure(self, connection: ClientConnection):
+        if connection.id in self.connections:
+            self._reap(connection, "send_failure", CLOSE_INTERNAL_ERROR)
+
+    def _drop(self, connection: ClientConnection, code: int = CLOSE_INTERNAL_ERROR):
+        """Remove a connection from its group and close it in the background"""
+        if connection.user_id is not None:
+            self.disconnect_user(connection.id, connection.user_id)
+        elif connection.agent_id is None:
+            self.disconnect_admin(connection.id)
+        else:
+            self.disconnect(connection.id, connection.agent_id)
+        asyncio.create_task(self._close_quietly(connection.websocket, code))
+
+    @staticmethod
+    async def _close_quietly(websocket: WebSocket, code: int, reason: str = ""):
+        try:
+            await websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    def _deliver(self, connection: ClientConnection, encoded: EncodedMessage):
+        payload = encoded.frame(connection.codec)
+        if connection.enqueue(payload):
+            return
+        if self.slow_consumer_policy == "sample":
+            connection.enqueue_latest(payload)
+        else:
+            self.slow_consumers_dropped += 1
+            print("Dropping slow WebSocket consumer")
+            self._reap(connection, "slow_consumer", CLOSE_TRY_AGAIN_LATER)
+
+    async def connect(self, websocket: WebSocket, agent_id: str) -> Optional[str]:
+        """
+        Connect a client to an agent chat
+
+        Returns:
+            Connection id, or None if admission control rejected the client
+            (the socket is already closed with code 1013)
+        """
+        if len(self.connections) >= self.max_connections:
+            await self._reject(websocket, "process_limit", "Server connection limit reached")
+            return None
+        agent_sockets = self.agent_connections.get(agent_id)
+        if agent_sockets is not None and len(agent_sockets) >= self.max_connections_per_agent:
+            await self._reject(websocket, "agent_limit", f"Connection limit reached for agent {agent_id}")
+            return None
+
+        codec = await ws_codecs.accept(websocket)
+        connection = self._register(websocket, agent_id, codec)
         if agent_id not in self.agent_connections:
-            self.agent_connections[agent_id] = []
-        self.agent_connections[agent_id].append(websocket)
+            self.backplane.subscribe(AGENT_CHANNEL_PREFIX + agent_id)
+        self.agent_connections.setdefault(agent_id, {})[connection.id] = connection
+        WS_AGENT_CONNECTIONS.labels(agent_id).set(len(self.agent_connections[agent_id]))
         print(f"Client connected to agent {agent_id}. Total: {len(self.agent_connections[agent_id])}")
-    
-    async def connect_admin(self, websocket: WebSocket):
-        """Connect an admin client for monitoring"""
-        await websocket.accept()
-        self.admin_connections.add(websocket)
+        return connection.id
+
+    async def connect_admin(self, websocket: WebSocket) -> Optional[str]:
+        """
+        Connect an admin client for monitoring
+
+        Returns:
+            Connection id, or None if the process connection limit is reached
+        """
+        if len(self.connections) >= self.max_connections:
+            await self._reject(websocket, "process_limit", "Server connection limit reached")
+            return None
+
+        codec = await ws_codecs.accept(websocket)
+        connection = self._register(websocket, None, codec)
+        if not self.admin_connections:
+            self.backplane.subscribe(ADMIN_CHANNEL)
+        self.admin_connections[connection.id] = connection
         print(f"Admin connected. Total admins: {len(self.admin_connections)}")
-    
-    def disconnect(self, websocket: WebSocket, agent_id: str):
+        return connection.id
+
+    async def connect_user(self, websocket: WebSocket, user_id: str) -> Optional[str]:
+        """
+        Connect one of a user's own clients (progress of their jobs and
+        other per-user notifications)
+
+        Returns:
+            Connection id, or None if the process connection limit is reached
+        """
+        if len(self.connections) >= self.max_connections:
+            await self._reject(websocket, "process_limit", "Server connection limit reached")
+            return None
+
+        codec = await ws_codecs.accept(websocket)
+        connection = self._register(websocket, None, codec, user_id=user_id)
+        if user_id not in self.user_connections:
+            self.backplane.subscribe(USER_CHANNEL_PREFIX + user_id)
+        self.user_connections.setdefault(user_id, {})[connection.id] = connection
+        return connection.id
+
+    def disconnect_user(self, connection_id: str, user_id: str):
+        """Disconnect one of a user's clients"""
+        user_sockets = self.user_connections.get(user_id)
+        if user_sockets is not None:
+            user_sockets.pop(connection_id, None)
+            if not user_sockets:
+                del self.user_connections[user_id]
+                self.backplane.unsubscribe(USER_CHANNEL_PREFIX + user_id)
+        self._unregister(connection_id)
+
+    def disconnect(self, connection_id: str, agent_id: str):
         """Disconnect a client from agent chat"""
-        if agent_id in self.agent_connections:
-            if websocket in self.agent_connections[agent_id]:
-                self.agent_connections[agent_id].remove(websocket)
-            if not self.agent_connections[agent_id]:
+        agent_sockets = self.agent_connections.get(agent_id)
+        if agent_sockets is not None:
+            agent_sockets.pop(connection_id, None)
+            if agent_sockets:
+                WS_AGENT_CONNECTIONS.labels(agent_id).set(len(agent_sockets))
+            else:
                 del self.agent_connections[agent_id]
-        print(f"Client disconnected from agent {agent_id}")
-    
-    def disconnect_admin(self, websocket: WebSocket):
+                WS_AGENT_CONNECTIONS.labels(agent_id).set(0)
+                WS_AGENT_CONNECTIONS.remove(agent_id)
+                self.backplane.unsubscribe(AGENT_CHANNEL_PREFIX + agent_id)
+        if self._unregister(connection_id) is not None:
+            print(f"Client disconnected from agent {agent_id}")
+
+    def disconnect_admin(self, connection_id: str):
         """Disconnect an admin client"""
-        self.admin_connections.discard(websocket)
-        print(f"Admin disconnected. Total admins: {len(self.admin_connections)}")
-    
+        if self.admin_connections.pop(connection_id, None) is not None and not self.admin_connections:
+            self.backplane.unsubscribe(ADMIN_CHANNEL)
+        if self._unregister(connection_id) is not None:
+            print(f"Admin disconnected. Total admins: {len(self.admin_connections)}")
+
+    def send_encoded(self, connection_id: str, encoded: EncodedMessage) -> bool:
+        """Queue a pre-encoded message for one client; False if it is gone"""
+        connection = self.connections.get(connection_id)
+        if connection is None:
+            return False
+        self._deliver(connection, encoded)
+        return True
+
+    async def send_personal(self, connection_id: str, message: dict):
+        """Send a message to one client through its writer queue"""
+        connection = self.connections.get(connection_id)
+        if connection is not None:
+            self._deliver(connection, EncodedMessage(message))
+
     async def send_to_agent(self, agent_id: str, message: dict):
-        """Send message to all clients connected to an agent"""
-        if agent_id in self.agent_connections:
-            disconnected = []
-            for websocket in self.agent_connections[agent_id]:
-                try:
-                    await websocket.send_json(message)
-                except Exception as e:
-                    print(f"Error sending to client: {e}")
-                    disconnected.append(websocket)
-            
-            # Clean up disconnected websockets
-            for ws in disconnected:
-                self.disconnect(ws, agent_id)
-    
+        """Send message to all clients connected to an agent, on any process"""
+        # Encode once per codec, enqueue everywhere
+        encoded = EncodedMessage(message)
+        self.backplane.publish(AGENT_CHANNEL_PREFIX + agent_id, encoded.frame("json"))
+        for connection in list(self.agent_connections.get(agent_id, {}).values()):
+            self._deliver(connection, encoded)
+
+    async def send_to_user(self, user_id: str, message: dict):
+        """Send message to all of a user's own clients, on any process"""
+        encoded = EncodedMessage(message)
+        self.backplane.publish(USER_CHANNEL_PREFIX + user_id, encoded.frame("json"))
+        for connection in list(self.user_connections.get(user_id, {}).values()):
+            self._deliver(connection, encoded)
+
     async def broadcast_to_admins(self, event_type: str, data: dict):
-        """Broadcast event to all admin connections"""
+        """Broadcast event to all admin connections, on any process"""
         message = {
             "event": event_type,
             "data": data,
             "timestamp": asyncio.get_event_loop().time()
         }
-        
-        disconnected = []
-        for websocket in self.admin_connections:
-            try:
-                await websocket.send_json(message)
-            except Exception as e:
-                print(f"Error sending to admin: {e}")
-                disconnected.append(websocket)
-        
-        # Clean up disconnected websockets
-        for ws in disconnected:
-            self.disconnect_admin(ws)
-    
+
+        encoded = EncodedMessage(message)
+        self.backplane.publish(ADMIN_CHANNEL, encoded.frame("json"))
+        for connection in list(self.admin_connections.values()):
+            self._deliver(connection, encoded)
+
     async def emit_system_event(self, event_type: str, data: dict):
-        """Emit system-wide event to admins"""
-        await self.broadcast_to_admins(event_type, data)
-    
+        """Emit system-wide event to admins (coalesced when the admin stream is active)"""
+        if self.event_sink is not None:
+            self.event_sink(event_type, data)
+        else:
+            await self.broadcast_to_admins(event_type, data)
+
+    def get_agent_connection_counts(self) -> Dict[str, int]:
+        """Live connection count per agent"""
+        return {agent_id: len(sockets) for agent_id, sockets in self.agent_connections.items()}
+
+    def get_codec_counts(self) -> Dict[str, int]:
+        """Live connection count per negotiated codec"""
+        counts: Dict[str, int] = {}
+        for connection in self.connections.values():
+            counts[connection.codec] = counts.get(connection.codec, 0) + 1
+        return counts
+
+    def get_stats(self) -> dict:
+        """Connection and backpressure stats for the admin dashboard"""
+        return {
+            "connections": len(self.connections),
+            "max_connections": self.max_connections,
+            "admins": len(self.admin_connections),
+            "users": len(self.user_connections),
+            "agents": len(self.agent_connections),
+            "per_agent": self.get_agent_connection_counts(),
+            "queued_messages": sum(c.queue.qsize() for c in self.connections.values()),
+            "dropped_messages": sum(c.dropped_messages for c in self.connections.values()),
+            "slow_consumers_dropped": self.slow_consumers_dropped,
+            "rejected": dict(self.rejected),
+            "codecs": self.get_codec_counts(),
+            "reaped": dict(self.reaped),
+            "backplane": self.backplane.get_stats()
+        }
+
     async def close_all(self):
         """Close all WebSocket connections"""
-        # Close agent connections
-        for agent_id, connections in self.agent_connections.items():
-            for ws in connections:
-                try:
-                    await ws.close()
-                except:
-                    pass
-        
-        # Close admin connections
-        for ws in self.admin_connections:
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        await self.backplane.stop()
+        connections = list(self.connections.values())
+        for connection in connections:
+            connection.stop()
+        await asyncio.gather(*(c.writer for c in connections), return_exceptions=True)
+
+        for connection in connections:
             try:
-                await ws.close()
+                await connection.websocket.close()
             except:
                 pass
-        
+
+        for connection in connections:
+            WS_CONNECTIONS.labels(connection.kind).dec()
+        for agent_id in self.agent_connections:
+            WS_AGENT_CONNECTIONS.labels(agent_id).set(0)
+            WS_AGENT_CONNECTIONS.remove(agent_id)
         self.agent_connections.clear()
         self.admin_connections.clear()
+        self.user_connections.clear()
+        self.connections.clear()
         print("All WebSocket connections closed")
 
 # Global WebSocket manager instance
-ws_manager = WebSocketManager()
\ No newline at end of file
+ws_manager = WebSocketManager(
+    queue_size=settings.WS_SEND_QUEUE_SIZE,
+    send_timeout=settings.WS_SEND_TIMEOUT_SECONDS,
+    slow_consumer_policy=settings.WS_SLOW_CONSUMER_POLICY,
+    max_connections=settings.WS_MAX_CONNECTIONS,
+    max_connections_per_agent=settings.WS_MAX_CONNECTIONS_PER_AGENT,
+    backplane=build_backplane(),
+    heartbeat_interval=settings.WS_HEARTBEAT_INTERVAL_SECONDS,
+    idle_timeout=settings.WS_IDLE_TIMEOUT_SECONDS,
+    inbound_rate=settings.WS_INBOUND_RATE_PER_SECOND,
+    inbound_burst=settings.WS_INBOUND_BURST,
+    max_rate_violations=settings.WS_MAX_RATE_VIOLATIONS
+)
@@ -3,6 +3,7 @@ import json
 import uuid
 from datetime import datetime
 import httpx
+from app.services.rag_service import rag_service
 
 class WorkflowService:
     """
@@ -298,12 +299,19 @@ class WorkflowService:
                 if not agent_id:
                     return {"error": "Agent ID not provided for RAG query"}
                 
-                # TODO: Integrate with actual RAG/knowledge service
-                # For now, return placeholder
+                # Same budget, token cap and cache as chat unless the node overrides them
+                rag = await rag_service.get_context(
+                    agent_id,
+                    query,
+                    top_k=config.get("top_k"),
+                    budget_ms=config.get("budget_ms")
+                )
                 return {
-                    "rag_results": [],
+                    "rag_results": rag["results"],
                     "query": query,
-                    "message": "RAG integration pending"
+                    "context": rag["context"],
+                    "context_tokens": rag["tokens"],
+                    "timed_out": rag["timed_out"]
                 }
             except Exception as e:
                 return {"error": str(e)}
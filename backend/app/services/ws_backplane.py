@@ -0,0 +1,226 @@
+"""
+WebSocket Pub/Sub Backplane for AFO Platform
+Relays broadcasts between uvicorn workers/nodes so send_to_agent and
+broadcast_to_admins reach sockets held by other processes
+
+Backends:
+- memory: single process, nothing to relay
+- redis: Redis pub/sub (any redis.asyncio-compatible client works, so
+  tests can pass a local stand-in)
+
+Publishes are buffered for a few milliseconds and sent as one frame per
+channel in a single pipelined round-trip. Each process only subscribes
+to channels it holds local connections for.
+"""
+
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+from app.core.config import settings
+import asyncio
+import msgpack
+import uuid
+
+# handler(channel, payloads) delivers messages published by other processes
+RemoteHandler = Callable[[str, List[str]], Awaitable[None]]
+
+
+class Backplane(ABC):
+    """Interface between the WebSocket manager and a pub/sub transport"""
+
+    @abstractmethod
+    async def start(self, handler: RemoteHandler):
+        """Begin relaying; handler receives messages from other processes"""
+
+    @abstractmethod
+    async def stop(self):
+        """Flush pending publishes and stop relaying"""
+
+    @abstractmethod
+    def publish(self, channel: str, payload: str):
+        """Queue an encoded message for every other process on channel"""
+
+    @abstractmethod
+    def subscribe(self, channel: str):
+        """Start receiving channel (first local connection arrived)"""
+
+    @abstractmethod
+    def unsubscribe(self, channel: str):
+        """Stop receiving channel (last local connection left)"""
+
+    def get_stats(self) -> dict:
+        return {}
+
+
+class InProcessBackplane(Backplane):
+    """Single-node backend: every connection is local, nothing to relay"""
+
+    def __init__(self):
+        self.channels: Set[str] = set()
+
+    async def start(self, handler: RemoteHandler):
+        pass
+
+    async def stop(self):
+        pass
+
+    def publish(self, channel: str, payload: str):
+        pass
+
+    def subscribe(self, channel: str):
+        self.channels.add(channel)
+
+    def unsubscribe(self, channel: str):
+        self.channels.discard(channel)
+
+    def get_stats(self) -> dict:
+        return {"backend": "memory", "channels": len(self.channels)}
+
+
+class RedisBackplane(Backplane):
+    """
+    Redis pub/sub backplane
+
+    Frames are msgpack [origin, [payload, ...]]; a process skips frames
+    it published itself because it already delivered them locally.
+    Subscription changes are applied by the flush loop, so a viewer that
+    connects and leaves within one window costs no round-trips.
+    """
+
+    def __init__(
+        self,
+        client=None,
+        url: str = "redis://localhost:6379",
+        flush_interval_ms: float = 2,
+        namespace: str = "afo:ws:"
+    ):
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.from_url(url)
+        self.client = client
+        self.flush_interval = flush_interval_ms / 1000
+        self.namespace = namespace
+        self.origin = uuid.uuid4().hex
+        self.pubsub = None
+        self._handler: Optional[RemoteHandler] = None
+        self._pending: Dict[str, List[str]] = {}
+        self._wanted: Set[str] = set()
+        self._subscribed: Set[str] = set()
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self.running = False
+        self.published_frames = 0
+        self.published_messages = 0
+        self.received_messages = 0
+
+    async def start(self, handler: RemoteHandler):
+        self._handler = handler
+        self.pubsub = self.client.pubsub()
+        self.running = True
+        self._tasks = [
+            asyncio.create_task(self._flush_loop()),
+            asyncio.create_task(self._read_loop())
+        ]
+        print("✅ WebSocket backplane connected (redis)")
+
+    async def stop(self):
+        self.running = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        try:
+            await self._flush()
+        except Exception as e:
+            print(f"Error flushing WebSocket backplane: {e}")
+        if self.pubsub is not None:
+            await self.pubsub.aclose()
+            self.pubsub = None
+
+    def publish(self, channel: str, payload: str):
+        self._pending.setdefault(channel, []).append(payload)
+        self._wakeup.set()
+
+    def subscribe(self, channel: str):
+        self._wanted.add(channel)
+        self._wakeup.set()
+
+    def unsubscribe(self, channel: str):
+        self._wanted.discard(channel)
+        self._wakeup.set()
+
+    async def _flush_loop(self):
+        while self.running:
+            await self._wakeup.wait()
+            # Let concurrent publishes pile up for one window
+            await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                await self._flush()
+            except Exception as e:
+                print(f"Error flushing WebSocket backplane: {e}")
+
+    async def _flush(self):
+        added = self._wanted - self._subscribed
+        removed = self._subscribed - self._wanted
+        if self.pubsub is not None:
+            if added:
+                await self.pubsub.subscribe(*[self.namespace + c for c in added])
+            if removed:
+                await self.pubsub.unsubscribe(*[self.namespace + c for c in removed])
+            self._subscribed = set(self._wanted)
+
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for channel, payloads in pending.items():
+            pipe.publish(self.namespace + channel, msgpack.packb([self.origin, payloads]))
+            self.published_messages += len(payloads)
+        self.published_frames += len(pending)
+        await pipe.execute()
+
+    async def _read_loop(self):
+        while self.running:
+            if not self._subscribed:
+                # get_message errors on a pubsub with no subscriptions
+                await asyncio.sleep(0.05)
+                continue
+            try:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error reading WebSocket backplane: {e}")
+                await asyncio.sleep(1)
+                continue
+            if message is None or message.get("type") != "message":
+                continue
+
+            origin, payloads = msgpack.unpackb(message["data"])
+            if origin == self.origin:
+                continue
+            channel = message["channel"]
+            channel = channel.decode() if isinstance(channel, bytes) else channel
+            self.received_messages += len(payloads)
+            try:
+                await self._handler(channel[len(self.namespace):], payloads)
+            except Exception as e:
+                print(f"Error delivering backplane message: {e}")
+
+    def get_stats(self) -> dict:
+        return {
+            "backend": "redis",
+            "channels": len(self._subscribed),
+            "published_frames": self.published_frames,
+            "published_messages": self.published_messages,
+            "received_messages": self.received_messages
+        }
+
+
+def build_backplane() -> Backplane:
+    if settings.WS_BACKPLANE == "redis":
+        return RedisBackplane(
+            url=settings.REDIS_URL,
+            flush_interval_ms=settings.WS_BACKPLANE_FLUSH_MS
+        )
+    return InProcessBackplane()
@@ -0,0 +1,143 @@
+"""
+WebSocket wire codecs for AFO Platform
+
+Clients pick a codec with the Sec-WebSocket-Protocol header
+(e.g. "afo.msgpack") or a ?codec= query parameter; JSON text stays the
+default. The *.deflate codecs send raw-deflate compressed binary frames
+that are compressed once per broadcast, unlike transport-level
+permessage-deflate (WS_PER_MESSAGE_DEFLATE) which compresses again for
+every socket.
+"""
+
+from typing import Any, Dict, Optional, Union
+from fastapi import WebSocket
+import json
+import msgpack
+import zlib
+
+Frame = Union[str, bytes]
+
+SUBPROTOCOL_PREFIX = "afo."
+DEFAULT_CODEC = "json"
+DEFLATE_LEVEL = 6
+
+
+def _deflate(data: bytes) -> bytes:
+    compressor = zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _inflate(data: bytes) -> bytes:
+    return zlib.decompress(data, -15)
+
+
+def _json_dumps(message: Any) -> str:
+    return json.dumps(message, separators=(",", ":"))
+
+
+# name -> (encode, decode); text codecs produce str, binary codecs bytes
+CODECS: Dict[str, tuple] = {
+    "json": (
+        _json_dumps,
+        lambda frame: json.loads(frame)
+    ),
+    "msgpack": (
+        lambda message: msgpack.packb(message),
+        lambda frame: msgpack.unpackb(frame)
+    ),
+    "json.deflate": (
+        lambda message: _deflate(_json_dumps(message).encode()),
+        lambda frame: json.loads(_inflate(frame))
+    ),
+    "msgpack.deflate": (
+        lambda message: _deflate(msgpack.packb(message)),
+        lambda frame: msgpack.unpackb(_inflate(frame))
+    ),
+}
+
+
+def negotiate(websocket: WebSocket) -> tuple:
+    """
+    Pick the codec for a connecting client
+
+    Returns:
+        (codec name, subprotocol to echo in accept() or None)
+    """
+    for offered in websocket.scope.get("subprotocols") or []:
+        name = offered[len(SUBPROTOCOL_PREFIX):] if offered.startswith(SUBPROTOCOL_PREFIX) else None
+        if name in CODECS:
+            return name, offered
+
+    name = websocket.query_params.get("codec", DEFAULT_CODEC)
+    return (name if name in CODECS else DEFAULT_CODEC), None
+
+
+async def accept(websocket: WebSocket) -> str:
+    """Negotiate a codec, accept the socket and return the codec name"""
+    codec, subprotocol = negotiate(websocket)
+    await websocket.accept(subprotocol=subprotocol)
+    return codec
+
+
+def encode(codec: str, message: Any) -> Frame:
+    return CODECS[codec][0](message)
+
+
+def decode(codec: str, frame: Frame) -> Any:
+    # Clients may always fall back to plain JSON text frames
+    if isinstance(frame, str):
+        return json.loads(frame)
+    return CODECS[codec][1](frame)
+
+
+async def send(websocket: WebSocket, codec: str, message: Any):
+    """Send one message directly (for endpoints without a writer queue)"""
+    frame = encode(codec, message)
+    if isinstance(frame, str):
+        await websocket.send_text(frame)
+    else:
+        await websocket.send_bytes(frame)
+
+
+async def receive(websocket: WebSocket, codec: str) -> Optional[Any]:
+    """
+    Receive and decode one client message
+
+    Returns:
+        The decoded message, or None when the client disconnected
+    """
+    data = await websocket.receive()
+    if data.get("type") == "websocket.disconnect":
+        return None
+    if data.get("text") is not None:
+        return decode(codec, data["text"])
+    return decode(codec, data["bytes"])
+
+
+class EncodedMessage:
+    """
+    A message that is encoded at most once per codec
+
+    Fan-out hands the same instance to every connection; each asks for
+    its own codec and reuses whatever an earlier connection produced.
+    """
+
+    __slots__ = ("_message", "_frames")
+
+    def __init__(self, message: Any = None, json_text: Optional[str] = None):
+        self._message = message
+        self._frames: Dict[str, Frame] = {}
+        if json_text is not None:
+            self._frames["json"] = json_text
+
+    @property
+    def message(self) -> Any:
+        if self._message is None:
+            self._message = json.loads(self._frames["json"])
+        return self._message
+
+    def frame(self, codec: str) -> Frame:
+        frame = self._frames.get(codec)
+        if frame is None:
+            frame = self._frames[codec] = encode(codec, self.message)
+        return frame
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Micro-batching benchmark against a local mock embeddings server
+Many concurrent "conversations" each embed one text; compares one HTTP
+call per text with the batched dispatcher
+
+Usage: python benchmarks/bench_batching.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.embedding_service import EmbeddingService
+from benchmarks.mock_llm_server import MockLLMServer
+
+CONVERSATIONS = 500
+
+
+async def _timed(coro_factory):
+    start = time.perf_counter()
+    await asyncio.gather(*(coro_factory(i) for i in range(CONVERSATIONS)))
+    return time.perf_counter() - start
+
+
+async def main():
+    server = await MockLLMServer(embedding_latency_ms=20).start()
+
+    unbatched = EmbeddingService("mock", server.base_url, max_batch_size=1, max_wait_ms=0)
+    server.requests = 0
+    elapsed = await _timed(lambda i: unbatched.embed(f"conversation {i} query"))
+    print(f"unbatched: {elapsed * 1000:.0f} ms, {server.requests} upstream calls")
+
+    for max_wait_ms in (2, 5, 10):
+        batched = EmbeddingService("mock", server.base_url, max_batch_size=128, max_wait_ms=max_wait_ms)
+        server.requests = 0
+        elapsed = await _timed(lambda i: batched.embed(f"conversation {i} query"))
+        stats = batched.get_stats()["embeddings"]
+        print(
+            f"batched (max_wait={max_wait_ms}ms): {elapsed * 1000:.0f} ms, "
+            f"{server.requests} upstream calls, avg batch {stats['avg_batch_size']}"
+        )
+
+    await server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
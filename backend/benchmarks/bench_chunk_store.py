@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Chunk store benchmark
+Stores N chunks (~1.5KB of text each) and times loading the passages of
+a query's top 5 hits from:
+
+- json blobs: one row per chunk with a JSON payload in SQLite (in-process,
+  so a lower bound for a database round trip)
+- payload log: the vector store's msgpack records log (one pread per
+  header, one per body, then a full unpack)
+- chunk store: index lookup + slice of the memory-mapped segment
+
+then the retrieval path itself: 50 vector candidates with payloads, as
+before, versus ids only and texts for the fused top 5 from the chunk
+store. Finally deletes half the chunks, compacts, and reports the space
+reclaimed and read latency while the compaction runs.
+
+Usage: python benchmarks/bench_chunk_store.py [CHUNKS]
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.chunk_store import ChunkSegment
+from app.services.vector_store import LocalCollection
+
+DIM = 384
+QUERIES = 2000
+TOP_K = 5
+CANDIDATES = 50
+WORDS = [f"word{i}" for i in range(5000)]
+
+
+def percentiles(samples):
+    p50, p99 = np.percentile(np.array(samples) * 1000, [50, 99])
+    return f"p50 {p50:7.3f}ms  p99 {p99:7.3f}ms"
+
+
+def timed(fn, queries):
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    rng = np.random.default_rng(0)
+    root = tempfile.mkdtemp(prefix="afo_chunks_")
+    try:
+        ids = [f"kb{i // 100}:{i:08x}" for i in range(n)]
+        texts = [" ".join(rng.choice(WORDS, size=180)) for _ in range(n)]
+        metadata = [{"kb_id": id_.split(":")[0]} for id_ in ids]
+        vectors = rng.standard_normal((n, DIM)).astype(np.float32)
+
+        db = sqlite3.connect(os.path.join(root, "chunks.db"))
+        db.execute("CREATE TABLE chunks (id TEXT PRIMARY KEY, payload TEXT)")
+        db.executemany(
+            "INSERT INTO chunks VALUES (?, ?)",
+            [(id_, json.dumps({"text": text, **meta})) for id_, text, meta in zip(ids, texts, metadata)]
+        )
+        db.commit()
+
+        with_payloads = LocalCollection(os.path.join(root, "vectors_payload"))
+        ids_only = LocalCollection(os.path.join(root, "vectors"))
+        segment = ChunkSegment(os.path.join(root, "chunks"))
+        for start in range(0, n, 1000):
+            end = start + 1000
+            with_payloads.upsert(ids[start:end], vectors[start:end],
+                                 [{"text": t, **m} for t, m in zip(texts[start:end], metadata[start:end])])
+            ids_only.upsert(ids[start:end], vectors[start:end], metadata[start:end])
+            segment.add(ids[start:end], texts[start:end], metadata[start:end])
+        print(f"{n} chunks, {segment.get_stats()['segment_bytes'] / 2 ** 20:.0f}MB of text\n")
+
+        top = [[ids[i] for i in rng.choice(n, TOP_K, replace=False)] for _ in range(QUERIES)]
+
+        def from_db(hit_ids):
+            marks = ",".join("?" * len(hit_ids))
+            rows = db.execute(f"SELECT id, payload FROM chunks WHERE id IN ({marks})", hit_ids).fetchall()
+            return {id_: json.loads(payload) for id_, payload in rows}
+
+        for label, fetch in (
+            ("json blobs (sqlite)", from_db),
+            ("payload log (msgpack)", with_payloads.fetch),
+            ("chunk store (mmap)", segment.get)
+        ):
+            assert fetch(top[0])[top[0][0]]["text"] == texts[ids.index(top[0][0])]
+            timed(fetch, top[:200])  # page cache warm-up
+            print(f"top-{TOP_K} passages, {label:<22} {percentiles(timed(fetch, top))}")
+
+        queries = rng.standard_normal((QUERIES, DIM)).astype(np.float32)
+        before = timed(lambda q: with_payloads.search(q, CANDIDATES), queries)
+
+        def after(q):
+            hits = ids_only.search(q, CANDIDATES, with_payload=False)
+            return segment.get([hit["id"] for hit in hits[:TOP_K]])
+
+        print(f"\nretrieval, {CANDIDATES} candidates with payloads   {percentiles(before)}")
+        print(f"retrieval, ids + top-{TOP_K} from chunk store   {percentiles(timed(after, queries))}")
+
+        # Delete half (whole documents), then compact while a reader keeps going
+        doomed = [id_ for id_ in ids if int(id_[2:].split(":")[0]) % 2 == 0]
+        segment.delete(doomed)
+        gone = set(doomed)
+        survivors = [[id_ for id_ in hit_ids if id_ not in gone] or [ids[-1]] for hit_ids in top[:200]]
+        size = dir_size(os.path.join(root, "chunks"))
+        during, stop = [], threading.Event()
+
+        def reader():
+            i = 0
+            while not stop.is_set():
+                start = time.perf_counter()
+                got = segment.get(survivors[i % len(survivors)])
+                during.append(time.perf_counter() - start)
+                assert got, "reads must keep working during compaction"
+                i += 1
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        start = time.perf_counter()
+        result = segment.compact()
+        elapsed = time.perf_counter() - start
+        stop.set()
+        thread.join()
+        print(f"\ndeleted {len(doomed)} chunks (dead ratio {1 - (size - result['reclaimed_bytes']) / size:.2f}); "
+              f"compaction {elapsed * 1000:.0f}ms: {size / 2 ** 20:.0f}MB -> "
+              f"{dir_size(os.path.join(root, 'chunks')) / 2 ** 20:.0f}MB, {result['chunks']} chunks kept")
+        print(f"reads during compaction ({len(during)})          {percentiles(during)}")
+        reopened = ChunkSegment(os.path.join(root, "chunks"))
+        assert reopened.live_count() == n - len(doomed)
+        db.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
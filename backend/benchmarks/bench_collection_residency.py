@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Knowledge index residency benchmark
+Creates many small per-agent collections (vectors + BM25), then replays
+queries with a skewed (Zipf) agent popularity under a memory budget that
+holds only a fraction of them. Reports loads, evictions, resident memory
+against keeping everything open, and cold (load + query) versus warm
+query latency; then shows pre-warming taking the load off the first query.
+
+Usage: python benchmarks/bench_collection_residency.py [AGENTS] [CHUNKS_PER_AGENT] [BUDGET_MB]
+"""
+
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.collection_manager import CollectionManager
+from app.services.keyword_index import KeywordStore
+from app.services.vector_store import LocalVectorStore
+
+DIM = 384
+QUERIES = 5000
+WORDS = [f"term{i}" for i in range(2000)] + [f"SKU-{i:04d}" for i in range(500)]
+
+
+def percentiles(samples):
+    p50, p99 = np.percentile(np.array(samples) * 1000, [50, 99])
+    return f"p50 {p50:6.2f}ms  p99 {p99:6.2f}ms  ({len(samples)})"
+
+
+async def main():
+    agents = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    chunks = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    budget_mb = float(sys.argv[3]) if len(sys.argv) > 3 else 128
+    rng = np.random.default_rng(0)
+    root = tempfile.mkdtemp(prefix="afo_residency_")
+    try:
+        manager = CollectionManager(memory_budget_bytes=int(budget_mb * 2 ** 20), max_resident=10 ** 6)
+        vectors = LocalVectorStore(os.path.join(root, "vectors"), manager=manager)
+        keywords = KeywordStore(os.path.join(root, "keywords"), manager=manager)
+
+        start = time.perf_counter()
+        for a in range(agents):
+            collection = f"agent_{a}"
+            ids = [f"kb{a}:{i}" for i in range(chunks)]
+            texts = [" ".join(rng.choice(WORDS, size=60)) for _ in range(chunks)]
+            await vectors.upsert(collection, ids, rng.standard_normal((chunks, DIM)).astype(np.float32), [{"text": t} for t in texts])
+            await keywords.add(collection, ids, texts)
+        print(f"{agents} agents x {chunks} chunks written in {time.perf_counter() - start:.1f}s")
+
+        # Everything resident: what holding every index would cost
+        full = CollectionManager(memory_budget_bytes=2 ** 62, max_resident=10 ** 6)
+        full_vectors = LocalVectorStore(os.path.join(root, "vectors"), manager=full)
+        full_keywords = KeywordStore(os.path.join(root, "keywords"), manager=full)
+        query = rng.standard_normal(DIM).astype(np.float32)
+        for a in range(agents):
+            await full_vectors.search(f"agent_{a}", query, 5)
+            await full_keywords.search(f"agent_{a}", "term1 term2", 5)
+        print(f"all {2 * agents} indexes resident: {full.resident_bytes / 2 ** 20:.0f}MB; budget {budget_mb:.0f}MB")
+        for kind in ("vectors", "keywords"):
+            for name in full.resident(kind):
+                full.evict((kind, name))
+
+        # Zipf popularity: a few agents take most of the traffic
+        weights = 1.0 / np.arange(1, agents + 1) ** 1.1
+        picks = rng.choice(agents, size=QUERIES, p=weights / weights.sum())
+        stats_before = dict(manager.stats)
+        cold, warm = [], []
+        for a in picks:
+            collection = f"agent_{a}"
+            was_resident = manager.is_resident(("vectors", collection)) and manager.is_resident(("keywords", collection))
+            start = time.perf_counter()
+            await asyncio.gather(
+                vectors.search(collection, rng.standard_normal(DIM).astype(np.float32), 5),
+                keywords.search(collection, " ".join(rng.choice(WORDS, size=4)), 5)
+            )
+            (warm if was_resident else cold).append(time.perf_counter() - start)
+        stats = {key: manager.stats[key] - stats_before[key] for key in stats_before}
+        print(f"\n{QUERIES} queries, Zipf(1.1) over agents")
+        print(f"  loads {stats['loads']}, evictions {stats['evictions']}, hits {stats['hits']}, "
+              f"resident {manager.get_stats()['resident']} indexes / {manager.resident_bytes / 2 ** 20:.0f}MB")
+        print(f"  warm query  {percentiles(warm)}")
+        print(f"  cold query  {percentiles(cold)}")
+
+        # Pre-warming on connect: the load happens before the first question
+        prewarmed = []
+        cold_agents = [a for a in range(agents - 1, 0, -1) if not manager.is_resident(("vectors", f"agent_{a}"))][:50]
+        for a in cold_agents:
+            collection = f"agent_{a}"
+            await asyncio.gather(vectors.prewarm(collection), keywords.prewarm(collection))
+            start = time.perf_counter()
+            await asyncio.gather(
+                vectors.search(collection, rng.standard_normal(DIM).astype(np.float32), 5),
+                keywords.search(collection, " ".join(rng.choice(WORDS, size=4)), 5)
+            )
+            prewarmed.append(time.perf_counter() - start)
+        print(f"  first query after pre-warm  {percentiles(prewarmed)}")
+        print(f"\nload latency: {manager.get_stats()['load_ms_p50']}ms p50, {manager.get_stats()['load_ms_p99']}ms p99")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
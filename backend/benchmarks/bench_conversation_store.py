@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Conversation store check with a local Redis stand-in
+Runs the same conversation through InMemoryConversationStore and
+RedisConversationStore (on a fakeredis server shared by two "workers")
+and asserts they agree:
+
+- get_history returns the most recent `limit` turns, oldest first
+- append keeps only the last max_turns (RPUSH + LTRIM on Redis)
+- every read refreshes the idle TTL of both the history and the metadata
+- a second worker sees what the first one wrote; delete and keys cover
+  both of a session's Redis keys
+
+then times append + get_history round trips on each backend.
+
+Requires fakeredis (pip install fakeredis)
+Usage: python benchmarks/bench_conversation_store.py [TURNS]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakeredis
+
+from app.services.conversation_store import InMemoryConversationStore, RedisConversationStore
+
+MAX_TURNS = 6
+IDLE_TTL = 600
+
+
+def turn(i: int) -> dict:
+    return {"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}"}
+
+
+async def check(store, other=None):
+    """other: a second store on the same backend (another worker), if any"""
+    other = other or store
+    await store.set_meta("chat:a", {"agent_id": "agent-1", "created_at": 1.5})
+    for i in range(0, 10, 2):
+        await store.append("chat:a", [turn(i), turn(i + 1)], max_turns=MAX_TURNS)
+
+    history = await other.get_history("chat:a")
+    assert history == [turn(i) for i in range(4, 10)], history
+    assert await other.get_history("chat:a", limit=3) == [turn(i) for i in range(7, 10)]
+    assert await other.get_history("chat:a", limit=50) == history
+    assert await other.get_history("missing") == []
+    assert await other.get_meta("chat:a") == {"agent_id": "agent-1", "created_at": 1.5}
+    assert await other.get_meta("missing") is None
+
+    # Store default when no max_turns is given
+    await store.append("chat:b", [turn(i) for i in range(store.max_turns + 3)])
+    assert await other.get_history("chat:b") == [turn(i) for i in range(3, store.max_turns + 3)]
+
+    assert await other.keys("chat:") == ["chat:a", "chat:b"]
+    assert await other.delete("chat:b") is True
+    assert await other.delete("chat:b") is False
+    assert await store.keys("chat:") == ["chat:a"]
+
+
+async def check_ttl(store, client):
+    history_key, meta_key = store._history_key("chat:a"), store._meta_key("chat:a")
+    assert 0 < await client.ttl(history_key) <= IDLE_TTL and 0 < await client.ttl(meta_key) <= IDLE_TTL
+    for read in (lambda: store.get_history("chat:a", limit=2), lambda: store.get_meta("chat:a")):
+        await client.expire(history_key, 5)
+        await client.expire(meta_key, 5)
+        await read()
+        assert await client.ttl(history_key) > IDLE_TTL - 5, "read didn't refresh the history TTL"
+        assert await client.ttl(meta_key) > IDLE_TTL - 5, "read didn't refresh the metadata TTL"
+    await client.expire(history_key, 5)
+    await store.append("chat:a", [turn(10)], max_turns=MAX_TURNS)
+    assert await client.ttl(history_key) > IDLE_TTL - 5, "append didn't refresh the history TTL"
+
+
+async def timed(label, store, turns):
+    start = time.perf_counter()
+    for i in range(turns):
+        await store.append(f"bench:{i % 50}", [turn(i)], max_turns=MAX_TURNS)
+        await store.get_history(f"bench:{i % 50}", limit=MAX_TURNS)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {turns / elapsed:9.0f} append+read/s   {elapsed / turns * 1e6:7.1f}us each")
+
+
+async def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    memory = InMemoryConversationStore(idle_ttl_seconds=IDLE_TTL, max_turns=8)
+    await check(memory)
+
+    server = fakeredis.FakeServer()
+    client = fakeredis.aioredis.FakeRedis(server=server)
+    workers = [
+        RedisConversationStore(
+            client=fakeredis.aioredis.FakeRedis(server=server), idle_ttl_seconds=IDLE_TTL, max_turns=8
+        )
+        for _ in range(2)
+    ]
+    await check(workers[0], workers[1])
+    await check_ttl(workers[0], client)
+    print("memory and redis backends agree: history limits, trimming, TTL refresh, cross-worker reads\n")
+
+    await timed("memory", InMemoryConversationStore(max_turns=MAX_TURNS), turns)
+    await timed("redis (fakeredis)", RedisConversationStore(client=client, max_turns=MAX_TURNS), turns)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
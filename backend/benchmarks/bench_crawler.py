@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Site crawler benchmark
+Serves a generated docs site (HTML pages linking to each other, a sitemap
+with lastmod dates and a robots.txt that disallows /docs/private/) from a
+local static HTTP server that answers If-Modified-Since with 304, then:
+
+- crawls it from the seed page with 1 and with N concurrent fetches
+- re-crawls it unchanged: conditional requests, nothing re-ingested
+- edits and deletes a few pages and re-crawls: only those are ingested
+  or removed
+- re-crawls from the sitemap, where lastmod alone skips unchanged pages
+- checks that a crawler without allow_private_networks refuses loopback
+  and link-local (metadata) hosts, also when a redirect leads there, and
+  that a gzipped sitemap can't inflate past max_page_bytes
+
+Ingestion is simulated (a fixed delay per page) so only the crawler is
+measured.
+
+Usage: python benchmarks/bench_crawler.py [PAGES] [CONCURRENCY] [SERVER_DELAY_MS]
+"""
+
+import asyncio
+import functools
+import gzip
+import ipaddress
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from app.services.crawler import BlockedAddress, Crawler, PageTooLarge, parse_sitemap
+
+INGEST_DELAY = 0.005
+
+
+class Server(ThreadingHTTPServer):
+    # The default listen backlog (5) drops concurrent connects into 1s SYN retries
+    request_queue_size = 128
+
+
+class SlowHandler(SimpleHTTPRequestHandler):
+    delay = 0.0
+    requests = 0
+    redirect_to = None
+
+    def do_GET(self):
+        SlowHandler.requests += 1
+        if self.path == "/redirect" and self.redirect_to:
+            self.send_response(302)
+            self.send_header("Location", self.redirect_to)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        time.sleep(self.delay)
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+def write_page(root: str, i: int, pages: int, revision: int = 0):
+    links = "".join(f'<a href="page{j}.html">Page {j}</a> ' for j in (i + 1, i + 2, 2 * i + 1) if j < pages)
+    body = " ".join(f"Section {i} paragraph {k} revision {revision}." for k in range(50))
+    with open(os.path.join(root, "docs", f"page{i}.html"), "w") as f:
+        f.write(f"<html><head><title>Page {i}</title></head><body><p>{body}</p>{links}"
+                f'<a href="private/secret.html">private</a> <a href="/elsewhere.html">out of scope</a></body></html>')
+
+
+def write_sitemap(root: str, port: int):
+    entries = []
+    for name in sorted(os.listdir(os.path.join(root, "docs"))):
+        if name.endswith(".html"):
+            mtime = datetime.fromtimestamp(os.path.getmtime(os.path.join(root, "docs", name)), timezone.utc)
+            entries.append(f"<url><loc>http://127.0.0.1:{port}/docs/{name}</loc><lastmod>{mtime.isoformat()}</lastmod></url>")
+    with open(os.path.join(root, "sitemap.xml"), "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>'
+                '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">' + "".join(entries) + "</urlset>")
+
+
+def touch(path: str, seconds_ahead: float):
+    # If-Modified-Since has one-second resolution
+    stamp = time.time() + seconds_ahead
+    os.utime(path, (stamp, stamp))
+
+
+async def crawl(crawler: Crawler, seed: str, known: dict, max_pages: int, label: str):
+    ingested, removed = [], []
+
+    async def on_page(page):
+        await asyncio.sleep(INGEST_DELAY)
+        ingested.append(page["url"])
+
+    async def on_gone(url):
+        removed.append(url)
+
+    SlowHandler.requests = 0
+    start = time.perf_counter()
+    counters = await crawler.crawl(seed, known, on_page, on_gone, max_pages=max_pages)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<34} {elapsed * 1000:8.0f}ms  requests {SlowHandler.requests:4d}  "
+          f"fetched {counters['pagesFetched']:4d}  304/unchanged {counters['notModified']:4d}  "
+          f"ingested {counters['pagesIngested']:4d}  removed {counters['pagesRemoved']:3d}  "
+          f"robots {counters['skippedRobots']:2d}  failed {counters['failed']:2d}")
+    return counters
+
+
+class LoopbackOnlyCrawler(Crawler):
+    """Stands in for "the public internet is 127.0.0.1" so redirects off it can be tested locally"""
+
+    def address_allowed(self, address):
+        return address == ipaddress.ip_address("127.0.0.1")
+
+
+async def check_private_networks(client: httpx.AsyncClient, seed: str, port: int):
+    strict = Crawler(client)
+    for url in (seed, "http://169.254.169.254/latest/meta-data/", "http://[::1]/", "http://[::ffff:10.0.0.1]/"):
+        try:
+            await strict.fetch(url)
+        except BlockedAddress:
+            continue
+        raise AssertionError(f"{url} was fetched")
+
+    SlowHandler.redirect_to = f"http://127.0.0.2:{port}/docs/page0.html"
+    requests = SlowHandler.requests
+    loopback = LoopbackOnlyCrawler(client)
+    response, _ = await loopback.fetch(seed)
+    assert response.status_code == 200
+    try:
+        await loopback.fetch(f"http://127.0.0.1:{port}/redirect")
+        raise AssertionError("redirect to a blocked address was followed")
+    except BlockedAddress:
+        pass
+    assert SlowHandler.requests == requests + 2, "blocked redirect target was requested"
+
+    max_bytes = 64 * 1024
+    bomb = gzip.compress(b"<urlset>" + b" " * (max_bytes * 16) + b"</urlset>")
+    assert len(bomb) < max_bytes
+    try:
+        parse_sitemap(bomb, max_bytes)
+        raise AssertionError("gzipped sitemap inflated past max_page_bytes")
+    except PageTooLarge:
+        pass
+    assert parse_sitemap(gzip.compress(b"<urlset></urlset>"), max_bytes) == ([], [])
+    print("private addresses, redirects to them and sitemap gzip bombs are refused\n")
+
+
+async def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    SlowHandler.delay = (float(sys.argv[3]) if len(sys.argv) > 3 else 20) / 1000
+
+    root = tempfile.mkdtemp(prefix="afo_site_")
+    os.makedirs(os.path.join(root, "docs", "private"))
+    for i in range(pages):
+        write_page(root, i, pages)
+        touch(os.path.join(root, "docs", f"page{i}.html"), -3600)
+    with open(os.path.join(root, "docs", "private", "secret.html"), "w") as f:
+        f.write("<html><body>internal</body></html>")
+    with open(os.path.join(root, "robots.txt"), "w") as f:
+        f.write("User-agent: *\nDisallow: /docs/private/\n")
+
+    server = Server(("127.0.0.1", 0), functools.partial(SlowHandler, directory=root))
+    port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    write_sitemap(root, port)
+    seed = f"http://127.0.0.1:{port}/docs/page0.html"
+    print(f"{pages} pages, server delay {SlowHandler.delay * 1000:.0f}ms, simulated ingest {INGEST_DELAY * 1000:.0f}ms/page\n")
+
+    try:
+        async with httpx.AsyncClient(limits=httpx.Limits(max_connections=100)) as client:
+            def make(n):
+                # No per-host spacing here: the point is fetch concurrency
+                return Crawler(client, concurrency=n, ingest_concurrency=2, host_interval_ms=0, allow_private_networks=True)
+
+            await check_private_networks(client, seed, port)
+
+            await crawl(make(1), seed, {}, pages * 2, "first crawl, 1 fetch at a time")
+            known = {}
+            await crawl(make(concurrency), seed, known, pages * 2, f"first crawl, {concurrency} concurrent")
+            await crawl(make(concurrency), seed, known, pages * 2, "re-crawl, nothing changed")
+
+            changed = list(range(1, pages, 10))
+            for i in changed:
+                write_page(root, i, pages, revision=1)
+                touch(os.path.join(root, "docs", f"page{i}.html"), 10)
+            deleted = [pages - 1, pages - 2]
+            for i in deleted:
+                os.remove(os.path.join(root, "docs", f"page{i}.html"))
+            counters = await crawl(make(concurrency), seed, known, pages * 2,
+                                   f"re-crawl, {len(changed)} edited, {len(deleted)} deleted")
+            assert counters["pagesIngested"] == len(changed), counters
+            assert counters["pagesRemoved"] == len(deleted), counters
+
+            sitemap = f"http://127.0.0.1:{port}/sitemap.xml"
+            write_sitemap(root, port)
+            known = {}
+            await crawl(make(concurrency), sitemap, known, pages * 2, "sitemap crawl")
+            write_sitemap(root, port)
+            await crawl(make(concurrency), sitemap, known, pages * 2, "sitemap re-crawl (lastmod)")
+
+            # Politeness: the default spacing between requests to one host
+            polite = Crawler(client, concurrency=concurrency, host_interval_ms=250, allow_private_networks=True)
+            start = time.perf_counter()
+            await crawl(polite, seed, {}, 20, "20 pages at 250ms per host")
+            print(f"\n  -> {20 / (time.perf_counter() - start):.1f} requests/s to the host despite {concurrency} workers")
+    finally:
+        server.shutdown()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
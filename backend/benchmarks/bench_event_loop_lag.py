@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Event loop lag benchmark
+Runs S concurrent streamed generations on the event loop while a probe
+task sleeps 10ms at a time and records how late it wakes up, i.e. how
+long anything else (HTTP requests, WebSocket frames) would wait for the
+loop:
+
+- before: a Thread per request running model.generate() and a
+  TextIteratorStreamer iterated with a plain for loop, which blocks the
+  loop for every token
+- after: AsyncTextStreamer, read with async for, and generate() on a
+  bounded worker pool (WORKERS threads) - Qwen 3 Omni's path for
+  audio/video prompts, or with batching off
+- scheduler: the GenerationScheduler's request streams - Qwen 3 Omni's
+  path for text prompts
+
+The model is the tiny random Qwen2 from bench_generation_scheduler.
+
+Usage: python benchmarks/bench_event_loop_lag.py [SESSIONS] [TOKENS] [WORKERS]
+"""
+
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transformers import TextIteratorStreamer
+
+from benchmarks.bench_generation_scheduler import load
+
+from app.services.generation_scheduler import AsyncTextStreamer, GenerationCancelled, GenerationScheduler
+
+PROBE_INTERVAL = 0.01
+PROMPT_TOKENS = 64
+
+
+async def probe(lags, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+
+def generation_kwargs(prompt, streamer, tokens):
+    return dict(
+        input_ids=torch.tensor([prompt]),
+        attention_mask=torch.ones(1, len(prompt), dtype=torch.long),
+        streamer=streamer,
+        max_new_tokens=tokens,
+        min_new_tokens=tokens,
+        do_sample=True,
+        temperature=0.7,
+        top_p=0.9
+    )
+
+
+async def before(model, tokenizer, prompt, tokens, executor):
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    Thread(target=model.generate, kwargs=generation_kwargs(prompt, streamer, tokens)).start()
+    # The async generator of the old _stream_response: each next() blocks the loop
+    for _ in streamer:
+        await asyncio.sleep(0)
+
+
+async def after(model, tokenizer, prompt, tokens, executor):
+    loop = asyncio.get_running_loop()
+    streamer = AsyncTextStreamer(tokenizer, loop, skip_prompt=True, skip_special_tokens=True)
+
+    def generate():
+        try:
+            model.generate(**generation_kwargs(prompt, streamer, tokens))
+        except GenerationCancelled:
+            pass
+        except Exception as e:
+            streamer.fail(e)
+
+    loop.run_in_executor(executor, generate)
+    async for _ in streamer:
+        pass
+
+
+async def batched(scheduler, prompt, tokens):
+    request = scheduler.submit(prompt, max_new_tokens=tokens, temperature=0.7, top_p=0.9)
+    async for _ in request.stream():
+        pass
+
+
+async def run(label, session, model, tokenizer, prompts, tokens, workers):
+    lags, stop = [], asyncio.Event()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    scheduler = GenerationScheduler(model, tokenizer, max_batch_size=len(prompts), max_new_tokens=tokens, eos_token_ids=[])
+    prober = asyncio.create_task(probe(lags, stop))
+    await asyncio.sleep(0.1)
+    start = time.perf_counter()
+    if session is batched:
+        await asyncio.gather(*(batched(scheduler, prompt, tokens) for prompt in prompts))
+    else:
+        await asyncio.gather(*(session(model, tokenizer, prompt, tokens, executor) for prompt in prompts))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await prober
+    executor.shutdown()
+    lag = np.array(lags) * 1000
+    print(f"{label:<34} {len(prompts) * tokens / elapsed:7.1f} tokens/s   loop lag p50 {np.percentile(lag, 50):7.1f}ms  "
+          f"p99 {np.percentile(lag, 99):7.1f}ms  max {lag.max():7.1f}ms   ({len(lags)} probes)")
+
+
+async def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    tokens = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+
+    model, tokenizer = load(None)
+    model.generation_config.eos_token_id = None
+    model.generation_config.pad_token_id = 0
+    rng = np.random.default_rng(0)
+    prompts = [rng.integers(0, model.config.vocab_size, PROMPT_TOKENS).tolist() for _ in range(sessions)]
+    print(f"{sessions} concurrent streamed generations x {tokens} tokens, probe every {PROBE_INTERVAL * 1000:.0f}ms\n")
+
+    await run("before: thread + blocking streamer", before, model, tokenizer, prompts, tokens, workers)
+    await run(f"after: async streamer, {workers} workers", after, model, tokenizer, prompts, tokens, workers)
+    await run("scheduler: batched request streams", batched, model, tokenizer, prompts, tokens, workers)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
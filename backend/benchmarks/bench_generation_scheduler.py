@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Generation scheduler benchmark
+Starts S sessions a few milliseconds apart, each generating T tokens, and
+compares:
+
+- one thread per session running model.generate() with a
+  TextIteratorStreamer (the previous Qwen 3 Omni path)
+- the continuous batching GenerationScheduler: every session's request
+  joins one batch that is stepped a token at a time
+
+and reports aggregate tokens/s and per-session time to first token.
+
+Before that it checks that the scheduler is exact: greedy requests of
+different lengths, arriving while others decode and leaving at different
+steps, must produce the tokens model.generate() does for each alone; and
+a failure inside the scheduler thread must fail the requests in flight
+and leave the scheduler serving the next ones.
+
+The model is a tiny randomly initialised Qwen2 on CPU unless a model id
+is given (its own tokenizer is used then); either way EOS is ignored so
+every session generates exactly T tokens.
+
+Usage: python benchmarks/bench_generation_scheduler.py [SESSIONS] [TOKENS] [MODEL_ID]
+"""
+
+import asyncio
+import os
+import sys
+import time
+from threading import Thread
+
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transformers import AutoModelForCausalLM, AutoTokenizer, Qwen2Config, Qwen2ForCausalLM, TextIteratorStreamer
+
+from app.services.generation_scheduler import GenerationScheduler
+
+PROMPT_TOKENS = 64
+ARRIVAL_GAP = 0.005
+
+
+class WordTokenizer:
+    """Token i is the word "w<i> ", so every token streams as soon as it's decoded"""
+
+    eos_token_id = None
+
+    def decode(self, ids, skip_special_tokens=False, **kwargs):
+        if isinstance(ids, torch.Tensor):
+            ids = ids.tolist()
+        return "".join(f"w{i} " for i in ids)
+
+
+def load(model_id):
+    if model_id:
+        return AutoModelForCausalLM.from_pretrained(model_id).eval(), AutoTokenizer.from_pretrained(model_id)
+    config = Qwen2Config(
+        vocab_size=2048,
+        hidden_size=256,
+        intermediate_size=688,
+        num_hidden_layers=4,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=2048
+    )
+    torch.manual_seed(0)
+    return Qwen2ForCausalLM(config).eval(), WordTokenizer()
+
+
+def percentiles(samples):
+    p50, p99 = np.percentile(np.array(samples) * 1000, [50, 99])
+    return f"p50 {p50:7.0f}ms  p99 {p99:7.0f}ms"
+
+
+async def thread_per_session(model, tokenizer, prompts, tokens):
+    async def session(prompt, delay):
+        await asyncio.sleep(delay)
+        submitted = time.perf_counter()
+        streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        kwargs = dict(
+            input_ids=torch.tensor([prompt]),
+            streamer=streamer,
+            max_new_tokens=tokens,
+            min_new_tokens=tokens,
+            do_sample=True,
+            temperature=0.7,
+            top_p=0.9
+        )
+        Thread(target=model.generate, kwargs=kwargs).start()
+        first = None
+        # The streamer blocks, so read it off the loop like an async caller must
+        while True:
+            chunk = await asyncio.to_thread(next, streamer, None)
+            if chunk is None:
+                return first
+            if first is None and chunk:
+                first = time.perf_counter() - submitted
+
+    return await asyncio.gather(*(session(p, i * ARRIVAL_GAP) for i, p in enumerate(prompts)))
+
+
+async def batched(scheduler, prompts, tokens):
+    async def session(prompt, delay):
+        await asyncio.sleep(delay)
+        request = scheduler.submit(prompt, max_new_tokens=tokens, temperature=0.7, top_p=0.9)
+        async for _ in request.stream():
+            pass
+        assert len(request.tokens) == tokens, len(request.tokens)
+        return request.ttft_ms / 1000
+
+    return await asyncio.gather(*(session(p, i * ARRIVAL_GAP) for i, p in enumerate(prompts)))
+
+
+def reference(model, prompt, tokens):
+    input_ids = torch.tensor([prompt])
+    # Explicit mask: generate() would otherwise take any pad_token_id (0) in the prompt for padding
+    output = model.generate(
+        input_ids=input_ids,
+        attention_mask=torch.ones_like(input_ids),
+        max_new_tokens=tokens,
+        min_new_tokens=tokens,
+        do_sample=False
+    )
+    return output[0, len(prompt):].tolist()
+
+
+async def check_greedy(model, tokenizer, prompts, tokens):
+    lengths = [tokens if i % 2 == 0 else max(1, tokens // (i + 1)) for i in range(len(prompts))]
+    scheduler = GenerationScheduler(
+        model, tokenizer, max_batch_size=max(1, len(prompts) // 2), max_new_tokens=tokens, eos_token_ids=[]
+    )
+
+    async def session(prompt, length, delay):
+        await asyncio.sleep(delay)
+        request = scheduler.submit(prompt, max_new_tokens=length, temperature=0)
+        async for _ in request.stream():
+            pass
+        return request.tokens
+
+    results = await asyncio.gather(*(
+        session(p, n, i * ARRIVAL_GAP) for i, (p, n) in enumerate(zip(prompts, lengths))
+    ))
+    for i, (prompt, length, result) in enumerate(zip(prompts, lengths, results)):
+        assert result == reference(model, prompt, length), f"session {i}: batched greedy output differs from generate()"
+    print(f"greedy: {len(prompts)} batched sessions match generate() token for token")
+
+
+async def check_failure(model, tokenizer, prompts, tokens):
+    scheduler = GenerationScheduler(model, tokenizer, max_batch_size=2, max_new_tokens=tokens, eos_token_ids=[])
+    step = scheduler._step
+
+    def broken_step():
+        scheduler._step = step
+        raise RuntimeError("injected step failure")
+
+    scheduler._step = broken_step
+    failed = 0
+    for request in [scheduler.submit(prompt, max_new_tokens=tokens) for prompt in prompts[:3]]:
+        try:
+            async for _ in request.stream():
+                pass
+        except RuntimeError:
+            failed += 1
+    assert failed == 3, f"{failed} of 3 requests failed after a broken step"
+    request = scheduler.submit(prompts[0], max_new_tokens=tokens)
+    async for _ in request.stream():
+        pass
+    assert len(request.tokens) == tokens
+    print("failure: a broken step fails the requests in flight and queued, the next request is served\n")
+
+
+async def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    tokens = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    model_id = sys.argv[3] if len(sys.argv) > 3 else None
+    torch.set_num_threads(os.cpu_count() or 1)
+
+    model, tokenizer = load(model_id)
+    model.generation_config.eos_token_id = None
+    model.generation_config.pad_token_id = 0
+    vocab = model.config.vocab_size
+    rng = np.random.default_rng(0)
+    # Different prompt lengths, so the batch really has to be padded
+    prompts = [rng.integers(0, vocab, PROMPT_TOKENS + 8 * i).tolist() for i in range(sessions)]
+    print(f"{sessions} sessions x {tokens} tokens, {model_id or 'tiny random Qwen2'} on CPU, "
+          f"{torch.get_num_threads()} threads\n")
+
+    with torch.inference_mode():
+        model(input_ids=torch.tensor([prompts[0]]))  # warm-up
+
+    await check_greedy(model, tokenizer, prompts, tokens)
+    await check_failure(model, tokenizer, prompts, tokens)
+
+    start = time.perf_counter()
+    ttft = await thread_per_session(model, tokenizer, prompts, tokens)
+    elapsed = time.perf_counter() - start
+    print(f"thread per session     {sessions * tokens / elapsed:7.1f} tokens/s   TTFT {percentiles(ttft)}")
+
+    for batch_size in (1, sessions):
+        scheduler = GenerationScheduler(model, tokenizer, max_batch_size=batch_size, max_new_tokens=tokens, eos_token_ids=[])
+        start = time.perf_counter()
+        ttft = await batched(scheduler, prompts, tokens)
+        elapsed = time.perf_counter() - start
+        stats = scheduler.get_stats()
+        print(f"scheduler, batch <= {batch_size:<3d}{sessions * tokens / elapsed:7.1f} tokens/s   TTFT {percentiles(ttft)}"
+              f"   mean batch {stats['mean_batch_size']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Hybrid retrieval benchmark
+Indexes the bundled support corpus (benchmarks/data/support_corpus.json:
+product pages and troubleshooting notes full of SKUs and error codes) and
+reports recall@k and latency for vector-only, BM25-only and RRF-fused
+retrieval, per query kind (sku / code / natural language)
+
+Documents go through the Markdown text extractor first, as uploads do,
+so identifiers it mangled (ERR_CONNECTION_RESET, get_user_id()) would
+show up as lost recall.
+
+Embeddings come from the configured OpenAI model with --openai; otherwise
+a deterministic hashed bag-of-words embedder stands in, so the benchmark
+runs offline (its absolute vector recall is lower than a real model's).
+
+Usage: python benchmarks/bench_hybrid_retrieval.py [--openai]
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.chunk_store import ChunkStore
+from app.services.hybrid_search import HybridRetriever
+from app.services.keyword_index import KeywordStore
+from app.services.text_extraction import extract_to_file
+from app.services.vector_store import LocalVectorStore
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "support_corpus.json")
+COLLECTION = "agent_bench"
+KS = (1, 5, 10)
+DIM = 384
+
+
+async def hashed_embed(text: str):
+    vector = np.zeros(DIM, dtype=np.float32)
+    for word in re.findall(r"\w+", text.lower()):
+        digest = hashlib.md5(word.encode()).digest()
+        bucket = int.from_bytes(digest[:4], "little") % DIM
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    return vector.tolist()
+
+
+async def run(embed):
+    with open(CORPUS) as f:
+        corpus = json.load(f)
+    documents, queries = corpus["documents"], corpus["queries"]
+
+    root = tempfile.mkdtemp(prefix="afo_hybrid_")
+    try:
+        vectors = LocalVectorStore(os.path.join(root, "vectors"))
+        keywords = KeywordStore(os.path.join(root, "keywords"))
+        chunks = ChunkStore(os.path.join(root, "chunks"))
+        retriever = HybridRetriever(vectors, keywords, chunks, embed_fn=embed, candidates=50)
+
+        ids = [doc["id"] for doc in documents]
+        texts = []
+        for doc in documents:
+            source = os.path.join(root, f"{doc['id']}.md")
+            with open(source, "w", encoding="utf-8") as f:
+                f.write(doc["text"])
+            extract_to_file(source, "markdown", f"{source}.txt")
+            with open(f"{source}.txt", encoding="utf-8") as f:
+                texts.append(f.read())
+        extracted = "".join(texts)
+        for identifier in ("ERR_CONNECTION_RESET", "AB-1234_X", "get_user_id()", "sync_batch_size", "2*3 = 6"):
+            assert identifier in extracted, f"Markdown extraction mangled {identifier}"
+        start = time.perf_counter()
+        embedded = [await embed(text) for text in texts]
+        await vectors.upsert(COLLECTION, ids, embedded, [{} for _ in texts])
+        await keywords.add(COLLECTION, ids, texts)
+        await chunks.add(COLLECTION, ids, texts, [{} for _ in texts])
+        print(f"indexed {len(documents)} documents in {time.perf_counter() - start:.2f}s, {len(queries)} queries\n")
+
+        # Query embeddings are computed up front so latency compares the retrievers, not the API
+        query_vectors = {q["query"]: await embed(q["query"]) for q in queries}
+
+        async def cached_embed(text):
+            return query_vectors[text]
+
+        retriever.embed_fn = cached_embed
+
+        async def vector_only(query, k):
+            return [hit["id"] for hit in await vectors.search(COLLECTION, query_vectors[query], k)]
+
+        async def keyword_only(query, k):
+            return [hit["id"] for hit in await keywords.search(COLLECTION, query, k)]
+
+        async def hybrid(query, k):
+            return [hit["id"] for hit in await retriever.search(COLLECTION, query, k)]
+
+        print(f"{'mode':<8} {'kind':<8} " + " ".join(f"recall@{k:<3}" for k in KS) + "   p50 ms   p99 ms")
+        for mode, search in (("vector", vector_only), ("bm25", keyword_only), ("hybrid", hybrid)):
+            hits = defaultdict(lambda: defaultdict(int))
+            totals = defaultdict(int)
+            latencies = []
+            for q in queries:
+                start = time.perf_counter()
+                ranked = await search(q["query"], max(KS))
+                latencies.append(time.perf_counter() - start)
+                relevant = set(q["relevant"])
+                for kind in (q["kind"], "all"):
+                    totals[kind] += 1
+                    for k in KS:
+                        hits[kind][k] += bool(relevant & set(ranked[:k]))
+            p50, p99 = np.percentile(np.array(latencies) * 1000, [50, 99])
+            for kind in ("sku", "code", "natural", "all"):
+                recalls = " ".join(f"{hits[kind][k] / totals[kind]:<9.3f}" for k in KS)
+                print(f"{mode:<8} {kind:<8} {recalls}  {p50:7.2f}  {p99:7.2f}")
+            print()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    if "--openai" in sys.argv:
+        from app.services.embedding_service import embedding_service
+        embed = embedding_service.embed
+    else:
+        embed = hashed_embed
+    asyncio.run(run(embed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Intent classification benchmark
+Measures local classifier throughput and, when OPENAI_API_KEY is set,
+agreement between the local stage and the LLM path
+
+Usage: python benchmarks/bench_intent.py [--llm]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.intent_classifier import intent_classifier
+
+EVAL_MESSAGES = [
+    ("Could you walk me through the pricing tiers?", "information_request"),
+    ("Does it work with HubSpot?", "information_request"),
+    ("What's included in the starter plan", "information_request"),
+    ("I'd love a demo on Wednesday morning", "meeting_scheduling"),
+    ("Can we schedule a call for next week? jane@globex.com", "meeting_scheduling"),
+    ("Are you free at 2pm tomorrow to talk", "meeting_scheduling"),
+    ("I keep getting an error when I log in", "support"),
+    ("Our webhook integration is broken since yesterday", "support"),
+    ("I was billed twice this month", "support"),
+    ("hey there", "other"),
+    ("thanks a lot!", "other"),
+    ("ok cool", "other"),
+]
+
+# Off-distribution messages: each must either fall back to the LLM (None) or
+# be classified as expected, and extract exactly these entities
+OFF_DISTRIBUTION = [
+    ("Hi, I'm John Smith from Acme Corp, we are evaluating vendors for next quarter", None,
+     {"name": "John Smith", "company": "Acme Corp"}),
+    ("I want to talk with Sales", "meeting_scheduling", {}),
+    ("Can someone from Customer Success call me?", "meeting_scheduling", {}),
+    ("Let's meet on 20240315 0900", "meeting_scheduling", {}),
+    ("Our meeting on 15.03.2024 please", "meeting_scheduling", {}),
+    ("my number is +1 415 555 0132", None, {"phone": "+1 415 555 0132"}),
+    ("I work at Initech", None, {"company": "Initech"}),
+]
+
+
+def bench_local(iterations: int = 20000):
+    messages = [m for m, _ in EVAL_MESSAGES]
+    start = time.perf_counter()
+    for i in range(iterations):
+        intent_classifier.classify(messages[i % len(messages)])
+    elapsed = time.perf_counter() - start
+
+    correct = sum(intent_classifier.predict(m)[0] == label for m, label in EVAL_MESSAGES)
+    confident = sum(intent_classifier.classify(m)["confident"] for m, _ in EVAL_MESSAGES)
+
+    print(f"Local classifier: {iterations / elapsed:,.0f} msg/s, {elapsed / iterations * 1e6:.1f} us/msg")
+    print(f"  accuracy on eval set: {correct}/{len(EVAL_MESSAGES)}")
+    print(f"  confident (no LLM fallback): {confident}/{len(EVAL_MESSAGES)}")
+
+    wrong = []
+    for message, expected, entities in OFF_DISTRIBUTION:
+        result = intent_classifier.classify(message)
+        if result["confident"] and result["intent"] != expected:
+            wrong.append(f"{message!r}: confident {result['intent']}, expected {expected or 'an LLM fallback'}")
+        if result["entities"] != entities:
+            wrong.append(f"{message!r}: entities {result['entities']}")
+    print(f"  off-distribution cases: {len(OFF_DISTRIBUTION)}, problems: {len(wrong)}")
+    for problem in wrong:
+        print(f"    {problem}")
+    assert not wrong, "off-distribution regressions"
+
+
+async def bench_llm():
+    from app.services.chat_service import ChatService
+
+    service = ChatService()
+    agree = 0
+    latencies = []
+    for message, _ in EVAL_MESSAGES:
+        start = time.perf_counter()
+        llm = await service._analyze_intent_llm(message)
+        latencies.append(time.perf_counter() - start)
+        local_intent, _ = intent_classifier.predict(message)
+        agree += local_intent == llm["intent"]
+
+    latencies.sort()
+    print(f"LLM path: median {latencies[len(latencies) // 2] * 1000:.0f} ms/msg")
+    print(f"  local/LLM agreement: {agree}/{len(EVAL_MESSAGES)}")
+
+
+if __name__ == "__main__":
+    bench_local()
+    if "--llm" in sys.argv:
+        if not os.getenv("OPENAI_API_KEY"):
+            print("OPENAI_API_KEY not set, skipping LLM agreement benchmark")
+        else:
+            asyncio.run(bench_llm())
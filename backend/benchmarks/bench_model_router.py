@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Model router benchmark against local mock LLM servers
+A primary that stalls on a fraction of requests and a fast secondary;
+compares end-to-end latency with hedging off and on, then checks
+fallback when the primary errors, and when its stream drops after the
+first token
+
+Usage: python benchmarks/bench_model_router.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.model_router import ModelRouter
+from benchmarks.mock_llm_server import MockLLMServer
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+async def _run(router: ModelRouter, requests: int = 200, concurrency: int = 20):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await router.chat_completion(MESSAGES, max_tokens=20)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies
+
+
+async def main():
+    primary = await MockLLMServer(ttft_ms=80, stall_rate=0.1, stall_ms=2000).start()
+    secondary = await MockLLMServer(ttft_ms=120).start()
+
+    for hedging in (False, True):
+        router = ModelRouter(
+            default_routes=[("primary", "model-a"), ("secondary", "model-b")],
+            hedge_after_ms=250,
+            hedging_enabled=hedging
+        )
+        router.register_provider("primary", "mock", primary.base_url)
+        router.register_provider("secondary", "mock", secondary.base_url)
+
+        latencies = await _run(router)
+        print(
+            f"hedging={'on ' if hedging else 'off'} "
+            f"p50={_percentile(latencies, 0.5) * 1000:.0f}ms "
+            f"p95={_percentile(latencies, 0.95) * 1000:.0f}ms "
+            f"p99={_percentile(latencies, 0.99) * 1000:.0f}ms "
+            f"hedges={router.hedges_sent}"
+        )
+
+    failing = await MockLLMServer(error_rate=1.0).start()
+    router = ModelRouter(default_routes=[("failing", "model-a"), ("secondary", "model-b")])
+    router.register_provider("failing", "mock", failing.base_url)
+    router.register_provider("secondary", "mock", secondary.base_url)
+    result = await router.chat_completion(MESSAGES)
+    print(f"fallback: served by {result['provider']}:{result['model']}, fallbacks={router.fallbacks}")
+
+    dropping = await MockLLMServer(drop_rate=1.0).start()
+    router = ModelRouter(default_routes=[("dropping", "model-a"), ("secondary", "model-b")])
+    router.register_provider("dropping", "mock", dropping.base_url)
+    router.register_provider("secondary", "mock", secondary.base_url)
+    result = await router.chat_completion(MESSAGES)
+    assert result["provider"] == "secondary", result
+    print(f"mid-stream failure: served by {result['provider']}:{result['model']}, fallbacks={router.fallbacks}")
+
+    for server in (primary, secondary, failing, dropping):
+        await server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
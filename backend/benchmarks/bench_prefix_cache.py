@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Prefix cache benchmark
+Runs S sessions of one agent (a SYSTEM-token system prompt) for T turns
+each through the GenerationScheduler, one turn per session at a time as a
+chat would, and reports per turn the prompt length, the tokens actually
+prefilled and the time to first token, with and without the PrefixCache.
+
+Prompts are built from token ids the way the chat template does: system
+prompt, then every earlier user message and reply, then the new user
+message. The model is a tiny randomly initialised Qwen2 on CPU (see
+bench_generation_scheduler).
+
+Replies are greedy, so reusing cached KV state must not change them: the
+benchmark asserts every session's replies are token for token the same
+with and without the cache, and that every entry left in the cache still
+holds exactly the KV state a fresh prefill of its tokens produces - no
+batching, padding or decoding wrote into the tensors sessions share.
+
+It also checks that the service's agent prefix entry covers exactly the
+system turn of a real chat template (a ChatML tokenizer built locally),
+i.e. that the length taken from apply_chat_template is a token count.
+
+Usage: python benchmarks/bench_prefix_cache.py [SESSIONS] [TURNS] [SYSTEM_TOKENS]
+"""
+
+import asyncio
+import os
+import sys
+
+import numpy as np
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers
+from transformers import PreTrainedTokenizerFast
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_generation_scheduler import load
+
+from app.services.generation_scheduler import GenerationScheduler, _layers
+from app.services.prefix_cache import PrefixCache
+from app.services.qwen_omni_service import Qwen3OmniService
+
+USER_TOKENS = 24
+REPLY_TOKENS = 32
+CHATML = (
+    "{% for m in messages %}<|im_start|>{{ m.role }}\n{{ m.content }}<|im_end|>\n{% endfor %}"
+    "{% if add_generation_prompt %}<|im_start|>assistant\n{% endif %}"
+)
+
+
+async def conversation(scheduler, session, system, turns, rng, vocab, rows, replies):
+    history = []
+    for turn in range(turns):
+        prompt = system + history + rng.integers(0, vocab, USER_TOKENS).tolist()
+        request = scheduler.submit(
+            prompt,
+            max_new_tokens=REPLY_TOKENS,
+            temperature=0,
+            prefixes=[(("agent", "bench"), len(system)), (("session", session), None)]
+        )
+        async for _ in request.stream():
+            pass
+        rows.append((turn, len(prompt), len(prompt) - request.cached_tokens, request.ttft_ms))
+        replies[session, turn] = request.tokens
+        history = prompt[len(system):] + request.tokens
+
+
+async def run(model, tokenizer, sessions, turns, system, cache):
+    scheduler = GenerationScheduler(
+        model, tokenizer, max_batch_size=sessions, max_new_tokens=REPLY_TOKENS, eos_token_ids=[], prefix_cache=cache
+    )
+    rows, replies = [], {}
+    vocab = model.config.vocab_size
+    await asyncio.gather(*(
+        conversation(scheduler, f"s{i}", system, turns, np.random.default_rng(i), vocab, rows, replies)
+        for i in range(sessions)
+    ))
+    return rows, replies
+
+
+def check_entries(model, cache):
+    """Every cached entry must equal a fresh prefill of its tokens"""
+    with torch.inference_mode():
+        for key, entry in cache._entries.items():
+            fresh = _layers(model(input_ids=torch.tensor([entry.tokens]), use_cache=True).past_key_values)
+            for (keys, values), (fresh_keys, fresh_values) in zip(entry.layers, fresh):
+                assert torch.allclose(keys, fresh_keys, atol=1e-4) and torch.allclose(values, fresh_values, atol=1e-4), \
+                    f"cache entry {key} was modified after it was stored"
+    return len(cache._entries)
+
+
+def chatml_tokenizer(vocab_size):
+    """Word-level tokenizer (token i is "w<i>") with Qwen's ChatML chat template"""
+    words = ["<|im_start|>", "<|im_end|>", "system", "user", "assistant", "[UNK]"]
+    words += [f"w{i}" for i in range(vocab_size - len(words))]
+    backend = Tokenizer(models.WordLevel({w: i for i, w in enumerate(words)}, unk_token="[UNK]"))
+    backend.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=backend, unk_token="[UNK]", additional_special_tokens=["<|im_start|>", "<|im_end|>"]
+    )
+    tokenizer.chat_template = CHATML
+    return tokenizer
+
+
+def check_system_length(system_tokens):
+    """The agent prefix entry spans the system turn of the templated prompt, no more and no less"""
+    service = Qwen3OmniService()
+    service.tokenizer = chatml_tokenizer(2048)
+    system_prompt = " ".join(f"w{i % 2000}" for i in range(system_tokens))
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": "w1 w2 w3"}
+    ]
+    (_, length), _ = service._prefixes(messages, {"agent_id": "agent-1", "session_id": "s1"})
+    prompt = service.tokenizer.apply_chat_template(messages, tokenize=True, add_generation_prompt=True, return_dict=False)
+    # <|im_start|> system <words> <|im_end|>
+    assert length == system_tokens + 3, f"agent prefix is {length} tokens, the system turn {system_tokens + 3}"
+    assert prompt[length - 1] == service.tokenizer.convert_tokens_to_ids("<|im_end|>")
+    assert prompt[length] == service.tokenizer.convert_tokens_to_ids("<|im_start|>")
+    print(f"chat template: agent prefix entry is the {length}-token system turn")
+
+
+def report(label, rows, turns):
+    print(label)
+    for turn in range(turns):
+        prompt, prefilled, ttft = zip(*[(p, f, t) for n, p, f, t in rows if n == turn])
+        print(f"  turn {turn + 1:2d}  prompt {np.mean(prompt):6.0f}  prefilled {np.mean(prefilled):6.0f}  "
+              f"TTFT p50 {np.percentile(ttft, 50):7.1f}ms  p99 {np.percentile(ttft, 99):7.1f}ms")
+    total, prefilled = sum(r[1] for r in rows), sum(r[2] for r in rows)
+    print(f"  prefilled {prefilled} of {total} prompt tokens ({prefilled / total:.0%})\n")
+
+
+async def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    turns = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    system_tokens = int(sys.argv[3]) if len(sys.argv) > 3 else 512
+    torch.set_num_threads(os.cpu_count() or 1)
+
+    check_system_length(system_tokens)
+    model, tokenizer = load(None)
+    system = np.random.default_rng(99).integers(0, model.config.vocab_size, system_tokens).tolist()
+    print(f"{sessions} sessions x {turns} turns, {system_tokens}-token system prompt, "
+          f"{USER_TOKENS}-token messages, {REPLY_TOKENS}-token replies\n")
+    with torch.inference_mode():
+        model(input_ids=torch.tensor([system[:64]]))  # warm-up
+
+    rows, uncached = await run(model, tokenizer, sessions, turns, system, None)
+    report("no prefix cache", rows, turns)
+    cache = PrefixCache(512 * 1024 ** 2)
+    rows, cached = await run(model, tokenizer, sessions, turns, system, cache)
+    report("prefix cache", rows, turns)
+    stats = cache.get_stats()
+    print(f"cache: {stats['entries']} entries, {stats['bytes'] / 2 ** 20:.1f}MB, hit rate {stats['hit_rate']}")
+
+    for key in uncached:
+        assert cached[key] == uncached[key], f"session {key[0]} turn {key[1] + 1}: reply differs with the prefix cache"
+    print(f"greedy: all {len(cached)} replies identical with and without the prefix cache")
+    print(f"entries: all {check_entries(model, cache)} still match a fresh prefill of their tokens")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Re-ranking benchmark
+Runs the bundled support corpus through hybrid retrieval, then re-ranks
+the top candidates and reports recall@k with and without re-ranking, the
+mean rank of the relevant chunk, the prompt tokens the top k chunks cost,
+and the smallest k (and its tokens) that matches the recall plain
+retrieval reaches at --target-k
+
+Embeddings are the hashed stand-in from bench_hybrid_retrieval unless
+--openai is given; the scorer is the configured RERANK_MODEL.
+
+Usage: python benchmarks/bench_reranking.py [--openai] [--target-k N]
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.services.chunk_store import ChunkStore
+from app.services.hybrid_search import HybridRetriever
+from app.services.keyword_index import KeywordStore
+from app.services.reranker import Reranker, _build_scorer
+from app.services.vector_store import LocalVectorStore
+from benchmarks.bench_hybrid_retrieval import COLLECTION, CORPUS, hashed_embed
+
+KS = (1, 2, 3, 5)
+
+
+def token_counter():
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=())), "cl100k_base"
+    except ImportError:
+        # ~1.3 tokens per word for English prose with identifiers
+        return lambda text: round(len(text.split()) * 1.3), "approx. 1.3/word"
+
+
+def evaluate(rankings: list, queries: list, count_tokens) -> dict:
+    ranks, tokens = [], {k: 0 for k in range(1, max(KS) + 1)}
+    for ranked, q in zip(rankings, queries):
+        relevant = set(q["relevant"])
+        rank = next((i + 1 for i, hit in enumerate(ranked) if hit["id"] in relevant), None)
+        ranks.append(rank)
+        for k in tokens:
+            tokens[k] += sum(count_tokens(hit["text"]) for hit in ranked[:k])
+    n = len(queries)
+    found = [rank for rank in ranks if rank is not None]
+    return {
+        "recall": {k: sum(rank is not None and rank <= k for rank in ranks) / n for k in tokens},
+        "tokens": {k: tokens[k] / n for k in tokens},
+        "mean_rank": float(np.mean(found)) if found else float("nan"),
+    }
+
+
+async def run(embed, target_k: int):
+    with open(CORPUS) as f:
+        corpus = json.load(f)
+    documents, queries = corpus["documents"], corpus["queries"]
+    count_tokens, tokenizer = token_counter()
+    candidates = max(KS) * settings.RERANK_CANDIDATE_FACTOR
+
+    root = tempfile.mkdtemp(prefix="afo_rerank_")
+    try:
+        vectors = LocalVectorStore(os.path.join(root, "vectors"))
+        keywords = KeywordStore(os.path.join(root, "keywords"))
+        chunks = ChunkStore(os.path.join(root, "chunks"))
+        ids = [doc["id"] for doc in documents]
+        texts = [doc["text"] for doc in documents]
+        await vectors.upsert(COLLECTION, ids, [await embed(text) for text in texts], [{} for _ in texts])
+        await keywords.add(COLLECTION, ids, texts)
+        await chunks.add(COLLECTION, ids, texts, [{} for _ in texts])
+
+        query_vectors = {q["query"]: await embed(q["query"]) for q in queries}
+
+        async def cached_embed(text):
+            return query_vectors[text]
+
+        retriever = HybridRetriever(vectors, keywords, chunks, embed_fn=cached_embed, candidates=50)
+        first_stage = []
+        for q in queries:
+            hits = await retriever.search(COLLECTION, q["query"], candidates)
+            first_stage.append([{"id": hit["id"], "text": hit["payload"]["text"]} for hit in hits])
+
+        reranker = Reranker(_build_scorer(), workers=settings.RERANK_WORKERS)
+        for label in ("cold", "warm"):
+            latencies, reranked = [], []
+            for q, hits in zip(queries, first_stage):
+                start = time.perf_counter()
+                reranked.append(await reranker.rerank(q["query"], hits, max(KS)))
+                latencies.append(time.perf_counter() - start)
+            p50, p99 = np.percentile(np.array(latencies) * 1000, [50, 99])
+            print(f"re-rank {label}: {candidates} candidates/query, p50 {p50:.2f}ms p99 {p99:.2f}ms")
+        stats = reranker.get_stats()
+        print(f"scorer {stats['scorer']}, {stats['pairs']} pairs, {stats['cache_hits']} served from cache\n")
+
+        results = {
+            "hybrid": evaluate([hits[:max(KS)] for hits in first_stage], queries, count_tokens),
+            "reranked": evaluate(reranked, queries, count_tokens),
+        }
+        print(f"{len(queries)} queries, tokens counted with {tokenizer}")
+        print(f"{'mode':<9} " + " ".join(f"recall@{k:<3}" for k in KS) + "  mean rank   "
+              + " ".join(f"tok@{k:<4}" for k in KS))
+        for mode, result in results.items():
+            recalls = " ".join(f"{result['recall'][k]:<9.3f}" for k in KS)
+            tokens = " ".join(f"{result['tokens'][k]:<8.0f}" for k in KS)
+            print(f"{mode:<9} {recalls}  {result['mean_rank']:<9.2f}   {tokens}")
+
+        target = results["hybrid"]["recall"][target_k]
+        base_tokens = results["hybrid"]["tokens"][target_k]
+        k = next((k for k in sorted(results["reranked"]["recall"]) if results["reranked"]["recall"][k] >= target), None)
+        print(f"\nplain retrieval: recall {target:.3f} at k={target_k}, {base_tokens:.0f} prompt tokens/query")
+        if k is None:
+            print("re-ranked: does not reach that recall")
+        else:
+            tokens = results["reranked"]["tokens"][k]
+            print(
+                f"re-ranked: recall {results['reranked']['recall'][k]:.3f} at k={k}, {tokens:.0f} prompt tokens/query "
+                f"({(1 - tokens / base_tokens) * 100:.0f}% fewer)"
+            )
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    target_k = int(sys.argv[sys.argv.index("--target-k") + 1]) if "--target-k" in sys.argv else 5
+    if "--openai" in sys.argv:
+        from app.services.embedding_service import embedding_service
+        embed = embedding_service.embed
+    else:
+        embed = hashed_embed
+    asyncio.run(run(embed, target_k))
+
+
+if __name__ == "__main__":
+    main()
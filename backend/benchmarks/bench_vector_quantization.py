@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Vector quantization benchmark
+Loads N synthetic embeddings into local collections stored as float32,
+int8 and PQ codes, and reports the memory similarity scans need per
+million vectors, query latency (flat and IVF) and recall@10 against an
+exact full-precision search
+
+Usage: python benchmarks/bench_vector_quantization.py [N] [DIM]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.vector_store import LocalCollection
+from benchmarks.bench_vector_store import synthetic
+
+BATCH = 20000
+QUERIES = 200
+TOP_K = 10
+
+
+def measure(collection: LocalCollection, queries: np.ndarray, truth: list):
+    times, recall = [], 0.0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        hits = collection.search(query, TOP_K)
+        times.append(time.perf_counter() - start)
+        recall += len(expected & {hit["id"] for hit in hits}) / TOP_K
+    p50, p99 = np.percentile(np.array(times) * 1000, [50, 99])
+    return p50, p99, recall / len(queries)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 384
+    rng = np.random.default_rng(42)
+    clusters = 2000
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32) / np.sqrt(dim) * 4
+    data = synthetic(n, dim, clusters, rng, centers)
+    queries = synthetic(QUERIES, dim, clusters, rng, centers)
+
+    # Exact answers from a plain float32 scan
+    normalized = data / np.linalg.norm(data, axis=1, keepdims=True)
+    truth = []
+    for query in queries:
+        scores = normalized @ (query / np.linalg.norm(query))
+        truth.append({f"doc:{i}" for i in np.argpartition(-scores, TOP_K)[:TOP_K]})
+    del normalized
+
+    print(f"{n} x {dim}, top {TOP_K}, {QUERIES} queries")
+    print(f"{'mode':<6} {'B/vec':>6} {'MB per 1M':>10} {'train s':>8}   "
+          f"{'flat p50':>9} {'p99':>7} {'recall':>7}   {'ivf p50':>8} {'p99':>7} {'recall':>7}")
+    for mode in ("none", "int8", "pq"):
+        path = tempfile.mkdtemp(prefix="afo_quant_")
+        try:
+            # Thresholds above n: training and the index build are run (and timed) explicitly
+            collection = LocalCollection(path, index_threshold=n + 1, quantization=mode, train_size=n + 1)
+            for i in range(0, n, BATCH):
+                size = min(BATCH, n - i)
+                collection.upsert(
+                    [f"doc:{j}" for j in range(i, i + size)],
+                    data[i:i + size],
+                    [{"text": f"chunk {j}"} for j in range(i, i + size)]
+                )
+            start = time.perf_counter()
+            if mode != "none":
+                collection.train_quantizer()
+            train_seconds = time.perf_counter() - start
+
+            flat = measure(collection, queries, truth)
+            collection.build_index()
+            ivf = measure(collection, queries, truth)
+            bytes_per_vector = collection.get_stats()["bytes_per_vector"]
+            print(
+                f"{mode:<6} {bytes_per_vector:>6} {bytes_per_vector * 1e6 / 2 ** 20:>10.0f} {train_seconds:>8.1f}   "
+                f"{flat[0]:>8.2f}ms {flat[1]:>5.2f}ms {flat[2]:>7.3f}   "
+                f"{ivf[0]:>6.2f}ms {ivf[1]:>5.2f}ms {ivf[2]:>7.3f}"
+            )
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
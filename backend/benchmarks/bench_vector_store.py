@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Local vector store benchmark
+Loads N synthetic embeddings (clustered, like real chunk embeddings) into
+an embedded collection, then compares brute-force and IVF query latency
+and recall@10 against the exact answer
+
+Usage: python benchmarks/bench_vector_store.py [N] [DIM]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.vector_store import LocalCollection
+
+BATCH = 20000
+QUERIES = 200
+TOP_K = 10
+
+
+def synthetic(n: int, dim: int, clusters: int, rng: np.random.Generator, centers: np.ndarray) -> np.ndarray:
+    labels = rng.integers(0, clusters, size=n)
+    return centers[labels] + 0.25 * rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def percentiles(samples):
+    samples = np.asarray(samples) * 1000
+    return f"p50 {np.percentile(samples, 50):7.2f}ms  p99 {np.percentile(samples, 99):7.2f}ms"
+
+
+def check_duplicate_ids(path: str, dim: int, rng: np.random.Generator):
+    """An id repeated within one upsert batch keeps only its last row"""
+    collection = LocalCollection(path, index_threshold=1000)
+    vectors = rng.standard_normal((3, dim)).astype(np.float32)
+    collection.upsert(["a", "b", "a"], vectors, [{"v": 1}, {"v": 2}, {"v": 3}])
+    assert collection.live_count() == 2, collection.live_count()
+    hits = collection.search(vectors[0], 10)
+    assert sorted(hit["id"] for hit in hits) == ["a", "b"], hits
+    assert collection.fetch(["a"])["a"] == {"v": 3}
+    assert collection.delete(["a"]) == 1 and collection.live_count() == 1
+    reopened = LocalCollection(path, index_threshold=1000)
+    assert reopened.live_count() == 1 and [hit["id"] for hit in reopened.search(vectors[1], 10)] == ["b"]
+    print("duplicate ids in a batch: last one wins, delete leaves no ghost row")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    rng = np.random.default_rng(42)
+    clusters = 2000
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32) / np.sqrt(dim) * 4
+
+    path = tempfile.mkdtemp(prefix="afo_vectors_")
+    try:
+        check_duplicate_ids(os.path.join(path, "duplicates"), dim, rng)
+        # Threshold above n: the benchmark builds the index itself to time it
+        collection = LocalCollection(path, index_threshold=n + 1, nprobe=16)
+        start = time.perf_counter()
+        for i in range(0, n, BATCH):
+            size = min(BATCH, n - i)
+            vectors = synthetic(size, dim, clusters, rng, centers)
+            collection.upsert(
+                [f"doc:{j}" for j in range(i, i + size)],
+                vectors,
+                [{"text": f"chunk {j}"} for j in range(i, i + size)]
+            )
+        print(f"upsert   {n} x {dim}: {time.perf_counter() - start:.1f}s")
+
+        queries = synthetic(QUERIES, dim, clusters, rng, centers)
+        exact, flat_times = [], []
+        for query in queries:
+            t = time.perf_counter()
+            hits = collection.search(query, TOP_K)
+            flat_times.append(time.perf_counter() - t)
+            exact.append({hit["id"] for hit in hits})
+        print(f"flat     {percentiles(flat_times)}")
+
+        start = time.perf_counter()
+        collection.build_index()
+        print(f"build    ivf nlist={collection.ivf.nlist}: {time.perf_counter() - start:.1f}s")
+
+        for nprobe in (8, 16, 32):
+            collection.nprobe = nprobe
+            times, recall = [], 0.0
+            for query, truth in zip(queries, exact):
+                t = time.perf_counter()
+                hits = collection.search(query, TOP_K)
+                times.append(time.perf_counter() - t)
+                recall += len(truth & {hit["id"] for hit in hits}) / TOP_K
+            print(f"ivf np={nprobe:<3} {percentiles(times)}  recall@{TOP_K} {recall / len(queries):.3f}")
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+WebSocket fan-out benchmark with in-process fake sockets
+Compares the old sequential send_json loop with the serialize-once,
+per-connection-queue broadcast for 1k-10k admin connections, with a
+few stalled clients mixed in
+
+Usage: python benchmarks/bench_websocket_fanout.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.websocket_manager import WebSocketManager
+
+SEND_LATENCY = 0.0002
+STALLED_EVERY = 500
+EVENT = {"type": "anomaly", "severity": "high", "metrics": {f"metric_{i}": i * 0.5 for i in range(20)}}
+
+
+class FakeWebSocket:
+    # No subprotocols or query string offered, so the JSON codec is negotiated
+    scope = {}
+    query_params = {}
+
+    def __init__(self, stalled: bool, delivered: asyncio.Event, counter: list, target: int):
+        self.stalled = stalled
+        self.delivered = delivered
+        self.counter = counter
+        self.target = target
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+    async def _send(self):
+        await asyncio.sleep(5 if self.stalled else SEND_LATENCY)
+        self.counter[0] += 1
+        if self.counter[0] >= self.target:
+            self.delivered.set()
+
+    async def send_json(self, message):
+        json.dumps(message)
+        await self._send()
+
+    async def send_text(self, payload):
+        await self._send()
+
+
+async def bench(n: int):
+    healthy = n - n // STALLED_EVERY
+    sockets_args = [(i % STALLED_EVERY == 0 and i > 0) for i in range(n)]
+
+    # Old behaviour: await send_json per socket, one after another
+    delivered, counter = asyncio.Event(), [0]
+    sockets = [FakeWebSocket(stalled, delivered, counter, healthy) for stalled in sockets_args]
+    start = time.perf_counter()
+    for ws in sockets:
+        if ws.stalled:
+            continue  # a stalled client would block everyone for its full timeout
+        await ws.send_json({"event": "anomaly.detected", "data": EVENT})
+    sequential = time.perf_counter() - start
+
+    # New behaviour: encode once, enqueue, writers drain concurrently
+    manager = WebSocketManager(queue_size=64, send_timeout=1.0, max_connections=n)
+    delivered, counter = asyncio.Event(), [0]
+    sockets = [FakeWebSocket(stalled, delivered, counter, healthy) for stalled in sockets_args]
+    for ws in sockets:
+        await manager.connect_admin(ws)
+
+    start = time.perf_counter()
+    await manager.broadcast_to_admins("anomaly.detected", EVENT)
+    enqueue = time.perf_counter() - start
+    await delivered.wait()
+    fanout = time.perf_counter() - start
+
+    await manager.close_all()
+    return (
+        f"{n:>6} connections: sequential {sequential * 1000:8.1f} ms (stalled clients skipped) | "
+        f"broadcast call {enqueue * 1000:6.1f} ms, all healthy delivered {fanout * 1000:7.1f} ms"
+    )
+
+
+async def main():
+    import builtins
+    original_print = builtins.print
+    for n in (1000, 5000, 10000):
+        # Silence the manager's per-connection logging
+        builtins.print = lambda *a, **k: None
+        try:
+            result = await bench(n)
+        finally:
+            builtins.print = original_print
+        print(result)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Cross-worker WebSocket broadcast check with a local Redis stand-in
+Runs several WebSocketManager "workers" in one process sharing a
+fakeredis server, spreads admin and agent viewers across them, and
+measures how long a burst of broadcasts from one worker takes to reach
+every socket, and how many pub/sub frames it cost
+
+Requires fakeredis (pip install fakeredis)
+Usage: python benchmarks/bench_ws_backplane.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakeredis
+
+from app.services.websocket_manager import WebSocketManager
+from app.services.ws_backplane import RedisBackplane
+
+WORKERS = 4
+ADMINS_PER_WORKER = 250
+EVENTS = 200
+
+
+class FakeWebSocket:
+    # No subprotocols or query string offered, so the JSON codec is negotiated
+    scope = {}
+    query_params = {}
+
+    def __init__(self, counter: list, target: int, done: asyncio.Event):
+        self.counter = counter
+        self.target = target
+        self.done = done
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        pass
+
+    async def send_text(self, payload):
+        self.counter[0] += 1
+        if self.counter[0] >= self.target:
+            self.done.set()
+
+
+async def bench() -> str:
+    server = fakeredis.FakeServer()
+    workers = [
+        WebSocketManager(
+            max_connections=10000,
+            backplane=RedisBackplane(client=fakeredis.aioredis.FakeRedis(server=server))
+        )
+        for _ in range(WORKERS)
+    ]
+    for manager in workers:
+        await manager.start()
+
+    target = WORKERS * ADMINS_PER_WORKER * EVENTS
+    counter, done = [0], asyncio.Event()
+    for manager in workers:
+        for _ in range(ADMINS_PER_WORKER):
+            await manager.connect_admin(FakeWebSocket(counter, target, done))
+    # Only worker 1 holds a viewer of agent-x; the others must not subscribe to it
+    await workers[1].connect(FakeWebSocket([0], 1, asyncio.Event()), "agent-x")
+    # Let subscriptions apply before publishing
+    await asyncio.sleep(0.05)
+
+    start = time.perf_counter()
+    for i in range(EVENTS):
+        await workers[0].broadcast_to_admins("anomaly.detected", {"seq": i})
+    await asyncio.wait_for(done.wait(), timeout=30)
+    elapsed = time.perf_counter() - start
+
+    stats = workers[0].backplane.get_stats()
+    channels = [m.backplane.get_stats()["channels"] for m in workers]
+    for manager in workers:
+        await manager.close_all()
+
+    return (
+        f"{EVENTS} broadcasts x {WORKERS * ADMINS_PER_WORKER} admins on {WORKERS} workers: "
+        f"all {target} deliveries in {elapsed * 1000:.1f} ms | "
+        f"{stats['published_messages']} messages sent as {stats['published_frames']} pub/sub frames | "
+        f"subscribed channels per worker: {channels}"
+    )
+
+
+async def main():
+    import builtins
+    original_print = builtins.print
+    # Silence the manager's per-connection logging
+    builtins.print = lambda *a, **k: None
+    try:
+        result = await bench()
+    finally:
+        builtins.print = original_print
+    print(result)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
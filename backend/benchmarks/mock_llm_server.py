@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Minimal OpenAI-compatible mock server for local benchmarks
+Serves /v1/chat/completions (streaming and non-streaming), /v1/embeddings
+and /v1/moderations with configurable latency and error injection
+
+Usage: python benchmarks/mock_llm_server.py --port 8100 --ttft-ms 200 --stall-rate 0.1
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import zlib
+
+
+class MockLLMServer:
+    def __init__(
+        self,
+        port: int = 0,
+        ttft_ms: float = 50,
+        token_ms: float = 5,
+        stall_rate: float = 0.0,
+        stall_ms: float = 3000,
+        error_rate: float = 0.0,
+        drop_rate: float = 0.0,
+        embedding_dim: int = 384,
+        embedding_latency_ms: float = 20
+    ):
+        self.port = port
+        self.ttft = ttft_ms / 1000
+        self.token_delay = token_ms / 1000
+        self.stall_rate = stall_rate
+        self.stall = stall_ms / 1000
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.embedding_dim = embedding_dim
+        self.embedding_latency = embedding_latency_ms / 1000
+        self.requests = 0
+        self.server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode().partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                payload = json.loads(body) if body else {}
+                self.requests += 1
+                await self._route(path, payload, writer)
+        except (ConnectionResetError, asyncio.IncompleteReadError, BrokenPipeError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, path: str, payload: dict, writer: asyncio.StreamWriter):
+        if random.random() < self.error_rate:
+            return self._write_json(writer, {"error": {"message": "injected failure"}}, status=500)
+        if path.endswith("/chat/completions"):
+            return await self._chat(payload, writer)
+        if path.endswith("/embeddings"):
+            await asyncio.sleep(self.embedding_latency)
+            inputs = payload.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            return self._write_json(writer, {
+                "object": "list",
+                "model": payload.get("model", "mock-embedding"),
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": self._embed(text)}
+                    for i, text in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": sum(len(t.split()) for t in inputs), "total_tokens": sum(len(t.split()) for t in inputs)}
+            })
+        if path.endswith("/moderations"):
+            await asyncio.sleep(self.embedding_latency)
+            inputs = payload.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            return self._write_json(writer, {
+                "id": "modr-mock",
+                "model": "mock-moderation",
+                "results": [{"flagged": "attack" in text.lower(), "categories": {}, "category_scores": {}} for text in inputs]
+            })
+        self._write_json(writer, {"error": {"message": "not found"}}, status=404)
+
+    def _embed(self, text: str) -> list:
+        rng = random.Random(zlib.crc32(text.encode()))
+        return [rng.uniform(-1, 1) for _ in range(self.embedding_dim)]
+
+    async def _chat(self, payload: dict, writer: asyncio.StreamWriter):
+        delay = self.stall if random.random() < self.stall_rate else self.ttft
+        await asyncio.sleep(delay)
+        words = f"mock reply from port {self.port} for {payload.get('model')}".split()
+        created = int(time.time())
+
+        if not payload.get("stream"):
+            return self._write_json(writer, {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "created": created,
+                "model": payload.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": len(words), "total_tokens": 10 + len(words)}
+            })
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\nConnection: keep-alive\r\n\r\n"
+        )
+        for i, word in enumerate(words):
+            chunk = {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": payload.get("model"),
+                "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]
+            }
+            self._write_chunk(writer, f"data: {json.dumps(chunk)}\n\n".encode())
+            await writer.drain()
+            if i == 0 and random.random() < self.drop_rate:
+                # Connection lost after the first token
+                raise ConnectionResetError()
+            if i:
+                await asyncio.sleep(self.token_delay)
+        usage = {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": payload.get("model"),
+            "choices": [],
+            "usage": {"prompt_tokens": 10, "completion_tokens": len(words), "total_tokens": 10 + len(words)}
+        }
+        self._write_chunk(writer, f"data: {json.dumps(usage)}\n\ndata: [DONE]\n\n".encode())
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    def _write_chunk(writer: asyncio.StreamWriter, data: bytes):
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+    @staticmethod
+    def _write_json(writer: asyncio.StreamWriter, body: dict, status: int = 200):
+        data = json.dumps(body).encode()
+        reason = {200: "OK", 404: "Not Found", 500: "Internal Server Error"}[status]
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\nConnection: keep-alive\r\n\r\n".encode() + data
+        )
+
+
+async def _main(args):
+    server = await MockLLMServer(
+        port=args.port,
+        ttft_ms=args.ttft_ms,
+        stall_rate=args.stall_rate,
+        error_rate=args.error_rate
+    ).start()
+    print(f"Mock LLM server listening on {server.base_url}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--ttft-ms", type=float, default=50)
+    parser.add_argument("--stall-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    asyncio.run(_main(parser.parse_args()))
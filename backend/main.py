@@ -1,10 +1,11 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import uvicorn
 import os
 import asyncio
 from dotenv import load_dotenv
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest, multiprocess
 
 # Load environment variables BEFORE importing config
 load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
@@ -14,6 +15,9 @@ from app.api import agents, conversations, knowledge, integrations, admin, webso
 from app.services.websocket_manager import ws_manager
 from app.services.anomaly_detector import anomaly_detector
 from app.services.qwen_omni_service import qwen_service
+from app.services.usage_accounting import usage_accounting
+from app.services.ingestion_pipeline import shutdown_extract_pool
+from app.services.http_client import close_http_client
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -22,6 +26,12 @@ async def lifespan(app: FastAPI):
     # await init_db()  # Commented out for now - will enable when DB is ready
     print("✅ Service initialized")
     
+    # Start cross-worker WebSocket broadcast relay and idle reaper
+    await ws_manager.start()
+    
+    # Start usage accounting flusher
+    await usage_accounting.start()
+    
     # Start anomaly detector
     await anomaly_detector.start()
     print("✅ Anomaly detector started")
@@ -35,7 +45,11 @@ async def lifespan(app: FastAPI):
     # Shutdown
     print("🛑 Shutting down AFO Agent Service...")
     await anomaly_detector.stop()
+    await usage_accounting.stop()
     await ws_manager.close_all()
+    shutdown_extract_pool()
+    qwen_service.shutdown()
+    await close_http_client()
 
 app = FastAPI(
     title="AFO Agent Service",
@@ -73,6 +87,17 @@ async def root():
         "version": "1.0.0"
     }
 
+if settings.ENABLE_METRICS:
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        """Prometheus metrics (batch sizes, latencies, ...), for all workers in multiprocess mode"""
+        if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/health")
 async def health_check():
     return {
@@ -87,5 +112,9 @@ if __name__ == "__main__":
         "main:app",
         host=settings.HOST,
         port=settings.PORT,
-        reload=settings.ENVIRONMENT == "development"
+        reload=settings.ENVIRONMENT == "development",
+        ws_per_message_deflate=settings.WS_PER_MESSAGE_DEFLATE,
+        # Transport-level pings catch half-open sockets even for clients that ignore app pings
+        ws_ping_interval=settings.WS_HEARTBEAT_INTERVAL_SECONDS,
+        ws_ping_timeout=settings.WS_IDLE_TIMEOUT_SECONDS
     )
\ No newline at end of file
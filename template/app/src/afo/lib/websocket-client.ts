@@ -26,6 +26,11 @@ export class WebSocketClient {
     this.ws.onmessage = (event) => {
       try {
         const data = JSON.parse(event.data);
+        // Answer server heartbeats, or the server reaps the connection as idle
+        if (data.type === 'ping') {
+          this.send({ type: 'pong' });
+          return;
+        }
         this.handleMessage(data);
       } catch (error) {
         console.error('Failed to parse WebSocket message:', error);